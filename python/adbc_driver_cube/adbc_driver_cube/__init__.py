@@ -90,9 +90,13 @@ def connect(
     password : str, optional
         Password (for PostgreSQL mode)
     connection_mode : str, optional
-        Connection mode: "postgresql" (default) or "native"/"arrow_native"
+        Connection mode: "postgresql" (default), "native"/"arrow_native" or "auto"
         - "postgresql": Use PostgreSQL wire protocol (backward compatible)
         - "native" or "arrow_native": Use Arrow Native protocol (high performance)
+        - "auto": Keep one connection per protocol and route each statement
+          by its latency and result-size history (see policy.py). Ports
+          come from `native_port` (default: `port` or 4445) and
+          `postgresql_port` (default 4444); returns an AutoRoutingDatabase.
     db_kwargs : dict, optional
         Additional database options
     **kwargs : dict
@@ -101,7 +105,7 @@ def connect(
     Returns
     -------
     AdbcDatabase
-        Connected database instance
+        Connected database instance (AutoRoutingDatabase for "auto")
 
     Examples
     --------
@@ -118,6 +122,11 @@ def connect(
 
     Using URI:
     >>> db = connect(uri="localhost:4445", db_kwargs={"connection_mode": "native"})
+
+    Routing between both protocols:
+    >>> db = connect(connection_mode="auto", token="your-cube-token", user="root")
+    >>> table = db.execute("SELECT status, COUNT(*) FROM orders GROUP BY 1")
+    >>> print(db.format_report())
     """
     # Find the driver library
     driver_path = _find_driver_library()
@@ -136,7 +145,7 @@ def connect(
     if port is None:
         # Default port based on connection mode
         mode = (db_kwargs or {}).get("connection_mode", connection_mode).lower()
-        port = 4445 if mode in ("native", "arrow_native") else 4444
+        port = 4445 if mode in ("native", "arrow_native", "auto") else 4444
 
     # Merge db_kwargs
     if db_kwargs:
@@ -146,6 +155,18 @@ def connect(
         user = db_kwargs.pop("user", user)
         password = db_kwargs.pop("password", password)
 
+    if connection_mode.lower() == "auto":
+        native_port = kwargs.pop("native_port", port)
+        postgresql_port = kwargs.pop("postgresql_port", 4444)
+        policy = kwargs.pop("routing_policy", None)
+        databases = {
+            mode: connect(host=host, port=int(mode_port), database=database, token=token,
+                          user=user, password=password, connection_mode=mode,
+                          db_kwargs=dict(db_kwargs or {}), **kwargs)
+            for mode, mode_port in (("native", native_port), ("postgresql", postgresql_port))
+        }
+        return AutoRoutingDatabase(databases, policy)
+
     # Build options dictionary
     options = {
         "driver": driver_path,
@@ -181,6 +202,10 @@ AdbcConnection = adbc_driver_manager.AdbcConnection
 AdbcDatabase = adbc_driver_manager.AdbcDatabase
 AdbcStatement = adbc_driver_manager.AdbcStatement
 
+from .streaming import execute_arrow_stream, fetch_batches, measure_stream  # noqa: E402
+from .policy import RoutingDecision, RoutingPolicy  # noqa: E402
+from .routing import AutoRoutingDatabase  # noqa: E402
+
 
 __all__ = [
     "connect",
@@ -190,5 +215,11 @@ __all__ = [
     "DatabaseOptions",
     "ConnectionOptions",
     "StatementOptions",
+    "execute_arrow_stream",
+    "fetch_batches",
+    "measure_stream",
+    "AutoRoutingDatabase",
+    "RoutingDecision",
+    "RoutingPolicy",
     "__version__",
 ]
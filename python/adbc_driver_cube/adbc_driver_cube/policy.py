@@ -0,0 +1,151 @@
+"""
+Protocol routing policy for connection_mode="auto"
+
+Decides, per query fingerprint (the SQL with literals stripped, see
+sql_normalize.fingerprint_sql), whether the next statement runs over Arrow
+Native or the PostgreSQL wire protocol. No I/O: AutoRoutingDatabase
+(routing.py) executes the statements and reports back.
+
+- Once both protocols have latency samples for a fingerprint, the faster
+  one (exponentially weighted moving average) wins. Every
+  `explore_every`-th statement of a fingerprint runs on the other protocol
+  so a cache that warmed up (or went cold) is noticed.
+- Results that have been large (`large_result_rows`) stay on Arrow Native
+  and are never explored over PostgreSQL.
+- New fingerprints start on Arrow Native, the recommended protocol.
+- If a protocol fails at the connection level, the statement is retried
+  on the other one and the failed protocol is skipped for
+  `retry_after` seconds (doubling on repeated failures). Query errors
+  (bad SQL) are raised as usual.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+from .sql_normalize import fingerprint_sql
+
+NATIVE = "native"
+POSTGRESQL = "postgresql"
+MODES = (NATIVE, POSTGRESQL)
+
+
+def _other(mode: str) -> str:
+    return POSTGRESQL if mode == NATIVE else NATIVE
+
+
+def query_fingerprint(sql: str) -> str:
+    """SQL with literals replaced by ? and IN lists collapsed (as in the
+    Python clients' metrics and workload log)
+    """
+    return fingerprint_sql(sql)
+
+
+@dataclass
+class ModeHistory:
+    """Recent behaviour of one protocol for one fingerprint"""
+    samples: int = 0
+    latency: float = 0.0  # EWMA seconds to the last batch
+    rows: float = 0.0     # EWMA result rows
+
+    def observe(self, seconds: float, rows: int, alpha: float):
+        if self.samples == 0:
+            self.latency, self.rows = seconds, float(rows)
+        else:
+            self.latency += alpha * (seconds - self.latency)
+            self.rows += alpha * (rows - self.rows)
+        self.samples += 1
+
+
+@dataclass
+class FingerprintHistory:
+    statements: int = 0
+    modes: Dict[str, ModeHistory] = field(default_factory=lambda: {m: ModeHistory() for m in MODES})
+
+    @property
+    def rows(self) -> float:
+        """Largest recent result size seen on any protocol"""
+        return max(h.rows for h in self.modes.values())
+
+
+@dataclass
+class RoutingDecision:
+    """Where one statement ran and why"""
+    fingerprint: str
+    mode: str
+    reason: str  # "latency", "explore", "size", "default", "fallback"
+    fallback_from: Optional[str] = None
+    seconds: Optional[float] = None
+    rows: Optional[int] = None
+    error: Optional[str] = None
+
+
+class RoutingPolicy:
+    """Per-fingerprint protocol choice (no I/O; see AutoRoutingDatabase)"""
+
+    def __init__(self, min_samples: int = 2, explore_every: int = 20,
+                 large_result_rows: int = 100_000, alpha: float = 0.3,
+                 retry_after: float = 5.0, max_retry_after: float = 60.0,
+                 max_fingerprints: int = 10_000, clock: Callable[[], float] = time.monotonic):
+        self.min_samples = min_samples
+        self.explore_every = explore_every
+        self.large_result_rows = large_result_rows
+        self.alpha = alpha
+        self.retry_after = retry_after
+        self.max_retry_after = max_retry_after
+        self.max_fingerprints = max_fingerprints
+        self.clock = clock
+        self.history: Dict[str, FingerprintHistory] = {}
+        self._down_until: Dict[str, float] = {}
+        self._backoff: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def available(self, mode: str) -> bool:
+        return self._down_until.get(mode, 0.0) <= self.clock()
+
+    def choose(self, fingerprint: str) -> Tuple[str, str]:
+        """(mode, reason) for the next statement of `fingerprint`"""
+        with self._lock:
+            history = self.history.get(fingerprint)
+            if history is None:
+                if len(self.history) >= self.max_fingerprints:
+                    self.history.pop(next(iter(self.history)))
+                history = self.history[fingerprint] = FingerprintHistory()
+            history.statements += 1
+            mode, reason = self._preferred(history)
+        if not self.available(mode):
+            other = _other(mode)
+            if self.available(other):
+                return other, "fallback"
+        return mode, reason
+
+    def _preferred(self, history: FingerprintHistory) -> Tuple[str, str]:
+        native, pg = history.modes[NATIVE], history.modes[POSTGRESQL]
+        if history.rows >= self.large_result_rows:
+            return NATIVE, "size"
+        if native.samples >= self.min_samples and pg.samples >= self.min_samples:
+            best = NATIVE if native.latency <= pg.latency else POSTGRESQL
+            if self.explore_every and history.statements % self.explore_every == 0:
+                return _other(best), "explore"
+            return best, "latency"
+        if native.samples >= self.min_samples:
+            return POSTGRESQL, "explore"
+        if native.samples == 0 and pg.samples == 0:
+            return NATIVE, "default"
+        # Gather samples where they are missing
+        return (NATIVE if native.samples < self.min_samples else POSTGRESQL), "explore"
+
+    def record(self, fingerprint: str, mode: str, seconds: float, rows: int):
+        with self._lock:
+            history = self.history.get(fingerprint)
+            if history is not None:
+                history.modes[mode].observe(seconds, rows, self.alpha)
+            self._backoff.pop(mode, None)
+
+    def mark_down(self, mode: str):
+        """Skip `mode` for a while (doubling on consecutive failures)"""
+        with self._lock:
+            backoff = min(self._backoff.get(mode, self.retry_after / 2) * 2, self.max_retry_after)
+            self._backoff[mode] = backoff
+            self._down_until[mode] = self.clock() + backoff
@@ -0,0 +1,163 @@
+"""
+Adaptive protocol routing for connection_mode="auto"
+
+Which protocol is faster depends on the query: small results often come
+back quicker over the PostgreSQL wire protocol, large ones (or ones the
+server-side Arrow cache already holds) over Arrow Native. In auto mode the
+driver keeps one warm connection per protocol and routes every statement
+by what it has seen for the statement's query fingerprint (the SQL with
+literals stripped); see policy.py for the rules. A statement whose
+protocol fails at the connection level is retried on the other one.
+
+Every statement appends a RoutingDecision to `decisions`; `report()`
+summarizes them per fingerprint.
+"""
+
+import time
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional
+
+import adbc_driver_manager
+import pyarrow as pa
+
+from .policy import MODES, RoutingDecision, RoutingPolicy, _other, query_fingerprint
+from .streaming import execute_arrow_stream
+
+# Errors that mean the endpoint (not the statement) failed
+ENDPOINT_ERRORS = (adbc_driver_manager.OperationalError, adbc_driver_manager.InternalError,
+                   OSError)
+
+
+class AutoRoutingDatabase:
+    """Two warm Cube connections (Arrow Native + PostgreSQL) behind one router
+
+    Returned by `connect(connection_mode="auto")`. Not thread-safe, like a
+    DBAPI connection; consume a reader before executing the next statement.
+    """
+
+    def __init__(self, databases: Dict[str, adbc_driver_manager.AdbcDatabase],
+                 policy: Optional[RoutingPolicy] = None, max_decisions: int = 1000):
+        self.databases = databases
+        self.policy = policy or RoutingPolicy()
+        self.decisions: Deque[RoutingDecision] = deque(maxlen=max_decisions)
+        self._connections: Dict[str, adbc_driver_manager.AdbcConnection] = {}
+        for mode in MODES:
+            try:
+                self._connection(mode)
+            except ENDPOINT_ERRORS:
+                self.policy.mark_down(mode)
+        if not self._connections:
+            raise adbc_driver_manager.OperationalError(
+                "connection_mode='auto': neither Arrow Native nor PostgreSQL is reachable")
+
+    def _connection(self, mode: str) -> adbc_driver_manager.AdbcConnection:
+        conn = self._connections.get(mode)
+        if conn is None:
+            conn = self._connections[mode] = adbc_driver_manager.AdbcConnection(self.databases[mode])
+        return conn
+
+    def _drop(self, mode: str):
+        conn = self._connections.pop(mode, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except adbc_driver_manager.Error:
+                pass
+
+    def execute_arrow_stream(self, sql: str, batch_size: Optional[int] = None) -> pa.RecordBatchReader:
+        """Route `sql` and return a lazily consumed reader
+
+        Latency is measured up to the last batch, so it is recorded once the
+        reader is drained.
+        """
+        fingerprint = query_fingerprint(sql)
+        mode, reason = self.policy.choose(fingerprint)
+        fallback_from = _other(mode) if reason == "fallback" else None
+        started = time.perf_counter()
+        try:
+            reader = execute_arrow_stream(self._connection(mode), sql, batch_size=batch_size)
+        except ENDPOINT_ERRORS as e:
+            other = _other(mode)
+            self._fail(mode, fingerprint, reason, e)
+            if not self.policy.available(other):
+                raise
+            fallback_from, mode, reason = mode, other, "fallback"
+            started = time.perf_counter()
+            try:
+                reader = execute_arrow_stream(self._connection(mode), sql, batch_size=batch_size)
+            except ENDPOINT_ERRORS as e2:
+                self._fail(mode, fingerprint, reason, e2)
+                raise
+        decision = RoutingDecision(fingerprint, mode, reason, fallback_from)
+        self.decisions.append(decision)
+        return pa.RecordBatchReader.from_batches(
+            reader.schema, self._timed(reader, decision, started))
+
+    def execute(self, sql: str) -> pa.Table:
+        """Route `sql` and return the whole result"""
+        return self.execute_arrow_stream(sql).read_all()
+
+    def _timed(self, reader: pa.RecordBatchReader, decision: RoutingDecision,
+               started: float) -> Iterator[pa.RecordBatch]:
+        rows = 0
+        try:
+            for batch in reader:
+                rows += batch.num_rows
+                yield batch
+        except ENDPOINT_ERRORS as e:
+            # Mid-stream failure: already-delivered batches can't be replayed
+            self._fail(decision.mode, decision.fingerprint, decision.reason, e, record=False)
+            decision.error = str(e)
+            raise
+        decision.seconds = time.perf_counter() - started
+        decision.rows = rows
+        self.policy.record(decision.fingerprint, decision.mode, decision.seconds, rows)
+
+    def _fail(self, mode: str, fingerprint: str, reason: str, error: BaseException, record: bool = True):
+        self.policy.mark_down(mode)
+        self._drop(mode)
+        if record:
+            self.decisions.append(RoutingDecision(fingerprint, mode, reason, error=str(error)))
+
+    def report(self) -> List[Dict[str, object]]:
+        """Per-fingerprint routing summary (statements, picks per protocol, EWMA latency)"""
+        picks: Dict[str, Dict[str, int]] = {}
+        fallbacks: Dict[str, int] = {}
+        for d in self.decisions:
+            if d.error is None:
+                counts = picks.setdefault(d.fingerprint, {m: 0 for m in MODES})
+                counts[d.mode] += 1
+            if d.fallback_from is not None:
+                fallbacks[d.fingerprint] = fallbacks.get(d.fingerprint, 0) + 1
+        rows = []
+        for fingerprint, history in list(self.policy.history.items()):
+            entry: Dict[str, object] = {"fingerprint": fingerprint, "statements": history.statements,
+                                        "fallbacks": fallbacks.get(fingerprint, 0)}
+            for mode in MODES:
+                h = history.modes[mode]
+                entry[f"{mode}_picks"] = picks.get(fingerprint, {}).get(mode, 0)
+                entry[f"{mode}_ms"] = round(h.latency * 1000, 2) if h.samples else None
+                entry[f"{mode}_rows"] = round(h.rows) if h.samples else None
+            rows.append(entry)
+        return rows
+
+    def format_report(self) -> str:
+        lines = [f"{'native':>8} {'pg':>8} {'native ms':>10} {'pg ms':>10}  fingerprint"]
+        for r in self.report():
+            native_ms = "-" if r["native_ms"] is None else f"{r['native_ms']:.1f}"
+            pg_ms = "-" if r["postgresql_ms"] is None else f"{r['postgresql_ms']:.1f}"
+            lines.append(f"{r['native_picks']:>8} {r['postgresql_picks']:>8} {native_ms:>10} {pg_ms:>10}  "
+                         f"{r['fingerprint'][:80]}")
+        return "\n".join(lines)
+
+    def close(self):
+        for mode in list(self._connections):
+            self._drop(mode)
+        for db in self.databases.values():
+            db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,88 @@
+"""
+SQL Text Normalization
+
+Normalizes SQL text so that queries differing only in formatting map to the
+same key (for request coalescing and caching):
+- comments are removed
+- runs of whitespace collapse to a single space
+- unquoted text is lower-cased (unquoted identifiers and keywords are
+  case-insensitive in the PostgreSQL dialect CubeSQL speaks)
+- trailing semicolons are dropped
+
+String literals ('...') and quoted identifiers ("...") are kept verbatim.
+
+`fingerprint_sql` goes further for grouping queries by shape (metrics,
+workload logs): string and numeric literals become `?` and IN lists
+collapse to `(?)`, so queries differing only in parameters share one
+fingerprint.
+"""
+
+import re
+
+_LITERALS = re.compile(r"""("(?:[^"]|"")*")|'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:e[-+]?\d+)?\b""")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def normalize_sql(sql: str) -> str:
+    """Return the canonical form of a SQL string"""
+    out = []
+    i = 0
+    n = len(sql)
+    pending_space = False
+
+    while i < n:
+        ch = sql[i]
+
+        # Quoted string literal or identifier - copy verbatim ('' / "" escapes)
+        if ch == "'" or ch == '"':
+            end = i + 1
+            while end < n:
+                if sql[end] == ch:
+                    if end + 1 < n and sql[end + 1] == ch:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            if pending_space and out:
+                out.append(" ")
+            pending_space = False
+            out.append(sql[i:end + 1])
+            i = end + 1
+            continue
+
+        # Line comment
+        if ch == "-" and sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = n if end == -1 else end
+            pending_space = True
+            continue
+
+        # Block comment
+        if ch == "/" and sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            pending_space = True
+            continue
+
+        if ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        out.append(ch.lower())
+        i += 1
+
+    return "".join(out).rstrip("; ")
+
+
+def _literal(match: "re.Match") -> str:
+    # Quoted identifiers are kept, literals become placeholders
+    return match.group(1) or "?"
+
+
+def fingerprint_sql(sql: str) -> str:
+    """Return the normalized SQL with literals replaced by `?`"""
+    return _IN_LIST.sub("(?)", _LITERALS.sub(_literal, normalize_sql(sql)))
@@ -0,0 +1,216 @@
+"""
+Incremental Arrow result streaming for the Cube ADBC driver
+
+`stmt.execute_query()` followed by `pa.RecordBatchReader._import_from_c()`
+and `read_all()` materializes the whole result and relies on a private
+PyArrow API. The helpers here return a public `pyarrow.RecordBatchReader`
+that pulls batches from the driver only as they are consumed, so peak
+memory stays at about one batch instead of the full result.
+
+- execute_arrow_stream(conn, sql): run SQL on an AdbcDatabase,
+  AdbcConnection or DBAPI connection and stream the result
+- fetch_batches(cursor): stream the result of an executed DBAPI cursor,
+  batch size defaulting to the cursor's `arraysize`
+- measure_stream(reader): consume a reader and report rows, batches and
+  peak memory
+
+The driver has no batch size option: it returns batches as the server
+sends them. `batch_size` caps them client-side with zero-copy slices, so it
+bounds what the consumer holds at a time, not what the driver reads.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional, Sequence
+
+import adbc_driver_manager
+import pyarrow as pa
+
+def _import_stream(handle) -> pa.RecordBatchReader:
+    """RecordBatchReader over an ArrowArrayStream handle from the driver"""
+    if hasattr(handle, "__arrow_c_stream__") and hasattr(pa.RecordBatchReader, "from_stream"):
+        # Arrow PyCapsule interface (pyarrow >= 14, adbc-driver-manager >= 1.0)
+        return pa.RecordBatchReader.from_stream(handle)
+    return pa.RecordBatchReader._import_from_c(handle.address)
+
+
+def _sliced(batches: Iterator[pa.RecordBatch], batch_size: Optional[int]) -> Iterator[pa.RecordBatch]:
+    """Cap batches at `batch_size` rows (zero-copy slices)"""
+    for batch in batches:
+        if batch_size is None or batch.num_rows <= batch_size:
+            yield batch
+            continue
+        for offset in range(0, batch.num_rows, batch_size):
+            yield batch.slice(offset, batch_size)
+
+
+def _streaming_reader(reader: pa.RecordBatchReader, batch_size: Optional[int],
+                      *resources) -> pa.RecordBatchReader:
+    """Lazy reader that closes `resources` once drained or dropped"""
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        try:
+            yield from _sliced(reader, batch_size)
+        finally:
+            reader.close()
+            for resource in resources:
+                resource.close()
+
+    return pa.RecordBatchReader.from_batches(reader.schema, batches())
+
+
+def execute_arrow_stream(conn, sql: str, *, batch_size: Optional[int] = None,
+                         parameters: Optional[Sequence[Any]] = None) -> pa.RecordBatchReader:
+    """
+    Execute SQL and return a reader that fetches batches lazily.
+
+    Parameters
+    ----------
+    conn : AdbcDatabase, AdbcConnection or DBAPI connection
+        With an AdbcDatabase a connection is opened for this query and
+        closed together with the reader.
+    sql : str
+        Query to execute
+    batch_size : int, optional
+        Max rows per batch, enforced client-side by zero-copy slicing of
+        the driver's batches
+    parameters : sequence, optional
+        Bind parameters (DBAPI connections only)
+
+    Returns
+    -------
+    pyarrow.RecordBatchReader
+        Consume it (iterate, `read_next_batch()`) before executing another
+        query on the same connection; `read_all()` materializes everything.
+
+    Examples
+    --------
+    >>> db = cube.connect(port=4445, connection_mode="native", token="test")
+    >>> for batch in execute_arrow_stream(db, "SELECT * FROM orders", batch_size=65536):
+    ...     process(batch)
+    """
+    if hasattr(conn, "cursor"):
+        # DBAPI connection: run through a cursor so parameters bind normally
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, parameters)
+            return fetch_batches(cursor, batch_size, close_cursor=True)
+        except BaseException:
+            cursor.close()
+            raise
+    if parameters is not None:
+        raise TypeError("parameters require a DBAPI connection")
+
+    owned = []
+    if isinstance(conn, adbc_driver_manager.AdbcDatabase):
+        conn = adbc_driver_manager.AdbcConnection(conn)
+        owned.append(conn)
+    statement = adbc_driver_manager.AdbcStatement(conn)
+    try:
+        statement.set_sql_query(sql)
+        handle, _ = statement.execute_query()
+        reader = _import_stream(handle)
+    except BaseException:
+        statement.close()
+        for resource in owned:
+            resource.close()
+        raise
+    return _streaming_reader(reader, batch_size, statement, *owned)
+
+
+def fetch_batches(cursor, batch_size: Optional[int] = None,
+                  close_cursor: bool = False) -> pa.RecordBatchReader:
+    """
+    Stream the result of an executed DBAPI cursor batch by batch.
+
+    Parameters
+    ----------
+    cursor : adbc_driver_manager.dbapi.Cursor
+        Cursor after `execute()`
+    batch_size : int, optional
+        Max rows per batch, sliced client-side (default: `cursor.arraysize`
+        when set above 1, otherwise the driver's batches as they arrive)
+    close_cursor : bool
+        Close the cursor once the reader is drained or dropped
+
+    Returns
+    -------
+    pyarrow.RecordBatchReader
+    """
+    if batch_size is None and getattr(cursor, "arraysize", 1) > 1:
+        batch_size = cursor.arraysize
+    reader = cursor.fetch_record_batch()
+    resources = (cursor,) if close_cursor else ()
+    return _streaming_reader(reader, batch_size, *resources)
+
+
+# === Peak memory measurement ===
+
+@dataclass
+class StreamStats:
+    """Outcome of consuming a result"""
+    rows: int = 0
+    batches: int = 0
+    arrow_bytes: int = 0
+    seconds: float = 0.0
+    peak_rss_delta: int = 0
+    peak_arrow_allocated: int = 0
+
+
+def _rss_bytes() -> int:
+    """Current resident set size (Linux /proc; 0 where unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def measure_stream(reader: pa.RecordBatchReader, keep: bool = False) -> StreamStats:
+    """
+    Consume a reader and report rows, batches and peak memory.
+
+    Memory is sampled after every batch: `peak_rss_delta` is the process
+    RSS growth (covers driver-side buffers too), `peak_arrow_allocated` the
+    growth of PyArrow's default pool. With `keep=True` every batch is held,
+    which is what `read_all()` costs.
+    """
+    stats = StreamStats()
+    kept = []
+    rss_start, arrow_start = _rss_bytes(), pa.total_allocated_bytes()
+    started = time.perf_counter()
+    for batch in reader:
+        stats.rows += batch.num_rows
+        stats.batches += 1
+        stats.arrow_bytes += batch.nbytes
+        if keep:
+            kept.append(batch)
+        stats.peak_rss_delta = max(stats.peak_rss_delta, _rss_bytes() - rss_start)
+        stats.peak_arrow_allocated = max(stats.peak_arrow_allocated,
+                                         pa.total_allocated_bytes() - arrow_start)
+        del batch
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from adbc_driver_cube import connect
+
+    parser = argparse.ArgumentParser(description="Peak memory: streaming vs read_all")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=4445)
+    parser.add_argument("--token", default="test")
+    parser.add_argument("--sql", default="SELECT * FROM orders LIMIT 1000000")
+    parser.add_argument("--batch-size", type=int, default=65536)
+    args = parser.parse_args()
+
+    db = connect(host=args.host, port=args.port, connection_mode="native", token=args.token)
+    for label, keep in (("read_all", True), ("streaming", False)):
+        stats = measure_stream(execute_arrow_stream(db, args.sql, batch_size=args.batch_size), keep=keep)
+        print(f"  {label:10} {stats.rows:>10,} rows  {stats.batches:>5} batches  "
+              f"{stats.seconds:6.2f}s  peak RSS +{stats.peak_rss_delta / 1e6:8.1f} MB  "
+              f"(result {stats.arrow_bytes / 1e6:.1f} MB)")
+    db.close()
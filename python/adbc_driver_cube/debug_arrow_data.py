@@ -1,109 +1,89 @@
 #!/usr/bin/env python3
 """Debug script to capture raw Arrow IPC data from Cube server."""
 
+import os
 import socket
 import struct
-
-def read_message(sock):
-    """Read a length-prefixed message."""
-    length_data = b''
-    while len(length_data) < 4:
-        chunk = sock.recv(4 - len(length_data))
-        if not chunk:
-            return None
-        length_data += chunk
-
-    length = struct.unpack('>I', length_data)[0]
-    print(f"Message length: {length}")
-
-    payload = b''
-    while len(payload) < length:
-        chunk = sock.recv(length - len(payload))
+import sys
+
+# The wire format comes from the shared sans-IO codec (python/arrow_native_codec.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from arrow_native_codec import (  # noqa: E402
+    AuthResponse,
+    Batch,
+    Error,
+    FrameDecoder,
+    HandshakeResponse,
+    QueryComplete,
+    Schema,
+    SchemaRef,
+    auth_request,
+    frame,
+    handshake_request,
+    query_request,
+)
+
+
+def read_events(sock, decoder):
+    """Yield decoded messages until the connection closes."""
+    while True:
+        chunk = sock.recv(65536)
         if not chunk:
-            break
-        payload += chunk
-
-    if len(payload) < length:
-        return None
-    return payload
+            return
+        for event in decoder.feed(chunk):
+            yield event
 
-def send_message(sock, msg_type, data):
-    """Send a length-prefixed message."""
-    payload = bytes([msg_type]) + data
-    length = struct.pack('>I', len(payload))
-    sock.sendall(length + payload)
 
 def main():
     # Connect to Cube
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect(('localhost', 4445))
     print("Connected to Cube server")
+    events = read_events(sock, FrameDecoder())
 
-    # Handshake (type=0, version=1)
-    handshake_payload = struct.pack('>I', 1)  # Version 1 as U32
-    send_message(sock, 0, handshake_payload)
-    response = read_message(sock)
-    if not response:
-        print("ERROR: No handshake response")
+    # Handshake (HandshakeRequest 0x01, version=1)
+    sock.sendall(frame(handshake_request()))
+    response = next(events, None)
+    if not isinstance(response, HandshakeResponse):
+        print(f"ERROR: No handshake response ({response})")
         sock.close()
         return
-    print(f"Handshake response: {len(response)} bytes")
-    print(f"  Hex: {response.hex()}")
-
-    # Auth (type=1, token="test", database=optional empty)
-    token = b'test'
-    database = b''
-    auth_payload = struct.pack('>I', len(token)) + token  # String: length + data
-    if database:
-        auth_payload += b'\x01' + struct.pack('>I', len(database)) + database  # OptionalString: 1 + length + data
-    else:
-        auth_payload += b'\x00'  # OptionalString: 0 (no value)
-    send_message(sock, 1, auth_payload)
-    response = read_message(sock)
-    if not response:
-        print("ERROR: No auth response")
+    print(f"Handshake response: version={response.version}, server={response.server_version}")
+
+    # Auth (AuthRequest 0x03, token="test", no database)
+    sock.sendall(frame(auth_request('test')))
+    response = next(events, None)
+    if not isinstance(response, AuthResponse):
+        print(f"ERROR: No auth response ({response})")
         sock.close()
         return
-    print(f"Auth response: {len(response)} bytes")
-    print(f"  Hex: {response.hex()}")
+    print(f"Auth response: success={response.success}, session={response.session_id}")
 
-    # Query (type=2, sql=String)
-    query = b'SELECT 1 as test, 2 as value'
-    query_payload = struct.pack('>I', len(query)) + query  # String: length + data
-    send_message(sock, 2, query_payload)
+    # Query (QueryRequest 0x10, sql=String)
+    sock.sendall(frame(query_request('SELECT 1 as test, 2 as value')))
 
     # Read all responses
     all_arrow_data = b''
     msg_count = 0
-    while True:
-        response = read_message(sock)
-        if not response:
-            break
-
+    for response in events:
         msg_count += 1
-        msg_type = response[0]
-        print(f"\nMessage {msg_count}: type={msg_type}, size={len(response)-1}")
+        print(f"\nMessage {msg_count}: {type(response).__name__}")
 
-        if msg_type == 3:  # QueryResponseSchema
-            arrow_data = response[1:]
-            print(f"  Schema Arrow IPC data: {len(arrow_data)} bytes")
+        if isinstance(response, (Schema, Batch)):
+            arrow_data = response.ipc.to_pybytes()
+            print(f"  Arrow IPC data: {len(arrow_data)} bytes")
             print(f"  First 64 bytes: {arrow_data[:64].hex()}")
             all_arrow_data += arrow_data
 
-        elif msg_type == 4:  # QueryResponseBatch
-            arrow_data = response[1:]
-            print(f"  Batch Arrow IPC data: {len(arrow_data)} bytes")
-            print(f"  First 64 bytes: {arrow_data[:64].hex()}")
-            all_arrow_data += arrow_data
+        elif isinstance(response, SchemaRef):
+            print(f"  Schema reference: 0x{response.fingerprint:016x}")
 
-        elif msg_type == 5:  # QueryComplete
-            rows_affected_data = response[1:]
-            rows_affected = struct.unpack('>Q', rows_affected_data)[0]
-            print(f"  Query complete: {rows_affected} rows")
+        elif isinstance(response, QueryComplete):
+            print(f"  Query complete: {response.rows_affected} rows")
             break
 
-        elif msg_type == 6:  # Error
-            print(f"  Error: {response[1:].decode('utf-8', errors='replace')}")
+        elif isinstance(response, Error):
+            print(f"  Error [{response.code}]: {response.message}")
             break
 
     sock.close()
@@ -19,7 +19,6 @@ try:
     print("✓ Connected to Cube server")
 
     conn = cube.AdbcConnection(db)
-    stmt = cube.AdbcStatement(conn)
 
     # Real Cube query with dimension and measure
     sql = """
@@ -34,11 +33,8 @@ FROM
 GROUP BY 1"""
     print(f"\nQuery: {sql}")
 
-    stmt.set_sql_query(sql)
-    stream, _ = stmt.execute_query()
-
-    import pyarrow as pa
-    reader = pa.RecordBatchReader._import_from_c(stream.address)
+    # Batches arrive lazily; read_all() collects them for display
+    reader = cube.execute_arrow_stream(conn, sql)
     table = reader.read_all()
 
     print(f"\n✓ Got {len(table)} rows")
@@ -49,7 +45,6 @@ GROUP BY 1"""
     df_arrow = table.to_pandas()
     print(df_arrow)
 
-    stmt.close()
     conn.close()
     db.close()
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the connection_mode="auto" routing policy (no driver or server needed)
+
+Run:
+    python -m pytest test_routing_policy.py -q
+"""
+
+import pytest
+
+from adbc_driver_cube.policy import NATIVE, POSTGRESQL, RoutingPolicy, query_fingerprint
+
+SQL = "SELECT status, COUNT(*) FROM orders WHERE updated_at >= '2024-01-01' GROUP BY 1"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _run(policy: RoutingPolicy, fingerprint: str, seconds: dict, rows: int = 10):
+    """Choose, then record the latency of the chosen protocol"""
+    mode, reason = policy.choose(fingerprint)
+    policy.record(fingerprint, mode, seconds[mode], rows)
+    return mode, reason
+
+
+def test_fingerprint_strips_literals():
+    assert query_fingerprint(SQL) == query_fingerprint(SQL.replace("2024-01-01", "2025-06-30").lower())
+    assert query_fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3);") == "select * from t where id in (?)"
+
+
+def test_samples_both_protocols_then_picks_the_faster():
+    policy = RoutingPolicy(min_samples=2, explore_every=5)
+    fp = query_fingerprint(SQL)
+    latency = {NATIVE: 0.050, POSTGRESQL: 0.010}
+    steps = [_run(policy, fp, latency) for _ in range(4)]
+    assert steps == [(NATIVE, "default"), (NATIVE, "explore"),
+                     (POSTGRESQL, "explore"), (POSTGRESQL, "explore")]
+    assert _run(policy, fp, latency) == (NATIVE, "explore")  # 5th statement
+    assert [_run(policy, fp, latency) for _ in range(4)] == [(POSTGRESQL, "latency")] * 4
+    assert _run(policy, fp, latency) == (NATIVE, "explore")  # 10th statement
+
+
+def test_exploration_notices_a_change():
+    policy = RoutingPolicy(min_samples=1, explore_every=2, alpha=1.0)
+    fp = query_fingerprint(SQL)
+    for _ in range(4):
+        _run(policy, fp, {NATIVE: 0.050, POSTGRESQL: 0.010})
+    # Arrow Native's cache warmed up: the next exploration sees it
+    for _ in range(4):
+        _run(policy, fp, {NATIVE: 0.001, POSTGRESQL: 0.010})
+    assert policy.choose(fp) == (NATIVE, "latency")
+
+
+def test_large_results_stay_on_arrow_native():
+    policy = RoutingPolicy(min_samples=1, explore_every=2, large_result_rows=1000)
+    fp = query_fingerprint(SQL)
+    _run(policy, fp, {NATIVE: 0.5, POSTGRESQL: 0.1}, rows=5000)
+    assert [policy.choose(fp) for _ in range(4)] == [(NATIVE, "size")] * 4
+
+
+def test_failed_protocol_falls_back_with_backoff():
+    clock = FakeClock()
+    policy = RoutingPolicy(retry_after=5.0, max_retry_after=12.0, clock=clock)
+    fp = query_fingerprint(SQL)
+    policy.mark_down(NATIVE)
+    assert policy.choose(fp) == (POSTGRESQL, "fallback")
+    clock.now += 5.0
+    assert policy.choose(fp)[0] == NATIVE
+
+    # Consecutive failures double the pause, up to the cap
+    policy.mark_down(NATIVE)
+    clock.now += 9.9
+    assert not policy.available(NATIVE)
+    clock.now += 0.1
+    assert policy.available(NATIVE)
+    policy.mark_down(NATIVE)
+    clock.now += 12.0
+    assert policy.available(NATIVE)
+
+    # A success resets the backoff
+    policy.record(fp, NATIVE, 0.01, 10)
+    policy.mark_down(NATIVE)
+    clock.now += 5.0
+    assert policy.available(NATIVE)
+
+
+def test_both_down_keeps_preferred_protocol():
+    policy = RoutingPolicy(clock=FakeClock())
+    policy.mark_down(NATIVE)
+    policy.mark_down(POSTGRESQL)
+    assert policy.choose(query_fingerprint(SQL)) == (NATIVE, "default")
+
+
+@pytest.mark.parametrize("limit", [1, 3])
+def test_fingerprint_history_is_bounded(limit):
+    policy = RoutingPolicy(max_fingerprints=limit)
+    for i in range(10):
+        policy.choose(f"select {i}")
+    assert len(policy.history) == limit
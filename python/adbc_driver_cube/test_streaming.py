@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming helpers' client-side batch sizing (no server needed)
+
+Run:
+    python -m pytest test_streaming.py -q
+"""
+
+import pyarrow as pa
+
+from adbc_driver_cube.streaming import execute_arrow_stream, fetch_batches
+
+TABLE = pa.table({"x": list(range(1000))})
+
+
+class FakeCursor:
+    """DBAPI cursor returning TABLE in batches of 400 rows"""
+
+    def __init__(self):
+        self.arraysize = 1
+        self.closed = False
+
+    def execute(self, sql, parameters=None):
+        self.sql = sql
+
+    def fetch_record_batch(self):
+        return pa.RecordBatchReader.from_batches(TABLE.schema, TABLE.to_batches(max_chunksize=400))
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cursors = []
+
+    def cursor(self):
+        self.cursors.append(FakeCursor())
+        return self.cursors[-1]
+
+
+def test_dbapi_batch_size_slices_driver_batches():
+    conn = FakeConnection()
+    reader = execute_arrow_stream(conn, "SELECT x FROM t", batch_size=300)
+    sizes = [batch.num_rows for batch in reader]
+    assert sizes == [300, 100, 300, 100, 200]
+    assert conn.cursors[0].closed
+
+
+def test_fetch_batches_defaults_to_arraysize():
+    cursor = FakeCursor()
+    assert [b.num_rows for b in fetch_batches(cursor)] == [400, 400, 200]
+    cursor.arraysize = 250
+    assert [b.num_rows for b in fetch_batches(cursor)] == [250, 150, 250, 150, 200]
+    assert not cursor.closed
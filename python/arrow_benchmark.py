@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Arrow Native vs HTTP Benchmark Suite
+
+Statistically rigorous replacement for the single-shot timings in
+test_arrow_cache_performance.py:
+- configurable warmup and iteration counts
+- `time.perf_counter_ns` timing (no rounding to whole milliseconds)
+- mean / median / stdev / min / max / p50 / p90 / p95 / p99
+- 95% confidence interval of the mean (Student t)
+- machine-readable JSON output including raw samples
+- compare mode: Welch's t-test against a stored baseline file, flagging
+  regressions that are both statistically significant and larger than a
+  relative threshold; exits non-zero so client changes can be gated
+
+Requirements:
+    pip install requests pyarrow
+    pip install orjson   # optional, used by the HTTP client
+
+Usage:
+    # Record a baseline
+    python arrow_benchmark.py --iterations 50 --output baseline.json
+
+    # Later: compare against it (exit code 1 on regression)
+    python arrow_benchmark.py --iterations 50 --compare baseline.json --output current.json
+
+    # Dictionary-encoded dimensions vs plain Arrow on the wider queries
+    python arrow_benchmark.py --cases medium,large --apis arrow,arrow-dict
+"""
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pyarrow as pa
+
+from arrow_native_client import ArrowNativeClient
+
+
+APIS = ("arrow", "arrow-dict", "http")
+
+
+@dataclass
+class BenchmarkCase:
+    """One query, expressed for both APIs"""
+    name: str
+    sql: str
+    http_query: Dict[str, Any]
+
+
+BENCHMARK_CASES = [
+    BenchmarkCase(
+        name="small",
+        sql="""
+        SELECT market_code, COUNT(*) as count
+        FROM orders_with_preagg
+        WHERE updated_at >= '2024-06-01'
+        GROUP BY market_code
+        LIMIT 200
+        """,
+        http_query={
+            "measures": ["orders_with_preagg.count"],
+            "dimensions": ["orders_with_preagg.market_code"],
+            "timeDimensions": [{
+                "dimension": "orders_with_preagg.updated_at",
+                "dateRange": ["2024-06-01", "2024-12-31"]
+            }],
+            "limit": 200
+        },
+    ),
+    BenchmarkCase(
+        name="medium",
+        sql="""
+        SELECT market_code, brand_code, financial_status,
+               COUNT(*) as count,
+               SUM(total_amount) as total_amount,
+               SUM(tax_amount) as tax_amount
+        FROM orders_with_preagg
+        WHERE updated_at >= '2024-01-01'
+        GROUP BY market_code, brand_code, financial_status
+        LIMIT 2000
+        """,
+        http_query={
+            "measures": [
+                "orders_with_preagg.count",
+                "orders_with_preagg.total_amount_sum",
+                "orders_with_preagg.tax_amount_sum"
+            ],
+            "dimensions": [
+                "orders_with_preagg.market_code",
+                "orders_with_preagg.brand_code",
+                "orders_with_preagg.financial_status"
+            ],
+            "timeDimensions": [{
+                "dimension": "orders_with_preagg.updated_at",
+                "dateRange": ["2024-01-01", "2024-12-31"]
+            }],
+            "limit": 2000
+        },
+    ),
+    BenchmarkCase(
+        name="large",
+        sql="""
+        SELECT market_code, brand_code,
+               DATE_TRUNC('hour', updated_at) as hour,
+               COUNT(*) as count,
+               SUM(total_amount) as total_amount
+        FROM orders_with_preagg
+        WHERE updated_at >= '2024-01-01'
+        GROUP BY market_code, brand_code, DATE_TRUNC('hour', updated_at)
+        LIMIT 10000
+        """,
+        http_query={
+            "measures": [
+                "orders_with_preagg.count",
+                "orders_with_preagg.total_amount_sum"
+            ],
+            "dimensions": [
+                "orders_with_preagg.market_code",
+                "orders_with_preagg.brand_code"
+            ],
+            "timeDimensions": [{
+                "dimension": "orders_with_preagg.updated_at",
+                "granularity": "hour",
+                "dateRange": ["2024-01-01", "2024-12-31"]
+            }],
+            "limit": 10000
+        },
+    ),
+]
+
+
+# === Statistics ===
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Linear-interpolated percentile of pre-sorted values (q in [0, 100])"""
+    if not sorted_values:
+        return float("nan")
+    pos = (len(sorted_values) - 1) * q / 100.0
+    lo = math.floor(pos)
+    hi = math.ceil(pos)
+    if lo == hi:
+        return sorted_values[lo]
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def _betacf(a: float, b: float, x: float) -> float:
+    """Continued fraction for the incomplete beta function (Lentz's method)"""
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 200):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-12:
+            break
+    return h
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta function I_x(a, b)"""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    ln_front = (math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b)
+                + a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return math.exp(ln_front) * _betacf(a, b, x) / a
+    return 1.0 - math.exp(ln_front) * _betacf(b, a, 1.0 - x) / b
+
+
+def t_sf_two_sided(t: float, df: float) -> float:
+    """Two-sided p-value of Student's t distribution"""
+    if math.isinf(t):
+        return 0.0
+    return _betainc(df / 2.0, 0.5, df / (df + t * t))
+
+
+def t_critical(df: float, confidence: float = 0.95) -> float:
+    """Two-sided critical value of Student's t (bisection on the CDF)"""
+    alpha = 1.0 - confidence
+    lo, hi = 0.0, 1000.0
+    for _ in range(100):
+        mid = (lo + hi) / 2.0
+        if t_sf_two_sided(mid, df) > alpha:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2.0
+
+
+def summarize(samples_ns: List[int]) -> Dict[str, float]:
+    """Summary statistics of a sample, in milliseconds"""
+    ms = sorted(s / 1e6 for s in samples_ns)
+    n = len(ms)
+    mean = statistics.fmean(ms)
+    stdev = statistics.stdev(ms) if n > 1 else 0.0
+    half_width = t_critical(n - 1) * stdev / math.sqrt(n) if n > 1 else float("nan")
+    return {
+        "n": n,
+        "mean_ms": mean,
+        "median_ms": statistics.median(ms),
+        "stdev_ms": stdev,
+        "min_ms": ms[0],
+        "max_ms": ms[-1],
+        "p50_ms": percentile(ms, 50),
+        "p90_ms": percentile(ms, 90),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "ci95_low_ms": mean - half_width,
+        "ci95_high_ms": mean + half_width,
+    }
+
+
+def welch_t_test(a: List[float], b: List[float]) -> Dict[str, float]:
+    """Welch's unequal-variance t-test of mean(b) vs mean(a)"""
+    na, nb = len(a), len(b)
+    ma, mb = statistics.fmean(a), statistics.fmean(b)
+    va = statistics.variance(a) if na > 1 else 0.0
+    vb = statistics.variance(b) if nb > 1 else 0.0
+    se2 = va / na + vb / nb
+    if se2 == 0.0:
+        t = 0.0 if ma == mb else math.copysign(float("inf"), mb - ma)
+        return {"t": t, "df": float(na + nb - 2), "p_value": 1.0 if t == 0.0 else 0.0}
+    t = (mb - ma) / math.sqrt(se2)
+    df = se2 ** 2 / ((va / na) ** 2 / max(na - 1, 1) + (vb / nb) ** 2 / max(nb - 1, 1))
+    return {"t": t, "df": df, "p_value": t_sf_two_sided(t, df)}
+
+
+# === Runners ===
+
+@dataclass
+class Measurement:
+    """Raw samples for one (case, api) pair"""
+    case: str
+    api: str
+    samples_ns: List[int] = field(default_factory=list)
+    rows: int = 0
+    columns: int = 0
+    result_bytes: int = 0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "case": self.case,
+            "api": self.api,
+            "rows": self.rows,
+            "columns": self.columns,
+            "result_bytes": self.result_bytes,
+            "samples_ns": self.samples_ns,
+            "stats": summarize(self.samples_ns),
+        }
+
+
+def measure(fn: Callable[[], pa.Table], warmup: int, iterations: int) -> Measurement:
+    """Time `fn` after `warmup` untimed calls; each call must return a table"""
+    for _ in range(warmup):
+        fn()
+    m = Measurement(case="", api="")
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        table = fn()
+        m.samples_ns.append(time.perf_counter_ns() - start)
+    m.rows, m.columns = table.num_rows, table.num_columns
+    m.result_bytes = table.nbytes
+    return m
+
+
+class BenchmarkSuite:
+    """Runs BENCHMARK_CASES against Arrow Native and HTTP"""
+
+    def __init__(self, arrow_host: str = "localhost", arrow_port: int = 4445,
+                 http_url: str = "http://localhost:4000/cubejs-api/v1/load",
+                 token: str = "test", reconnect: bool = False):
+        self.arrow_host = arrow_host
+        self.arrow_port = arrow_port
+        self.http_url = http_url
+        self.token = token
+        self.reconnect = reconnect
+
+    @contextmanager
+    def arrow_runner(self, case: BenchmarkCase,
+                     dictionary: bool = False) -> Iterator[Callable[[], pa.Table]]:
+        """Query over Arrow Native; one connection reused unless `reconnect`"""
+        def open_client():
+            return ArrowNativeClient(self.arrow_host, self.arrow_port, self.token,
+                                     dictionary_encoding=dictionary).connect()
+
+        if self.reconnect:
+            def run():
+                with open_client() as client:
+                    return client.query(case.sql).to_table()
+            yield run
+            return
+
+        with open_client() as client:
+            yield lambda: client.query(case.sql).to_table()
+
+    def arrow_dict_runner(self, case: BenchmarkCase) -> Iterator[Callable[[], pa.Table]]:
+        """Arrow Native with dictionary-encoded dimension columns"""
+        return self.arrow_runner(case, dictionary=True)
+
+    @contextmanager
+    def http_runner(self, case: BenchmarkCase) -> Iterator[Callable[[], pa.Table]]:
+        """Query over the Cube REST API with a pooled session, ending at a pa.Table"""
+        from cube_http_client import CubeHttpClient
+
+        with CubeHttpClient(self.http_url, token=self.token) as client:
+            yield lambda: client.load(case.http_query)
+
+    def run(self, cases: List[BenchmarkCase], apis: List[str],
+            warmup: int, iterations: int) -> List[Measurement]:
+        runners = {"arrow": self.arrow_runner, "arrow-dict": self.arrow_dict_runner,
+                   "http": self.http_runner}
+        results = []
+        for case in cases:
+            for api in apis:
+                with runners[api](case) as runner:
+                    m = measure(runner, warmup, iterations)
+                m.case, m.api = case.name, api
+                s = summarize(m.samples_ns)
+                print(f"  {case.name:8} {api:10} n={s['n']:<4} "
+                      f"mean={s['mean_ms']:9.3f}ms  median={s['median_ms']:9.3f}ms  "
+                      f"p95={s['p95_ms']:9.3f}ms  "
+                      f"ci95=[{s['ci95_low_ms']:.3f}, {s['ci95_high_ms']:.3f}]  "
+                      f"rows={m.rows}  bytes={m.result_bytes}")
+                results.append(m)
+        return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any],
+            alpha: float = 0.05, threshold: float = 0.05) -> List[Dict[str, Any]]:
+    """Compare current results to a baseline
+
+    A (case, api) pair regresses when its mean is slower by more than
+    `threshold` (relative) AND Welch's t-test gives p < `alpha`.
+    """
+    base_by_key = {(r["case"], r["api"]): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        base = base_by_key.get((r["case"], r["api"]))
+        if base is None:
+            continue
+        a = [s / 1e6 for s in base["samples_ns"]]
+        b = [s / 1e6 for s in r["samples_ns"]]
+        test = welch_t_test(a, b)
+        base_mean, cur_mean = statistics.fmean(a), statistics.fmean(b)
+        change = (cur_mean - base_mean) / base_mean if base_mean else 0.0
+        significant = test["p_value"] < alpha
+        rows.append({
+            "case": r["case"],
+            "api": r["api"],
+            "baseline_mean_ms": base_mean,
+            "current_mean_ms": cur_mean,
+            "change": change,
+            "p_value": test["p_value"],
+            "significant": significant,
+            "regression": significant and change > threshold,
+            "improvement": significant and change < -threshold,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Arrow Native vs HTTP benchmark suite")
+    parser.add_argument("--arrow-host", default="localhost")
+    parser.add_argument("--arrow-port", type=int, default=4445)
+    parser.add_argument("--http-url", default="http://localhost:4000/cubejs-api/v1/load")
+    parser.add_argument("--token", default="test")
+    parser.add_argument("--cases", default=",".join(c.name for c in BENCHMARK_CASES),
+                        help="comma-separated case names")
+    parser.add_argument("--apis", default="arrow,http", help=f"comma-separated: {','.join(APIS)}")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--reconnect", action="store_true",
+                        help="open a new Arrow Native connection per iteration")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline JSON to compare against")
+    parser.add_argument("--alpha", type=float, default=0.05, help="significance level")
+    parser.add_argument("--threshold", type=float, default=0.05,
+                        help="minimum relative slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.iterations < 2:
+        parser.error("--iterations must be at least 2")
+
+    wanted = args.cases.split(",")
+    unknown = sorted(set(wanted) - {c.name for c in BENCHMARK_CASES})
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)}")
+    cases = [c for c in BENCHMARK_CASES if c.name in wanted]
+    apis = args.apis.split(",")
+    unknown = [api for api in apis if api not in APIS]
+    if unknown:
+        parser.error(f"unknown API(s): {', '.join(unknown)} (choose from {', '.join(APIS)})")
+
+    suite = BenchmarkSuite(args.arrow_host, args.arrow_port, args.http_url,
+                           args.token, args.reconnect)
+    print(f"Benchmark: warmup={args.warmup} iterations={args.iterations}")
+    measurements = suite.run(cases, apis, args.warmup, args.iterations)
+
+    current = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "pyarrow": pa.__version__,
+            "platform": platform.platform(),
+            "warmup": args.warmup,
+            "iterations": args.iterations,
+            "reconnect": args.reconnect,
+        },
+        "results": [m.to_json() for m in measurements],
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        comparison = compare(baseline, current, args.alpha, args.threshold)
+        current["comparison"] = comparison
+        print(f"\nComparison vs {args.compare} (alpha={args.alpha}, threshold={args.threshold:.0%}):")
+        for row in comparison:
+            verdict = ("REGRESSION" if row["regression"]
+                       else "improvement" if row["improvement"]
+                       else "no significant change")
+            print(f"  {row['case']:8} {row['api']:10} {row['baseline_mean_ms']:9.3f}ms -> "
+                  f"{row['current_mean_ms']:9.3f}ms ({row['change']:+.1%}, p={row['p_value']:.4f})  {verdict}")
+        if any(row["regression"] for row in comparison):
+            exit_code = 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Arrow Native Protocol Codec Microbenchmark
+
+Measures the client-side cost of the Arrow Native protocol without a
+server: synthetic frame streams (handshake, auth, schema, N batches) are
+generated up front and replayed into ArrowNativeClient's framing and decode
+path, either from memory or over a socketpair.
+
+Column types: int64, decimal128, timestamp, string, dictionary-encoded
+string (DICTIONARY_ENCODE stream) and "mixed" (all of them side by side),
+each at several batch sizes and widths.
+
+Reported per case:
+- frames/s and MB/s of wire bytes (median iteration)
+- Arrow memory pool allocations per frame
+
+Transports:
+- memory: a socket stand-in copying from a pre-encoded buffer - isolates
+  framing and decoding from the kernel
+- socketpair: a writer thread pushes the same bytes through a local
+  socketpair - adds syscall and copy costs
+
+Usage:
+    python arrow_codec_benchmark.py
+    python arrow_codec_benchmark.py --types int64,string --batch-rows 1024,65536 --transport memory
+    python arrow_codec_benchmark.py --output codec.json
+"""
+
+import argparse
+import datetime
+import decimal
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional
+
+import pyarrow as pa
+
+from arrow_native_client import ArrowNativeClient, Capability
+from arrow_native_mock_server import auth_response, frame, handshake_response, result_payloads
+
+COLUMN_TYPES = ("int64", "decimal", "timestamp", "string", "dictionary", "mixed")
+TRANSPORTS = ("memory", "socketpair")
+
+
+def _column(kind: str, rows: int, seed: int) -> pa.Array:
+    """Deterministic synthetic column"""
+    if kind == "int64":
+        return pa.array(range(seed, seed + rows), pa.int64())
+    if kind == "decimal":
+        return pa.array([decimal.Decimal(i * 7 % 100000) / 100 for i in range(rows)], pa.decimal128(18, 2))
+    if kind == "timestamp":
+        start = datetime.datetime(2024, 1, 1)
+        return pa.array([start + datetime.timedelta(seconds=i * 37) for i in range(rows)],
+                        pa.timestamp("us"))
+    if kind in ("string", "dictionary"):
+        # Low-cardinality dimension values, like market or brand codes
+        return pa.array([f"value-{(i * 31 + seed) % 250:04d}" for i in range(rows)])
+    raise ValueError(f"Unknown column type: {kind}")
+
+
+def synthetic_table(kind: str, rows: int, width: int) -> pa.Table:
+    """`width` columns of `kind` ("mixed" cycles through the base types)"""
+    kinds = ["int64", "decimal", "timestamp", "string"] if kind == "mixed" else [kind]
+    columns = {}
+    for i in range(width):
+        column_kind = kinds[i % len(kinds)]
+        columns[f"c{i}_{column_kind}"] = _column(column_kind, rows, seed=i)
+    return pa.table(columns)
+
+
+class _MemorySocket:
+    """Socket stand-in replaying pre-encoded server bytes"""
+
+    def __init__(self, data: bytes):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def rewind(self):
+        self._pos = 0
+
+    def recv_into(self, buffer, nbytes: int = 0) -> int:
+        n = min(nbytes or len(buffer), len(self._view) - self._pos)
+        memoryview(buffer).cast("B")[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def recv(self, nbytes: int) -> bytes:
+        data = self._view[self._pos:self._pos + nbytes].tobytes()
+        self._pos += len(data)
+        return data
+
+    def sendall(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+@dataclass
+class CodecResult:
+    """Throughput of one (transport, column type, batch rows, width) case"""
+    transport: str
+    column_type: str
+    batch_rows: int
+    width: int
+    frames_per_iteration: int
+    wire_bytes_per_iteration: int
+    iterations: int
+    median_ms: float
+    frames_per_second: float
+    mb_per_second: float
+    allocations_per_frame: float
+
+
+def _replay(transport: str, response: bytes, iterations: int,
+            client: ArrowNativeClient, run: Callable[[], None]) -> List[float]:
+    """Feed `response` to `client` once per iteration; returns seconds per iteration"""
+    samples = []
+    if transport == "memory":
+        sock = _MemorySocket(response)
+        client.socket = sock
+        for _ in range(iterations):
+            sock.rewind()
+            start = time.perf_counter()
+            run()
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    server, client.socket = socket.socketpair()
+    # Drain requests so the client's sends never block
+    drain = threading.Thread(target=lambda: _drain(server), daemon=True)
+    drain.start()
+    ready = threading.Semaphore(0)
+
+    def write():
+        for _ in range(iterations):
+            ready.acquire()
+            server.sendall(response)
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            ready.release()
+            run()
+            samples.append(time.perf_counter() - start)
+    finally:
+        writer.join()
+        client.socket.close()
+        server.close()
+    return samples
+
+
+def _drain(sock: socket.socket):
+    try:
+        while sock.recv(65536):
+            pass
+    except OSError:
+        pass
+
+
+def run_case(transport: str, column_type: str, batch_rows: int, batches: int,
+             width: int, iterations: int, warmup: int) -> CodecResult:
+    client = ArrowNativeClient()
+    if column_type == "handshake":
+        payloads = [handshake_response(), auth_response()]
+
+        def run():
+            client._send_handshake()
+            client._receive_handshake()
+            client._send_auth()
+            client._receive_auth()
+    else:
+        dictionary = column_type == "dictionary"
+        table = synthetic_table(column_type, batch_rows * batches, width)
+        payloads = result_payloads(table, batch_size=batch_rows, dictionary=dictionary)
+        if dictionary:
+            client.capabilities = Capability.DICTIONARY_ENCODING
+
+        def run():
+            client.query("SELECT * FROM synthetic", dictionary=dictionary)
+
+    response = b"".join(frame(payload) for payload in payloads)
+    _replay(transport, response, warmup, client, run)
+
+    pool = client.memory_pool
+    allocations = pool.num_allocations()
+    samples = _replay(transport, response, iterations, client, run)
+    allocations = pool.num_allocations() - allocations
+
+    frames = len(payloads)
+    median = statistics.median(samples)
+    return CodecResult(
+        transport=transport, column_type=column_type, batch_rows=batch_rows, width=width,
+        frames_per_iteration=frames, wire_bytes_per_iteration=len(response),
+        iterations=iterations, median_ms=median * 1000,
+        frames_per_second=frames / median,
+        mb_per_second=len(response) / median / 1e6,
+        allocations_per_frame=allocations / (frames * iterations),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Arrow Native codec microbenchmark (no server)")
+    parser.add_argument("--transport", default=",".join(TRANSPORTS), help="memory,socketpair")
+    parser.add_argument("--types", default=",".join(COLUMN_TYPES),
+                        help=f"comma-separated: {','.join(COLUMN_TYPES)}")
+    parser.add_argument("--batch-rows", default="1024,65536", help="rows per batch frame")
+    parser.add_argument("--batches", type=int, default=8, help="batch frames per query")
+    parser.add_argument("--widths", default="1,8", help="columns per table")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--no-handshake", action="store_true", help="skip the handshake+auth case")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    results: List[CodecResult] = []
+    header = (f"  {'transport':10} {'type':10} {'rows':>6} {'width':>5} {'frames/s':>10} "
+              f"{'MB/s':>9} {'allocs/frame':>12}")
+    print(f"Codec benchmark: {args.batches} batches/query, {args.iterations} iterations, "
+          f"pyarrow {pa.__version__}")
+    print(header)
+    print("  " + "-" * (len(header) - 2))
+
+    cases = []
+    for transport in args.transport.split(","):
+        if not args.no_handshake:
+            cases.append((transport, "handshake", 0, 0))
+        for column_type in args.types.split(","):
+            for batch_rows in (int(x) for x in args.batch_rows.split(",")):
+                for width in (int(x) for x in args.widths.split(",")):
+                    cases.append((transport, column_type, batch_rows, width))
+
+    for transport, column_type, batch_rows, width in cases:
+        r = run_case(transport, column_type, batch_rows, args.batches, width,
+                     args.iterations, args.warmup)
+        results.append(r)
+        print(f"  {r.transport:10} {r.column_type:10} {r.batch_rows:>6} {r.width:>5} "
+              f"{r.frames_per_second:>10.0f} {r.mb_per_second:>9.1f} {r.allocations_per_frame:>12.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {"timestamp": time.time(), "pyarrow": pa.__version__,
+                         "python": sys.version.split()[0], "batches": args.batches},
+                "results": [asdict(r) for r in results],
+            }, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Row-Level Deltas Between Versions of a Query Result
+
+Refreshing a cached dashboard result usually changes a handful of rows.
+With the DELTA_RESULTS extension (see arrow_native_client) the client sends
+the version of the result it holds, and the server answers "unchanged", a
+delta, or the full result. A delta is two Arrow tables keyed on the GROUP BY
+columns:
+
+- upserts: complete new rows for keys that are new or whose values changed
+- deletes: key columns of rows that are gone
+
+Everything here is vectorized with pyarrow.compute; rows are matched by
+hash-grouping old and new keys together, which also matches null keys and
+dictionary-encoded keys.
+
+- result_version(table): content hash identifying a result
+- delta_keys(sql, schema): key columns of a GROUP BY query, if derivable
+- diff_tables(old, new, keys): the delta turning `old` into `new`
+- apply_delta(table, upserts, deletes, keys): merge a delta into a table
+
+Merged rows keep their position; inserted rows are appended in server
+order. Row order therefore only matches a full re-query when the query
+doesn't define one, which is why servers answer ORDER BY queries in full.
+"""
+
+import hashlib
+import re
+from typing import List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+_OLD = "__delta_old"
+_NEW = "__delta_new"
+
+_GROUP_BY = re.compile(r"\bGROUP\s+BY\s+(.+?)(?=\bHAVING\b|\bORDER\s+BY\b|\bLIMIT\b|\bOFFSET\b|;|$)",
+                       re.IGNORECASE | re.DOTALL)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+
+
+def result_version(table: pa.Table) -> int:
+    """Content hash of a result (first 8 bytes of the SHA-256 of its IPC bytes)
+
+    Independent of how the table is chunked.
+    """
+    digest = hashlib.sha256()
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table.combine_chunks())
+    digest.update(sink.getvalue())
+    return int.from_bytes(digest.digest()[:8], "big")
+
+
+def delta_keys(sql: str, schema: pa.Schema) -> Optional[List[str]]:
+    """GROUP BY columns of `sql` as result column names
+
+    None when the query has no GROUP BY, defines a row order, or groups by
+    something that isn't a result column (then only full results are sent).
+    """
+    if _ORDER_BY.search(sql):
+        return None
+    match = _GROUP_BY.search(sql)
+    if match is None:
+        return None
+    names = schema.names
+    lowered = {name.lower(): name for name in names}
+    keys = []
+    for item in _split_top_level(match.group(1)):
+        if item.isdigit():
+            position = int(item) - 1
+            if not 0 <= position < len(names):
+                return None
+            keys.append(names[position])
+            continue
+        name = item.rsplit(".", 1)[-1].strip('"`')
+        if name in names:
+            keys.append(name)
+        elif name.lower() in lowered:
+            keys.append(lowered[name.lower()])
+        else:
+            return None
+    return keys or None
+
+
+def _split_top_level(clause: str) -> List[str]:
+    """Split a comma-separated clause, ignoring commas inside parentheses"""
+    items, depth, current = [], 0, []
+    for char in clause:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append("".join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    items.append("".join(current).strip())
+    return [item for item in items if item]
+
+
+def _arange(n: int) -> pa.Array:
+    """0..n-1 as int64 without a Python loop"""
+    ones = pc.fill_null(pa.nulls(n, pa.int64()), 1)
+    return pc.subtract(pc.cumulative_sum(ones), 1)
+
+
+def _match(left: pa.Table, right: pa.Table, keys: Sequence[str]) -> pa.Table:
+    """Group left and right rows by key: one row per key with
+    `__delta_old_min/_count` (left row) and `__delta_new_min/_count` (right row)
+    """
+    left_keys = left.select(keys)
+    right_keys = right.select(keys)
+    combined = pa.concat_tables([
+        left_keys.append_column(_OLD, _arange(left.num_rows))
+                 .append_column(_NEW, pa.nulls(left.num_rows, pa.int64())),
+        right_keys.append_column(_OLD, pa.nulls(right.num_rows, pa.int64()))
+                  .append_column(_NEW, _arange(right.num_rows)),
+    ])
+    return combined.group_by(list(keys), use_threads=False).aggregate(
+        [(_OLD, "min"), (_OLD, "count"), (_NEW, "min"), (_NEW, "count")])
+
+
+def _unique(groups: pa.Table) -> bool:
+    """Every key occurs at most once on each side"""
+    for column in (f"{_OLD}_count", f"{_NEW}_count"):
+        most = pc.max(groups[column]).as_py()
+        if most is not None and most > 1:
+            return False
+    return True
+
+
+def _differs(a: pa.ChunkedArray, b: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Row-wise a != b, where null equals null"""
+    unequal = pc.fill_null(pc.not_equal(a, b), False)
+    return pc.or_(unequal, pc.xor(pc.is_null(a), pc.is_null(b)))
+
+
+def diff_tables(old: pa.Table, new: pa.Table,
+                keys: Sequence[str]) -> Optional[Tuple[pa.Table, pa.Table]]:
+    """(upserts, deletes) turning `old` into `new`
+
+    None if the delta can't be expressed: different schemas, or keys that
+    don't identify rows uniquely.
+    """
+    if not old.schema.equals(new.schema):
+        return None
+    groups = _match(old, new, keys)
+    if not _unique(groups):
+        return None
+    old_index, new_index = groups[f"{_OLD}_min"], groups[f"{_NEW}_min"]
+
+    deletes = old.select(keys).take(pc.drop_null(pc.if_else(pc.is_null(new_index), old_index, None)))
+
+    matched = pc.and_(pc.is_valid(old_index), pc.is_valid(new_index))
+    old_matched = pc.filter(old_index, matched)
+    new_matched = pc.filter(new_index, matched)
+    values = [name for name in new.column_names if name not in keys]
+    if values and len(new_matched):
+        before, after = old.select(values).take(old_matched), new.select(values).take(new_matched)
+        changed = _differs(before.column(0), after.column(0))
+        for i in range(1, len(values)):
+            changed = pc.or_(changed, _differs(before.column(i), after.column(i)))
+        updated = pc.filter(new_matched, changed)
+    else:
+        updated = new_matched.slice(0, 0)
+
+    inserted = pc.filter(new_index, pc.is_null(old_index))
+    rows = pc.sort_indices(pa.chunked_array([inserted, updated], pa.int64()))
+    upserts = new.take(pa.chunked_array([inserted, updated], pa.int64()).take(rows))
+    return upserts, deletes
+
+
+def apply_delta(table: pa.Table, upserts: pa.Table, deletes: pa.Table,
+                keys: Sequence[str]) -> pa.Table:
+    """Merge a delta into `table`
+
+    Upserted rows replace the row with the same key in place (or are
+    appended), deleted keys are dropped. Key columns of kept rows are never
+    copied; value columns are patched with one masked replace each.
+    """
+    if upserts.num_rows == 0 and deletes.num_rows == 0:
+        return table
+    if not upserts.schema.equals(table.schema):
+        upserts = upserts.cast(table.schema)
+
+    # Deleted keys are changes past the last upsert
+    key_schema = upserts.select(keys).schema
+    changes = pa.concat_tables([upserts.select(keys), deletes.select(keys).cast(key_schema)])
+    groups = _match(table, changes, keys)
+    has_row = pc.is_valid(groups[f"{_OLD}_min"])
+
+    # Change index per table row, in table order
+    existing = groups.filter(has_row)
+    change = existing[f"{_NEW}_min"].take(pc.sort_indices(existing[f"{_OLD}_min"]))
+    updated = pc.fill_null(pc.less(change, upserts.num_rows), False)
+    deleted = pc.fill_null(pc.greater_equal(change, upserts.num_rows), False)
+
+    if pc.any(updated).as_py():
+        replacements = upserts.take(pc.drop_null(pc.if_else(updated, change, None)))
+        columns = [table.column(name) if name in keys
+                   else pc.replace_with_mask(table.column(name).combine_chunks(), updated.combine_chunks(),
+                                             replacements.column(name).combine_chunks())
+                   for name in table.column_names]
+        table = pa.Table.from_arrays(columns, schema=table.schema)
+    if pc.any(deleted).as_py():
+        table = table.filter(pc.invert(deleted))
+
+    added = groups.filter(pc.invert(has_row))[f"{_NEW}_min"]
+    added = pc.filter(added, pc.less(added, upserts.num_rows))
+    if len(added) == 0:
+        return table
+    return pa.concat_tables([table, upserts.take(added.take(pc.sort_indices(added)))])
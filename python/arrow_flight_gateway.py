@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Arrow Flight Fan-Out Gateway for Cube
+
+Local consumers (notebooks, batch jobs, sidecars) that each open their own
+Arrow Native connection re-run the same queries against cubesqld. This
+gateway is a small `pyarrow.flight` server in front of one pooled upstream
+(ArrowNativePool) and a ResultCache: consumers call `DoGet` with the SQL as
+ticket, and load on cubesqld scales with distinct queries instead of with
+the number of consumers.
+
+- Cached results are served straight from the cache.
+- Concurrent readers of the same ticket (normalized SQL) share one upstream
+  execution. Batches are forwarded as they arrive from cubesqld; readers
+  that join mid-stream first replay the batches already received.
+- Forwarded batches are zero-copy views of the upstream receive buffers:
+  values are never decoded or copied, only the IPC message headers are
+  rebuilt for the Flight stream.
+- Server-reported query errors reach every reader as FlightServerError.
+- Optionally, every upstream execution is counted in a HotQueryLog, so a
+  CacheWarmer can replay the hottest queries after a restart.
+- Optionally, every request is appended to a WorkloadLog with its cache
+  outcome (see workload_log.py for the analyzer).
+
+Flight API:
+- DoGet(ticket=sql)
+- GetFlightInfo(FlightDescriptor.for_command(sql)): schema + a ticket
+- DoAction("stats") -> JSON counters, DoAction("invalidate", sql or b"")
+
+Usage:
+    python arrow_flight_gateway.py --upstream localhost:4445 --port 8815
+
+    client = flight.connect("grpc://localhost:8815")
+    table = client.do_get(flight.Ticket(sql)).read_all()
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.flight as flight
+
+from arrow_native_client import QueryError
+from arrow_native_pool import ArrowNativePool
+from cache_warmer import HotQueryLog
+from result_cache import ResultCache
+from sql_normalize import normalize_sql
+from workload_log import WorkloadLog
+
+
+@dataclass
+class GatewayStats:
+    """Downstream requests vs. upstream executions"""
+    requests: int = 0
+    cache_hits: int = 0
+    upstream_executions: int = 0
+    shared: int = 0
+    upstream_errors: int = 0
+
+
+class _Execution:
+    """One upstream execution fanned out to any number of readers"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self.schema: Optional[pa.Schema] = None
+        self.batches: List[pa.RecordBatch] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+    def start(self, schema: pa.Schema):
+        with self._cond:
+            self.schema = schema
+            self._cond.notify_all()
+
+    def append(self, batch: pa.RecordBatch):
+        with self._cond:
+            self.batches.append(batch)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def wait_schema(self) -> pa.Schema:
+        with self._cond:
+            while self.schema is None and not self.done:
+                self._cond.wait()
+            if self.error is not None:
+                raise _flight_error(self.error)
+            return self.schema
+
+    def stream(self) -> Iterator[pa.RecordBatch]:
+        """Every batch from the first one on, waiting for those still to come"""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.batches) and not self.done:
+                    self._cond.wait()
+                if index < len(self.batches):
+                    batch = self.batches[index]
+                elif self.error is not None:
+                    raise _flight_error(self.error)
+                else:
+                    return
+            index += 1
+            yield batch
+
+
+def _flight_error(error: BaseException) -> Exception:
+    if isinstance(error, QueryError):
+        return flight.FlightServerError(str(error))
+    return flight.FlightUnavailableError(f"Upstream failed: {error}")
+
+
+class CubeFlightGateway(flight.FlightServerBase):
+    """Flight server sharing one pooled, cached Arrow Native upstream"""
+
+    def __init__(self, location: str = "grpc://0.0.0.0:8815",
+                 pool: Optional[ArrowNativePool] = None,
+                 cache: Optional[ResultCache] = None,
+                 hot_queries: Optional[HotQueryLog] = None,
+                 workload_log: Optional[WorkloadLog] = None, **pool_kwargs):
+        """
+        Args:
+            location: Flight URI to listen on (port 0 picks a free port)
+            pool: Upstream pool (default: ArrowNativePool(**pool_kwargs))
+            cache: Result cache (default: 512 MB, 5 minute TTL); results are
+                cached by normalized SQL
+            hot_queries: Log counting each upstream execution and its time
+                (see cache_warmer)
+            workload_log: Log receiving one record per request, with its
+                cache outcome ("hit", "shared" or "miss")
+        """
+        super().__init__(location)
+        self.pool = pool if pool is not None else ArrowNativePool(**pool_kwargs)
+        self.cache = cache if cache is not None else ResultCache(max_bytes=512 << 20, ttl=300)
+        self.hot_queries = hot_queries
+        self.workload_log = workload_log
+        self.stats = GatewayStats()
+        self._executor = ThreadPoolExecutor(self.pool.max_size, thread_name_prefix="flight-upstream")
+        self._inflight: Dict[str, _Execution] = {}
+        self._lock = threading.Lock()
+
+    # === Flight RPCs ===
+
+    def do_get(self, context, ticket: flight.Ticket):
+        sql = ticket.ticket.decode("utf-8")
+        key = normalize_sql(sql)
+        table = self.cache.get(key)
+        with self._lock:
+            self.stats.requests += 1
+            if table is not None:
+                self.stats.cache_hits += 1
+        if table is not None:
+            if self.workload_log is not None:
+                self.workload_log.record_query(sql, 0.0, bytes_out=table.nbytes, rows=table.num_rows,
+                                               cache="hit", source="gateway")
+            return flight.RecordBatchStream(table)
+        execution = self._execution(key, sql)
+        return flight.GeneratorStream(execution.wait_schema(), execution.stream())
+
+    def get_flight_info(self, context, descriptor: flight.FlightDescriptor):
+        if descriptor.descriptor_type != flight.DescriptorType.CMD:
+            raise flight.FlightServerError("Expected a command descriptor carrying SQL")
+        sql = descriptor.command.decode("utf-8")
+        key = normalize_sql(sql)
+        table = self.cache.get(key)
+        if table is not None:
+            return flight.FlightInfo(table.schema, descriptor, [flight.FlightEndpoint(sql, [])],
+                                     table.num_rows, table.nbytes)
+        # Starts the execution early; the following DoGet joins it
+        schema = self._execution(key, sql).wait_schema()
+        return flight.FlightInfo(schema, descriptor, [flight.FlightEndpoint(sql, [])], -1, -1)
+
+    def list_actions(self, context):
+        return [("stats", "Gateway counters as JSON"),
+                ("invalidate", "Drop a cached SQL result (empty body: all)")]
+
+    def do_action(self, context, action: flight.Action):
+        if action.type == "stats":
+            with self._lock:
+                stats = dict(asdict(self.stats), cached=len(self.cache), cached_bytes=self.cache.nbytes)
+            yield flight.Result(json.dumps(stats).encode())
+        elif action.type == "invalidate":
+            body = action.body.to_pybytes() if action.body is not None else b""
+            self.cache.invalidate(normalize_sql(body.decode("utf-8")) if body else None)
+        else:
+            raise flight.FlightServerError(f"Unknown action: {action.type}")
+
+    def shutdown(self):
+        super().shutdown()
+        self._executor.shutdown(wait=False)
+        self.pool.close()
+
+    # === Upstream ===
+
+    def _execution(self, key: str, sql: str) -> _Execution:
+        """Join the in-flight execution of `key`, or start one"""
+        with self._lock:
+            execution = self._inflight.get(key)
+            if execution is not None:
+                self.stats.shared += 1
+                if self.workload_log is not None:
+                    self.workload_log.record_query(sql, 0.0, cache="shared", source="gateway")
+                return execution
+            execution = self._inflight[key] = _Execution()
+            self.stats.upstream_executions += 1
+        self._executor.submit(self._run, key, sql, execution)
+        return execution
+
+    def _run(self, key: str, sql: str, execution: _Execution):
+        error = None
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as client:
+                reader = client.query_reader(sql)
+                execution.start(reader.schema)
+                for batch in reader:
+                    execution.append(batch)
+            seconds = time.perf_counter() - started
+            if self.hot_queries is not None:
+                self.hot_queries.record(sql, seconds)
+            if self.workload_log is not None:
+                self.workload_log.record_query(
+                    sql, seconds, bytes_in=sum(batch.nbytes for batch in execution.batches),
+                    rows=sum(batch.num_rows for batch in execution.batches),
+                    batches=len(execution.batches), cache="miss", source="gateway")
+            self.cache.put(key, pa.Table.from_batches(execution.batches, execution.schema))
+        except BaseException as e:
+            error = e
+            with self._lock:
+                self.stats.upstream_errors += 1
+            if self.workload_log is not None:
+                self.workload_log.record_query(sql, time.perf_counter() - started, cache="miss",
+                                               error=True, source="gateway")
+        finally:
+            # Cached before leaving the in-flight map: no window in which a
+            # new reader would miss both
+            with self._lock:
+                del self._inflight[key]
+            execution.finish(error)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from arrow_native_balancer import parse_endpoint
+
+    parser = argparse.ArgumentParser(description="Arrow Flight fan-out gateway for cubesqld")
+    parser.add_argument("--upstream", default="localhost:4445", help="cubesqld Arrow Native host:port")
+    parser.add_argument("--token", default="test")
+    parser.add_argument("--database")
+    parser.add_argument("--host", default="0.0.0.0", help="Flight listen address")
+    parser.add_argument("--port", type=int, default=8815)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--ttl", type=float, default=300.0, help="result cache TTL in seconds")
+    parser.add_argument("--cache-mb", type=int, default=512)
+    parser.add_argument("--hot-log", help="hot query log to update (JSON, saved every minute)")
+    parser.add_argument("--workload-log", help="directory for per-request workload records")
+    args = parser.parse_args()
+
+    hot_queries = HotQueryLog.load(args.hot_log) if args.hot_log else None
+
+    upstream_host, upstream_port = parse_endpoint(args.upstream)
+    gateway = CubeFlightGateway(
+        f"grpc://{args.host}:{args.port}",
+        pool=ArrowNativePool(upstream_host, upstream_port, args.token, args.database,
+                             max_size=args.pool_size),
+        cache=ResultCache(max_bytes=args.cache_mb << 20, ttl=args.ttl),
+        hot_queries=hot_queries,
+        workload_log=WorkloadLog(args.workload_log, source="gateway") if args.workload_log else None,
+    )
+    if hot_queries is not None:
+        def save_periodically():
+            while not stopped.wait(60):
+                hot_queries.save()
+
+        stopped = threading.Event()
+        threading.Thread(target=save_periodically, daemon=True).start()
+    print(f"✓ Flight gateway on grpc://{args.host}:{gateway.port} -> {args.upstream}")
+    try:
+        gateway.serve()
+    finally:
+        if hot_queries is not None:
+            stopped.set()
+            hot_queries.save()
+        if gateway.workload_log is not None:
+            gateway.workload_log.close()
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""
+Arrow IPC Capture Inspector
+
+Summarizes captured Arrow IPC data (e.g. the Schema/Batch payloads written by
+adbc_driver_cube/debug_arrow_data.py) without decoding any values. The file
+is memory-mapped, and only the encapsulated message headers are read: the
+FlatBuffers `Message` metadata is walked in place with struct.unpack_from,
+and message bodies are skipped via their declared length. Null counts come
+from the FieldNodes of each RecordBatch header, and sizes from its Buffer
+entries. A multi-GB capture costs one pass over its (small) headers.
+
+Accepted input:
+- IPC streams, including several concatenated streams (one per protocol
+  frame, each ending with an end-of-stream marker)
+- IPC files (`ARROW1` magic; the footer is skipped)
+- the pre-0.15 framing without continuation marker
+
+Reported:
+- per message: offset, type, metadata/body bytes, rows, compression codec
+  and, on request, the buffer layout (role, column, offset, length)
+- per column (nested fields flattened, dictionaries separately): rows,
+  nulls, bytes per buffer role (validity, offsets, data, ...) and, for
+  compressed bodies, the uncompressed size from each buffer's prefix
+- where the walk stopped, for truncated or malformed captures (the
+  statistics cover the messages before it)
+
+Usage:
+    python arrow_ipc_inspect.py capture.bin
+    python arrow_ipc_inspect.py capture.bin --messages 20 --layout
+
+    summary = inspect_capture("capture.bin")
+    print(format_columns(summary))
+"""
+
+import mmap
+import os
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+CONTINUATION = 0xFFFFFFFF
+FILE_MAGIC = b"ARROW1"
+
+# Message.fbs MessageHeader union
+HEADER_TYPES = {1: "schema", 2: "dictionary_batch", 3: "record_batch", 4: "tensor", 5: "sparse_tensor"}
+CODECS = {0: "lz4_frame", 1: "zstd"}
+
+# Garbage metadata: offsets outside the buffer (struct.error, IndexError),
+# bad names (UnicodeDecodeError), a schema pyarrow rejects (ArrowException,
+# OSError for "Invalid flatbuffers message")
+_MALFORMED = (struct.error, IndexError, ValueError, OSError, pa.ArrowException)
+
+
+# === FlatBuffers ===
+
+class _Table:
+    """Read-only view of a FlatBuffers table inside a buffer"""
+    __slots__ = ("buf", "pos", "vtable", "vtable_size")
+
+    def __init__(self, buf, pos: int):
+        self.buf = buf
+        self.pos = pos
+        self.vtable = pos - struct.unpack_from("<i", buf, pos)[0]
+        self.vtable_size = struct.unpack_from("<H", buf, self.vtable)[0]
+
+    def _offset(self, slot: int) -> int:
+        entry = 4 + 2 * slot
+        if entry >= self.vtable_size:
+            return 0
+        return struct.unpack_from("<H", self.buf, self.vtable + entry)[0]
+
+    def scalar(self, slot: int, fmt: str, default=0):
+        offset = self._offset(slot)
+        return struct.unpack_from(fmt, self.buf, self.pos + offset)[0] if offset else default
+
+    def _indirect(self, slot: int) -> Optional[int]:
+        offset = self._offset(slot)
+        if not offset:
+            return None
+        pos = self.pos + offset
+        return pos + struct.unpack_from("<I", self.buf, pos)[0]
+
+    def table(self, slot: int) -> Optional["_Table"]:
+        pos = self._indirect(slot)
+        return _Table(self.buf, pos) if pos is not None else None
+
+    def vector(self, slot: int, element_size: int) -> Tuple[int, int]:
+        """(start of the elements, element count)"""
+        pos = self._indirect(slot)
+        if pos is None:
+            return 0, 0
+        count = struct.unpack_from("<I", self.buf, pos)[0]
+        if pos + 4 + count * element_size > len(self.buf):
+            raise IndexError(f"vector of {count} elements at {pos} extends past the end of the buffer")
+        return pos + 4, count
+
+    def tables(self, slot: int) -> List["_Table"]:
+        start, count = self.vector(slot, 4)
+        return [_Table(self.buf, start + 4 * i + struct.unpack_from("<I", self.buf, start + 4 * i)[0])
+                for i in range(count)]
+
+    def string(self, slot: int) -> Optional[str]:
+        pos = self._indirect(slot)
+        if pos is None:
+            return None
+        count = struct.unpack_from("<I", self.buf, pos)[0]
+        return bytes(self.buf[pos + 4:pos + 4 + count]).decode("utf-8")
+
+
+def _root(buf, pos: int) -> _Table:
+    return _Table(buf, pos + struct.unpack_from("<I", buf, pos)[0])
+
+
+# === Column layout ===
+
+@dataclass
+class ColumnLayout:
+    """One FieldNode of a batch: a (possibly nested) column and its buffers"""
+    path: str
+    type: pa.DataType
+    roles: Tuple[str, ...]
+    variadic: bool = False   # view types: plus a variadic number of data buffers
+
+
+def _roles(t: pa.DataType) -> Optional[Tuple[str, ...]]:
+    """Buffers of one node of type `t` (Arrow columnar format), None if unknown"""
+    if isinstance(t, pa.ExtensionType):
+        t = t.storage_type
+    if pa.types.is_dictionary(t):
+        return "validity", "indices"
+    if pa.types.is_null(t) or pa.types.is_run_end_encoded(t):
+        return ()
+    if pa.types.is_string_view(t) or pa.types.is_binary_view(t):
+        return "validity", "views"
+    if (pa.types.is_string(t) or pa.types.is_binary(t)
+            or pa.types.is_large_string(t) or pa.types.is_large_binary(t)):
+        return "validity", "offsets", "data"
+    if pa.types.is_list_view(t) or pa.types.is_large_list_view(t):
+        return "validity", "offsets", "sizes"
+    if pa.types.is_list(t) or pa.types.is_large_list(t) or pa.types.is_map(t):
+        return "validity", "offsets"
+    if pa.types.is_fixed_size_list(t) or pa.types.is_struct(t):
+        return ("validity",)
+    if pa.types.is_union(t):
+        return ("types",) if t.mode == "sparse" else ("types", "offsets")
+    try:
+        return ("validity", "data") if t.bit_width else None
+    except ValueError:
+        return None
+
+
+def _children(t: pa.DataType) -> List[pa.Field]:
+    if isinstance(t, pa.ExtensionType):
+        t = t.storage_type
+    if pa.types.is_dictionary(t):
+        return []
+    if pa.types.is_map(t):
+        return [pa.field("entries", pa.struct([t.key_field, t.item_field]), nullable=False)]
+    if (pa.types.is_list(t) or pa.types.is_large_list(t) or pa.types.is_fixed_size_list(t)
+            or pa.types.is_list_view(t) or pa.types.is_large_list_view(t)):
+        return [t.value_field]
+    if pa.types.is_struct(t) or pa.types.is_union(t):
+        return [t.field(i) for i in range(t.num_fields)]
+    if pa.types.is_run_end_encoded(t):
+        return [pa.field("run_ends", t.run_end_type), pa.field("values", t.value_type)]
+    return []
+
+
+def flatten(fields, prefix: str = "") -> Optional[List[ColumnLayout]]:
+    """FieldNode order (depth-first, pre-order) of `fields`; None if a type
+    has an unknown buffer layout
+    """
+    out = []
+    for f in fields:
+        path = f"{prefix}{f.name}"
+        roles = _roles(f.type)
+        if roles is None:
+            return None
+        out.append(ColumnLayout(path, f.type, roles,
+                                pa.types.is_string_view(f.type) or pa.types.is_binary_view(f.type)))
+        nested = flatten(_children(f.type), path + ".")
+        if nested is None:
+            return None
+        out.extend(nested)
+    return out
+
+
+def _dictionary_ids(fields: List[_Table], prefix: str = "") -> Dict[int, str]:
+    """Dictionary id -> field path, from the Schema's Field tables"""
+    ids = {}
+    for f in fields:
+        path = f"{prefix}{f.string(0) or ''}"
+        encoding = f.table(4)
+        if encoding is not None:
+            ids[encoding.scalar(0, "<q")] = path
+        ids.update(_dictionary_ids(f.tables(5), path + "."))
+    return ids
+
+
+def _field_at(schema: pa.Schema, path: str) -> Optional[pa.Field]:
+    fields, found = list(schema), None
+    for name in path.split("."):
+        found = next((f for f in fields if f.name == name), None)
+        if found is None:
+            return None
+        fields = _children(found.type)
+    return found
+
+
+# === Inspection ===
+
+@dataclass
+class BufferInfo:
+    role: str
+    column: str
+    offset: int       # absolute file offset
+    length: int
+    uncompressed: Optional[int] = None
+
+
+@dataclass
+class MessageInfo:
+    index: int
+    offset: int
+    kind: str
+    metadata_bytes: int
+    body_bytes: int
+    rows: int = 0
+    compression: Optional[str] = None
+    dictionary_id: Optional[int] = None
+    is_delta: bool = False
+    buffers: Optional[List[BufferInfo]] = None
+
+
+@dataclass
+class ColumnStats:
+    path: str
+    type: str
+    batches: int = 0
+    rows: int = 0
+    nulls: int = 0
+    bytes: Dict[str, int] = field(default_factory=dict)
+    compressed_bytes: int = 0
+    uncompressed_bytes: int = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.bytes.values())
+
+
+@dataclass
+class CaptureSummary:
+    path: str
+    file_bytes: int
+    messages: List[MessageInfo] = field(default_factory=list)
+    columns: Dict[str, ColumnStats] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    streams: int = 0
+    rows: int = 0
+    metadata_bytes: int = 0
+    body_bytes: int = 0
+    codecs: Dict[str, int] = field(default_factory=dict)
+    trailing_bytes: int = 0
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+
+def _header(buf, pos: int, end: int) -> Tuple[int, int]:
+    """(metadata start, metadata length) of the message at `pos`
+
+    Length 0 is an end-of-stream marker. Raises ValueError for bytes that
+    aren't a message header.
+    """
+    if pos + 4 > end:
+        raise ValueError(f"truncated message header at {pos}")
+    if struct.unpack_from("<I", buf, pos)[0] == CONTINUATION:
+        if pos + 8 > end:
+            raise ValueError(f"truncated message header at {pos}")
+        meta, length = pos + 8, struct.unpack_from("<i", buf, pos + 4)[0]
+    else:
+        meta, length = pos + 4, struct.unpack_from("<i", buf, pos)[0]   # pre-0.15 framing
+    if length < 0 or meta + length > end:
+        raise ValueError(f"invalid metadata length {length} at {pos}")
+    return meta, length
+
+
+def inspect_capture(path: str, keep_messages: Optional[int] = None,
+                    layout: bool = False) -> CaptureSummary:
+    """Walk every message of an IPC capture
+
+    Args:
+        keep_messages: Keep MessageInfo for the first N messages only
+            (None = all)
+        layout: Also record each kept message's buffer layout
+    """
+    started = time.perf_counter()
+    size = os.path.getsize(path)
+    summary = CaptureSummary(path, size)
+    if size == 0:
+        return summary
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        buf = memoryview(mapped)
+        try:
+            _walk(buf, summary, keep_messages, layout)
+        finally:
+            buf.release()
+    summary.seconds = time.perf_counter() - started
+    return summary
+
+
+def _walk(buf, summary: CaptureSummary, keep_messages: Optional[int], layout: bool):
+    pos, end = 0, len(buf)
+    is_file = bytes(buf[:6]) == FILE_MAGIC
+    if is_file:
+        pos = 8
+    columns: Optional[List[ColumnLayout]] = None
+    dictionaries: Dict[int, Optional[List[ColumnLayout]]] = {}
+    # Captures of protocol frames repeat the schema before every batch
+    layouts: Dict[bytes, tuple] = {}
+    index = 0
+    while pos < end:
+        try:
+            meta, length = _header(buf, pos, end)
+        except ValueError as e:
+            summary.error = str(e)
+            break
+        if length == 0:
+            summary.counts["eos"] = summary.counts.get("eos", 0) + 1
+            pos = meta
+            if is_file:
+                break   # the footer follows
+            continue
+        offset = pos
+        try:
+            message = _root(buf, meta)
+            kind = HEADER_TYPES.get(message.scalar(1, "<B"), "unknown")
+            body_start = meta + length
+            body = message.scalar(3, "<q")
+            if body < 0:
+                raise ValueError(f"negative body length {body}")
+            if body_start + body > end:
+                summary.error = f"body of message {index} at {offset} extends past the end of the file"
+                break
+            info = MessageInfo(index, offset, kind, body_start - offset, body)
+            header = message.table(2)
+            if header is None:
+                raise ValueError("no message header")
+            keep = keep_messages is None or index < keep_messages
+
+            if kind == "schema":
+                metadata = bytes(buf[meta:body_start])
+                if metadata not in layouts:
+                    layouts[metadata] = _schema_layout(buf, offset, body_start, header)
+                columns, dictionaries = layouts[metadata]
+                summary.streams += 1
+            elif kind == "record_batch":
+                _batch(buf, header, body_start, info, columns, summary, layout and keep)
+                summary.rows += info.rows
+            elif kind == "dictionary_batch":
+                info.dictionary_id = header.scalar(0, "<q")
+                info.is_delta = bool(header.scalar(2, "<B"))
+                _batch(buf, header.table(1), body_start, info, dictionaries.get(info.dictionary_id),
+                       summary, layout and keep)
+        except _MALFORMED as e:
+            summary.error = f"malformed message {index} (stopped at offset {offset}): {e}"
+            break
+
+        summary.counts[kind] = summary.counts.get(kind, 0) + 1
+        summary.metadata_bytes += info.metadata_bytes
+        summary.body_bytes += body
+        if keep:
+            summary.messages.append(info)
+        index += 1
+        pos = body_start + body
+    if summary.error is None and not is_file:
+        summary.trailing_bytes = end - pos
+
+
+def _schema_layout(buf, offset: int, end: int, header: _Table):
+    """Column layouts of a Schema message and of its dictionaries (by id)"""
+    schema = ipc.read_schema(pa.py_buffer(buf[offset:end]))
+    dictionaries = {}
+    for dict_id, dict_path in _dictionary_ids(header.tables(1)).items():
+        encoded = _field_at(schema, dict_path)
+        dictionaries[dict_id] = (flatten([pa.field(f"{dict_path}.dictionary", encoded.type.value_type)])
+                                 if encoded is not None else None)
+    return flatten(schema), dictionaries
+
+
+def _batch(buf, header: _Table, body_start: int, info: MessageInfo,
+           columns: Optional[List[ColumnLayout]], summary: CaptureSummary, layout: bool):
+    """Account one RecordBatch header (also the data of a DictionaryBatch)"""
+    if header is None:
+        raise ValueError("no RecordBatch header")
+    info.rows = header.scalar(0, "<q")
+    compression = header.table(3)
+    if compression is not None:
+        info.compression = CODECS.get(compression.scalar(0, "<b"), "unknown")
+        summary.codecs[info.compression] = summary.codecs.get(info.compression, 0) + 1
+    nodes_start, node_count = header.vector(1, 16)
+    buffers_start, buffer_count = header.vector(2, 16)
+    variadic_start, variadic_count = header.vector(4, 8)
+    if layout:
+        info.buffers = []
+    if columns is None or len(columns) != node_count:
+        # Unknown schema or layout: sizes only
+        columns = [ColumnLayout(f"<node {i}>", pa.null(), ()) for i in range(node_count)]
+
+    buffer, variadic = 0, 0
+    for i, column in enumerate(columns):
+        length, nulls = struct.unpack_from("<qq", buf, nodes_start + 16 * i)
+        stats = summary.columns.get(column.path)
+        if stats is None:
+            stats = summary.columns[column.path] = ColumnStats(column.path, str(column.type))
+        stats.batches += 1
+        stats.rows += length
+        stats.nulls += nulls
+        roles = list(column.roles)
+        if column.variadic and variadic < variadic_count:
+            # A bogus count can't claim more buffers than the batch has
+            count = struct.unpack_from("<q", buf, variadic_start + 8 * variadic)[0]
+            roles += ["data"] * min(count, buffer_count)
+            variadic += 1
+        for role in roles:
+            if buffer >= buffer_count:
+                break
+            offset, size = struct.unpack_from("<qq", buf, buffers_start + 16 * buffer)
+            buffer += 1
+            stats.bytes[role] = stats.bytes.get(role, 0) + size
+            uncompressed = None
+            if info.compression is not None and size >= 8:
+                # Compressed buffers start with their uncompressed length (-1: stored as is)
+                uncompressed = struct.unpack_from("<q", buf, body_start + offset)[0]
+                if uncompressed < 0:
+                    uncompressed = size - 8
+                stats.compressed_bytes += size
+                stats.uncompressed_bytes += uncompressed
+            if layout:
+                info.buffers.append(BufferInfo(role, column.path, body_start + offset, size, uncompressed))
+    # Buffers the layout didn't account for (unknown types)
+    while buffer < buffer_count:
+        offset, size = struct.unpack_from("<qq", buf, buffers_start + 16 * buffer)
+        buffer += 1
+        stats = summary.columns.setdefault("<unassigned>", ColumnStats("<unassigned>", ""))
+        stats.bytes["other"] = stats.bytes.get("other", 0) + size
+        if layout:
+            info.buffers.append(BufferInfo("other", "<unassigned>", body_start + offset, size))
+
+
+# === Reports ===
+
+def _size(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def format_summary(summary: CaptureSummary) -> str:
+    counts = ", ".join(f"{count:,} {kind}" for kind, count in summary.counts.items())
+    lines = [
+        f"{summary.path}: {_size(summary.file_bytes)} in {summary.seconds * 1000:.1f}ms "
+        f"({summary.file_bytes / max(summary.seconds, 1e-9) / 1e9:.1f} GB/s)",
+        f"  messages:  {counts or 'none'}",
+        f"  streams:   {summary.streams:,} schema(s), {summary.rows:,} rows",
+        f"  metadata:  {_size(summary.metadata_bytes)}, bodies: {_size(summary.body_bytes)}",
+    ]
+    if summary.codecs:
+        lines.append("  compression: " + ", ".join(f"{codec} ({n:,} batches)" for codec, n in summary.codecs.items()))
+    if summary.trailing_bytes:
+        lines.append(f"  trailing:  {summary.trailing_bytes:,} bytes after the last message")
+    if summary.error:
+        lines.append(f"  ✗ stopped: {summary.error}")
+    return "\n".join(lines)
+
+
+def format_messages(summary: CaptureSummary) -> str:
+    lines = [f"{'#':>6} {'offset':>12} {'type':<17} {'metadata':>9} {'body':>12} {'rows':>10}  compression"]
+    for m in summary.messages:
+        kind = m.kind if m.dictionary_id is None else f"dict[{m.dictionary_id}]{'+delta' if m.is_delta else ''}"
+        lines.append(f"{m.index:>6} {m.offset:>12,} {kind:<17} {m.metadata_bytes:>9,} {m.body_bytes:>12,} "
+                     f"{m.rows:>10,}  {m.compression or '-'}")
+        for b in m.buffers or ():
+            ratio = f"  ({b.uncompressed:,} uncompressed)" if b.uncompressed is not None else ""
+            lines.append(f"{'':>20}{b.column:<28} {b.role:<9} @{b.offset:>12,} {b.length:>12,}{ratio}")
+    shown = len(summary.messages)
+    total = sum(n for kind, n in summary.counts.items() if kind != "eos")
+    if shown < total:
+        lines.append(f"... {total - shown:,} more messages")
+    return "\n".join(lines)
+
+
+def format_columns(summary: CaptureSummary) -> str:
+    lines = [f"{'column':<32} {'type':<22} {'rows':>12} {'nulls':>10} {'null%':>6} "
+             f"{'validity':>10} {'offsets':>10} {'data':>10} {'total':>10}  compression"]
+    for c in summary.columns.values():
+        other = c.total_bytes - sum(c.bytes.get(role, 0) for role in ("validity", "offsets"))
+        ratio = (f"{c.uncompressed_bytes / c.compressed_bytes:.2f}x" if c.compressed_bytes else "-")
+        lines.append(f"{c.path[:32]:<32} {c.type[:22]:<22} {c.rows:>12,} {c.nulls:>10,} "
+                     f"{(c.nulls / c.rows * 100 if c.rows else 0):>6.1f} "
+                     f"{_size(c.bytes.get('validity', 0)):>10} {_size(c.bytes.get('offsets', 0)):>10} "
+                     f"{_size(other):>10} {_size(c.total_bytes):>10}  {ratio}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect captured Arrow IPC data without decoding it")
+    parser.add_argument("paths", nargs="+", help="capture files (IPC stream(s) or IPC file)")
+    parser.add_argument("--messages", type=int, default=20, help="messages to list (-1 = all)")
+    parser.add_argument("--layout", action="store_true", help="list the buffers of listed messages")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        summary = inspect_capture(path, None if args.messages < 0 else args.messages, args.layout)
+        print(format_summary(summary))
+        if args.messages:
+            print()
+            print(format_messages(summary))
+        print()
+        print(format_columns(summary))
+        print()
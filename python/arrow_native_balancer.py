@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Client-Side Load Balancing Across cubesqld Endpoints
+
+An L4 balancer in front of several cubesqld replicas spreads connections,
+not queries, and cannot see how many queries each replica is working on.
+BalancedArrowNativeClient takes the list of replicas itself and routes
+every query:
+
+- Policies: "p2c" (power of two choices: sample two endpoints, take the
+  less loaded), "least_outstanding" (fewest in-flight queries), plus
+  "round_robin" and "random" as baselines. Load is in-flight queries
+  divided by the endpoint's slow-start weight.
+- Passive health checks: I/O and protocol failures of real queries count
+  against an endpoint; `failure_threshold` consecutive failures eject it.
+  Server-reported query errors (QueryError) mean the endpoint is alive.
+- Active health checks: a background thread probes every endpoint with
+  `health_check_sql` on a fresh connection every `health_check_interval`
+  seconds, so idle endpoints are checked too.
+- Ejection backs off exponentially (`ejection_time` doubling up to
+  `max_ejection_time`). A reintroduced endpoint ramps its weight from
+  `min_weight` to 1 over `slow_start` seconds instead of taking a full
+  share of traffic at once.
+- If every endpoint is ejected, queries go to all of them anyway (fail
+  open) rather than failing outright.
+- Each endpoint has its own ArrowNativePool; queries that fail with an
+  I/O error are retried on a different endpoint (`retries`).
+
+Usage:
+    with BalancedArrowNativeClient(["cube-1:4445", "cube-2:4445"], token="test") as client:
+        table = client.query(sql).to_table()
+        outcomes = client.query_many([sql1, sql2, sql3])
+        print(client.stats())
+
+Benchmark (local stand-in servers with latency skew and a failure):
+    python arrow_native_balancer.py --latencies 0.002,0.002,0.02 --fail-at 0.3
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from arrow_native_client import ArrowNativeClient, QueryError, QueryResult
+from arrow_native_pool import ArrowNativePool, BulkQueryMixin
+
+EndpointSpec = Union[str, Tuple[str, int]]
+
+POLICIES = ("p2c", "least_outstanding", "round_robin", "random")
+
+
+def parse_endpoint(spec: EndpointSpec, default_port: int = 4445) -> Tuple[str, int]:
+    """"host:port", "host" or (host, port) -> (host, port)"""
+    if isinstance(spec, tuple):
+        return spec[0], int(spec[1])
+    host, sep, port = spec.rpartition(":")
+    if not sep:
+        return spec, default_port
+    return host, int(port)
+
+
+@dataclass
+class EndpointStats:
+    """Snapshot of one endpoint's routing and health state"""
+    address: str
+    outstanding: int
+    requests: int
+    failures: int
+    ejections: int
+    ejected: bool
+    weight: float
+
+
+class Endpoint:
+    """One cubesqld replica: its connection pool and health state"""
+
+    def __init__(self, host: str, port: int, pool: ArrowNativePool):
+        self.host = host
+        self.port = port
+        self.pool = pool
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        # Ejections in a row without a healthy slow-start in between (backoff)
+        self.ejections = 0
+        self.total_ejections = 0
+        self.ejected_until = 0.0
+        self.reintroduced_at: Optional[float] = None
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+class BalancedArrowNativeClient(BulkQueryMixin):
+    """Routes queries over several Arrow Native endpoints (thread-safe)"""
+
+    def __init__(self, endpoints: Sequence[EndpointSpec], token: str = "test",
+                 database: Optional[str] = None, policy: str = "p2c",
+                 max_size_per_endpoint: int = 4, retries: int = 1,
+                 failure_threshold: int = 3, ejection_time: float = 5.0,
+                 max_ejection_time: float = 60.0, slow_start: float = 10.0,
+                 min_weight: float = 0.1,
+                 health_check_interval: Optional[float] = 5.0,
+                 health_check_sql: str = "SELECT 1",
+                 health_check_timeout: float = 2.0,
+                 seed: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 **client_kwargs):
+        """
+        Args:
+            endpoints: "host:port" strings or (host, port) tuples
+            policy: One of POLICIES
+            max_size_per_endpoint: Max pooled connections per endpoint
+            retries: Extra attempts on other endpoints after an I/O failure
+            failure_threshold: Consecutive failures that eject an endpoint
+            ejection_time: First ejection duration in seconds (doubles on
+                repeated ejections, up to max_ejection_time)
+            slow_start: Seconds over which a reintroduced endpoint ramps up
+            min_weight: Starting weight of a reintroduced endpoint
+            health_check_interval: Seconds between active probes (None
+                disables the background thread; see check_health())
+            health_check_sql: Probe query
+            health_check_timeout: Socket timeout for probes
+            **client_kwargs: Passed to every ArrowNativeClient
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy} (expected one of {', '.join(POLICIES)})")
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+        self.token = token
+        self.database = database
+        self.policy = policy
+        self.max_size_per_endpoint = max_size_per_endpoint
+        self.retries = retries
+        self.failure_threshold = failure_threshold
+        self.ejection_time = ejection_time
+        self.max_ejection_time = max_ejection_time
+        self.slow_start = slow_start
+        self.min_weight = min_weight
+        self.health_check_sql = health_check_sql
+        self.health_check_timeout = health_check_timeout
+        self.client_kwargs = client_kwargs
+        self._clock = clock
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next = 0
+        self.endpoints = [Endpoint(host, port, self._new_pool(host, port))
+                          for host, port in (parse_endpoint(e) for e in endpoints)]
+        self.max_size = max_size_per_endpoint * len(self.endpoints)
+
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+        if health_check_interval:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, args=(health_check_interval,),
+                daemon=True, name="arrow-native-health")
+            self._health_thread.start()
+
+    def _new_pool(self, host: str, port: int) -> ArrowNativePool:
+        return ArrowNativePool(host, port, self.token, self.database,
+                               max_size=self.max_size_per_endpoint, **self.client_kwargs)
+
+    # === Routing ===
+
+    def _weight(self, endpoint: Endpoint, now: float) -> float:
+        """Slow-start weight in [min_weight, 1]"""
+        if endpoint.reintroduced_at is None:
+            return 1.0
+        if self.slow_start <= 0 or now - endpoint.reintroduced_at >= self.slow_start:
+            endpoint.reintroduced_at = None
+            return 1.0
+        return max(self.min_weight, (now - endpoint.reintroduced_at) / self.slow_start)
+
+    def _available(self, now: float) -> List[Endpoint]:
+        available = []
+        for endpoint in self.endpoints:
+            if endpoint.ejected_until:
+                if endpoint.ejected_until > now:
+                    continue
+                # Ejection over: reintroduce with slow start
+                endpoint.ejected_until = 0.0
+                endpoint.reintroduced_at = now
+            available.append(endpoint)
+        # Fail open when everything is ejected
+        return available or list(self.endpoints)
+
+    def _pick(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        with self._lock:
+            now = self._clock()
+            available = self._available(now)
+            candidates = [e for e in available if e not in exclude] or available
+
+            if self.policy == "round_robin":
+                endpoint = candidates[self._next % len(candidates)]
+                self._next += 1
+            elif self.policy == "random" or len(candidates) == 1:
+                endpoint = self._rng.choice(candidates)
+            elif self.policy == "p2c":
+                a, b = self._rng.sample(candidates, 2)
+                endpoint = a if self._load(a, now) <= self._load(b, now) else b
+            else:
+                loads = [self._load(e, now) for e in candidates]
+                lowest = min(loads)
+                endpoint = self._rng.choice([e for e, load in zip(candidates, loads) if load == lowest])
+
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _load(self, endpoint: Endpoint, now: float) -> float:
+        return (endpoint.outstanding + 1) / self._weight(endpoint, now)
+
+    # === Health ===
+
+    def _record(self, endpoint: Endpoint, ok: bool):
+        """Account one success/failure (caller holds the lock)"""
+        if ok:
+            endpoint.consecutive_failures = 0
+            # The backoff resets only once slow start has completed: probes
+            # answered while ejected or ramping up don't prove it stable
+            if not endpoint.ejected_until and self._weight(endpoint, self._clock()) >= 1.0:
+                endpoint.ejections = 0
+            return
+
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.failure_threshold and not endpoint.ejected_until:
+            self._eject(endpoint)
+
+    def _eject(self, endpoint: Endpoint):
+        endpoint.ejections += 1
+        endpoint.total_ejections += 1
+        duration = min(self.ejection_time * 2 ** (endpoint.ejections - 1), self.max_ejection_time)
+        endpoint.ejected_until = self._clock() + duration
+        endpoint.consecutive_failures = 0
+        endpoint.reintroduced_at = None
+        # Drop pooled connections; busy ones close when checked in
+        old_pool, endpoint.pool = endpoint.pool, self._new_pool(endpoint.host, endpoint.port)
+        old_pool.close()
+
+    def _release(self, endpoint: Endpoint, ok: Optional[bool]):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok is not None:
+                self._record(endpoint, ok)
+
+    def _probe(self, endpoint: Endpoint) -> bool:
+        client = ArrowNativeClient(endpoint.host, endpoint.port, self.token, self.database,
+                                   timeout=self.health_check_timeout)
+        try:
+            client.connect()
+            client.query(self.health_check_sql)
+            return True
+        except QueryError:
+            # The endpoint answered - it is alive
+            return True
+        except Exception:
+            # I/O, protocol or decoding failure alike: a failed probe
+            return False
+        finally:
+            client.close()
+
+    def check_health(self) -> List[bool]:
+        """Probe every endpoint once (active health check); returns results"""
+        results = []
+        for endpoint in self.endpoints:
+            ok = self._probe(endpoint)
+            with self._lock:
+                self._record(endpoint, ok)
+            results.append(ok)
+        return results
+
+    def _health_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            self.check_health()
+
+    # === Queries ===
+
+    def query(self, sql: str) -> QueryResult:
+        """Execute SQL on the endpoint chosen by the policy
+
+        Retries on another endpoint after I/O/protocol failures (queries are
+        assumed to be read-only); QueryError is raised at once.
+        """
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self._pick(tried)
+            # None: failed for another reason (interrupted, undecodable data) -
+            # free the slot without judging the endpoint
+            ok = None
+            try:
+                with endpoint.pool.connection() as client:
+                    result = client.query(sql)
+                ok = True
+                return result
+            except QueryError:
+                ok = True
+                raise
+            except (OSError, RuntimeError):
+                ok = False
+                tried.append(endpoint)
+                if len(tried) > self.retries:
+                    raise
+            finally:
+                self._release(endpoint, ok)
+
+    def stats(self) -> List[EndpointStats]:
+        """Per-endpoint routing and health snapshot"""
+        with self._lock:
+            now = self._clock()
+            return [EndpointStats(address=e.address, outstanding=e.outstanding,
+                                  requests=e.requests, failures=e.failures,
+                                  ejections=e.total_ejections,
+                                  ejected=e.ejected_until > now,
+                                  weight=self._weight(e, now))
+                    for e in self.endpoints]
+
+    def close(self):
+        """Stop health checks and close every endpoint's pool"""
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        for endpoint in self.endpoints:
+            endpoint.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# === Skew / failure benchmark ===
+
+def _benchmark(policy: str, latencies: List[float], requests: int,
+               concurrency: int, fail_at: Optional[float]) -> dict:
+    import pyarrow as pa
+
+    from arrow_benchmark import percentile
+    from arrow_native_mock_server import MockArrowNativeServer
+
+    table = pa.table({"x": list(range(100))})
+    servers = [MockArrowNativeServer(lambda sql: table, latency=latency).start()
+               for latency in latencies]
+    client = BalancedArrowNativeClient([s.address for s in servers], policy=policy,
+                                       max_size_per_endpoint=concurrency, seed=1,
+                                       ejection_time=1.0, slow_start=1.0,
+                                       health_check_interval=0.5)
+    sqls = [f"SELECT {i}" for i in range(requests)]
+    failed = threading.Event()
+    done = 0
+    elapsed: List[float] = []
+    errors = 0
+    start = time.perf_counter()
+    try:
+        for outcome in client.as_completed(sqls, max_concurrency=concurrency):
+            done += 1
+            elapsed.append(outcome.elapsed_ms)
+            errors += 0 if outcome.ok else 1
+            if fail_at is not None and not failed.is_set() and done >= fail_at * requests:
+                servers[0].set_fail_mode("refuse")
+                failed.set()
+        seconds = time.perf_counter() - start
+        stats = client.stats()
+    finally:
+        client.close()
+        for server in servers:
+            server.stop()
+
+    elapsed.sort()
+    return {
+        "policy": policy,
+        "qps": requests / seconds,
+        "p50_ms": percentile(elapsed, 50),
+        "p99_ms": percentile(elapsed, 99),
+        "errors": errors,
+        "share": [s.requests / requests for s in stats],
+        "ejections": [s.ejections for s in stats],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load balancing benchmark on local stand-in servers")
+    parser.add_argument("--latencies", default="0.002,0.002,0.02",
+                        help="comma-separated per-endpoint query latency in seconds")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fail-at", type=float, default=0.3,
+                        help="fraction of requests after which endpoint 0 goes down (<0 disables)")
+    parser.add_argument("--policies", default=",".join(POLICIES))
+    args = parser.parse_args()
+
+    latencies = [float(x) for x in args.latencies.split(",")]
+    fail_at = args.fail_at if args.fail_at >= 0 else None
+    print(f"Endpoints latencies={latencies} requests={args.requests} "
+          f"concurrency={args.concurrency} fail_at={fail_at}")
+    for policy in args.policies.split(","):
+        r = _benchmark(policy, latencies, args.requests, args.concurrency, fail_at)
+        share = " ".join(f"{s:.0%}" for s in r["share"])
+        print(f"  {policy:18} {r['qps']:8.0f} q/s  p50={r['p50_ms']:7.2f}ms  p99={r['p99_ms']:7.2f}ms  "
+              f"errors={r['errors']:<4} share=[{share}] ejections={r['ejections']}")
@@ -17,36 +17,163 @@ Message Format:
 - All messages start with: u8 message_type
 - Strings encoded as: u32 length + utf-8 bytes
 - Arrow IPC data: raw bytes (schema or batch)
+
+Protocol Extensions (opt-in, negotiated in the handshake):
+- HandshakeRequest may append u32 capability flags (see Capability); the
+  server echoes the flags it accepts as a trailing u32 in HandshakeResponse.
+  Servers that don't know extensions send no trailing flags, and the client
+  then speaks plain protocol version 1.
+- Once any capability is negotiated, QueryRequest appends u32 query option
+  flags (see QueryOption).
+- DICTIONARY_ENCODING: with QueryOption.DICTIONARY_ENCODE the server sends
+  string dimensions dictionary-encoded as one continuous Arrow IPC stream:
+  the schema frame carries the schema message, batch frames carry the
+  following IPC messages (dictionary batches, delta dictionaries, record
+  batches). The client keeps dictionaries across batches.
+- SCHEMA_FINGERPRINT: the fingerprint of a schema is the first 8 bytes
+  (big-endian u64) of the SHA-256 of its IPC bytes. Instead of repeating a
+  QueryResponseSchema already sent on this connection, the server sends
+  QueryResponseSchemaRef (u8 type + u64 fingerprint). The client keeps
+  every schema it received on the connection, so references always resolve.
+- DELTA_RESULTS: with QueryOption.RESULT_VERSION the QueryRequest may
+  append the u64 version of the result the client holds. The server first
+  sends QueryResultVersion (u8 ResultKind + u64 new version + u32 count and
+  strings of key columns), then for UNCHANGED only QueryComplete, for FULL
+  the whole result, and for DELTA the upsert rows as schema + batches
+  followed by QueryResponseDeletes (u32 length + Arrow IPC stream of the
+  deleted rows' key columns). Keys are the GROUP BY columns; the client
+  merges the delta into the table it holds (arrow_delta.apply_delta).
+
+Schemas are cached per connection by fingerprint even without the
+extension, so repeated result shapes skip decoding the schema frame.
+
+Framing and message parsing live in arrow_native_codec (sans-IO), shared
+with the asyncio client and the stand-in server.
+
+Memory:
+- Message payloads are received (via the codec's FrameDecoder) straight
+  into buffers allocated from a dedicated Arrow memory pool
+  (system/jemalloc/mimalloc selectable) and decoded zero-copy, so the pool
+  accounts for all result memory.
+- `query_to_file` streams batches straight into Parquet/Arrow IPC files or
+  a partitioned dataset without materializing the result.
+- Optional per-query and per-client memory budgets: once a result crosses
+  its budget, the remaining batches spill to a temporary Arrow IPC file and
+  the result is served from a memory-mapped file instead of RAM.
 """
 
+import contextlib
+import inspect
+import io
+import os
+import shutil
 import socket
-import struct
-from typing import List, Optional, Tuple
+import tempfile
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 import pyarrow as pa
 import pyarrow.ipc as ipc
-import io
 
+from arrow_delta import apply_delta
+
+# Protocol constants and QueryError are re-exported for existing imports
+from arrow_native_codec import (
+    PROTOCOL_VERSION,
+    AuthResponse,
+    Batch,
+    Capability,
+    Deletes,
+    Event,
+    FrameDecoder,
+    HandshakeResponse,
+    MessageType,
+    QueryComplete,
+    QueryError,
+    QueryOption,
+    ResultKind,
+    ResultVersion,
+    Schema,
+    SchemaRef,
+    auth_request,
+    frame,
+    handshake_request,
+    query_request,
+    schema_fingerprint,
+    unexpected,
+)
+
+
+# Dedicated proxy pools, one per allocator backend. They live for the whole
+# process: Arrow buffers must never outlive the pool they were allocated from.
+_MEMORY_POOLS: Dict[str, pa.MemoryPool] = {}
+
+MEMORY_POOL_BACKENDS = {
+    "default": pa.default_memory_pool,
+    "system": pa.system_memory_pool,
+    "jemalloc": pa.jemalloc_memory_pool,
+    "mimalloc": pa.mimalloc_memory_pool,
+}
+
+
+def get_memory_pool(backend: str = "default") -> pa.MemoryPool:
+    """Return the dedicated Arrow Native memory pool for an allocator backend
+
+    The pool is a proxy over the backend, so `bytes_allocated()` and
+    `max_memory()` only account for Arrow Native result memory.
+    """
+    pool = _MEMORY_POOLS.get(backend)
+    if pool is None:
+        if backend not in MEMORY_POOL_BACKENDS:
+            raise ValueError(f"Unknown memory pool backend: {backend} "
+                             f"(expected one of {', '.join(MEMORY_POOL_BACKENDS)})")
+        try:
+            parent = MEMORY_POOL_BACKENDS[backend]()
+        except NotImplementedError:
+            raise ValueError(f"Memory pool backend {backend} is not available in this pyarrow build")
+        pool = _MEMORY_POOLS[backend] = pa.proxy_memory_pool(parent)
+    return pool
 
-class MessageType:
-    """Message type constants matching Rust protocol.rs"""
-    HANDSHAKE_REQUEST = 0x01
-    HANDSHAKE_RESPONSE = 0x02
-    AUTH_REQUEST = 0x03
-    AUTH_RESPONSE = 0x04
-    QUERY_REQUEST = 0x10
-    QUERY_RESPONSE_SCHEMA = 0x11
-    QUERY_RESPONSE_BATCH = 0x12
-    QUERY_COMPLETE = 0x13
-    ERROR = 0xFF
+
+@dataclass
+class ExportStats:
+    """Outcome of a streaming export (query_to_file)"""
+    path: str
+    format: str
+    rows: int = 0
+    batches: int = 0
+    wire_bytes: int = 0
+    file_bytes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        """Wire (Arrow IPC) bytes received per second"""
+        return self.wire_bytes / self.seconds if self.seconds > 0 else 0.0
 
 
 @dataclass
 class QueryResult:
-    """Result from Arrow Native query execution"""
+    """Result from Arrow Native query execution
+
+    When the result was spilled, `batches` are views over a memory-mapped
+    Arrow IPC file (`spill_path`) rather than RAM.
+    """
     schema: pa.Schema
     batches: List[pa.RecordBatch]
     rows_affected: int
+    memory_bytes: int = 0
+    spill_path: Optional[str] = None
+
+    @property
+    def spilled(self) -> bool:
+        return self.spill_path is not None
 
     def to_table(self) -> pa.Table:
         """Convert batches to PyArrow Table"""
@@ -54,30 +181,122 @@ class QueryResult:
             return pa.Table.from_pydict({}, schema=self.schema)
         return pa.Table.from_batches(self.batches, schema=self.schema)
 
-    def to_pandas(self):
-        """Convert to pandas DataFrame"""
-        return self.to_table().to_pandas()
+    def to_pandas(self, **kwargs):
+        """Convert to pandas DataFrame
+
+        Dictionary-encoded columns become pandas Categoricals.
+        """
+        return self.to_table().to_pandas(**kwargs)
+
+
+@dataclass
+class VersionedResult:
+    """A result together with the server's version of it (DELTA_RESULTS)
+
+    Pass it back to `query_versioned` to refresh: the server then sends only
+    what changed. `version` is None when the server doesn't support deltas.
+    """
+    table: pa.Table
+    version: Optional[int]
+    kind: int = ResultKind.FULL  # how this refresh arrived
+    upserts: int = 0
+    deletes: int = 0
+    wire_bytes: int = 0
 
 
 class ArrowNativeClient:
     """Client for CubeSQL Arrow Native protocol (port 4445)"""
 
-    PROTOCOL_VERSION = 1
+    PROTOCOL_VERSION = PROTOCOL_VERSION
+    # Schemas kept per connection when the server doesn't reference them
+    SCHEMA_CACHE_SIZE = 256
 
     def __init__(self, host: str = "localhost", port: int = 4445,
-                 token: str = "test", database: Optional[str] = None):
+                 token: str = "test", database: Optional[str] = None,
+                 memory_pool: str = "default",
+                 query_memory_budget: Optional[int] = None,
+                 client_memory_budget: Optional[int] = None,
+                 spill_dir: Optional[str] = None,
+                 dictionary_encoding: bool = False,
+                 schema_fingerprints: bool = False,
+                 delta_results: bool = False,
+                 timeout: Optional[float] = None,
+                 metrics=None,
+                 workload_log=None):
+        """
+        Args:
+            memory_pool: Allocator backend for result memory
+                ("default", "system", "jemalloc" or "mimalloc")
+            query_memory_budget: Max bytes one result may hold in RAM
+                before spilling to disk (None = unlimited)
+            client_memory_budget: Max bytes all live in-memory results of
+                this client may hold before new results spill
+            spill_dir: Directory for spill files (default: system temp dir)
+            dictionary_encoding: Ask the server to send string dimensions
+                dictionary-encoded (DICTIONARY_ENCODING extension); the
+                default for `query(..., dictionary=None)`
+            schema_fingerprints: Let the server send only a fingerprint for
+                schemas already sent on this connection (SCHEMA_FINGERPRINT
+                extension)
+            delta_results: Let `query_versioned` receive unchanged/delta
+                answers for results the client holds (DELTA_RESULTS
+                extension)
+            timeout: Socket timeout in seconds for connecting and each
+                read/write (None = block indefinitely)
+            metrics: cube_metrics.Metrics receiving per-query latency and
+                counters (None = no instrumentation)
+            workload_log: workload_log.WorkloadLog receiving one record per
+                query (fingerprint, timings, bytes, rows, batches)
+        """
         self.host = host
         self.port = port
         self.token = token
         self.database = database
+        self.timeout = timeout
+        self.metrics = metrics
+        self.workload_log = workload_log
+        self.bytes_sent = 0
+        self.bytes_received = 0
         self.socket: Optional[socket.socket] = None
         self.session_id: Optional[str] = None
+        self.memory_pool = get_memory_pool(memory_pool)
+        self.query_memory_budget = query_memory_budget
+        self.client_memory_budget = client_memory_budget
+        self.spill_dir = spill_dir
+        self.dictionary_encoding = dictionary_encoding
+        self.requested_capabilities = 0
+        if dictionary_encoding:
+            self.requested_capabilities |= Capability.DICTIONARY_ENCODING
+        if schema_fingerprints:
+            self.requested_capabilities |= Capability.SCHEMA_FINGERPRINT
+        if delta_results:
+            self.requested_capabilities |= Capability.DELTA_RESULTS
+        # Capabilities accepted by the server (set by the handshake)
+        self.capabilities = 0
+        # Per-connection schema cache: fingerprint -> entry (LRU order)
+        self._schema_cache: "OrderedDict[int, _SchemaEntry]" = OrderedDict()
+        self.schema_cache_hits = 0
+        self.schema_cache_misses = 0
+        self._live_results: "weakref.WeakValueDictionary[int, QueryResult]" = weakref.WeakValueDictionary()
+        # Sans-IO frame decoder; payloads land in pool buffers
+        self._decoder = FrameDecoder(self.memory_pool)
+        self._events: "deque[Event]" = deque()
+
+    def memory_in_use(self) -> int:
+        """Bytes held in RAM by this client's live (non-spilled) results"""
+        return sum(r.memory_bytes for r in list(self._live_results.values()))
 
     def connect(self):
         """Connect and authenticate to Arrow Native server"""
         # Create socket connection
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.settimeout(self.timeout)
         self.socket.connect((self.host, self.port))
+        self._schema_cache.clear()
+        self._decoder.reset()
+        self._events.clear()
+        if self.metrics is not None:
+            self.metrics.inc("connections_opened")
 
         # Handshake
         self._send_handshake()
@@ -89,6 +308,19 @@ class ArrowNativeClient:
 
         return self
 
+    def cancel(self):
+        """Abort an in-flight query from another thread
+
+        The protocol has no cancel message, so the socket is shut down: the
+        blocked query raises and the connection must be discarded.
+        """
+        sock = self.socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
     def close(self):
         """Close connection"""
         if self.socket:
@@ -101,216 +333,602 @@ class ArrowNativeClient:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
-    def query(self, sql: str) -> QueryResult:
-        """Execute SQL query and return Arrow result"""
+    def query(self, sql: str, dictionary: Optional[bool] = None) -> QueryResult:
+        """Execute SQL query and return Arrow result
+
+        Args:
+            dictionary: Request dictionary-encoded string columns (defaults to
+                the client's `dictionary_encoding`; ignored unless negotiated)
+        """
+        return self._query(sql, dictionary)
+
+    def _query(self, sql: str, dictionary: Optional[bool] = None,
+               on_schema: Optional[Callable[[], None]] = None) -> QueryResult:
+        """query() with a hook called once the schema frame arrived"""
+        if self.metrics is None and self.workload_log is None:
+            schema, stream = self._execute(sql, dictionary)
+            if on_schema is not None:
+                on_schema()
+            return self._collect(schema, stream)
+
+        bytes_in, bytes_out = self.bytes_received, self.bytes_sent
+        result = None
+        started = time.perf_counter()
+        with self.metrics.span(sql) if self.metrics is not None else contextlib.nullcontext():
+            try:
+                schema, stream = self._execute(sql, dictionary)
+                if on_schema is not None:
+                    on_schema()
+                result = self._collect(schema, stream)
+                return result
+            finally:
+                self._record_query(sql, time.perf_counter() - started,
+                                   bytes_in=self.bytes_received - bytes_in,
+                                   bytes_out=self.bytes_sent - bytes_out,
+                                   rows=sum(b.num_rows for b in result.batches) if result is not None else 0,
+                                   batches=len(result.batches) if result is not None else 0,
+                                   error=result is None)
+
+    def _record_query(self, sql: str, seconds: float, bytes_in: int = 0, bytes_out: int = 0,
+                      rows: int = 0, batches: int = 0, error: bool = False):
+        """Report one query to the metrics registry and the workload log"""
+        if self.metrics is not None:
+            self.metrics.record_query(sql, seconds, bytes_in=bytes_in, bytes_out=bytes_out,
+                                      batches=batches, error=error)
+        if self.workload_log is not None:
+            self.workload_log.record_query(sql, seconds, bytes_in=bytes_in, bytes_out=bytes_out,
+                                           rows=rows, batches=batches, error=error)
+
+    def _collect(self, schema: pa.Schema, stream: Iterator[Tuple[pa.RecordBatch, int]]) -> QueryResult:
+        """Receive batches into a QueryResult, spilling to disk once over budget"""
+        batches = []
+        memory_bytes = 0
+        spill = None
+        client_in_use = self.memory_in_use() if self.client_memory_budget is not None else 0
+        try:
+            while True:
+                try:
+                    batch, size = next(stream)
+                except StopIteration as done:
+                    rows_affected = done.value
+                    break
+                if spill is not None:
+                    spill.write(batch)
+                    continue
+                batches.append(batch)
+                memory_bytes += size
+                if self._over_budget(memory_bytes, client_in_use):
+                    spill = _SpillFile(schema, self.spill_dir)
+                    for b in batches:
+                        spill.write(b)
+                    batches = []
+                    memory_bytes = 0
+        except BaseException:
+            if spill is not None:
+                spill.discard()
+            raise
+
+        if spill is not None:
+            batches, unlinked = spill.finish()
+            result = QueryResult(schema=schema, batches=batches,
+                                 rows_affected=rows_affected, spill_path=spill.path)
+            if not unlinked:
+                weakref.finalize(result, _remove_quietly, spill.path)
+            return result
+
+        result = QueryResult(schema=schema, batches=batches, rows_affected=rows_affected,
+                             memory_bytes=memory_bytes)
+        self._live_results[id(result)] = result
+        return result
+
+    def query_reader(self, sql: str, dictionary: Optional[bool] = None) -> pa.RecordBatchReader:
+        """Execute SQL query and return a reader that yields batches as they arrive
+
+        The reader must be fully consumed before the next query on this
+        connection.
+        """
+        schema, stream = self._execute(sql, dictionary)
+        return pa.RecordBatchReader.from_batches(schema, (batch for batch, _ in stream))
+
+    def query_versioned(self, sql: str, held: Optional[VersionedResult] = None) -> VersionedResult:
+        """Execute SQL, or refresh a result held from an earlier call
+
+        With DELTA_RESULTS negotiated and `held` given, the server answers
+        "unchanged" (held table returned as is), with a row-level delta that
+        is merged into the held table, or with the full result. Results are
+        never dictionary-encoded, so deltas merge without unifying
+        dictionaries.
+        """
+        if not self.capabilities & Capability.DELTA_RESULTS:
+            bytes_in = self.bytes_received
+            table = self.query(sql, dictionary=False).to_table()
+            return VersionedResult(table, None, wire_bytes=self.bytes_received - bytes_in)
+        if not self.socket:
+            raise RuntimeError("Not connected - call connect() first")
+
+        started = time.perf_counter()
+        bytes_in, bytes_out = self.bytes_received, self.bytes_sent
+        base_version = held.version if held is not None else None
+        self._send_message(query_request(sql, QueryOption.RESULT_VERSION, base_version))
+        event = self._receive_event()
+        if type(event) is not ResultVersion:
+            raise unexpected(event, "QueryResultVersion")
+
+        if event.kind == ResultKind.UNCHANGED:
+            done = self._receive_event()
+            if type(done) is not QueryComplete:
+                raise unexpected(done, "QueryComplete")
+            if held is None:
+                raise RuntimeError("Server reported an unchanged result the client doesn't hold")
+            result = VersionedResult(held.table, event.version, ResultKind.UNCHANGED)
+        else:
+            entry = self._receive_schema_entry()
+            batches, deletes = [], None
+            while True:
+                frame_event = self._receive_event()
+                kind = type(frame_event)
+                if kind is Batch:
+                    batches.append(ipc.open_stream(frame_event.ipc, memory_pool=self.memory_pool)
+                                   .read_next_batch())
+                elif kind is Deletes:
+                    deletes = ipc.open_stream(frame_event.ipc, memory_pool=self.memory_pool).read_all()
+                elif kind is QueryComplete:
+                    break
+                else:
+                    raise unexpected(frame_event, "QueryResponseBatch")
+            table = pa.Table.from_batches(batches, schema=entry.schema)
+            if event.kind == ResultKind.DELTA:
+                if held is None or deletes is None:
+                    raise RuntimeError("Incomplete delta response")
+                merged = apply_delta(held.table, table, deletes, list(event.keys))
+                result = VersionedResult(merged, event.version, ResultKind.DELTA,
+                                         upserts=table.num_rows, deletes=deletes.num_rows)
+            else:
+                result = VersionedResult(table, event.version, ResultKind.FULL)
+        result.wire_bytes = self.bytes_received - bytes_in
+        self._record_query(sql, time.perf_counter() - started, bytes_in=result.wire_bytes,
+                           bytes_out=self.bytes_sent - bytes_out, rows=result.table.num_rows)
+        return result
+
+    def query_to_file(self, sql: str, path: str, format: str = "parquet",
+                      partition_by: Optional[List[str]] = None,
+                      row_group_size: Optional[int] = None,
+                      compression: Optional[str] = None) -> ExportStats:
+        """Stream a query result straight into a Parquet or Arrow IPC file
+
+        Each QueryResponseBatch is written as it arrives, so peak memory stays
+        at about one batch (or one row group, if `row_group_size` asks for
+        row groups larger than the server's batches). If writing fails, the
+        partial output is removed and the rest of the result is read off the
+        connection (or the connection closed, if the stream itself broke).
+
+        Args:
+            sql: Query to execute
+            path: Output file, or output directory when `partition_by` is set
+            format: "parquet" or "arrow" (Arrow IPC file format)
+            partition_by: Columns for a hive-partitioned dataset
+                (`path/col=value/part-0.parquet`)
+            row_group_size: Max rows per Parquet row group / IPC batch
+            compression: Parquet codec (default "snappy") or IPC codec
+                ("lz4", "zstd"; default uncompressed)
+        """
+        if format not in ("parquet", "arrow"):
+            raise ValueError(f"Unsupported format: {format} (expected 'parquet' or 'arrow')")
+
+        started = time.perf_counter()
+        # A partitioned export may add to an existing directory: remember its files
+        existing = _list_files(path) if partition_by and os.path.isdir(path) else None
+        # The IPC file format allows one dictionary per field, but the server
+        # may replace dictionaries between batches - only Parquet gets them
+        schema, stream = self._execute(sql, None if format == "parquet" else False)
+        stats = ExportStats(path=path, format=format)
+        received = False
+
+        def counted() -> Iterator[pa.RecordBatch]:
+            nonlocal received
+            for batch, size in stream:
+                stats.batches += 1
+                stats.rows += batch.num_rows
+                stats.wire_bytes += size
+                yield batch
+            received = True
+
+        try:
+            if partition_by:
+                _write_dataset(schema, counted(), path, format, partition_by, row_group_size, compression)
+            elif format == "parquet":
+                _write_parquet(schema, counted(), path, row_group_size, compression)
+            else:
+                _write_ipc(schema, counted(), path, row_group_size, compression)
+        except BaseException as error:
+            _remove_partial_output(path, existing)
+            if not received and not isinstance(error, QueryError):
+                self._abandon(stream, drain=isinstance(error, Exception))
+            raise
+
+        stats.seconds = time.perf_counter() - started
+        stats.file_bytes = _disk_usage(path)
+        self._record_query(sql, stats.seconds, bytes_in=stats.wire_bytes,
+                           rows=stats.rows, batches=stats.batches)
+        return stats
+
+    def _abandon(self, stream: Iterator[Tuple[pa.RecordBatch, int]], drain: bool):
+        """Resync the connection after its consumer gave up on a result
+
+        Reads the rest of the result when the stream itself is intact (the
+        consumer failed); otherwise the protocol position is unknown and
+        the connection is closed.
+        """
+        if drain and inspect.getgeneratorstate(stream) != inspect.GEN_CLOSED:
+            try:
+                for _ in stream:
+                    pass
+                return
+            except Exception:
+                pass
+        self.close()
+
+    def _execute(self, sql: str, dictionary: Optional[bool] = None
+                 ) -> Tuple[pa.Schema, Iterator[Tuple[pa.RecordBatch, int]]]:
+        """Send a query and receive its schema
+
+        Returns the schema and a generator of (batch, payload bytes) that
+        returns rows_affected once QueryComplete arrives.
+        """
         if not self.socket:
             raise RuntimeError("Not connected - call connect() first")
 
+        if dictionary is None:
+            dictionary = self.dictionary_encoding
+        options = 0
+        if dictionary and self.capabilities & Capability.DICTIONARY_ENCODING:
+            options |= QueryOption.DICTIONARY_ENCODE
+
         # Send query request
-        self._send_query(sql)
+        self._send_query(sql, options)
 
         # Receive schema
-        schema = self._receive_schema()
+        entry = self._receive_schema_entry()
+        if options & QueryOption.DICTIONARY_ENCODE:
+            # The stream reader re-reads the (cached) schema message
+            source = _IpcFrameStream(self, entry.ipc_bytes)
+            reader = ipc.open_stream(source, memory_pool=self.memory_pool)
+            return reader.schema, self._iter_stream_batches(reader, source)
 
-        # Receive batches
-        batches = []
+        return entry.schema, self._iter_batches(entry.schema)
+
+    def _iter_batches(self, schema: pa.Schema) -> Iterator[Tuple[pa.RecordBatch, int]]:
+        """Receive batches until QueryComplete"""
         while True:
-            payload = self._receive_message()
-            msg_type = payload[0]
+            event = self._receive_event()
+            kind = type(event)
+            if kind is Batch:
+                # Decode Arrow IPC batch zero-copy: columns reference the pool buffer
+                reader = ipc.open_stream(event.ipc, memory_pool=self.memory_pool)
+                yield reader.read_next_batch(), event.size
+            elif kind is QueryComplete:
+                return event.rows_affected
+            else:
+                raise unexpected(event, "QueryResponseBatch")
 
-            if msg_type == MessageType.QUERY_RESPONSE_BATCH:
-                batch = self._receive_batch(schema, payload)
-                batches.append(batch)
-            elif msg_type == MessageType.QUERY_COMPLETE:
-                rows_affected = struct.unpack('>q', payload[1:9])[0]
+    def _iter_stream_batches(self, reader: ipc.RecordBatchStreamReader,
+                             source: "_IpcFrameStream") -> Iterator[Tuple[pa.RecordBatch, int]]:
+        """Decode one continuous IPC stream spread over batch frames
+
+        The stream reader keeps dictionaries (and applies delta dictionaries)
+        across batches.
+        """
+        while True:
+            consumed = source.bytes_read
+            try:
+                batch = reader.read_next_batch()
+            except StopIteration:
                 break
-            elif msg_type == MessageType.ERROR:
-                # Parse error
-                code_len = struct.unpack('>I', payload[1:5])[0]
-                code = payload[5:5+code_len].decode('utf-8')
-                msg_len = struct.unpack('>I', payload[5+code_len:9+code_len])[0]
-                message = payload[9+code_len:9+code_len+msg_len].decode('utf-8')
-                raise RuntimeError(f"Query error [{code}]: {message}")
-            else:
-                raise RuntimeError(f"Unexpected message type: 0x{msg_type:02x}")
+            yield batch, source.bytes_read - consumed
+        # The IPC end-of-stream marker may precede QueryComplete
+        return source.drain()
 
-        return QueryResult(schema=schema, batches=batches, rows_affected=rows_affected)
+    def _over_budget(self, query_bytes: int, client_bytes: int) -> bool:
+        if self.query_memory_budget is not None and query_bytes > self.query_memory_budget:
+            return True
+        if self.client_memory_budget is not None and client_bytes + query_bytes > self.client_memory_budget:
+            return True
+        return False
 
     # === Handshake ===
 
     def _send_handshake(self):
-        """Send HandshakeRequest"""
-        payload = bytearray()
-        payload.append(MessageType.HANDSHAKE_REQUEST)
-        payload.extend(struct.pack('>I', self.PROTOCOL_VERSION))
-        self._send_message(payload)
+        """Send HandshakeRequest (with capability flags if any are requested)"""
+        self._send_message(handshake_request(self.PROTOCOL_VERSION, self.requested_capabilities))
 
     def _receive_handshake(self) -> str:
         """Receive HandshakeResponse"""
-        payload = self._receive_message()
-        if payload[0] != MessageType.HANDSHAKE_RESPONSE:
-            raise RuntimeError(f"Expected HandshakeResponse, got 0x{payload[0]:02x}")
-
-        # Parse payload
-        version = struct.unpack('>I', payload[1:5])[0]
-        if version != self.PROTOCOL_VERSION:
-            raise RuntimeError(f"Protocol version mismatch: client={self.PROTOCOL_VERSION}, server={version}")
-
-        # Read server version string
-        str_len = struct.unpack('>I', payload[5:9])[0]
-        server_version = payload[9:9+str_len].decode('utf-8')
-        return server_version
-
-    def _receive_message(self) -> bytes:
-        """Receive a length-prefixed message"""
-        # Read length prefix
-        length = self._read_u32()
-        if length == 0 or length > 100 * 1024 * 1024:  # 100MB max
-            raise RuntimeError(f"Invalid message length: {length}")
-        # Read payload
-        return self._read_exact(length)
+        event = self._receive_event()
+        if type(event) is not HandshakeResponse:
+            raise unexpected(event, "HandshakeResponse")
+        if event.version != self.PROTOCOL_VERSION:
+            raise RuntimeError(f"Protocol version mismatch: client={self.PROTOCOL_VERSION}, server={event.version}")
+
+        # Accepted capability flags (absent for servers without extensions)
+        if self.requested_capabilities and event.capabilities is not None:
+            self.capabilities = event.capabilities & self.requested_capabilities
+        else:
+            self.capabilities = 0
+        return event.server_version
 
     # === Authentication ===
 
     def _send_auth(self):
         """Send AuthRequest"""
-        payload = bytearray()
-        payload.append(MessageType.AUTH_REQUEST)
-        payload.extend(self._encode_string(self.token))
-        payload.extend(self._encode_optional_string(self.database))
-        self._send_message(payload)
+        self._send_message(auth_request(self.token, self.database))
 
     def _receive_auth(self) -> str:
         """Receive AuthResponse"""
-        payload = self._receive_message()
-        if payload[0] != MessageType.AUTH_RESPONSE:
-            raise RuntimeError(f"Expected AuthResponse, got 0x{payload[0]:02x}")
-
-        success = payload[1] != 0
-        # Read session_id string
-        str_len = struct.unpack('>I', payload[2:6])[0]
-        session_id = payload[6:6+str_len].decode('utf-8')
-
-        if not success:
-            raise RuntimeError(f"Authentication failed: {session_id}")
-
-        return session_id
+        event = self._receive_event()
+        if type(event) is not AuthResponse:
+            raise unexpected(event, "AuthResponse")
+        if not event.success:
+            raise RuntimeError(f"Authentication failed: {event.session_id}")
+        return event.session_id
 
     # === Query ===
 
-    def _send_query(self, sql: str):
-        """Send QueryRequest"""
-        payload = bytearray()
-        payload.append(MessageType.QUERY_REQUEST)
-        payload.extend(self._encode_string(sql))
-        self._send_message(payload)
-
-    def _send_message(self, payload: bytes):
-        """Send a length-prefixed message"""
-        # Prepend u32 length
-        length = struct.pack('>I', len(payload))
-        self.socket.sendall(length + payload)
+    def _send_query(self, sql: str, options: int = 0):
+        """Send QueryRequest (option flags only when extensions are negotiated)"""
+        self._send_message(query_request(sql, options if self.capabilities else None))
 
     def _receive_schema(self) -> pa.Schema:
         """Receive QueryResponseSchema"""
-        payload = self._receive_message()
-
-        if payload[0] == MessageType.ERROR:
-            # Parse error message
-            code_len = struct.unpack('>I', payload[1:5])[0]
-            code = payload[5:5+code_len].decode('utf-8')
-            msg_len = struct.unpack('>I', payload[5+code_len:9+code_len])[0]
-            message = payload[9+code_len:9+code_len+msg_len].decode('utf-8')
-            raise RuntimeError(f"Query error [{code}]: {message}")
-
-        if payload[0] != MessageType.QUERY_RESPONSE_SCHEMA:
-            raise RuntimeError(f"Expected QueryResponseSchema, got 0x{payload[0]:02x}")
-
-        # Extract Arrow IPC schema bytes (after message type and length prefix)
-        schema_len = struct.unpack('>I', payload[1:5])[0]
-        schema_bytes = payload[5:5+schema_len]
+        return self._receive_schema_entry().schema
+
+    def _receive_schema_entry(self) -> "_SchemaEntry":
+        """Receive QueryResponseSchema (or a reference) via the schema cache"""
+        event = self._receive_event()
+
+        if type(event) is SchemaRef:
+            entry = self._schema_cache.get(event.fingerprint)
+            if entry is None:
+                raise RuntimeError(f"Server referenced unknown schema 0x{event.fingerprint:016x}")
+            self._schema_cache.move_to_end(event.fingerprint)
+            self.schema_cache_hits += 1
+            return entry
+
+        if type(event) is not Schema:
+            raise unexpected(event, "QueryResponseSchema")
+
+        schema_bytes = event.ipc
+        fingerprint = schema_fingerprint(schema_bytes)
+        entry = self._schema_cache.get(fingerprint)
+        if entry is not None:
+            self._schema_cache.move_to_end(fingerprint)
+            self.schema_cache_hits += 1
+            return entry
 
         # Decode Arrow IPC schema
-        reader = ipc.open_stream(io.BytesIO(schema_bytes))
-        return reader.schema
-
-    def _receive_batch(self, schema: pa.Schema, payload: bytes) -> pa.RecordBatch:
-        """Receive QueryResponseBatch (payload already read)"""
-        # Extract Arrow IPC batch bytes (after message type and length prefix)
-        batch_len = struct.unpack('>I', payload[1:5])[0]
-        batch_bytes = payload[5:5+batch_len]
-
-        # Decode Arrow IPC batch
-        reader = ipc.open_stream(io.BytesIO(batch_bytes))
-        batch = reader.read_next_batch()
-        return batch
+        self.schema_cache_misses += 1
+        reader = ipc.open_stream(schema_bytes, memory_pool=self.memory_pool)
+        entry = _SchemaEntry(reader.schema, schema_bytes.to_pybytes())
+        self._schema_cache[fingerprint] = entry
+        # Schemas the server may reference must never be evicted
+        if (not self.capabilities & Capability.SCHEMA_FINGERPRINT
+                and len(self._schema_cache) > self.SCHEMA_CACHE_SIZE):
+            self._schema_cache.popitem(last=False)
+        return entry
 
     # === Low-level I/O ===
 
-    def _read_u8(self) -> int:
-        """Read unsigned 8-bit integer"""
-        data = self.socket.recv(1)
-        if len(data) != 1:
-            raise RuntimeError("Connection closed")
-        return data[0]
-
-    def _read_bool(self) -> bool:
-        """Read boolean (u8)"""
-        return self._read_u8() != 0
-
-    def _read_exact(self, n: int) -> bytes:
-        """Read exactly n bytes from socket (handles partial reads)"""
-        data = bytearray()
-        while len(data) < n:
-            chunk = self.socket.recv(n - len(data))
-            if not chunk:
+    def _send_message(self, payload: bytes):
+        """Send a length-prefixed message"""
+        self.socket.sendall(frame(payload))
+        self.bytes_sent += 4 + len(payload)
+
+    def _receive_event(self) -> Event:
+        """Next decoded message, receiving straight into the decoder's buffers"""
+        events = self._events
+        while not events:
+            n = self.socket.recv_into(self._decoder.get_buffer())
+            if n == 0:
                 raise RuntimeError("Connection closed")
-            data.extend(chunk)
-        return bytes(data)
-
-    def _read_u32(self) -> int:
-        """Read unsigned 32-bit integer (big-endian)"""
-        data = self._read_exact(4)
-        return struct.unpack('>I', data)[0]
-
-    def _read_i64(self) -> int:
-        """Read signed 64-bit integer (big-endian)"""
-        data = self._read_exact(8)
-        return struct.unpack('>q', data)[0]
-
-    def _read_string(self) -> str:
-        """Read length-prefixed UTF-8 string"""
-        length = self._read_u32()
-        if length == 0:
-            return ""
-        data = self._read_exact(length)
-        return data.decode('utf-8')
-
-    def _read_bytes(self) -> bytes:
-        """Read length-prefixed byte array"""
-        length = self._read_u32()
-        if length == 0:
-            return b""
-        data = self._read_exact(length)
-        return data
-
-    def _encode_string(self, s: str) -> bytes:
-        """Encode string as length-prefixed UTF-8"""
-        utf8_bytes = s.encode('utf-8')
-        return struct.pack('>I', len(utf8_bytes)) + utf8_bytes
-
-    def _encode_optional_string(self, s: Optional[str]) -> bytes:
-        """Encode optional string (bool present + string if present)"""
-        if s is None:
-            return struct.pack('B', 0)  # false
-        else:
-            return struct.pack('B', 1) + self._encode_string(s)  # true + string
+            self.bytes_received += n
+            events.extend(self._decoder.buffer_updated(n))
+        return events.popleft()
+
+
+class _SchemaEntry:
+    """A decoded schema and the IPC bytes it was decoded from"""
+    __slots__ = ("schema", "ipc_bytes")
+
+    def __init__(self, schema: pa.Schema, ipc_bytes: bytes):
+        self.schema = schema
+        self.ipc_bytes = ipc_bytes
+
+
+class _IpcFrameStream(io.RawIOBase):
+    """File-like view of one Arrow IPC stream carried across batch frames
+
+    Starts with the schema frame's bytes and pulls QueryResponseBatch frames
+    from the connection on demand; reports EOF at QueryComplete.
+    """
+
+    def __init__(self, client: ArrowNativeClient, schema_bytes):
+        self._client = client
+        self._pending = memoryview(schema_bytes)
+        self.bytes_read = 0
+        self.rows_affected: Optional[int] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._pending:
+            if not self._next_frame():
+                return 0
+        n = min(len(b), len(self._pending))
+        b[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def _next_frame(self) -> bool:
+        """Load the next batch frame; False once QueryComplete arrived"""
+        if self.rows_affected is not None:
+            return False
+        event = self._client._receive_event()
+        if type(event) is Batch:
+            self._pending = memoryview(event.ipc)
+            self.bytes_read += event.size
+            return True
+        if type(event) is QueryComplete:
+            self.rows_affected = event.rows_affected
+            return False
+        raise unexpected(event, "QueryResponseBatch")
+
+    def drain(self) -> int:
+        """Consume frames up to QueryComplete and return rows_affected"""
+        while self._next_frame():
+            pass
+        return self.rows_affected
+
+
+# === Streaming export writers ===
+
+def _rechunk(batches: Iterator[pa.RecordBatch], rows: Optional[int]) -> Iterator[pa.Table]:
+    """Group batches into tables of about `rows` rows (one table per batch if None)"""
+    pending: List[pa.RecordBatch] = []
+    pending_rows = 0
+    for batch in batches:
+        if rows is None:
+            yield pa.Table.from_batches([batch])
+            continue
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        if pending_rows >= rows:
+            yield pa.Table.from_batches(pending)
+            pending, pending_rows = [], 0
+    if pending:
+        yield pa.Table.from_batches(pending)
+
+
+def _write_parquet(schema: pa.Schema, batches: Iterator[pa.RecordBatch], path: str,
+                   row_group_size: Optional[int], compression: Optional[str]):
+    import pyarrow.parquet as pq
+
+    with pq.ParquetWriter(path, schema, compression=compression or "snappy") as writer:
+        for table in _rechunk(batches, row_group_size):
+            writer.write_table(table, row_group_size=row_group_size)
+
+
+def _write_ipc(schema: pa.Schema, batches: Iterator[pa.RecordBatch], path: str,
+               row_group_size: Optional[int], compression: Optional[str]):
+    options = ipc.IpcWriteOptions(compression=compression)
+    with ipc.new_file(path, schema, options=options) as writer:
+        for table in _rechunk(batches, row_group_size):
+            writer.write_table(table, max_chunksize=row_group_size)
+
+
+def _write_dataset(schema: pa.Schema, batches: Iterator[pa.RecordBatch], path: str, format: str,
+                   partition_by: List[str], row_group_size: Optional[int], compression: Optional[str]):
+    import pyarrow.dataset as ds
+
+    if format == "parquet":
+        file_format = ds.ParquetFileFormat()
+        file_options = file_format.make_write_options(compression=compression or "snappy")
+    else:
+        file_format = ds.IpcFileFormat()
+        file_options = file_format.make_write_options(compression=compression)
+    ds.write_dataset(
+        pa.RecordBatchReader.from_batches(schema, batches),
+        path,
+        format=file_format,
+        file_options=file_options,
+        partitioning=partition_by,
+        partitioning_flavor="hive",
+        max_rows_per_group=row_group_size or (1 << 20),
+        existing_data_behavior="overwrite_or_ignore",
+    )
+
+
+def _list_files(directory: str) -> set:
+    return {os.path.join(root, name) for root, _, files in os.walk(directory) for name in files}
+
+
+def _remove_partial_output(path: str, existing: Optional[set]):
+    """Remove what a failed export wrote: the file, or the dataset files it added"""
+    if os.path.isfile(path):
+        _remove_quietly(path)
+    elif os.path.isdir(path):
+        if existing is None:
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        for file in _list_files(path) - existing:
+            _remove_quietly(file)
+        # Partition directories the export created are empty now
+        for root, dirs, files in os.walk(path, topdown=False):
+            if root != path and not os.listdir(root):
+                with contextlib.suppress(OSError):
+                    os.rmdir(root)
+
+
+def _disk_usage(path: str) -> int:
+    """Size of a file, or total size of all files below a directory"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+class _SpillFile:
+    """Temporary Arrow IPC stream file that an over-budget result spills into
+
+    The stream format (not the file format) is used so dictionary replacements
+    and deltas between batches can be spilled as received.
+    """
+
+    def __init__(self, schema: pa.Schema, spill_dir: Optional[str] = None):
+        fd, self.path = tempfile.mkstemp(prefix="arrow_native_spill_", suffix=".arrow", dir=spill_dir)
+        os.close(fd)
+        self._sink = pa.OSFile(self.path, "wb")
+        self._writer = ipc.new_stream(self._sink, schema)
+
+    def write(self, batch: pa.RecordBatch):
+        self._writer.write_batch(batch)
+
+    def finish(self) -> Tuple[List[pa.RecordBatch], bool]:
+        """Close the file and return zero-copy batches over a memory map
+
+        On POSIX the file is unlinked right away (the mapping keeps the data
+        alive until the last batch is released); the returned flag is False
+        when that was not possible and the caller must remove it later.
+        """
+        self._writer.close()
+        self._sink.close()
+        source = pa.memory_map(self.path, "r")
+        batches = list(ipc.open_stream(source))
+        try:
+            os.unlink(self.path)
+        except OSError:
+            return batches, False
+        return batches, True
+
+    def discard(self):
+        try:
+            self._writer.close()
+            self._sink.close()
+        finally:
+            _remove_quietly(self.path)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 
 # Example usage
 if __name__ == "__main__":
-    import time
-
     print("Testing Arrow Native Client")
     print("=" * 60)
 
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Sans-IO Codec for the Arrow Native Protocol
+
+The wire format of the Arrow Native protocol (port 4445) in one place,
+without any I/O: the blocking client, the asyncio client, the pools and the
+stand-in server all frame and parse through this module.
+
+- FrameDecoder: incremental, single-pass decoder. Bytes go in through
+  `feed(data)` or, zero-copy, through `get_buffer()` / `buffer_updated(n)`
+  (the asyncio BufferedProtocol convention: the caller receives straight
+  into the buffer the decoder hands out). Complete frames come out as
+  events.
+- Encoders: one function per message returning its payload; `frame()`
+  adds the u32 length prefix.
+
+Frames are u32 big-endian length + payload; the payload starts with the
+u8 message type. Payloads are copied exactly once, into a buffer allocated
+from an Arrow memory pool with a 3-byte lead pad, so the Arrow IPC bytes of
+schema/batch payloads (after u8 type + u32 length) are 8-byte aligned and
+decode zero-copy.
+
+Usage:
+    decoder = FrameDecoder()
+    for event in decoder.feed(chunk):
+        if type(event) is Batch:
+            ipc.open_stream(event.ipc).read_next_batch()
+        elif type(event) is Error:
+            raise event.exception()
+"""
+
+import hashlib
+import struct
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import pyarrow as pa
+
+
+class MessageType:
+    """Message type constants matching Rust protocol.rs"""
+    HANDSHAKE_REQUEST = 0x01
+    HANDSHAKE_RESPONSE = 0x02
+    AUTH_REQUEST = 0x03
+    AUTH_RESPONSE = 0x04
+    QUERY_REQUEST = 0x10
+    QUERY_RESPONSE_SCHEMA = 0x11
+    QUERY_RESPONSE_BATCH = 0x12
+    QUERY_COMPLETE = 0x13
+    QUERY_RESPONSE_SCHEMA_REF = 0x14
+    QUERY_RESULT_VERSION = 0x15
+    QUERY_RESPONSE_DELETES = 0x16
+    ERROR = 0xFF
+
+
+class Capability:
+    """Protocol extension flags negotiated in the handshake"""
+    DICTIONARY_ENCODING = 0x01
+    SCHEMA_FINGERPRINT = 0x02
+    DELTA_RESULTS = 0x04
+
+
+class QueryOption:
+    """Per-query option flags (sent only when extensions were negotiated)"""
+    DICTIONARY_ENCODE = 0x01
+    RESULT_VERSION = 0x02
+
+
+class ResultKind:
+    """What follows a QueryResultVersion frame (DELTA_RESULTS extension)"""
+    FULL = 0       # schema + batches of the whole result
+    DELTA = 1      # schema + upsert batches + deletes
+    UNCHANGED = 2  # nothing: the client's version is current
+
+
+class QueryError(RuntimeError):
+    """Error reported by the server for a query (connection stays usable)"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(f"Query error [{code}]: {message}")
+        self.code = code
+        self.message = message
+
+
+PROTOCOL_VERSION = 1
+MAX_MESSAGE_SIZE = 100 * 1024 * 1024
+
+# Leading pad of payload buffers that aligns Arrow IPC data
+_PAYLOAD_PAD = 3
+# Receive size while waiting for a frame header (small frames are parsed
+# from here; large bodies are received straight into their own buffer)
+_SCRATCH_SIZE = 64 * 1024
+
+_U32 = struct.Struct(">I")
+_U64 = struct.Struct(">Q")
+_I64 = struct.Struct(">q")
+
+
+def schema_fingerprint(ipc_bytes) -> int:
+    """Fingerprint of a schema's Arrow IPC bytes (SCHEMA_FINGERPRINT extension)"""
+    return int.from_bytes(hashlib.sha256(ipc_bytes).digest()[:8], "big")
+
+
+# === Events ===
+
+class HandshakeRequest(NamedTuple):
+    version: int
+    capabilities: Optional[int]  # None when the client sent no extension flags
+
+
+class HandshakeResponse(NamedTuple):
+    version: int
+    server_version: str
+    capabilities: Optional[int]  # None when the server knows no extensions
+
+
+class AuthRequest(NamedTuple):
+    token: str
+    database: Optional[str]
+
+
+class AuthResponse(NamedTuple):
+    success: bool
+    session_id: str
+
+
+class QueryRequest(NamedTuple):
+    sql: str
+    options: Optional[int]  # None when no extension was negotiated
+    base_version: Optional[int] = None  # result version the client holds
+
+
+class Schema(NamedTuple):
+    ipc: pa.Buffer  # Arrow IPC schema message
+    size: int       # payload bytes on the wire
+
+
+class SchemaRef(NamedTuple):
+    fingerprint: int
+
+
+class Batch(NamedTuple):
+    ipc: pa.Buffer  # Arrow IPC message(s)
+    size: int       # payload bytes on the wire
+
+
+class ResultVersion(NamedTuple):
+    kind: int           # ResultKind
+    version: int        # version of the result after this response
+    keys: Tuple[str, ...]  # delta key columns (DELTA only)
+
+
+class Deletes(NamedTuple):
+    ipc: pa.Buffer  # Arrow IPC stream of the deleted rows' key columns
+    size: int       # payload bytes on the wire
+
+
+class QueryComplete(NamedTuple):
+    rows_affected: int
+
+
+class Error(NamedTuple):
+    code: str
+    message: str
+
+    def exception(self) -> QueryError:
+        return QueryError(self.code, self.message)
+
+
+Event = Union[HandshakeRequest, HandshakeResponse, AuthRequest, AuthResponse, QueryRequest,
+              Schema, SchemaRef, Batch, ResultVersion, Deletes, QueryComplete, Error]
+
+_EVENT_NAMES = {
+    HandshakeRequest: "HandshakeRequest", HandshakeResponse: "HandshakeResponse",
+    AuthRequest: "AuthRequest", AuthResponse: "AuthResponse", QueryRequest: "QueryRequest",
+    Schema: "QueryResponseSchema", SchemaRef: "QueryResponseSchemaRef",
+    Batch: "QueryResponseBatch", ResultVersion: "QueryResultVersion",
+    Deletes: "QueryResponseDeletes", QueryComplete: "QueryComplete", Error: "Error",
+}
+
+
+def unexpected(event: Event, expected: str) -> Exception:
+    """Exception for an out-of-sequence event (the server's own error if it is one)"""
+    if type(event) is Error:
+        return event.exception()
+    return RuntimeError(f"Expected {expected}, got {_EVENT_NAMES[type(event)]}")
+
+
+# === Decoding ===
+
+def _string(view: memoryview, offset: int):
+    """u32 length + UTF-8 at offset -> (str, next offset)"""
+    length = _U32.unpack_from(view, offset)[0]
+    end = offset + 4 + length
+    return str(view[offset + 4:end], "utf-8"), end
+
+
+def decode_payload(payload, view: Optional[memoryview] = None) -> Event:
+    """Decode one complete payload (without length prefix) into an event
+
+    Schema/batch IPC bytes are zero-copy slices of `payload`.
+    """
+    if view is None:
+        view = memoryview(payload)
+    msg_type = view[0]
+    # Ordered by frequency: a result is mostly batch frames
+    if msg_type == MessageType.QUERY_RESPONSE_BATCH or msg_type == MessageType.QUERY_RESPONSE_SCHEMA:
+        length = _U32.unpack_from(view, 1)[0]
+        ipc_bytes = payload.slice(5, length) if isinstance(payload, pa.Buffer) else pa.py_buffer(view[5:5 + length])
+        if msg_type == MessageType.QUERY_RESPONSE_BATCH:
+            return Batch(ipc_bytes, len(view))
+        return Schema(ipc_bytes, len(view))
+    if msg_type == MessageType.QUERY_COMPLETE:
+        return QueryComplete(_I64.unpack_from(view, 1)[0])
+    if msg_type == MessageType.QUERY_RESPONSE_SCHEMA_REF:
+        return SchemaRef(_U64.unpack_from(view, 1)[0])
+    if msg_type == MessageType.QUERY_RESULT_VERSION:
+        version = _U64.unpack_from(view, 2)[0]
+        count = _U32.unpack_from(view, 10)[0]
+        keys, offset = [], 14
+        for _ in range(count):
+            key, offset = _string(view, offset)
+            keys.append(key)
+        return ResultVersion(view[1], version, tuple(keys))
+    if msg_type == MessageType.QUERY_RESPONSE_DELETES:
+        length = _U32.unpack_from(view, 1)[0]
+        ipc_bytes = payload.slice(5, length) if isinstance(payload, pa.Buffer) else pa.py_buffer(view[5:5 + length])
+        return Deletes(ipc_bytes, len(view))
+    if msg_type == MessageType.ERROR:
+        code, offset = _string(view, 1)
+        message, _ = _string(view, offset)
+        return Error(code, message)
+    if msg_type == MessageType.QUERY_REQUEST:
+        sql, offset = _string(view, 1)
+        options = _U32.unpack_from(view, offset)[0] if len(view) >= offset + 4 else None
+        base_version = _U64.unpack_from(view, offset + 4)[0] if len(view) >= offset + 12 else None
+        return QueryRequest(sql, options, base_version)
+    if msg_type == MessageType.HANDSHAKE_RESPONSE:
+        version = _U32.unpack_from(view, 1)[0]
+        server_version, offset = _string(view, 5)
+        flags = _U32.unpack_from(view, offset)[0] if len(view) >= offset + 4 else None
+        return HandshakeResponse(version, server_version, flags)
+    if msg_type == MessageType.AUTH_RESPONSE:
+        session_id, _ = _string(view, 2)
+        return AuthResponse(view[1] != 0, session_id)
+    if msg_type == MessageType.HANDSHAKE_REQUEST:
+        version = _U32.unpack_from(view, 1)[0]
+        flags = _U32.unpack_from(view, 5)[0] if len(view) >= 9 else None
+        return HandshakeRequest(version, flags)
+    if msg_type == MessageType.AUTH_REQUEST:
+        token, offset = _string(view, 1)
+        database = _string(view, offset + 1)[0] if view[offset] else None
+        return AuthRequest(token, database)
+    raise RuntimeError(f"Unexpected message type: 0x{msg_type:02x}")
+
+
+class FrameDecoder:
+    """Incremental decoder: bytes in, events out
+
+    Each payload byte is copied once, into a pool buffer that the decoded
+    event then references zero-copy. While a frame body is incomplete,
+    `get_buffer()` returns the unfilled rest of that body, so callers using
+    `recv_into` receive large payloads without any intermediate copy.
+    """
+
+    def __init__(self, memory_pool: Optional[pa.MemoryPool] = None):
+        self.memory_pool = memory_pool
+        self.bytes_received = 0
+        self.frames_received = 0
+        self._header = bytearray()
+        self._scratch = memoryview(bytearray(_SCRATCH_SIZE))
+        self._payload: Optional[pa.Buffer] = None
+        self._body: Optional[memoryview] = None
+        self._filled = 0
+
+    def reset(self):
+        """Discard any partial frame (new connection)"""
+        self._header.clear()
+        self._payload = self._body = None
+        self._filled = 0
+
+    def feed(self, data) -> List[Event]:
+        """Consume received bytes; returns the events they completed"""
+        view = memoryview(data)
+        if view.format != "B":
+            view = view.cast("B")
+        self.bytes_received += len(view)
+        events: List[Event] = []
+        self._consume(view, events)
+        return events
+
+    def get_buffer(self) -> memoryview:
+        """Writable buffer for the next receive (see buffer_updated)"""
+        if self._body is not None:
+            return self._body[self._filled:]
+        return self._scratch
+
+    def buffer_updated(self, nbytes: int) -> List[Event]:
+        """`nbytes` were written into the last get_buffer(); returns completed events"""
+        self.bytes_received += nbytes
+        events: List[Event] = []
+        if self._body is not None:
+            self._filled += nbytes
+            if self._filled == len(self._body):
+                self._complete(events)
+        else:
+            self._consume(self._scratch[:nbytes], events)
+        return events
+
+    def _consume(self, view: memoryview, events: List[Event]):
+        """Single pass over `view`: headers parsed in place, bodies copied once"""
+        pos = 0
+        end = len(view)
+        while pos < end:
+            body = self._body
+            if body is None:
+                header = self._header
+                if not header and end - pos >= 4:
+                    length = _U32.unpack_from(view, pos)[0]
+                    pos += 4
+                else:
+                    take = min(4 - len(header), end - pos)
+                    header += view[pos:pos + take]
+                    pos += take
+                    if len(header) < 4:
+                        return
+                    length = _U32.unpack_from(header)[0]
+                    header.clear()
+                body = self._start(length)
+            take = min(len(body) - self._filled, end - pos)
+            body[self._filled:self._filled + take] = view[pos:pos + take]
+            self._filled += take
+            pos += take
+            if self._filled == len(body):
+                self._complete(events)
+
+    def _start(self, length: int) -> memoryview:
+        if length == 0 or length > MAX_MESSAGE_SIZE:
+            raise RuntimeError(f"Invalid message length: {length}")
+        buffer = pa.allocate_buffer(length + _PAYLOAD_PAD, memory_pool=self.memory_pool)
+        self._payload = buffer.slice(_PAYLOAD_PAD, length)
+        self._body = memoryview(buffer).cast("B")[_PAYLOAD_PAD:]
+        self._filled = 0
+        return self._body
+
+    def _complete(self, events: List[Event]):
+        payload, body = self._payload, self._body
+        self._payload = self._body = None
+        self._filled = 0
+        self.frames_received += 1
+        events.append(decode_payload(payload, body))
+
+
+# === Encoding ===
+
+def frame(payload: bytes) -> bytes:
+    """Length-prefix one payload"""
+    return _U32.pack(len(payload)) + payload
+
+
+def encode_string(value: str) -> bytes:
+    """u32 length + UTF-8 bytes"""
+    data = value.encode("utf-8")
+    return _U32.pack(len(data)) + data
+
+
+def encode_optional_string(value: Optional[str]) -> bytes:
+    """u8 present flag + string if present"""
+    if value is None:
+        return b"\x00"
+    return b"\x01" + encode_string(value)
+
+
+def handshake_request(version: int = PROTOCOL_VERSION, capabilities: int = 0) -> bytes:
+    """HandshakeRequest payload (capability flags appended when requested)"""
+    if capabilities:
+        return struct.pack(">BII", MessageType.HANDSHAKE_REQUEST, version, capabilities)
+    return struct.pack(">BI", MessageType.HANDSHAKE_REQUEST, version)
+
+
+def handshake_response(server_version: str = "mock", accepted: Optional[int] = None,
+                       version: int = PROTOCOL_VERSION) -> bytes:
+    """HandshakeResponse payload (accepted capability flags appended if given)"""
+    payload = struct.pack(">BI", MessageType.HANDSHAKE_RESPONSE, version) + encode_string(server_version)
+    if accepted is not None:
+        payload += _U32.pack(accepted)
+    return payload
+
+
+def auth_request(token: str, database: Optional[str] = None) -> bytes:
+    """AuthRequest payload"""
+    return bytes([MessageType.AUTH_REQUEST]) + encode_string(token) + encode_optional_string(database)
+
+
+def auth_response(session_id: str = "mock-session", success: bool = True) -> bytes:
+    """AuthResponse payload"""
+    return bytes([MessageType.AUTH_RESPONSE, 1 if success else 0]) + encode_string(session_id)
+
+
+def query_request(sql: str, options: Optional[int] = None,
+                  base_version: Optional[int] = None) -> bytes:
+    """QueryRequest payload (option flags only once extensions are negotiated)
+
+    `base_version` (the result version the client holds) follows the
+    options, with QueryOption.RESULT_VERSION set.
+    """
+    payload = bytes([MessageType.QUERY_REQUEST]) + encode_string(sql)
+    if options is not None:
+        payload += _U32.pack(options)
+        if base_version is not None:
+            payload += _U64.pack(base_version)
+    return payload
+
+
+def schema_response(ipc_bytes: bytes) -> bytes:
+    """QueryResponseSchema payload"""
+    return struct.pack(">BI", MessageType.QUERY_RESPONSE_SCHEMA, len(ipc_bytes)) + ipc_bytes
+
+
+def schema_ref(fingerprint: int) -> bytes:
+    """QueryResponseSchemaRef payload"""
+    return struct.pack(">BQ", MessageType.QUERY_RESPONSE_SCHEMA_REF, fingerprint)
+
+
+def batch_response(ipc_bytes: bytes) -> bytes:
+    """QueryResponseBatch payload"""
+    return struct.pack(">BI", MessageType.QUERY_RESPONSE_BATCH, len(ipc_bytes)) + ipc_bytes
+
+
+def result_version(kind: int, version: int, keys: Sequence[str] = ()) -> bytes:
+    """QueryResultVersion payload"""
+    return (struct.pack(">BBQI", MessageType.QUERY_RESULT_VERSION, kind, version, len(keys))
+            + b"".join(encode_string(key) for key in keys))
+
+
+def deletes_response(ipc_bytes: bytes) -> bytes:
+    """QueryResponseDeletes payload"""
+    return struct.pack(">BI", MessageType.QUERY_RESPONSE_DELETES, len(ipc_bytes)) + ipc_bytes
+
+
+def query_complete(rows_affected: int) -> bytes:
+    """QueryComplete payload"""
+    return struct.pack(">Bq", MessageType.QUERY_COMPLETE, rows_affected)
+
+
+def error_response(code: str, message: str) -> bytes:
+    """Error payload"""
+    return bytes([MessageType.ERROR]) + encode_string(code) + encode_string(message)
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Stand-in Arrow Native Server for Local Tests and Benchmarks
+
+A small threaded TCP server that speaks the Arrow Native protocol well
+enough for client tests: handshake (with capability negotiation), auth,
+queries answered from canned tables, QueryComplete and Error frames.
+Several instances on different ports stand in for cubesqld replicas.
+
+Fault injection for load-balancing and failover tests:
+- `latency`: seconds to sleep before answering each query
+- `fail_mode`: None, "error" (Error frame), "close" (drop the connection
+  mid-query) or "refuse" (stop accepting connections)
+
+Supported extensions: DICTIONARY_ENCODING, SCHEMA_FINGERPRINT and
+DELTA_RESULTS (see arrow_native_client), enabled through `capabilities`.
+For DELTA_RESULTS the server remembers the last `delta_history` versions
+of each query's result and diffs against the one the client holds
+(arrow_delta). Requests are parsed and responses encoded with
+arrow_native_codec, like the clients.
+
+Usage:
+    with MockArrowNativeServer({"SELECT 1": pa.table({"x": [1]})}) as server:
+        client = ArrowNativeClient("127.0.0.1", server.port).connect()
+        client.query("SELECT 1")
+"""
+
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+import arrow_delta
+# Encoders are re-exported: benchmarks build server byte streams from them
+from arrow_native_codec import (
+    AuthRequest,
+    Capability,
+    Event,
+    FrameDecoder,
+    HandshakeRequest,
+    QueryError,
+    QueryOption,
+    QueryRequest,
+    ResultKind,
+    auth_response,
+    batch_response,
+    deletes_response,
+    error_response,
+    frame,
+    handshake_response,
+    query_complete,
+    result_version,
+    schema_fingerprint,
+    schema_ref,
+    schema_response,
+)
+from sql_normalize import normalize_sql
+
+Handler = Callable[[str], pa.Table]
+
+DEFAULT_TABLE = pa.table({"num": pa.array([1], pa.int64()), "text": ["hello"]})
+
+
+def _stream_bytes(schema: pa.Schema, batch: Optional[pa.RecordBatch] = None) -> bytes:
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, schema) as writer:
+        if batch is not None:
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def _table_bytes(table: pa.Table) -> bytes:
+    sink = pa.BufferOutputStream()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _stream_messages(table: pa.Table, max_chunksize: int) -> List[bytes]:
+    """One continuous IPC stream split into messages (dictionary mode)"""
+    sink = pa.BufferOutputStream()
+    options = ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+    with ipc.new_stream(sink, table.schema, options=options) as writer:
+        for batch in table.to_batches(max_chunksize=max_chunksize):
+            writer.write_batch(batch)
+    reader = ipc.MessageReader.open_stream(sink.getvalue())
+    return [message.serialize().to_pybytes() for message in reader]
+
+
+def result_payloads(table: pa.Table, batch_size: int = 65536,
+                    dictionary: bool = False) -> List[bytes]:
+    """Schema, batch and QueryComplete payloads answering one query
+
+    With `dictionary` the string columns are dictionary-encoded and sent as
+    one continuous IPC stream (DICTIONARY_ENCODE query option).
+    """
+    payloads = []
+    if dictionary:
+        messages = _stream_messages(dictionary_encode(table), batch_size)
+        payloads.append(schema_response(messages[0]))
+        payloads.extend(batch_response(m) for m in messages[1:])
+    else:
+        payloads.append(schema_response(_stream_bytes(table.schema)))
+        payloads.extend(batch_response(_stream_bytes(table.schema, batch))
+                        for batch in table.to_batches(max_chunksize=batch_size))
+    payloads.append(query_complete(table.num_rows))
+    return payloads
+
+
+def dictionary_encode(table: pa.Table) -> pa.Table:
+    """Dictionary-encode the string columns of a table"""
+    columns = [pc.dictionary_encode(column) if pa.types.is_string(column.type) else column
+               for column in table.columns]
+    return pa.table(columns, names=table.column_names)
+
+
+class MockArrowNativeServer:
+    """Threaded stand-in for one cubesqld Arrow Native endpoint"""
+
+    def __init__(self, responses: Union[Dict[str, pa.Table], Handler, None] = None,
+                 host: str = "127.0.0.1", port: int = 0,
+                 batch_size: int = 65536, latency: float = 0.0,
+                 capabilities: int = 0, server_version: str = "mock",
+                 delta_history: int = 8, delta_max_ratio: float = 0.5):
+        """
+        Args:
+            responses: {sql: table} (matched on normalized SQL) or a callable
+                sql -> table that may raise QueryError; default answers every
+                query with DEFAULT_TABLE
+            port: 0 picks a free port (see `port` after start())
+            batch_size: Max rows per QueryResponseBatch
+            latency: Seconds to sleep before answering each query
+            capabilities: Protocol extension flags the server accepts
+            delta_history: Result versions kept per query for DELTA_RESULTS
+            delta_max_ratio: Send the full result instead of a delta once
+                upserts + deletes exceed this fraction of the result rows
+        """
+        if responses is None:
+            self.handler: Handler = lambda sql: DEFAULT_TABLE
+        elif callable(responses):
+            self.handler = responses
+        else:
+            tables = {normalize_sql(sql): table for sql, table in responses.items()}
+
+            def lookup(sql: str) -> pa.Table:
+                try:
+                    return tables[normalize_sql(sql)]
+                except KeyError:
+                    raise QueryError("NOT_FOUND", f"No canned response for: {sql}")
+            self.handler = lookup
+        self.host = host
+        self.port = port
+        self.batch_size = batch_size
+        self.latency = latency
+        self.fail_mode: Optional[str] = None
+        self.capabilities = capabilities
+        self.server_version = server_version
+        self.delta_history = delta_history
+        self.delta_max_ratio = delta_max_ratio
+        self.queries = 0
+        self.connections = 0
+        # Responses to versioned queries by ResultKind
+        self.result_kinds = {ResultKind.FULL: 0, ResultKind.DELTA: 0, ResultKind.UNCHANGED: 0}
+        self._versions: Dict[str, "OrderedDict[int, pa.Table]"] = {}
+        self._lock = threading.Lock()
+        self._listener: Optional[socket.socket] = None
+        self._conns: List[socket.socket] = []
+        self._stopped = threading.Event()
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def start(self) -> "MockArrowNativeServer":
+        self._listen()
+        self._stopped.clear()
+        return self
+
+    def stop(self):
+        """Stop listening and drop every open connection"""
+        self._stopped.set()
+        self._close_listener()
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            _close_quietly(conn)
+
+    def set_fail_mode(self, mode: Optional[str]):
+        """None, "error", "close" or "refuse" (refuse also drops open connections)"""
+        if mode not in (None, "error", "close", "refuse"):
+            raise ValueError(f"Unknown fail mode: {mode}")
+        self.fail_mode = mode
+        if mode == "refuse":
+            self._close_listener()
+            with self._lock:
+                conns, self._conns = self._conns, []
+            for conn in conns:
+                _close_quietly(conn)
+        elif self._listener is None and not self._stopped.is_set():
+            self._listen()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    # === Connection handling ===
+
+    def _listen(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(128)
+        self.port = listener.getsockname()[1]
+        self._listener = listener
+        threading.Thread(target=self._accept_loop, args=(listener,), daemon=True,
+                         name=f"mock-arrow-native-{self.port}").start()
+
+    def _close_listener(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            _close_quietly(listener)
+
+    def _accept_loop(self, listener: socket.socket):
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._conns.append(conn)
+                self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        try:
+            self._session(conn)
+        except (OSError, RuntimeError):
+            # Connection dropped or undecodable bytes
+            pass
+        finally:
+            with self._lock:
+                if conn in self._conns:
+                    self._conns.remove(conn)
+            _close_quietly(conn)
+
+    def _session(self, conn: socket.socket):
+        requests = _requests(conn)
+
+        # Handshake (optional trailing capability flags)
+        event = next(requests, None)
+        if type(event) is not HandshakeRequest:
+            return
+        accepted = event.capabilities & self.capabilities if event.capabilities is not None else None
+        _send_frame(conn, handshake_response(self.server_version, accepted))
+        accepted = accepted or 0
+
+        # Auth (any token is accepted)
+        if type(next(requests, None)) is not AuthRequest:
+            return
+        _send_frame(conn, auth_response(f"mock-{id(conn)}"))
+
+        sent_schemas = set()
+        for event in requests:
+            if type(event) is not QueryRequest:
+                _send_frame(conn, error_response("PROTOCOL", f"Unexpected message {type(event).__name__}"))
+                continue
+            options = (event.options or 0) if accepted else 0
+
+            with self._lock:
+                self.queries += 1
+            if self.latency:
+                time.sleep(self.latency)
+            if self.fail_mode in ("close", "refuse"):
+                return
+            if self.fail_mode == "error":
+                _send_frame(conn, error_response("UNAVAILABLE", "Injected failure"))
+                continue
+            try:
+                table = self.handler(event.sql)
+            except QueryError as e:
+                _send_frame(conn, error_response(e.code, e.message))
+                continue
+
+            if accepted & Capability.DELTA_RESULTS and options & QueryOption.RESULT_VERSION:
+                self._send_versioned(conn, event, table, accepted, sent_schemas)
+            else:
+                self._send_result(conn, table, options, accepted, sent_schemas)
+
+    def _send_result(self, conn: socket.socket, table: pa.Table, options: int,
+                     accepted: int, sent_schemas: set):
+        payloads = result_payloads(table, self.batch_size,
+                                   dictionary=bool(options & QueryOption.DICTIONARY_ENCODE))
+        _reference_schema(payloads, accepted, sent_schemas)
+        conn.sendall(b"".join(frame(payload) for payload in payloads))
+
+    def _send_versioned(self, conn: socket.socket, request: QueryRequest, table: pa.Table,
+                        accepted: int, sent_schemas: set):
+        """Answer with unchanged, a delta against the client's version, or the full result"""
+        version = arrow_delta.result_version(table)
+        key = normalize_sql(request.sql)
+        with self._lock:
+            history = self._versions.setdefault(key, OrderedDict())
+            history[version] = table
+            history.move_to_end(version)
+            while len(history) > self.delta_history:
+                history.popitem(last=False)
+            base = history.get(request.base_version) if request.base_version is not None else None
+
+        kind, delta, keys = ResultKind.FULL, None, None
+        if request.base_version == version:
+            kind = ResultKind.UNCHANGED
+        elif base is not None:
+            keys = arrow_delta.delta_keys(request.sql, table.schema)
+            delta = arrow_delta.diff_tables(base, table, keys) if keys else None
+            if delta is not None and (delta[0].num_rows + delta[1].num_rows
+                                      <= self.delta_max_ratio * max(table.num_rows, 1)):
+                kind = ResultKind.DELTA
+        with self._lock:
+            self.result_kinds[kind] += 1
+
+        header = frame(result_version(kind, version, keys if kind == ResultKind.DELTA else ()))
+        if kind == ResultKind.UNCHANGED:
+            conn.sendall(header + frame(query_complete(0)))
+            return
+        if kind == ResultKind.FULL:
+            conn.sendall(header)
+            self._send_result(conn, table, 0, accepted, sent_schemas)
+            return
+        # Upserts go out like a result; the deleted keys precede QueryComplete
+        upserts, deletes = delta
+        payloads = result_payloads(upserts, self.batch_size)
+        _reference_schema(payloads, accepted, sent_schemas)
+        payloads.insert(-1, deletes_response(_table_bytes(deletes)))
+        conn.sendall(header + b"".join(frame(payload) for payload in payloads))
+
+
+def _reference_schema(payloads: List[bytes], accepted: int, sent_schemas: set):
+    """Replace the schema payload by a reference if this connection already has it"""
+    fingerprint = schema_fingerprint(payloads[0][5:])
+    if accepted & Capability.SCHEMA_FINGERPRINT and fingerprint in sent_schemas:
+        payloads[0] = schema_ref(fingerprint)
+    sent_schemas.add(fingerprint)
+
+
+def _requests(conn: socket.socket) -> Iterator[Event]:
+    """Decoded client messages until the connection closes"""
+    decoder = FrameDecoder()
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            return
+        yield from decoder.feed(data)
+
+
+def _send_frame(conn: socket.socket, payload: bytes):
+    conn.sendall(frame(payload))
+
+
+def _close_quietly(sock: socket.socket):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+
+# Example usage
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stand-in Arrow Native server")
+    parser.add_argument("--port", type=int, default=4445)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per query")
+    parser.add_argument("--rows", type=int, default=1000, help="rows in the canned result")
+    args = parser.parse_args()
+
+    table = pa.table({
+        "market_code": [f"M{i % 20:02d}" for i in range(args.rows)],
+        "count": pa.array(range(args.rows), pa.int64()),
+    })
+    server = MockArrowNativeServer(lambda sql: table, port=args.port, latency=args.latency,
+                                   capabilities=Capability.DICTIONARY_ENCODING
+                                   | Capability.SCHEMA_FINGERPRINT).start()
+    print(f"✓ Mock Arrow Native server on {server.address} ({args.rows} rows per query)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
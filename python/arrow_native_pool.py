@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+"""
+Pooled and asyncio Arrow Native Clients with Bulk Query API
+
+Dashboards run dozens of independent Cube queries per page. Running them one
+after another costs the sum of their latencies; spreading them over pooled
+connections costs roughly the slowest one.
+
+- ArrowNativePool: thread-safe pool of ArrowNativeClient connections
+- AsyncArrowNativeClient: asyncio implementation of the Arrow Native protocol
+- AsyncArrowNativePool: pool of AsyncArrowNativeClient connections
+
+Both pools offer:
+- query(sql): run one query on a pooled connection
+- query_many(sqls, max_concurrency=N): results in input order, one
+  QueryOutcome per query carrying its own result or error
+- as_completed(sqls, max_concurrency=N): outcomes as soon as each finishes
+
+ArrowNativePool can hedge (opt-in, `hedging=HedgePolicy()`): when a query
+has not received its schema frame within the observed p95 time-to-schema,
+the same query is sent on a second connection; the first result wins and
+the other attempt is cancelled. Cube reads are idempotent, so this trades
+a budgeted amount of extra load for a shorter tail.
+
+Usage:
+    with ArrowNativePool(host="localhost", port=4445, token="test", max_size=8) as pool:
+        outcomes = pool.query_many([sql1, sql2, sql3])
+        tables = [o.unwrap().to_table() for o in outcomes]
+
+    async with AsyncArrowNativePool(max_size=8) as pool:
+        outcomes = await pool.query_many([sql1, sql2, sql3])
+
+    with ArrowNativePool(max_size=8, hedging=HedgePolicy(quantile=0.95, budget=0.05)) as pool:
+        pool.query(sql)
+        print(pool.hedge_stats)
+"""
+
+import abc
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed as futures_as_completed
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, List, Optional, Sequence
+
+import pyarrow.ipc as ipc
+
+from arrow_native_client import ArrowNativeClient, QueryError, QueryResult, get_memory_pool
+from arrow_native_codec import (
+    AuthResponse,
+    Batch,
+    Event,
+    FrameDecoder,
+    HandshakeResponse,
+    QueryComplete,
+    Schema,
+    auth_request,
+    frame,
+    handshake_request,
+    query_request,
+    unexpected,
+)
+
+# Bytes per StreamReader read fed to the decoder
+_READ_SIZE = 256 * 1024
+
+
+@dataclass
+class QueryOutcome:
+    """Result or error of one query in a bulk request"""
+    index: int
+    sql: str
+    result: Optional[QueryResult] = None
+    error: Optional[BaseException] = None
+    elapsed_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def unwrap(self) -> QueryResult:
+        """Return the result or raise the query's error"""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+@dataclass
+class HedgeStats:
+    """Hedging counters"""
+    queries: int = 0
+    hedges_fired: int = 0
+    hedges_won: int = 0
+    skipped_budget: int = 0
+    skipped_no_connection: int = 0
+    cancelled: int = 0
+
+
+class HedgePolicy:
+    """When to hedge: a delay from observed time-to-schema, capped by a budget
+
+    The delay is the `quantile` of the last `window` times from sending a
+    query to receiving its schema frame, clamped to [min_delay, max_delay];
+    `initial_delay` is used until `min_samples` were observed.
+
+    Budget: every query earns `budget` hedge tokens (at most `burst` are
+    kept), every hedge spends one - hedges add at most about `budget`
+    (e.g. 5%) extra queries.
+    """
+
+    def __init__(self, quantile: float = 0.95, budget: float = 0.05,
+                 burst: float = 10.0, initial_delay: float = 0.05,
+                 min_delay: float = 0.001, max_delay: Optional[float] = None,
+                 window: int = 1000, min_samples: int = 20):
+        self.quantile = quantile
+        self.budget = budget
+        self.burst = burst
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.stats = HedgeStats()
+        self._samples = deque(maxlen=window)
+        self._delay = initial_delay
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for the schema frame before hedging"""
+        return self._delay
+
+    def observe(self, seconds: float):
+        """Record one time-to-schema sample"""
+        with self._lock:
+            self._samples.append(seconds)
+            n = len(self._samples)
+            # Re-sorting the window on every sample is wasteful; refresh every 16
+            if n >= self.min_samples and n % 16 == 0:
+                ordered = sorted(self._samples)
+                delay = max(ordered[min(n - 1, int(n * self.quantile))], self.min_delay)
+                self._delay = min(delay, self.max_delay) if self.max_delay is not None else delay
+
+    def admit(self):
+        """Count a query and earn its share of the hedge budget"""
+        with self._lock:
+            self.stats.queries += 1
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def try_hedge(self) -> bool:
+        """Spend a budget token for one hedge"""
+        with self._lock:
+            if self._tokens < 1.0:
+                self.stats.skipped_budget += 1
+                return False
+            self._tokens -= 1.0
+            self.stats.hedges_fired += 1
+            return True
+
+    def record(self, **counters: int):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+
+class _Attempt:
+    """One execution of a hedged query on its own connection"""
+    __slots__ = ("client", "hedge", "schema_received", "lock", "finished", "cancelled")
+
+    def __init__(self, client: ArrowNativeClient, hedge: bool):
+        self.client = client
+        self.hedge = hedge
+        self.schema_received = threading.Event()
+        self.lock = threading.Lock()
+        self.finished = False
+        self.cancelled = False
+
+    def cancel(self) -> bool:
+        """Abort the attempt unless it already finished"""
+        with self.lock:
+            if self.finished or self.cancelled:
+                return False
+            self.cancelled = True
+        self.client.cancel()
+        return True
+
+
+class BulkQueryMixin(abc.ABC):
+    """query_many/as_completed for thread-based clients
+
+    Subclasses implement `query(sql)` and set `max_size` (the default
+    concurrency).
+    """
+
+    max_size: int
+
+    @abc.abstractmethod
+    def query(self, sql: str) -> QueryResult:
+        """Run one query"""
+
+    def _run(self, index: int, sql: str) -> QueryOutcome:
+        start = time.perf_counter()
+        try:
+            result = self.query(sql)
+            return QueryOutcome(index, sql, result=result,
+                                elapsed_ms=(time.perf_counter() - start) * 1000)
+        except Exception as e:
+            return QueryOutcome(index, sql, error=e,
+                                elapsed_ms=(time.perf_counter() - start) * 1000)
+
+    def query_many(self, sqls: Sequence[str], max_concurrency: Optional[int] = None) -> List[QueryOutcome]:
+        """Run queries concurrently; outcomes are returned in input order"""
+        outcomes: List[Optional[QueryOutcome]] = [None] * len(sqls)
+        for outcome in self.as_completed(sqls, max_concurrency):
+            outcomes[outcome.index] = outcome
+        return outcomes
+
+    def as_completed(self, sqls: Sequence[str], max_concurrency: Optional[int] = None) -> Iterator[QueryOutcome]:
+        """Run queries concurrently, yielding each outcome as it finishes"""
+        if not sqls:
+            return
+        workers = min(max_concurrency or self.max_size, self.max_size, len(sqls))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="arrow-native") as executor:
+            futures = [executor.submit(self._run, i, sql) for i, sql in enumerate(sqls)]
+            for future in futures_as_completed(futures):
+                yield future.result()
+
+
+class ArrowNativePool(BulkQueryMixin):
+    """Thread-safe pool of Arrow Native connections
+
+    Connections are opened lazily up to `max_size` and reused LIFO. A
+    connection whose query fails with anything but a server-reported query
+    error (QueryError) is closed instead of being returned to the pool;
+    QueryError leaves it reusable. So is the connection of a cancelled
+    hedge attempt.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 4445,
+                 token: str = "test", database: Optional[str] = None,
+                 max_size: int = 8, hedging: Optional[HedgePolicy] = None,
+                 **client_kwargs):
+        """
+        Args:
+            max_size: Max open connections
+            hedging: Hedge slow queries on a second connection (opt-in)
+            **client_kwargs: Passed to ArrowNativeClient (memory budgets etc.)
+        """
+        self.host = host
+        self.port = port
+        self.token = token
+        self.database = database
+        self.max_size = max_size
+        self.hedging = hedging
+        self.client_kwargs = client_kwargs
+        self.metrics = client_kwargs.get("metrics")
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._idle: List[ArrowNativeClient] = []
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _new_client(self) -> ArrowNativeClient:
+        return ArrowNativeClient(self.host, self.port, self.token, self.database,
+                                 **self.client_kwargs).connect()
+
+    def checkout(self, timeout: Optional[float] = None) -> ArrowNativeClient:
+        """Take a connection, opening one if below max_size, else waiting"""
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            waited = False
+            while True:
+                if self._closed:
+                    raise RuntimeError("Pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("Timed out waiting for a pooled connection")
+                if self.metrics is not None and not waited:
+                    self.metrics.inc("pool_waits")
+                waited = True
+                self._cond.wait(remaining)
+        try:
+            return self._new_client()
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, client: ArrowNativeClient, broken: bool = False):
+        """Return a connection; broken connections are closed and dropped"""
+        with self._cond:
+            if broken or self._closed:
+                client.close()
+                self._size -= 1
+            else:
+                self._idle.append(client)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[ArrowNativeClient]:
+        """Context manager around checkout/checkin"""
+        client = self.checkout(timeout)
+        broken = False
+        try:
+            yield client
+        except QueryError:
+            # Server-reported error: the connection is still in sync
+            raise
+        except BaseException:
+            # I/O, decode or interrupt mid-stream: protocol state unknown - don't reuse
+            broken = True
+            raise
+        finally:
+            self.checkin(client, broken)
+
+    def query(self, sql: str) -> QueryResult:
+        """Execute one query on a pooled connection"""
+        if self.hedging is not None:
+            return self._query_hedged(sql)
+        with self.connection() as client:
+            return client.query(sql)
+
+    @property
+    def hedge_stats(self) -> Optional[HedgeStats]:
+        return self.hedging.stats if self.hedging is not None else None
+
+    def _query_hedged(self, sql: str) -> QueryResult:
+        """Run `sql`, adding a second attempt if the schema frame is late"""
+        policy = self.hedging
+        policy.admit()
+        with self._cond:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=2 * self.max_size,
+                                                          thread_name_prefix="arrow-native-hedge")
+        results: "queue.Queue" = queue.Queue()
+        primary = _Attempt(self.checkout(), hedge=False)
+        attempts = [primary]
+        self._hedge_executor.submit(self._run_attempt, primary, sql, results)
+
+        if not primary.schema_received.wait(policy.delay()):
+            try:
+                client = self.checkout(timeout=0)
+            except TimeoutError:
+                policy.record(skipped_no_connection=1)
+            else:
+                if policy.try_hedge():
+                    hedge = _Attempt(client, hedge=True)
+                    attempts.append(hedge)
+                    self._hedge_executor.submit(self._run_attempt, hedge, sql, results)
+                else:
+                    self.checkin(client)
+
+        # First result (or QueryError) wins; an I/O failure waits for the other attempt
+        pending = len(attempts)
+        while True:
+            winner, result, error = results.get()
+            pending -= 1
+            if error is None or isinstance(error, QueryError) or pending == 0:
+                break
+
+        for attempt in attempts:
+            if attempt is not winner and attempt.cancel():
+                policy.record(cancelled=1)
+        if error is not None:
+            raise error
+        if winner.hedge:
+            policy.record(hedges_won=1)
+        return result
+
+    def _run_attempt(self, attempt: _Attempt, sql: str, results: "queue.Queue"):
+        # Broken unless the attempt got a result or a QueryError; the
+        # connection is checked in and the outcome posted even if the
+        # thread dies (KeyboardInterrupt, SystemExit), or the query waits forever
+        broken = True
+        outcome = (attempt, None, RuntimeError("hedged attempt did not complete"))
+        try:
+            start = time.perf_counter()
+
+            def on_schema():
+                self.hedging.observe(time.perf_counter() - start)
+                attempt.schema_received.set()
+
+            outcome = (attempt, attempt.client._query(sql, on_schema=on_schema), None)
+            broken = False
+        except QueryError as e:
+            outcome = (attempt, None, e)
+            broken = False
+        except Exception as e:
+            outcome = (attempt, None, e)
+        except BaseException as e:
+            outcome = (attempt, None, e)
+            raise
+        finally:
+            with attempt.lock:
+                attempt.finished = True
+                # A cancelled attempt's socket was shut down
+                broken = broken or attempt.cancelled
+            attempt.schema_received.set()
+            self.checkin(attempt.client, broken)
+            results.put(outcome)
+
+    def close(self):
+        """Close idle connections; busy ones close when checked in"""
+        with self._cond:
+            self._closed = True
+            for client in self._idle:
+                client.close()
+            self._size -= len(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+            executor, self._hedge_executor = self._hedge_executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncArrowNativeClient:
+    """asyncio client for the CubeSQL Arrow Native protocol (port 4445)
+
+    Wire encoding and decoding are shared with the blocking client through
+    arrow_native_codec; this class only moves bytes.
+    """
+
+    PROTOCOL_VERSION = ArrowNativeClient.PROTOCOL_VERSION
+
+    def __init__(self, host: str = "localhost", port: int = 4445,
+                 token: str = "test", database: Optional[str] = None,
+                 memory_pool: str = "default"):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.database = database
+        self.session_id: Optional[str] = None
+        self.memory_pool = get_memory_pool(memory_pool)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._decoder = FrameDecoder(self.memory_pool)
+        self._events: "deque[Event]" = deque()
+
+    async def connect(self) -> "AsyncArrowNativeClient":
+        """Connect and authenticate to Arrow Native server"""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._decoder.reset()
+        self._events.clear()
+
+        # Handshake
+        self._send(handshake_request(self.PROTOCOL_VERSION))
+        event = await self._receive_event()
+        if type(event) is not HandshakeResponse:
+            raise unexpected(event, "HandshakeResponse")
+        if event.version != self.PROTOCOL_VERSION:
+            raise RuntimeError(f"Protocol version mismatch: client={self.PROTOCOL_VERSION}, server={event.version}")
+
+        # Authentication
+        self._send(auth_request(self.token, self.database))
+        event = await self._receive_event()
+        if type(event) is not AuthResponse:
+            raise unexpected(event, "AuthResponse")
+        if not event.success:
+            raise RuntimeError(f"Authentication failed: {event.session_id}")
+        self.session_id = event.session_id
+        return self
+
+    async def close(self):
+        """Close connection"""
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._writer = self._reader = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def query(self, sql: str) -> QueryResult:
+        """Execute SQL query and return Arrow result"""
+        if self._writer is None:
+            raise RuntimeError("Not connected - call connect() first")
+        self._send(query_request(sql))
+
+        event = await self._receive_event()
+        if type(event) is not Schema:
+            raise unexpected(event, "QueryResponseSchema")
+        schema = ipc.open_stream(event.ipc, memory_pool=self.memory_pool).schema
+
+        batches = []
+        while True:
+            event = await self._receive_event()
+            if type(event) is Batch:
+                reader = ipc.open_stream(event.ipc, memory_pool=self.memory_pool)
+                batches.append(reader.read_next_batch())
+            elif type(event) is QueryComplete:
+                return QueryResult(schema=schema, batches=batches, rows_affected=event.rows_affected)
+            else:
+                raise unexpected(event, "QueryResponseBatch")
+
+    # === Low-level I/O ===
+
+    def _send(self, payload: bytes):
+        self._writer.write(frame(payload))
+
+    async def _receive_event(self) -> Event:
+        """Next decoded message"""
+        await self._writer.drain()
+        events = self._events
+        while not events:
+            data = await self._reader.read(_READ_SIZE)
+            if not data:
+                raise RuntimeError("Connection closed")
+            events.extend(self._decoder.feed(data))
+        return events.popleft()
+
+
+class AsyncArrowNativePool:
+    """asyncio pool of Arrow Native connections"""
+
+    def __init__(self, host: str = "localhost", port: int = 4445,
+                 token: str = "test", database: Optional[str] = None,
+                 max_size: int = 8):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.database = database
+        self.max_size = max_size
+        self._idle: List[AsyncArrowNativeClient] = []
+        self._slots = asyncio.Semaphore(max_size)
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[AsyncArrowNativeClient]:
+        """Borrow a connection, opening one if none is idle"""
+        async with self._slots:
+            client = self._idle.pop() if self._idle else None
+            if client is None:
+                client = await AsyncArrowNativeClient(self.host, self.port, self.token,
+                                                      self.database).connect()
+            try:
+                yield client
+            except QueryError:
+                # Server-reported error: the connection is still in sync
+                self._idle.append(client)
+                raise
+            except BaseException:
+                # Failed or cancelled mid-query: the stream position is unknown
+                await client.close()
+                raise
+            else:
+                self._idle.append(client)
+
+    async def query(self, sql: str) -> QueryResult:
+        """Execute one query on a pooled connection"""
+        async with self.connection() as client:
+            return await client.query(sql)
+
+    async def _run(self, index: int, sql: str, limit: asyncio.Semaphore) -> QueryOutcome:
+        async with limit:
+            start = time.perf_counter()
+            try:
+                result = await self.query(sql)
+                return QueryOutcome(index, sql, result=result,
+                                    elapsed_ms=(time.perf_counter() - start) * 1000)
+            except Exception as e:
+                return QueryOutcome(index, sql, error=e,
+                                    elapsed_ms=(time.perf_counter() - start) * 1000)
+
+    async def query_many(self, sqls: Sequence[str], max_concurrency: Optional[int] = None) -> List[QueryOutcome]:
+        """Run queries concurrently; outcomes are returned in input order"""
+        limit = asyncio.Semaphore(max_concurrency or self.max_size)
+        return list(await asyncio.gather(*(self._run(i, sql, limit) for i, sql in enumerate(sqls))))
+
+    async def as_completed(self, sqls: Sequence[str],
+                           max_concurrency: Optional[int] = None) -> AsyncIterator[QueryOutcome]:
+        """Run queries concurrently, yielding each outcome as it finishes"""
+        limit = asyncio.Semaphore(max_concurrency or self.max_size)
+        tasks = [asyncio.ensure_future(self._run(i, sql, limit)) for i, sql in enumerate(sqls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def close(self):
+        """Close idle connections"""
+        idle, self._idle = self._idle, []
+        for client in idle:
+            await client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    from arrow_benchmark import BENCHMARK_CASES
+
+    sqls = [case.sql for case in BENCHMARK_CASES]
+
+    print("Testing pooled bulk queries")
+    print("=" * 60)
+
+    with ArrowNativePool(host="localhost", port=4445, token="test", max_size=4) as pool:
+        start = time.perf_counter()
+        for sql in sqls:
+            pool.query(sql)
+        sequential_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        outcomes = pool.query_many(sqls)
+        bulk_ms = (time.perf_counter() - start) * 1000
+
+        for case, outcome in zip(BENCHMARK_CASES, outcomes):
+            status = f"{outcome.result.to_table().num_rows} rows" if outcome.ok else f"error: {outcome.error}"
+            print(f"  {case.name:8} {outcome.elapsed_ms:8.1f}ms  {status}")
+        print(f"✓ Sequential: {sequential_ms:.1f}ms")
+        print(f"✓ query_many: {bulk_ms:.1f}ms (slowest query: {max(o.elapsed_ms for o in outcomes):.1f}ms)")
+
+    async def run_async():
+        async with AsyncArrowNativePool(host="localhost", port=4445, token="test", max_size=4) as pool:
+            start = time.perf_counter()
+            async for outcome in pool.as_completed(sqls):
+                print(f"  async #{outcome.index} done after {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    asyncio.run(run_async())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Zero-Copy Arrow Handoff to a Process Pool
+
+CPU-heavy post-processing of Cube results (feature engineering, scoring)
+needs processes to get around the GIL, but submitting a `pa.Table` to a
+ProcessPoolExecutor pickles every buffer into the worker and back.
+
+ArrowProcessPool writes a result once, as an Arrow IPC stream, into a
+memory-mapped file on tmpfs (/dev/shm where available) and sends workers
+only a SharedTable handle (path + size). Workers map the file and read the
+table zero-copy: columns are views over the shared pages, so handoff cost
+no longer grows with the result size.
+
+Cleanup is reference counted in the parent: the handle returned by
+`share()` holds one reference, every submitted task holds one until it
+finishes (`shared()` scopes the handle's reference to a with-block). The
+file is unlinked when the count drops to zero; workers that
+still have the file mapped keep their pages until they drop their views.
+
+A memory-mapped file is used instead of `multiprocessing.shared_memory`:
+Arrow ties the lifetime of the mapping to the buffers referencing it, and
+the multiprocessing resource tracker does not unlink segments behind the
+pool's back.
+
+Usage:
+    with ArrowProcessPool(max_workers=4) as pool:
+        with pool.shared(client.query(sql)) as shared:
+            futures = [pool.submit(score, shared, model_id) for model_id in models]
+            scores = [f.result() for f in futures]
+
+    # worker side: score(table: pa.Table, model_id) receives a zero-copy table
+"""
+
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Union
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from arrow_native_client import QueryResult
+
+Shareable = Union[pa.Table, pa.RecordBatchReader, QueryResult]
+
+
+def _default_directory() -> str:
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+@dataclass(frozen=True)
+class SharedTable:
+    """Picklable handle to a table in a memory-mapped Arrow IPC stream"""
+    path: str
+    nbytes: int
+    num_rows: int
+
+    def to_table(self) -> pa.Table:
+        """Map the file and read the table zero-copy (any process)"""
+        # The mapping outlives the file object while buffers reference it
+        with pa.memory_map(self.path, "r") as source:
+            return ipc.open_stream(source).read_all()
+
+
+def write_shared(data: Shareable, directory: Optional[str] = None) -> SharedTable:
+    """Write a table (or stream of batches) into a new shared IPC file
+
+    Batches are written as they come, so a RecordBatchReader (e.g.
+    `ArrowNativeClient.query_reader`) never has to be materialized.
+    """
+    if isinstance(data, QueryResult):
+        schema, batches = data.schema, data.batches
+    elif isinstance(data, pa.Table):
+        schema, batches = data.schema, data.to_batches()
+    else:
+        schema, batches = data.schema, data
+    path = os.path.join(directory or _default_directory(), f"arrow_shared_{uuid.uuid4().hex}.arrow")
+    rows = 0
+    try:
+        with pa.OSFile(path, "wb") as sink:
+            # Stream format: dictionary replacements between batches are allowed
+            with ipc.new_stream(sink, schema) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+            nbytes = sink.tell()
+    except BaseException:
+        _remove_quietly(path)
+        raise
+    return SharedTable(path, nbytes, rows)
+
+
+def _run_shared(fn: Callable[..., Any], shared: SharedTable, share_result: bool,
+                directory: Optional[str], args: tuple, kwargs: dict) -> Any:
+    """Worker entry point: zero-copy table in, optional shared table out"""
+    result = fn(shared.to_table(), *args, **kwargs)
+    if share_result and isinstance(result, (pa.Table, pa.RecordBatchReader)):
+        return write_shared(result, directory)
+    return result
+
+
+class ArrowProcessPool:
+    """ProcessPoolExecutor that hands Arrow tables to workers zero-copy"""
+
+    def __init__(self, max_workers: Optional[int] = None, directory: Optional[str] = None,
+                 mp_context=None, initializer: Optional[Callable[..., None]] = None,
+                 initargs: tuple = ()):
+        """
+        Args:
+            max_workers: Worker processes (default: CPU count)
+            directory: Where shared IPC files live (default /dev/shm, else
+                the temp dir); must be visible to all workers
+            mp_context: multiprocessing context (e.g. "spawn" via
+                multiprocessing.get_context)
+        """
+        self.directory = directory or _default_directory()
+        self._executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                                             initializer=initializer, initargs=initargs)
+        self._lock = threading.Lock()
+        self._refs: Dict[str, int] = {}
+
+    def share(self, data: Shareable) -> SharedTable:
+        """Write `data` once into shared memory; the handle holds one reference
+
+        Release it with `release(handle)`, or use `shared()` instead.
+        """
+        shared = write_shared(data, self.directory)
+        self._adopt(shared)
+        return shared
+
+    @contextmanager
+    def shared(self, data: Shareable) -> Iterator[SharedTable]:
+        """share() for the duration of a with-block"""
+        handle = self.share(data)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def submit(self, fn: Callable[..., Any], data: Union[SharedTable, Shareable], *args,
+               share_result: bool = False, **kwargs) -> Future:
+        """Run `fn(table, *args, **kwargs)` in a worker on a zero-copy table
+
+        `data` may be a handle from `share()` (reused across tasks) or a table
+        that is shared just for this task. With `share_result`, a table
+        returned by `fn` comes back as a SharedTable owned by this pool
+        (release it when done) instead of being pickled.
+        """
+        if isinstance(data, SharedTable):
+            shared = data
+            self._retain(shared)
+        else:
+            shared = self.share(data)   # the task takes over this reference
+        try:
+            task = self._executor.submit(_run_shared, fn, shared, share_result,
+                                         self.directory, args, kwargs)
+        except BaseException:
+            self.release(shared)
+            raise
+
+        # Resolved only after the bookkeeping, so callers never see a result
+        # whose input is still referenced or whose output is not yet owned
+        future: Future = Future()
+        future.add_done_callback(lambda f: f.cancelled() and task.cancel())
+
+        def done(f: Future):
+            self.release(shared)
+            if f.cancelled():
+                future.cancel()
+                return
+            error = f.exception()
+            result = f.result() if error is None else None
+            if share_result and isinstance(result, SharedTable):
+                self._adopt(result)
+            try:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+            except InvalidStateError:
+                # Cancelled by the caller meanwhile
+                if share_result and isinstance(result, SharedTable):
+                    self.release(result)
+
+        task.add_done_callback(done)
+        return future
+
+    def map(self, fn: Callable[..., Any], data: Union[SharedTable, Shareable], *iterables):
+        """`fn(table, *items)` for each item tuple, all on one shared table"""
+        shared = data if isinstance(data, SharedTable) else self.share(data)
+        try:
+            futures = [self.submit(fn, shared, *items) for items in zip(*iterables)]
+        finally:
+            if shared is not data:
+                self.release(shared)
+        return [f.result() for f in futures]
+
+    def release(self, shared: SharedTable):
+        """Drop one reference; the file is unlinked at zero"""
+        with self._lock:
+            count = self._refs.get(shared.path)
+            if count is None:
+                return
+            if count > 1:
+                self._refs[shared.path] = count - 1
+                return
+            del self._refs[shared.path]
+        _remove_quietly(shared.path)
+
+    @property
+    def live_files(self) -> int:
+        """Shared files still referenced"""
+        with self._lock:
+            return len(self._refs)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers and unlink every shared file this pool owns"""
+        self._executor.shutdown(wait=wait)
+        with self._lock:
+            paths, self._refs = list(self._refs), {}
+        for path in paths:
+            _remove_quietly(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def _adopt(self, shared: SharedTable):
+        with self._lock:
+            self._refs[shared.path] = 1
+
+    def _retain(self, shared: SharedTable):
+        with self._lock:
+            if shared.path not in self._refs:
+                raise ValueError(f"Shared table was already released: {shared.path}")
+            self._refs[shared.path] += 1
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# === Benchmark: pickle vs shared-memory handoff ===
+
+def _checksum(table: pa.Table) -> int:
+    """Touches every value of the first column (stands in for real work)"""
+    import pyarrow.compute as pc
+    return pc.sum(table.column(0)).as_py()
+
+
+def _benchmark(rows: int, tasks: int, workers: int):
+    import time
+    import pyarrow.compute as pc
+
+    table = pa.table({
+        "id": pa.array(range(rows), pa.int64()),
+        "value": pc.multiply(pa.array(range(rows), pa.float64()), 0.5),
+        "market": pa.array([f"M{i % 50:02d}" for i in range(rows)]).dictionary_encode(),
+    })
+    print(f"Handoff benchmark: {rows:,} rows ({table.nbytes / 1e6:.1f} MB), "
+          f"{tasks} tasks, {workers} workers")
+
+    with ArrowProcessPool(max_workers=workers) as pool:
+        # Warm up the workers (imports, process start)
+        warmup = pa.table({"x": [1]})
+        for f in [pool.submit(_checksum, warmup) for _ in range(workers)]:
+            f.result()
+
+        start = time.perf_counter()
+        futures = [pool._executor.submit(_checksum, table) for _ in range(tasks)]
+        pickled = [f.result() for f in futures]
+        pickle_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with pool.shared(table) as shared:
+            futures = [pool.submit(_checksum, shared) for _ in range(tasks)]
+            zero_copy = [f.result() for f in futures]
+        shared_s = time.perf_counter() - start
+        assert pickled == zero_copy
+        assert pool.live_files == 0
+
+    print(f"  pickle:        {pickle_s * 1000 / tasks:8.1f} ms/task")
+    print(f"  shared memory: {shared_s * 1000 / tasks:8.1f} ms/task "
+          f"({pickle_s / shared_s:.1f}x, file written once: {shared.nbytes / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pickle vs zero-copy Arrow handoff to worker processes")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--tasks", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+    _benchmark(args.rows, args.tasks, args.workers)
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Background Cache Warmer for Hot Queries
+
+After a deploy or a cubesqld restart the first users pay for cold caches
+(the "cache MISS" run of test_cache_warmup_and_hit takes several times
+longer than the hit). The warmer replays the queries that matter most
+before users ask for them:
+
+- HotQueryLog: per-fingerprint tally of executed queries (SQL with literals
+  stripped, see sql_normalize.fingerprint_sql) with the latest SQL text,
+  count and total time, persisted atomically as JSON. Queries are ranked by
+  total time (frequency x latency), decayed by age, so a frequent slow
+  query outranks a one-off and last week's reports fade out.
+- CacheWarmer: replays the top-N on a bounded thread pool at a rate limit.
+  Each replay refreshes cubesqld's Arrow results cache and stores the
+  result in a client-side ResultCache. Running in the background, it
+  re-warms every entry once it is within `refresh_ahead` of its TTL, so hot
+  results never expire under users. A result the cache doesn't keep is
+  replayed at most once per `interval`.
+
+Usage:
+    log = HotQueryLog("/var/lib/cube/hot_queries.json")
+    gateway = CubeFlightGateway(pool=pool, cache=cache, hot_queries=log)
+
+    warmer = CacheWarmer(pool, cache, HotQueryLog.load("/var/lib/cube/hot_queries.json"),
+                         top_n=50, max_workers=4, rate=10.0)
+    warmer.start()      # warm now, then keep hot entries fresh
+
+    python cache_warmer.py --log hot_queries.json --top 50 --rate 10
+"""
+
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Union
+
+from result_cache import ResultCache
+from sql_normalize import fingerprint_sql, normalize_sql
+
+
+@dataclass
+class HotQuery:
+    """One query fingerprint in the log"""
+    sql: str             # latest SQL text seen for the fingerprint (replayable)
+    count: int = 0
+    total_seconds: float = 0.0
+    last_seen: float = 0.0  # unix time
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count else 0.0
+
+
+class HotQueryLog:
+    """Thread-safe per-fingerprint query tally, persisted as JSON"""
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1000,
+                 half_life: float = 86400.0, max_age: float = 7 * 86400.0,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            path: Default file for save()
+            max_entries: Fingerprints kept (the lowest ranked are dropped)
+            half_life: Seconds after which a query's weight halves
+            max_age: Queries not seen for this long are dropped
+            clock: Wall-clock time source (injectable for tests)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.half_life = half_life
+        self.max_age = max_age
+        self.clock = clock
+        self.entries: Dict[str, HotQuery] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def record(self, sql: str, seconds: float, count: int = 1):
+        """Count an executed query and its latency"""
+        fingerprint = fingerprint_sql(sql)
+        now = self.clock()
+        with self._lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                entry = self.entries[fingerprint] = HotQuery(sql)
+            entry.sql = sql
+            entry.count += count
+            entry.total_seconds += seconds
+            entry.last_seen = now
+            if len(self.entries) > 2 * self.max_entries:
+                self._trim(now)
+
+    def score(self, entry: HotQuery, now: Optional[float] = None) -> float:
+        """Total seconds spent on the query, halved every `half_life` since last seen"""
+        age = max((self.clock() if now is None else now) - entry.last_seen, 0.0)
+        return entry.total_seconds * 0.5 ** (age / self.half_life)
+
+    def top(self, n: int) -> List[HotQuery]:
+        """The `n` highest ranked queries that are not too old"""
+        now = self.clock()
+        with self._lock:
+            entries = [e for e in self.entries.values() if now - e.last_seen <= self.max_age]
+        entries.sort(key=lambda e: self.score(e, now), reverse=True)
+        return entries[:n]
+
+    def _trim(self, now: float):
+        ranked = sorted(self.entries.items(), key=lambda item: self.score(item[1], now), reverse=True)
+        self.entries = {fingerprint: entry for fingerprint, entry in ranked[:self.max_entries]
+                        if now - entry.last_seen <= self.max_age}
+
+    def save(self, path: Optional[str] = None):
+        """Write the log atomically (readers never see a partial file)"""
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path given for the hot query log")
+        with self._lock:
+            self._trim(self.clock())
+            data = {fingerprint: asdict(entry) for fingerprint, entry in self.entries.items()}
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".hot_queries_", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": 1, "queries": data}, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "HotQueryLog":
+        """Log saved by save(); an empty log if the file doesn't exist yet"""
+        log = cls(path, **kwargs)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return log
+        log.entries = {fingerprint: HotQuery(**entry) for fingerprint, entry in data["queries"].items()}
+        return log
+
+
+@dataclass
+class WarmerStats:
+    """Warm-up outcome counters"""
+    cycles: int = 0
+    warmed: int = 0      # queries replayed into an empty cache slot
+    refreshed: int = 0   # queries replayed ahead of TTL expiry
+    fresh: int = 0       # skipped: cached and not yet due
+    held: int = 0        # skipped: replayed within `interval` but not kept by the cache
+    errors: int = 0
+    seconds: float = 0.0  # time spent in replays
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart"""
+
+    def __init__(self, rate: Optional[float]):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, stopped: threading.Event) -> bool:
+        """Block until the next slot; False if `stopped` was set meanwhile"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        return not stopped.wait(slot - now) if slot > now else not stopped.is_set()
+
+
+QuerySource = Union[HotQueryLog, Sequence[str]]
+
+# Cache value standing in for a result that was only warmed server-side
+_WARMED = object()
+
+
+class CacheWarmer:
+    """Replays hot queries into the client cache and cubesqld's results cache"""
+
+    def __init__(self, pool, cache: ResultCache, queries: QuerySource, top_n: int = 50,
+                 max_workers: int = 4, rate: Optional[float] = 10.0, refresh_ahead: float = 0.2,
+                 interval: float = 60.0, key: Callable[[str], Hashable] = normalize_sql,
+                 keep_results: bool = True):
+        """
+        Args:
+            pool: Anything with `query(sql)` returning a QueryResult, e.g.
+                ArrowNativePool (its size should be >= max_workers)
+            cache: Cache receiving the results (what users read from)
+            queries: HotQueryLog (re-ranked every cycle) or a fixed SQL list
+            top_n: Queries to keep warm
+            max_workers: Concurrent replays
+            rate: Max replays started per second (None = unlimited)
+            refresh_ahead: Re-warm entries once less than this fraction of
+                the cache TTL is left
+            interval: Max seconds between cycles (new hot queries are
+                picked up at the next cycle)
+            key: Cache key of a SQL string (same as the cache's readers use)
+            keep_results: False stores only a marker in `cache`, to track
+                expiry when only cubesqld's cache is warmed
+        """
+        self.pool = pool
+        self.cache = cache
+        self.queries = queries
+        self.top_n = top_n
+        self.max_workers = max_workers
+        self.refresh_ahead = refresh_ahead
+        self.interval = interval
+        self.key = key
+        self.keep_results = keep_results
+        self.stats = WarmerStats()
+        self._limiter = _RateLimiter(rate)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="cache-warmer")
+        self._lock = threading.Lock()
+        # Cache key -> monotonic time of its last successful replay
+        self._replayed: Dict[Hashable, float] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def hot_sql(self) -> List[str]:
+        """SQL to keep warm, hottest first"""
+        if isinstance(self.queries, HotQueryLog):
+            return [entry.sql for entry in self.queries.top(self.top_n)]
+        return list(self.queries)[:self.top_n]
+
+    def _refresh_window(self) -> float:
+        ttl = self.cache.ttl
+        return self.refresh_ahead * ttl if ttl is not None else 0.0
+
+    def due(self, sql: str) -> Optional[str]:
+        """"warm" if not cached, "refresh" if expiring soon, None if fresh"""
+        remaining = self.cache.expires_in(self.key(sql))
+        if remaining is None or remaining <= 0:
+            return "warm"
+        if remaining <= self._refresh_window():
+            return "refresh"
+        return None
+
+    def _held_for(self, key: Hashable) -> float:
+        """Seconds an uncached entry waits before its next replay
+
+        A result the cache doesn't keep (larger than max_bytes, or evicted
+        because top_n exceeds max_entries) would otherwise be replayed on
+        every cycle.
+        """
+        with self._lock:
+            replayed = self._replayed.get(key)
+        return 0.0 if replayed is None else replayed + self.interval - time.monotonic()
+
+    def warm(self, force: bool = False) -> int:
+        """Replay every hot query that is due (all with `force`); returns replays started"""
+        futures = []
+        hot = self.hot_sql()
+        keys = {self.key(sql) for sql in hot}
+        with self._lock:
+            for key in [k for k in self._replayed if k not in keys]:
+                del self._replayed[key]
+        for sql in hot:
+            reason = "warm" if force else self.due(sql)
+            if reason is None:
+                with self._lock:
+                    self.stats.fresh += 1
+                continue
+            if reason == "warm" and not force and self._held_for(self.key(sql)) > 0:
+                with self._lock:
+                    self.stats.held += 1
+                continue
+            if not self._limiter.wait(self._stopped):
+                break
+            futures.append(self._executor.submit(self._replay, sql, reason))
+        for future in futures:
+            future.result()
+        with self._lock:
+            self.stats.cycles += 1
+        return len(futures)
+
+    def _replay(self, sql: str, reason: str):
+        started = time.perf_counter()
+        try:
+            table = self.pool.query(sql).to_table()
+        except Exception:
+            # Keep warming the rest (QueryError, connection or decoding
+            # errors alike); a failing query is retried next cycle
+            with self._lock:
+                self.stats.errors += 1
+            return
+        elapsed = time.perf_counter() - started
+        # Replays are not recorded in the log: they are not user demand
+        key = self.key(sql)
+        self.cache.put(key, table if self.keep_results else _WARMED)
+        with self._lock:
+            self._replayed[key] = time.monotonic()
+            self.stats.seconds += elapsed
+            if reason == "refresh":
+                self.stats.refreshed += 1
+            else:
+                self.stats.warmed += 1
+
+    def next_due(self) -> float:
+        """Seconds until the first hot entry is due: enters its refresh
+        window, or is uncached and no longer held (see _held_for)
+        """
+        window = self._refresh_window()
+        soonest = self.interval
+        for sql in self.hot_sql():
+            key = self.key(sql)
+            remaining = self.cache.expires_in(key)
+            if remaining is None or remaining <= 0:
+                soonest = min(soonest, self._held_for(key))
+            else:
+                soonest = min(soonest, remaining - window)
+        return max(soonest, 0.0)
+
+    def start(self) -> "CacheWarmer":
+        """Warm now, then re-warm in the background until stop()"""
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="cache-warmer")
+            self._thread.start()
+        return self
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            errors = self.stats.errors
+            self.warm()
+            # A due entry that failed is not retried before the next interval
+            delay = self.next_due() if self.stats.errors == errors else self.interval
+            self._stopped.wait(max(delay, 0.05))
+
+    def stop(self):
+        self._stopped.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        self.stop()
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load_queries(paths: Iterable[str]) -> HotQueryLog:
+    """Merge saved hot query logs (e.g. one per client host)"""
+    merged = HotQueryLog()
+    for path in paths:
+        log = HotQueryLog.load(path)
+        for fingerprint, entry in log.entries.items():
+            current = merged.entries.get(fingerprint)
+            if current is None:
+                merged.entries[fingerprint] = entry
+                continue
+            current.count += entry.count
+            current.total_seconds += entry.total_seconds
+            if entry.last_seen > current.last_seen:
+                current.sql, current.last_seen = entry.sql, entry.last_seen
+    return merged
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from arrow_native_pool import ArrowNativePool
+
+    parser = argparse.ArgumentParser(description="Replay hot queries to warm cubesqld's result cache")
+    parser.add_argument("--log", action="append", required=True, help="hot query log (repeatable)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=4445)
+    parser.add_argument("--token", default="test")
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=10.0, help="max replays per second")
+    parser.add_argument("--ttl", type=float, default=300.0,
+                        help="server cache TTL; with --every, re-warm ahead of it")
+    parser.add_argument("--every", action="store_true", help="keep running and re-warm ahead of TTL")
+    args = parser.parse_args()
+
+    log = load_queries(args.log)
+    for entry in log.top(args.top):
+        print(f"  {entry.count:>7} x {entry.mean_seconds * 1000:8.1f} ms  {fingerprint_sql(entry.sql)[:90]}")
+    # Results are not kept in this process: the cache only tracks expiry
+    cache = ResultCache(max_entries=args.top, ttl=args.ttl)
+    with ArrowNativePool(args.host, args.port, args.token, max_size=args.workers) as pool, \
+            CacheWarmer(pool, cache, log, top_n=args.top, max_workers=args.workers, rate=args.rate,
+                        keep_results=False) as warmer:
+        started = time.perf_counter()
+        warmer.warm(force=True)
+        print(f"✓ Warmed {warmer.stats.warmed} queries in {time.perf_counter() - started:.1f}s "
+              f"({warmer.stats.errors} errors)")
+        if args.every:
+            warmer.start()
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,57 @@
+"""
+Shared pytest fixtures: a controllable clock and stand-in Arrow Native
+servers answering every query with one table
+"""
+
+from typing import Callable, List
+
+import pyarrow as pa
+import pytest
+
+from arrow_native_client import QueryError
+from arrow_native_mock_server import MockArrowNativeServer
+
+
+class FakeClock:
+    """Clock for the `clock=` parameters; advance it through `now`"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def table_handler(table: pa.Table) -> Callable[[str], pa.Table]:
+    """Mock server handler: `table` for every query, QueryError for SQL containing "bad" """
+
+    def handler(sql: str) -> pa.Table:
+        if "bad" in sql:
+            raise QueryError("BAD", "bad query")
+        return table
+    return handler
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def mock_server():
+    """
+    Factory starting MockArrowNativeServers answering with a table
+    (see table_handler); every server is stopped at teardown.
+
+        server = mock_server(TABLE, batch_size=50, latency=0.2)
+    """
+    started: List[MockArrowNativeServer] = []
+
+    def start(table: pa.Table, **kwargs) -> MockArrowNativeServer:
+        server = MockArrowNativeServer(table_handler(table), **kwargs).start()
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.stop()
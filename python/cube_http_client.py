@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Cube REST API Client (HTTP baseline)
+
+A fair HTTP counterpart to ArrowNativeClient for benchmarks and for callers
+that must use the REST API:
+- one `requests.Session` with a pooled, keep-alive `HTTPAdapter`, so TCP/TLS
+  setup is paid once per connection instead of once per query
+- the fastest available JSON parser (orjson if installed, else stdlib json)
+- conversion of the `/load` response `data` rows into a typed `pa.Table`,
+  column by column, using the response `annotation` for types
+
+Both APIs are then measured to the same endpoint: an Arrow table in hand.
+
+Requirements:
+    pip install requests pyarrow
+    pip install orjson   # optional, faster JSON parsing
+
+Usage:
+    with CubeHttpClient("http://localhost:4000/cubejs-api/v1/load", token="test") as client:
+        table = client.load({"measures": ["orders.count"], "dimensions": ["orders.brand"]})
+"""
+
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import pyarrow as pa
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+    _loads: Callable[[bytes], Any] = orjson.loads
+    _dumps: Callable[[Any], bytes] = orjson.dumps
+    JSON_PARSER = "orjson"
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    JSON_PARSER = "json"
+
+
+# Cube annotation type -> Arrow type
+_ANNOTATION_TYPES = {
+    "number": pa.float64(),
+    "count": pa.int64(),
+    "string": pa.string(),
+    "boolean": pa.bool_(),
+    "time": pa.timestamp("ms"),
+}
+
+
+def _column(values: List[Any], cube_type: Optional[str]) -> pa.Array:
+    """Build one typed column from raw JSON values
+
+    The Arrow type depends on the annotation alone, never on the values, so
+    one query always yields one schema ("number" is float64 even when every
+    value is integral). Cube serializes most measures as strings; they are
+    parsed with a single vectorized Arrow cast rather than per-value Python
+    conversions.
+    """
+    target = _ANNOTATION_TYPES.get(cube_type or "string", pa.string())
+    try:
+        array = pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed JSON types (1 and "a"): cast from their JSON text instead
+        array = pa.array([v if v is None or isinstance(v, str) else json.dumps(v) for v in values],
+                         pa.string())
+    if array.type == target:
+        return array
+    if pa.types.is_null(array.type):
+        return pa.nulls(len(values), type=target)
+    try:
+        return array.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        if pa.types.is_timestamp(target):
+            # ISO timestamps with a zone offset ("...Z"): normalize to UTC
+            try:
+                return array.cast(pa.timestamp(target.unit, "UTC")).cast(target)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                pass
+        raise ValueError(f"Values of Cube type {cube_type!r} don't convert to {target}") from None
+
+
+def annotation_types(annotation: Dict[str, Any]) -> Dict[str, str]:
+    """Flatten a `/load` annotation into {member: cube type}"""
+    types: Dict[str, str] = {}
+    for section in ("measures", "dimensions", "segments", "timeDimensions"):
+        for member, meta in (annotation.get(section) or {}).items():
+            types[member] = meta.get("type", "string")
+    return types
+
+
+def response_to_table(response: Dict[str, Any]) -> pa.Table:
+    """Convert a `/load` response (default or compact format) to a typed table"""
+    types = annotation_types(response.get("annotation") or {})
+
+    if "members" in response and "dataset" in response:
+        # responseFormat=compact: rows are positional lists
+        members = response["members"]
+        rows = response["dataset"]
+        columns = [[row[i] for row in rows] for i in range(len(members))]
+    else:
+        rows = response.get("data") or []
+        members = list(rows[0].keys()) if rows else list(types)
+        columns = [[row.get(m) for row in rows] for m in members]
+
+    arrays = [_column(values, types.get(member)) for member, values in zip(members, columns)]
+    return pa.Table.from_arrays(arrays, names=members)
+
+
+class CubeHttpClient:
+    """Pooled keep-alive client for the Cube REST `/load` endpoint"""
+
+    def __init__(self, url: str = "http://localhost:4000/cubejs-api/v1/load",
+                 token: str = "test", pool_size: int = 10,
+                 compact: bool = False, timeout: float = 60.0,
+                 continue_wait_interval: float = 0.1):
+        """
+        Args:
+            url: Full `/load` endpoint URL
+            token: Cube API token (sent as Authorization header)
+            pool_size: Max keep-alive connections held by the session
+            compact: Request `responseFormat: "compact"` (smaller payloads,
+                needs a recent Cube version)
+            timeout: Per-request timeout in seconds
+            continue_wait_interval: Delay before retrying "Continue wait"
+        """
+        self.url = url
+        self.compact = compact
+        self.timeout = timeout
+        self.continue_wait_interval = continue_wait_interval
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": token,
+            "Content-Type": "application/json",
+        })
+
+    def load_json(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """POST a query and return the parsed response, waiting out "Continue wait\""""
+        body = {"query": dict(query)}
+        if self.compact:
+            body["query"]["responseFormat"] = "compact"
+        payload = _dumps(body)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            response = self.session.post(self.url, data=payload, timeout=self.timeout)
+            data = _loads(response.content)
+            if isinstance(data, dict) and data.get("error") == "Continue wait":
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Cube query still in progress after timeout")
+                time.sleep(self.continue_wait_interval)
+                continue
+            if response.status_code >= 400 or (isinstance(data, dict) and "error" in data):
+                message = data.get("error") if isinstance(data, dict) else response.text
+                raise RuntimeError(f"Cube HTTP error [{response.status_code}]: {message}")
+            return data
+
+    def load(self, query: Dict[str, Any]) -> pa.Table:
+        """Execute a query and return a typed Arrow table"""
+        return response_to_table(self.load_json(query))
+
+    def close(self):
+        """Close pooled connections"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    query = {
+        "measures": ["orders_with_preagg.count"],
+        "dimensions": ["orders_with_preagg.market_code"],
+        "limit": 200,
+    }
+
+    print(f"Testing Cube HTTP client (JSON parser: {JSON_PARSER})")
+    print("=" * 60)
+
+    with CubeHttpClient(token="test") as client:
+        for i in range(3):
+            start = time.perf_counter()
+            table = client.load(query)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"✓ Run {i + 1}: {table.num_rows} rows in {elapsed_ms:.1f}ms")
+        print(f"✓ Schema: {table.schema}")
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Client Metrics for the Cube Python Clients
+
+Counterpart of the Elixir app's telemetry for ArrowNativeClient and the
+pools/caches built on it:
+- latency histograms per query fingerprint (SQL with literals stripped,
+  see sql_normalize.fingerprint_sql), log-bucketed: 4 sub-buckets per
+  power of two (<= 25% relative error) from ~1us to ~17min
+- counters: queries, errors, bytes in/out, batches, cache hits/misses,
+  pool waits, connections opened
+- Prometheus text exposition, served over a local HTTP endpoint or written
+  atomically to a file (for node_exporter's textfile collector)
+- optional OpenTelemetry span per query (if opentelemetry-api is installed)
+
+Recording takes no lock (per-thread shards, merged on export; a thread's
+shard is folded into a retired total when the thread exits) and costs
+well under 1us per event; run `python cube_metrics.py` for the
+microbenchmark.
+
+Usage:
+    metrics = Metrics()
+    client = ArrowNativeClient(host="localhost", port=4445, metrics=metrics).connect()
+    client.query(sql)
+
+    metrics.serve(port=9464)                 # http://127.0.0.1:9464/metrics
+    metrics.write_prometheus("/var/lib/node_exporter/cube_client.prom")
+"""
+
+import contextlib
+import hashlib
+import math
+import os
+import tempfile
+import threading
+import weakref
+from bisect import bisect_right as _bisect_right
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ContextManager, Dict, List, Optional, Tuple
+
+from sql_normalize import fingerprint_sql
+
+try:
+    from opentelemetry import trace as _otel_trace
+except ImportError:
+    _otel_trace = None
+
+# Counter name -> help text
+COUNTERS = {
+    "queries": "Queries executed",
+    "errors": "Queries that failed",
+    "bytes_in": "Bytes received from the server",
+    "bytes_out": "Bytes sent to the server",
+    "batches": "Record batches received",
+    "cache_hits": "Client-side cache hits",
+    "cache_misses": "Client-side cache misses",
+    "pool_waits": "Pool checkouts that had to wait for a connection",
+    "connections_opened": "Connections opened",
+}
+
+_SUB_BUCKETS = 4
+_MIN_EXPONENT = -19   # 2**-20 s ~ 1us
+_MAX_EXPONENT = 10    # 2**10 s ~ 17min
+_NUM_BUCKETS = (_MAX_EXPONENT - _MIN_EXPONENT + 1) * _SUB_BUCKETS
+
+
+def _upper_bound(index: int) -> float:
+    """Exclusive upper bound of bucket `index`: 2**e * (0.5 + (k + 1) / 8)"""
+    exponent, sub = divmod(index, _SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub + 1) / (2 * _SUB_BUCKETS), exponent + _MIN_EXPONENT)
+
+
+# The last bucket is open-ended
+_UPPER_BOUNDS = [_upper_bound(i) for i in range(_NUM_BUCKETS - 1)]
+
+
+class LogHistogram:
+    """Log-bucketed histogram of durations in seconds
+
+    Each power of two [2**(e-1), 2**e) is split into 4 linear sub-buckets
+    with upper bounds 2**e * (0.5 + (k + 1) / 8); values outside the range
+    are clamped into the first/last bucket.
+    """
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+
+    @staticmethod
+    def bucket(seconds: float) -> int:
+        return _bisect_right(_UPPER_BOUNDS, seconds)
+
+    @staticmethod
+    def upper_bound(index: int) -> float:
+        return _upper_bound(index)
+
+    def record(self, seconds: float):
+        """Not thread-safe - Metrics gives every thread its own histograms"""
+        # A C-level bisect beats computing the index from math.frexp here
+        self.counts[_bisect_right(_UPPER_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other: "LogHistogram"):
+        for index, n in enumerate(list(other.counts)):
+            self.counts[index] += n
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (q in [0, 1])"""
+        if not self.count:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return self.upper_bound(index)
+        return self.upper_bound(_NUM_BUCKETS - 1)
+
+    def octaves(self) -> List[Tuple[float, int]]:
+        """Cumulative (le, count) per power of two, for Prometheus buckets"""
+        cumulative = []
+        seen = 0
+        for octave in range(_MAX_EXPONENT - _MIN_EXPONENT + 1):
+            seen += sum(self.counts[octave * _SUB_BUCKETS:(octave + 1) * _SUB_BUCKETS])
+            cumulative.append((math.ldexp(1.0, octave + _MIN_EXPONENT), seen))
+        return cumulative
+
+
+class _Shard:
+    """Counters and histograms written by one thread only"""
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters: Dict[str, float] = dict.fromkeys(COUNTERS, 0)
+        self.histograms: Dict[str, LogHistogram] = {}
+
+    def merge(self, other: "_Shard"):
+        for name, value in other.counters.items():
+            self.counters[name] += value
+        other_bucket = other.histograms.get("other")
+        for fingerprint, histogram in other.histograms.items():
+            if fingerprint != "other" and histogram is other_bucket:
+                continue  # alias of "other"
+            total = self.histograms.get(fingerprint)
+            if total is None:
+                total = self.histograms[fingerprint] = LogHistogram()
+            total.merge(histogram)
+
+
+class _ShardOwner:
+    """Thread-local handle; collected (with its thread's locals) on thread exit"""
+    __slots__ = ("__weakref__",)
+
+
+def _retire(metrics_ref: "weakref.ref[Metrics]", shard: _Shard):
+    metrics = metrics_ref()
+    if metrics is not None:
+        metrics._retire(shard)
+
+
+class Metrics:
+    """Registry of client counters and per-fingerprint latencies
+
+    Every thread records into its own shard, so recording takes no lock;
+    exports merge the shards (a concurrent export may miss in-flight
+    increments, never double count them). When a thread exits its shard
+    is folded into a retired total, so short-lived worker threads don't
+    grow memory or export cost.
+    """
+
+    def __init__(self, namespace: str = "cube_client", max_fingerprints: int = 500,
+                 otel: bool = False):
+        """
+        Args:
+            namespace: Prefix of every exported metric name
+            max_fingerprints: Distinct query fingerprints tracked; further
+                shapes are folded into fingerprint "other"
+            otel: Emit an OpenTelemetry span per query (needs
+                opentelemetry-api; ignored when it is missing)
+        """
+        self.namespace = namespace
+        self.max_fingerprints = max_fingerprints
+        self.statements: Dict[str, str] = {}
+        self._fingerprints: Dict[str, str] = {}
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard()
+        # Reentrant: a shard may retire on a thread already holding the lock
+        self._lock = threading.RLock()
+        self._tracer = _otel_trace.get_tracer(namespace) if otel and _otel_trace else None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def fingerprint(self, sql: str) -> str:
+        """Short stable id of a query's shape (memoized per SQL string)"""
+        fingerprint = self._fingerprints.get(sql)
+        if fingerprint is None:
+            statement = fingerprint_sql(sql)
+            fingerprint = hashlib.sha256(statement.encode("utf-8")).hexdigest()[:12]
+            with self._lock:
+                if len(self._fingerprints) >= 4 * self.max_fingerprints:
+                    self._fingerprints.clear()
+                self._fingerprints[sql] = fingerprint
+                if fingerprint not in self.statements and len(self.statements) < self.max_fingerprints:
+                    self.statements[fingerprint] = statement
+        return fingerprint
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            return self._new_shard()
+
+    def _new_shard(self) -> _Shard:
+        shard = self._local.shard = _Shard()
+        owner = self._local.owner = _ShardOwner()
+        weakref.finalize(owner, _retire, weakref.ref(self), shard)
+        with self._lock:
+            self._shards.append(shard)
+        return shard
+
+    def _retire(self, shard: _Shard):
+        # The owning thread is gone: nothing writes to the shard any more
+        with self._lock:
+            self._shards.remove(shard)
+            self._retired.merge(shard)
+
+    def _histogram(self, shard: _Shard, fingerprint: str) -> LogHistogram:
+        histogram = shard.histograms.get(fingerprint)
+        if histogram is None:
+            if fingerprint != "other" and fingerprint not in self.statements:
+                # Over the cardinality limit: alias to "other"
+                histogram = self._histogram(shard, "other")
+            else:
+                histogram = LogHistogram()
+            shard.histograms[fingerprint] = histogram
+        return histogram
+
+    def inc(self, name: str, value: float = 1):
+        """Increment a counter (see COUNTERS)"""
+        self._shard().counters[name] += value
+
+    def observe(self, fingerprint: str, seconds: float):
+        """Record one query latency"""
+        shard = self._shard()
+        histogram = shard.histograms.get(fingerprint) or self._histogram(shard, fingerprint)
+        histogram.record(seconds)
+
+    def record_query(self, sql: str, seconds: float, bytes_in: int = 0, bytes_out: int = 0,
+                     batches: int = 0, error: bool = False):
+        """Record a finished query: latency plus its counters"""
+        fingerprint = self._fingerprints.get(sql) or self.fingerprint(sql)
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+        histogram = shard.histograms.get(fingerprint) or self._histogram(shard, fingerprint)
+        histogram.record(seconds)
+        counters = shard.counters
+        counters["queries"] += 1
+        counters["bytes_in"] += bytes_in
+        counters["bytes_out"] += bytes_out
+        counters["batches"] += batches
+        if error:
+            counters["errors"] += 1
+
+    @property
+    def counters(self) -> Dict[str, float]:
+        """Counter totals across threads"""
+        totals = dict.fromkeys(COUNTERS, 0)
+        # Under the lock: a shard retiring meanwhile must not be seen twice
+        with self._lock:
+            for shard in [self._retired] + self._shards:
+                for name, value in list(shard.counters.items()):
+                    totals[name] += value
+        return totals
+
+    @property
+    def histograms(self) -> Dict[str, LogHistogram]:
+        """Per-fingerprint histograms merged across threads"""
+        merged: Dict[str, LogHistogram] = {}
+        with self._lock:
+            for shard in [self._retired] + self._shards:
+                for fingerprint, histogram in list(shard.histograms.items()):
+                    if fingerprint != "other" and fingerprint not in self.statements:
+                        continue  # alias of "other"
+                    total = merged.get(fingerprint)
+                    if total is None:
+                        total = merged[fingerprint] = LogHistogram()
+                    total.merge(histogram)
+        return merged
+
+    def span(self, sql: str) -> ContextManager:
+        """OpenTelemetry span for one query (no-op without otel)"""
+        if self._tracer is None:
+            return contextlib.nullcontext()
+        return self._tracer.start_as_current_span(
+            "cube.query", attributes={"db.system": "cube",
+                                      "db.statement": fingerprint_sql(sql),
+                                      "cube.query.fingerprint": self.fingerprint(sql)})
+
+    # === Export ===
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        ns = self.namespace
+        counters = self.counters
+        histograms = {fp: (h.octaves(), h.count, h.sum) for fp, h in self.histograms.items()}
+        with self._lock:
+            statements = dict(self.statements)
+
+        lines = []
+        for name, help_text in COUNTERS.items():
+            metric = f"{ns}_{name}_total"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {_number(counters[name])}")
+
+        metric = f"{ns}_query_duration_seconds"
+        lines.append(f"# HELP {metric} Query latency by query fingerprint")
+        lines.append(f"# TYPE {metric} histogram")
+        for fingerprint in sorted(histograms):
+            octaves, count, total = histograms[fingerprint]
+            label = f'fingerprint="{fingerprint}"'
+            for le, cumulative in octaves:
+                lines.append(f'{metric}_bucket{{{label},le="{le:.9g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum{{{label}}} {total!r}")
+            lines.append(f"{metric}_count{{{label}}} {count}")
+
+        metric = f"{ns}_query_info"
+        lines.append(f"# HELP {metric} Normalized statement of each query fingerprint")
+        lines.append(f"# TYPE {metric} gauge")
+        for fingerprint in sorted(statements):
+            statement = _escape_label(statements[fingerprint][:200])
+            lines.append(f'{metric}{{fingerprint="{fingerprint}",statement="{statement}"}} 1')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Write the exposition atomically (textfile collector friendly)"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".cube_metrics_", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve /metrics from a daemon thread; returns the server"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True,
+                         name="cube-metrics").start()
+        return self._server
+
+    def close(self):
+        """Stop the HTTP endpoint, if serving"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Microbenchmark
+if __name__ == "__main__":
+    import timeit
+
+    iterations = 100_000
+    metrics = Metrics()
+    sql = "SELECT market_code, COUNT(*) FROM orders WHERE updated_at >= '2024-06-01' GROUP BY 1"
+    fingerprint = metrics.fingerprint(sql)
+
+    def bench(label: str, fn, events: int = 1):
+        # Best of 5 runs: the least disturbed by other load on the machine
+        per_call = min(timeit.repeat(fn, number=iterations, repeat=5)) / iterations * 1e9
+        print(f"  {label:32} {per_call:7.0f} ns/call  {per_call / events:7.0f} ns/event")
+
+    print(f"Metrics microbenchmark (best of 5 x {iterations} calls)")
+    print("=" * 60)
+    bench("empty call", lambda: None)
+    bench("inc(counter)", lambda: metrics.inc("batches"))
+    bench("observe(fingerprint, seconds)", lambda: metrics.observe(fingerprint, 0.0042))
+    # One latency sample + 4 counters
+    bench("record_query(sql, ...)", lambda: metrics.record_query(sql, 0.0042, 1024, 128, 2), events=5)
+    bench("span(sql) (otel disabled)", lambda: metrics.span(sql))
+    print(f"\n{len(metrics.render_prometheus().splitlines())} exposition lines, "
+          f"p50={metrics.histograms[fingerprint].quantile(0.5) * 1000:.2f}ms")
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Semantic Query Builder for CubeSQL
+
+Python counterpart of the Elixir `ExamplesOfPoT.CubeQuery.query_cube/1` helper.
+Builds `SELECT ... MEASURE(...) ... GROUP BY` SQL from a structured query spec
+(cube, measures, dimensions, filters, time dimension, limit) instead of
+hand-written SQL strings.
+
+Every spec is canonicalized on construction:
+- member names are qualified with the cube name ("count" -> "orders.count")
+- measures, dimensions and filters are de-duplicated and sorted
+- filter values of set-style operators are sorted
+
+so textually different but equivalent requests compile to the same SQL and
+the same cache key. Compiled SQL is memoized per canonical spec.
+
+Note: because columns are emitted in canonical order, consumers should select
+result columns by name, not by position.
+
+Usage:
+    q = CubeQuery(
+        cube="orders_with_preagg",
+        measures=["count", "total_amount_sum"],
+        dimensions=["market_code", "brand_code"],
+        time_dimension=TimeDimension("updated_at", "day", ("2024-01-01", "2024-12-31")),
+        limit=500,
+    )
+    client.query(q.to_sql())
+"""
+
+import datetime
+import functools
+import hashlib
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional, Tuple
+
+
+GRANULARITIES = ("second", "minute", "hour", "day", "week", "month", "quarter", "year")
+
+# Cube REST filter operators supported by the builder, mapped to SQL
+_COMPARISON_OPERATORS = {
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+}
+_SET_OPERATORS = ("equals", "notEquals")
+_UNARY_OPERATORS = ("set", "notSet")
+_LIKE_OPERATORS = ("contains", "notContains")
+OPERATORS = tuple(_COMPARISON_OPERATORS) + _SET_OPERATORS + _UNARY_OPERATORS + _LIKE_OPERATORS
+
+
+def _qualify(cube: str, member: str) -> str:
+    """Qualify a member name with its cube ("count" -> "orders.count")"""
+    return member if "." in member else f"{cube}.{member}"
+
+
+def _sort_key(value: Any) -> Tuple[str, str]:
+    """Stable sort key for mixed-type filter values"""
+    return (type(value).__name__, repr(value))
+
+
+def _literal(value: Any) -> str:
+    """Render a Python value as a SQL literal"""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        value = value.isoformat()
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise TypeError(f"Unsupported filter value type: {type(value).__name__}")
+
+
+def _like_pattern(value: Any) -> str:
+    """LIKE pattern matching `value` as a literal substring (escape character: backslash)"""
+    text = str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return _literal(f"%{text}%")
+
+
+@dataclass(frozen=True)
+class Filter:
+    """Filter on a cube member, using Cube REST API operator names"""
+    member: str
+    operator: str = "equals"
+    values: Tuple[Any, ...] = ()
+
+    def __post_init__(self):
+        if self.operator not in OPERATORS:
+            raise ValueError(f"Unsupported filter operator: {self.operator}")
+        values = tuple(self.values)
+        if self.operator in _UNARY_OPERATORS:
+            if values:
+                raise ValueError(f"Operator {self.operator} takes no values")
+        elif not values:
+            raise ValueError(f"Operator {self.operator} requires at least one value")
+        elif self.operator in _COMPARISON_OPERATORS and len(values) != 1:
+            raise ValueError(f"Operator {self.operator} takes exactly one value")
+        if self.operator in _SET_OPERATORS or self.operator in _LIKE_OPERATORS:
+            values = tuple(sorted(set(values), key=_sort_key))
+        object.__setattr__(self, "values", values)
+
+    def to_sql(self) -> str:
+        """Render filter as a SQL predicate"""
+        if self.operator in _COMPARISON_OPERATORS:
+            return f"{self.member} {_COMPARISON_OPERATORS[self.operator]} {_literal(self.values[0])}"
+        if self.operator == "set":
+            return f"{self.member} IS NOT NULL"
+        if self.operator == "notSet":
+            return f"{self.member} IS NULL"
+        if self.operator in _SET_OPERATORS:
+            negate = self.operator == "notEquals"
+            if len(self.values) == 1:
+                return f"{self.member} {'<>' if negate else '='} {_literal(self.values[0])}"
+            items = ", ".join(_literal(v) for v in self.values)
+            return f"{self.member} {'NOT IN' if negate else 'IN'} ({items})"
+        # contains / notContains
+        like = "NOT LIKE" if self.operator == "notContains" else "LIKE"
+        joiner = " AND " if self.operator == "notContains" else " OR "
+        parts = [f"{self.member} {like} {_like_pattern(v)} ESCAPE '\\'" for v in self.values]
+        return parts[0] if len(parts) == 1 else "(" + joiner.join(parts) + ")"
+
+
+@dataclass(frozen=True)
+class TimeDimension:
+    """Time dimension with optional granularity and inclusive date range"""
+    dimension: str
+    granularity: Optional[str] = None
+    date_range: Optional[Tuple[str, str]] = None
+
+    def __post_init__(self):
+        if self.granularity is not None:
+            granularity = self.granularity.lower()
+            if granularity not in GRANULARITIES:
+                raise ValueError(f"Unsupported granularity: {self.granularity}")
+            object.__setattr__(self, "granularity", granularity)
+        if self.date_range is not None:
+            if len(self.date_range) != 2:
+                raise ValueError("date_range must be a (start, end) pair")
+            start, end = (v.isoformat() if isinstance(v, (datetime.date, datetime.datetime)) else str(v)
+                          for v in self.date_range)
+            object.__setattr__(self, "date_range", (start, end))
+
+    @property
+    def alias(self) -> str:
+        """Output column name for the truncated time dimension"""
+        return f"{self.dimension.rsplit('.', 1)[-1]}_{self.granularity}"
+
+    def select_sql(self) -> str:
+        return f"DATE_TRUNC('{self.granularity}', {self.dimension}) AS {self.alias}"
+
+    def range_sql(self) -> Optional[str]:
+        """Render date range as half-open predicate (end day is inclusive, as in Cube)"""
+        if self.date_range is None:
+            return None
+        start, end = self.date_range
+        try:
+            end_exclusive = (datetime.date.fromisoformat(end) + datetime.timedelta(days=1)).isoformat()
+            upper = f"{self.dimension} < {_literal(end_exclusive)}"
+        except ValueError:
+            # Full timestamp given - treat as inclusive upper bound
+            upper = f"{self.dimension} <= {_literal(end)}"
+        return f"{self.dimension} >= {_literal(start)} AND {upper}"
+
+
+@dataclass(frozen=True)
+class CubeQuery:
+    """Canonical Cube query spec
+
+    Equal specs (after canonicalization) compare and hash equal, compile to the
+    same SQL and share one cache key.
+    """
+    cube: str
+    measures: Tuple[str, ...] = ()
+    dimensions: Tuple[str, ...] = ()
+    filters: Tuple[Filter, ...] = ()
+    time_dimension: Optional[TimeDimension] = None
+    limit: Optional[int] = None
+
+    def __post_init__(self):
+        cube = self.cube
+        measures = tuple(sorted({_qualify(cube, m) for m in self.measures}))
+        dimensions = tuple(sorted({_qualify(cube, d) for d in self.dimensions}))
+
+        filters = []
+        for f in self.filters:
+            if isinstance(f, dict):
+                f = Filter(f["member"], f.get("operator", "equals"), tuple(f.get("values", ())))
+            filters.append(replace(f, member=_qualify(cube, f.member)))
+        filters = tuple(sorted(set(filters), key=lambda f: (f.member, f.operator, repr(f.values))))
+
+        time_dimension = self.time_dimension
+        if isinstance(time_dimension, dict):
+            time_dimension = TimeDimension(
+                time_dimension["dimension"],
+                time_dimension.get("granularity"),
+                tuple(time_dimension["dateRange"]) if time_dimension.get("dateRange") else None,
+            )
+        if time_dimension is not None:
+            time_dimension = replace(time_dimension, dimension=_qualify(cube, time_dimension.dimension))
+        # A time dimension without granularity only filters: it selects nothing
+        if not measures and not dimensions and (time_dimension is None or not time_dimension.granularity):
+            raise ValueError("Query needs at least one measure or dimension")
+
+        if self.limit is not None and (not isinstance(self.limit, int) or self.limit < 0):
+            raise ValueError(f"Invalid limit: {self.limit!r}")
+
+        object.__setattr__(self, "measures", measures)
+        object.__setattr__(self, "dimensions", dimensions)
+        object.__setattr__(self, "filters", filters)
+        object.__setattr__(self, "time_dimension", time_dimension)
+
+    @classmethod
+    def from_rest(cls, query: Dict[str, Any]) -> "CubeQuery":
+        """Build from a Cube REST API `/load` query dict
+
+        Only a single time dimension is supported.
+        """
+        members = list(query.get("measures", [])) + list(query.get("dimensions", []))
+        time_dimensions = query.get("timeDimensions", [])
+        if len(time_dimensions) > 1:
+            raise ValueError("Only one time dimension is supported")
+        if time_dimensions:
+            members.append(time_dimensions[0]["dimension"])
+        if not members:
+            raise ValueError("Query needs at least one measure or dimension")
+        cube = members[0].split(".", 1)[0]
+        return cls(
+            cube=cube,
+            measures=tuple(query.get("measures", ())),
+            dimensions=tuple(query.get("dimensions", ())),
+            filters=tuple(query.get("filters", ())),
+            time_dimension=time_dimensions[0] if time_dimensions else None,
+            limit=query.get("limit"),
+        )
+
+    def to_rest(self) -> Dict[str, Any]:
+        """Render as a Cube REST API `/load` query dict"""
+        query: Dict[str, Any] = {}
+        if self.measures:
+            query["measures"] = list(self.measures)
+        if self.dimensions:
+            query["dimensions"] = list(self.dimensions)
+        if self.filters:
+            query["filters"] = [
+                {"member": f.member, "operator": f.operator, "values": [str(v) for v in f.values]}
+                for f in self.filters
+            ]
+        if self.time_dimension is not None:
+            td: Dict[str, Any] = {"dimension": self.time_dimension.dimension}
+            if self.time_dimension.granularity:
+                td["granularity"] = self.time_dimension.granularity
+            if self.time_dimension.date_range:
+                td["dateRange"] = list(self.time_dimension.date_range)
+            query["timeDimensions"] = [td]
+        if self.limit is not None:
+            query["limit"] = self.limit
+        return query
+
+    def to_sql(self) -> str:
+        """Compile to canonical Cube SQL (memoized per spec)"""
+        return _compile_sql(self)
+
+    def cache_key(self) -> str:
+        """Stable cache key shared by all equivalent specs"""
+        return _cache_key(self)
+
+
+@functools.lru_cache(maxsize=4096)
+def _compile_sql(query: CubeQuery) -> str:
+    """Compile a canonical spec to SQL, following CubeQuery.build_cube_sql in Elixir"""
+    td = query.time_dimension
+    grouped = list(query.dimensions)
+    if td is not None and td.granularity:
+        grouped.append(td.select_sql())
+    select_items = grouped + [f"MEASURE({m})" for m in query.measures]
+
+    predicates = [f.to_sql() for f in query.filters]
+    if td is not None and td.date_range:
+        predicates.append(td.range_sql())
+
+    clauses = [
+        f"SELECT {', '.join(select_items)}",
+        f"FROM {query.cube}",
+        f"WHERE {' AND '.join(predicates)}" if predicates else None,
+        f"GROUP BY {', '.join(str(i) for i in range(1, len(grouped) + 1))}" if grouped else None,
+        f"LIMIT {query.limit}" if query.limit is not None else None,
+    ]
+    return "\n".join(c for c in clauses if c is not None)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cache_key(query: CubeQuery) -> str:
+    return hashlib.sha256(_compile_sql(query).encode("utf-8")).hexdigest()
+
+
+def compile_cache_info():
+    """Hit/miss statistics of the compiled-SQL memo"""
+    return _compile_sql.cache_info()
+
+
+# Example usage
+if __name__ == "__main__":
+    a = CubeQuery(
+        cube="orders_with_preagg",
+        measures=["count", "orders_with_preagg.total_amount_sum"],
+        dimensions=["market_code", "brand_code"],
+        time_dimension=TimeDimension("updated_at", "day", ("2024-01-01", "2024-12-31")),
+        filters=[Filter("financial_status", "equals", ("paid", "refunded"))],
+        limit=500,
+    )
+    b = CubeQuery.from_rest({
+        "measures": ["orders_with_preagg.total_amount_sum", "orders_with_preagg.count"],
+        "dimensions": ["orders_with_preagg.brand_code", "orders_with_preagg.market_code"],
+        "filters": [{"member": "orders_with_preagg.financial_status",
+                     "operator": "equals", "values": ["refunded", "paid"]}],
+        "timeDimensions": [{"dimension": "orders_with_preagg.updated_at",
+                            "granularity": "DAY", "dateRange": ["2024-01-01", "2024-12-31"]}],
+        "limit": 500,
+    })
+
+    print(a.to_sql())
+    print(f"\nEquivalent specs: {a == b}")
+    print(f"Cache key:        {a.cache_key()}")
+    b.to_sql()
+    print(f"Compile memo:     {compile_cache_info()}")
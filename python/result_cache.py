@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+In-Process Result Cache
+
+A thread-safe TTL + LRU cache for query results, bounded by entry count
+and by bytes (`pa.Table.nbytes` for tables). Entries expire `ttl` seconds
+after they were stored; the least recently used entries are evicted first
+once a bound is exceeded.
+
+Keys are whatever the caller uses to identify a result, typically the
+normalized SQL (see sql_normalize) plus token and database.
+
+Usage:
+    cache = ResultCache(max_bytes=512 << 20, ttl=300)
+    table = cache.get(key)
+    if table is None:
+        table = client.query(sql).to_table()
+        cache.put(key, table)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional
+
+
+@dataclass
+class ResultCacheStats:
+    """Cache outcome counters"""
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class _Entry:
+    __slots__ = ("value", "nbytes", "expires")
+
+    def __init__(self, value: Any, nbytes: int, expires: float):
+        self.value = value
+        self.nbytes = nbytes
+        self.expires = expires
+
+
+def _nbytes(value: Any) -> int:
+    return getattr(value, "nbytes", 0)
+
+
+class ResultCache:
+    """TTL + LRU cache bounded by entries and bytes"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = 300.0, clock: Callable[[], float] = time.monotonic,
+                 metrics=None):
+        """
+        Args:
+            max_entries: Max cached results
+            max_bytes: Max total bytes of cached results (None = unbounded);
+                a single result larger than this is not cached
+            ttl: Seconds a result stays valid (None = until evicted)
+            clock: Time source (injectable for tests)
+            metrics: cube_metrics.Metrics receiving cache_hits/cache_misses
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.metrics = metrics
+        self.stats = ResultCacheStats()
+        self.nbytes = 0
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[Any]:
+        """Cached value for `key`, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= self.clock():
+                self._remove(key)
+                self.stats.expirations += 1
+                entry = None
+            if count:
+                if entry is None:
+                    self.stats.misses += 1
+                else:
+                    self.stats.hits += 1
+            if entry is None:
+                value = None
+            else:
+                self._entries.move_to_end(key)
+                value = entry.value
+        if count and self.metrics is not None:
+            self.metrics.inc("cache_hits" if value is not None else "cache_misses")
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store `value`; `ttl` overrides the cache default for this entry
+
+        A value larger than `max_bytes` is not stored, and drops any older
+        value cached under `key` so it is no longer served.
+        """
+        nbytes = _nbytes(value)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            self.invalidate(key)
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires = self.clock() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, nbytes, expires)
+            self.nbytes += nbytes
+            self.stats.stores += 1
+            while (len(self._entries) > self.max_entries
+                   or (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def expires_in(self, key: Hashable) -> Optional[float]:
+        """Seconds until `key` expires (None if not cached)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry.expires - self.clock()
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop one entry, or everything when `key` is None"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+                self.nbytes = 0
+            elif key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self.nbytes -= entry.nbytes
@@ -0,0 +1,582 @@
+#!/usr/bin/env python3
+"""
+Semantic Result Cache for Cube Queries
+
+Exact-key caches (ResultCache) miss whenever a dashboard asks for a slice of
+a result the client already holds: fewer measures, a tighter filter, a
+smaller LIMIT. This cache keeps results per `CubeQuery` spec and answers
+such narrower queries locally, with `pyarrow.compute` filter/take/select on
+the cached superset, instead of sending them to cubesqld.
+
+A cached result R of query C answers query Q when (all checked on the
+canonical specs, never on SQL text):
+- same cube; Q's dimensions are a subset of C's and its time granularity
+  is the same or coarser (hour < day < month), or Q drops it
+- Q's measures are a subset of C's, and both have measures
+- every filter of C is implied by a filter of Q on the same member
+  ("equals a,b" implies "equals a,b,c"; "gt 10" implies "gte 5"; any
+  null-rejecting filter implies "set"), and every filter of Q that is not
+  also a filter of C is on a member that is a column of R; on C's time
+  dimension only "gte"/"lt" a bucket boundary, "set" or "notSet", since R
+  holds bucket starts, not the timestamps
+- Q's date range lies inside C's and both ends fall on bucket boundaries
+  of C's granularity (hour/day/month), so the bucket column decides it
+- R is complete (C had no LIMIT or R has fewer rows than it), unless Q only
+  drops measures and/or lowers the LIMIT
+Anything else is a miss. Filters are then evaluated with SQL semantics
+(NULL never matches a comparison) and Q's LIMIT applied.
+
+Rollups: when Q groups coarser than C (drill-up, e.g. from market/brand/
+status to market, or from day to month), R is re-aggregated with
+`pa.Table.group_by().aggregate()`: counts and sums are summed, min/max
+taken again, and avg measures averaged weighted by their count measure
+(`avg_weights`). Count-distinct, avg without a count, and measures of
+unknown type (see measure_type) are never rolled up; neither is a C with
+filters on measures (HAVING on the finer groups). Q's measure filters are
+applied after re-aggregation.
+
+Usage:
+    cache = SemanticCache(client)
+    medium = CubeQuery("orders_with_preagg", measures=["count", "total_amount_sum"],
+                       dimensions=["market_code", "brand_code", "financial_status"])
+    cache.query(medium)                                      # from cubesqld
+    cache.query(replace(medium, measures=("count",),
+                        filters=(Filter("market_code", "equals", ("US",)),),
+                        limit=10))                           # answered locally
+    cache.query(replace(medium, dimensions=("market_code",)))  # rolled up locally
+"""
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from cube_query_builder import CubeQuery, Filter, TimeDimension
+from result_cache import ResultCache
+from time_bucket_cache import BUCKET_GRANULARITIES, truncate
+
+_LOWER = ("gt", "gte")
+_UPPER = ("lt", "lte")
+_COMPARE = {"gt": pc.greater, "gte": pc.greater_equal, "lt": pc.less, "lte": pc.less_equal}
+_ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, TypeError)
+
+
+@dataclass
+class SemanticCacheStats:
+    """Lookup outcomes and time spent answering locally"""
+    requests: int = 0
+    exact_hits: int = 0
+    derived_hits: int = 0
+    misses: int = 0
+    local_seconds: float = 0.0
+
+    @property
+    def mean_local_us(self) -> float:
+        """Mean time of a derived answer in microseconds"""
+        return self.local_seconds / self.derived_hits * 1e6 if self.derived_hits else 0.0
+
+
+# === Containment ===
+
+def _comparable(a, b) -> bool:
+    """Values Python orders the way SQL does, whatever the column type
+
+    Strings are excluded: '9' > '10' as text but not as numbers.
+    """
+    if isinstance(a, bool) or isinstance(b, bool):
+        return False
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return True
+    return isinstance(a, datetime.date) and type(a) is type(b)
+
+
+def _passes(value, condition: Filter) -> bool:
+    """A non-null value satisfies a comparison filter (values comparable)"""
+    bound = condition.values[0]
+    if not _comparable(value, bound):
+        return False
+    return {"gt": value > bound, "gte": value >= bound,
+            "lt": value < bound, "lte": value <= bound}[condition.operator]
+
+
+def implies(narrow: Filter, wide: Filter) -> bool:
+    """Every row passing `narrow` passes `wide` (same member; conservative)"""
+    if narrow == wide:
+        return True
+    if narrow.member != wide.member:
+        return False
+    op, values = narrow.operator, narrow.values
+    if wide.operator == "set":
+        # Every operator but notSet rejects NULL
+        return op != "notSet"
+    if wide.operator == "equals":
+        return op == "equals" and set(values) <= set(wide.values)
+    if wide.operator == "notEquals":
+        if op == "notEquals":
+            return set(values) >= set(wide.values)
+        # Disjoint only counts for one value type: SQL coerces '1' = 1
+        return (op == "equals" and len({type(v) for v in values + wide.values}) == 1
+                and not set(values) & set(wide.values))
+    if wide.operator in _COMPARE:
+        if op == "equals":
+            return all(_passes(v, wide) for v in values)
+        same_side = _LOWER if wide.operator in _LOWER else _UPPER
+        if op not in same_side:
+            return False
+        bound, limit = values[0], wide.values[0]
+        if type(bound) is type(limit) and bound == limit:
+            # "> x" implies ">= x"; the converse doesn't hold
+            return op == wide.operator or wide.operator in ("gte", "lte")
+        if not _comparable(bound, limit):
+            return False
+        return bound > limit if same_side is _LOWER else bound < limit
+    if wide.operator == "contains":
+        if op not in ("contains", "equals") or not all(isinstance(v, str) for v in values):
+            return False
+        return all(any(str(w) in v for w in wide.values) for v in values)
+    if wide.operator == "notContains":
+        return op == "notContains" and set(values) >= set(wide.values)
+    return False
+
+
+def _bucket_range(td: TimeDimension) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+    """Half-open [start, end) of a date range, if both ends are bucket boundaries"""
+    if td.granularity not in BUCKET_GRANULARITIES or td.date_range is None:
+        return None
+    start_s, end_s = td.date_range
+    try:
+        start = datetime.datetime.fromisoformat(start_s)
+        end = datetime.datetime.combine(datetime.date.fromisoformat(end_s) + datetime.timedelta(days=1),
+                                        datetime.time())
+    except ValueError:
+        # An inclusive end timestamp never falls on a boundary
+        return None
+    if start.tzinfo is not None or truncate(start, td.granularity) != start \
+            or truncate(end, td.granularity) != end:
+        return None
+    return start, end
+
+
+def _bucket_exact(condition: Filter, granularity: Optional[str]) -> bool:
+    """A filter on the time member selects the same rows from bucket starts
+
+    ">= b" and "< b" do when b is a bucket boundary; ">", "<=", equality
+    and bounds inside a bucket would keep or drop whole buckets.
+    """
+    if condition.operator in ("set", "notSet"):
+        return True
+    if condition.operator not in ("gte", "lt") or granularity not in BUCKET_GRANULARITIES:
+        return False
+    bound = condition.values[0]
+    if not isinstance(bound, datetime.datetime):
+        if not isinstance(bound, datetime.date):
+            return False
+        bound = datetime.datetime.combine(bound, datetime.time())
+    return bound.tzinfo is None and truncate(bound, granularity) == bound
+
+
+def _time_plan(cached: Optional[TimeDimension], target: Optional[TimeDimension]):
+    """Compare time dimensions
+
+    Returns None when the cached result can't answer, else
+    (range, regroup): the [start, end) of buckets to keep (None = all) and
+    whether the target groups by a coarser granularity, or not by time.
+    """
+    if cached is None or target is None:
+        return (None, False) if cached == target else None
+    if cached.dimension != target.dimension:
+        return None
+    regroup = target.granularity != cached.granularity
+    if regroup:
+        if cached.granularity not in BUCKET_GRANULARITIES:
+            return None
+        if target.granularity is not None and (
+                target.granularity not in BUCKET_GRANULARITIES
+                or BUCKET_GRANULARITIES.index(target.granularity)
+                < BUCKET_GRANULARITIES.index(cached.granularity)):
+            return None
+    if cached.date_range == target.date_range:
+        return None, regroup
+    # Buckets of the cached granularity must decide the range
+    narrow = _bucket_range(replace(target, granularity=cached.granularity))
+    if narrow is None:
+        return None
+    if cached.date_range is not None:
+        wide = _bucket_range(cached)
+        if wide is None or narrow[0] < wide[0] or narrow[1] > wide[1]:
+            return None
+    return narrow, regroup
+
+
+def _candidates(member: str, measure: bool) -> List[str]:
+    """Column names cubesqld may use for a member's result column"""
+    name = member.rsplit(".", 1)[-1]
+    names = [name, member, member.replace(".", "__")]
+    return [f"measure({member})"] + names if measure else names
+
+
+def resolve_columns(query: CubeQuery, schema: pa.Schema) -> Optional[Dict[str, str]]:
+    """Member -> result column name, for every member `query` selects
+
+    None when a member can't be found or two members map to one column.
+    """
+    lowered: Dict[str, str] = {}
+    for name in schema.names:
+        if lowered.setdefault(name.lower(), name) != name:
+            return None
+    columns: Dict[str, str] = {}
+    members = [(d, False) for d in query.dimensions] + [(m, True) for m in query.measures]
+    for member, measure in members:
+        found = next((lowered[c.lower()] for c in _candidates(member, measure)
+                      if c.lower() in lowered), None)
+        if found is None:
+            return None
+        columns[member] = found
+    td = query.time_dimension
+    if td is not None and td.granularity:
+        if td.alias.lower() not in lowered:
+            return None
+        columns[td.dimension] = lowered[td.alias.lower()]
+    if len(set(columns.values())) != len(columns):
+        return None
+    return columns
+
+
+# === Local evaluation ===
+
+def _decoded(column: pa.ChunkedArray) -> pa.ChunkedArray:
+    if pa.types.is_dictionary(column.type):
+        return column.cast(column.type.value_type)
+    return column
+
+
+def filter_mask(condition: Filter, column: pa.ChunkedArray):
+    """Boolean mask of `condition` over a result column, with SQL NULL
+    semantics (NULL rows never pass); None if it can't be evaluated exactly
+    """
+    column = _decoded(column)
+    op, values = condition.operator, condition.values
+    if op == "set":
+        return pc.is_valid(column)
+    if op == "notSet":
+        return pc.is_null(column)
+    try:
+        if op in ("contains", "notContains"):
+            if not pa.types.is_string(column.type) and not pa.types.is_large_string(column.type):
+                return None
+            masks = [pc.match_substring(column, str(v)) for v in values]
+            if op == "notContains":
+                masks = [pc.invert(m) for m in masks]
+            combine = pc.and_kleene if op == "notContains" else pc.or_kleene
+            mask = masks[0]
+            for other in masks[1:]:
+                mask = combine(mask, other)
+            return mask
+        if pa.types.is_temporal(column.type) and any(not isinstance(v, datetime.date) for v in values):
+            # String literals against timestamps depend on the session time zone
+            return None
+        if op in _COMPARE:
+            return _COMPARE[op](column, pa.scalar(values[0]).cast(column.type))
+        value_set = pa.array(values).cast(column.type)
+        if op == "equals":
+            return pc.is_in(column, value_set=value_set)
+        return pc.and_kleene(pc.invert(pc.is_in(column, value_set=value_set)), pc.is_valid(column))
+    except _ARROW_ERRORS:
+        return None
+
+
+def measure_type(member: str, measure_types: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """Cube measure type of `member`: declared, or inferred from its name
+
+    Only "count" and the "_sum"/"_min"/"_max"/"_avg" suffixes are inferred;
+    declare anything else (e.g. from Cube's /meta) in `measure_types`.
+    """
+    if measure_types and member in measure_types:
+        return measure_types[member]
+    name = member.rsplit(".", 1)[-1]
+    if name == "count":
+        return "count"
+    for suffix in ("sum", "min", "max", "avg"):
+        if name.endswith("_" + suffix):
+            return suffix
+    return None
+
+
+def _rollup(table: pa.Table, keys: List[str], measures: List[str], columns: Dict[str, str],
+            measure_types: Optional[Dict[str, str]],
+            avg_weights: Optional[Dict[str, str]]) -> Optional[pa.Table]:
+    """Re-aggregate finer groups by `keys`; None for non-additive measures"""
+    aggregations = []
+    weighted = {}
+    for member in measures:
+        column, kind = columns[member], measure_type(member, measure_types)
+        if kind in ("count", "sum"):
+            aggregations.append((column, "sum"))
+        elif kind in ("min", "max"):
+            aggregations.append((column, kind))
+        elif kind == "avg" and avg_weights and avg_weights.get(member) in columns:
+            # Mean of means, weighted by the count of averaged values
+            weight = columns[avg_weights[member]]
+            product = f"__rollup_{column}"
+            try:
+                table = table.append_column(product, pc.multiply(table[column], table[weight]))
+            except _ARROW_ERRORS:
+                return None
+            aggregations += [(product, "sum"), (weight, "sum")]
+            weighted[column] = (product, weight)
+        else:
+            # countDistinct, avg without its count, number, ... don't add up
+            return None
+    # The count weighting an avg is often selected too: aggregate it once
+    aggregations = list(dict.fromkeys(aggregations))
+    if not keys and table.num_rows == 0:
+        return None  # an aggregate without GROUP BY still returns one row
+    grouped = table.group_by(keys, use_threads=False).aggregate(aggregations)
+    out = [grouped[key] for key in keys]
+    for member in measures:
+        column = columns[member]
+        if column in weighted:
+            product, weight = weighted[column]
+            total, count = grouped[f"{product}_sum"], grouped[f"{weight}_sum"]
+            out.append(pc.divide(pc.cast(total, pa.float64()),
+                                 pc.if_else(pc.equal(count, 0), None, pc.cast(count, pa.float64()))))
+        else:
+            kind = measure_type(member, measure_types)
+            aggregated = grouped[f"{column}_{'sum' if kind in ('count', 'sum') else kind}"]
+            out.append(aggregated.cast(table.schema.field(column).type))
+    return pa.Table.from_arrays(out, names=keys + [columns[m] for m in measures])
+
+
+def _all_of(conditions: List[Filter], table: pa.Table, columns: Dict[str, str]):
+    """Mask of rows passing every condition: None if there are none, False
+    if one can't be evaluated on `table`
+    """
+    mask = None
+    for condition in conditions:
+        if condition.member not in columns:
+            return False
+        condition_mask = filter_mask(condition, table[columns[condition.member]])
+        if condition_mask is None:
+            return False
+        mask = condition_mask if mask is None else pc.and_kleene(mask, condition_mask)
+    return mask
+
+
+def derive(cached: CubeQuery, table: pa.Table, target: CubeQuery,
+           measure_types: Optional[Dict[str, str]] = None,
+           avg_weights: Optional[Dict[str, str]] = None) -> Optional[pa.Table]:
+    """Answer `target` from the result `table` of `cached`, or None
+
+    Args:
+        measure_types: Cube measure type per member (see measure_type);
+            needed to roll up to fewer dimensions or a coarser granularity
+        avg_weights: For "avg" measures, the count measure of the averaged
+            values, which must be in the cached result too
+    """
+    if target.cube != cached.cube or not target.measures or not cached.measures:
+        return None
+    if not set(target.dimensions) <= set(cached.dimensions) or not set(target.measures) <= set(cached.measures):
+        return None
+    plan = _time_plan(cached.time_dimension, target.time_dimension)
+    if plan is None:
+        return None
+    time_range, regroup_time = plan
+    regroup = regroup_time or target.dimensions != cached.dimensions
+    if not all(any(implies(f, c) for f in target.filters) for c in cached.filters):
+        return None
+    local = [f for f in target.filters if f not in cached.filters]
+    td = cached.time_dimension
+    if td is not None and not all(_bucket_exact(f, td.granularity)
+                                  for f in local if f.member == td.dimension):
+        return None
+
+    complete = cached.limit is None or table.num_rows < cached.limit
+    if not complete and (local or time_range is not None or regroup
+                         or target.limit is None or target.limit > cached.limit):
+        return None
+
+    columns = resolve_columns(cached, table.schema)
+    if columns is None:
+        return None
+    having = []
+    if regroup:
+        # Filters of the finer query must be row filters (WHERE), not HAVING
+        row_members = set(cached.dimensions)
+        if cached.time_dimension is not None:
+            row_members.add(cached.time_dimension.dimension)
+        if any(f.member not in row_members for f in cached.filters):
+            return None
+        having = [f for f in local if f.member in cached.measures]
+        local = [f for f in local if f.member not in cached.measures]
+    mask = _all_of(local, table, columns)
+    if mask is False:
+        return None
+    if time_range is not None:
+        bucket = table[columns[td.dimension]]
+        if not pa.types.is_timestamp(bucket.type):
+            return None
+        start, end = (pa.scalar(t, type=bucket.type) for t in time_range)
+        in_range = pc.and_kleene(pc.greater_equal(bucket, start), pc.less(bucket, end))
+        mask = in_range if mask is None else pc.and_kleene(mask, in_range)
+    if mask is not None:
+        table = table.filter(mask)
+
+    keys = [columns[d] for d in target.dimensions]
+    if target.time_dimension is not None and target.time_dimension.granularity:
+        keys.append(columns[td.dimension])
+    if regroup:
+        if regroup_time and target.time_dimension.granularity:
+            bucket = table[columns[td.dimension]]
+            if not pa.types.is_timestamp(bucket.type) or bucket.type.tz not in (None, "UTC"):
+                return None
+            alias = target.time_dimension.alias
+            table = table.append_column(alias, pc.floor_temporal(bucket, unit=target.time_dimension.granularity))
+            keys[-1] = alias
+        measures = list(target.measures) + [f.member for f in having if f.member not in target.measures]
+        table = _rollup(table, keys, measures, columns, measure_types, avg_weights)
+        if table is None:
+            return None
+        mask = _all_of(having, table, columns)
+        if mask is False:
+            return None
+        if mask is not None:
+            table = table.filter(mask)
+
+    result = table.select(keys + [columns[m] for m in target.measures])
+    if target.limit is not None and result.num_rows > target.limit:
+        result = result.slice(0, target.limit)
+    return result
+
+
+# === Cache ===
+
+class SemanticCache:
+    """Cache of CubeQuery results that also answers contained queries"""
+
+    def __init__(self, client=None, cache: Optional[ResultCache] = None,
+                 max_candidates: int = 64, measure_types: Optional[Dict[str, str]] = None,
+                 avg_weights: Optional[Dict[str, str]] = None, metrics=None,
+                 clock: Callable[[], float] = time.perf_counter):
+        """
+        Args:
+            client: Connected client exposing `query(sql) -> QueryResult`
+                (needed for `query()` only)
+            cache: Storage for results (default: 256 MB, 5 minute TTL);
+                expiry and eviction apply to derived answers too
+            max_candidates: Cached specs per cube tried for a derived answer
+            measure_types: Cube measure type per qualified member ("count",
+                "sum", "min", "max", "avg", "countDistinct", ...), for
+                measures whose type isn't evident from the name
+            avg_weights: Qualified "avg" measure -> the count measure of its
+                averaged values (avg rolls up only as a weighted mean)
+            metrics: cube_metrics.Metrics counting cache hits/misses
+        """
+        self.client = client
+        self.cache = cache if cache is not None else ResultCache(max_bytes=256 << 20, ttl=300)
+        self.max_candidates = max_candidates
+        self.measure_types = measure_types
+        self.avg_weights = avg_weights
+        self.metrics = metrics
+        self.clock = clock
+        self.stats = SemanticCacheStats()
+        # cube -> cache key -> spec, most recently stored last
+        self._index: Dict[str, "OrderedDict[str, CubeQuery]"] = {}
+        self._lock = threading.Lock()
+
+    def put(self, query: CubeQuery, table: pa.Table):
+        key = query.cache_key()
+        self.cache.put(key, table)
+        with self._lock:
+            specs = self._index.setdefault(query.cube, OrderedDict())
+            specs[key] = query
+            specs.move_to_end(key)
+            while len(specs) > self.max_candidates:
+                specs.popitem(last=False)
+
+    def get(self, query: CubeQuery) -> Optional[pa.Table]:
+        """Cached or locally derived result of `query`, or None"""
+        table = self.cache.get(query.cache_key(), count=False)
+        if table is not None:
+            self._count("exact_hits")
+            return table
+        started = self.clock()
+        for cached, cached_table in self._candidates(query.cube):
+            result = derive(cached, cached_table, query, self.measure_types, self.avg_weights)
+            if result is not None:
+                with self._lock:
+                    self.stats.local_seconds += self.clock() - started
+                self._count("derived_hits")
+                return result
+        self._count("misses")
+        return None
+
+    def query(self, query: CubeQuery) -> pa.Table:
+        """`get`, falling back to cubesqld (and caching the result)"""
+        table = self.get(query)
+        if table is None:
+            table = self.client.query(query.to_sql()).to_table()
+            self.put(query, table)
+        return table
+
+    def invalidate(self, cube: Optional[str] = None):
+        """Drop the results of one cube, or everything"""
+        with self._lock:
+            if cube is None:
+                keys = [key for specs in self._index.values() for key in specs]
+                self._index.clear()
+            else:
+                keys = list(self._index.pop(cube, {}))
+        for key in keys:
+            self.cache.invalidate(key)
+
+    def _candidates(self, cube: str):
+        """(spec, table) of live cached results of `cube`, most recent first"""
+        with self._lock:
+            specs = list(self._index.get(cube, {}).items())
+        for key, spec in reversed(specs):
+            table = self.cache.get(key, count=False)
+            if table is None:
+                with self._lock:
+                    self._index.get(cube, {}).pop(key, None)
+                continue
+            yield spec, table
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.stats.requests += 1
+            setattr(self.stats, outcome, getattr(self.stats, outcome) + 1)
+        if self.metrics is not None:
+            self.metrics.inc("cache_misses" if outcome == "misses" else "cache_hits")
+
+
+# Example usage
+if __name__ == "__main__":
+    from arrow_native_client import ArrowNativeClient
+
+    medium = CubeQuery(
+        cube="orders_with_preagg",
+        measures=["count", "total_amount_sum", "tax_amount_sum"],
+        dimensions=["market_code", "brand_code", "financial_status"],
+    )
+    narrower = [
+        replace(medium, measures=("orders_with_preagg.count",)),
+        replace(medium, filters=(Filter("financial_status", "equals", ("paid",)),)),
+        replace(medium, filters=(Filter("count", "gt", (100,)),), limit=20),
+        replace(medium, dimensions=("orders_with_preagg.market_code",)),  # the "small" query
+    ]
+
+    with ArrowNativeClient(host="localhost", port=4445, token="test") as client:
+        cache = SemanticCache(client)
+        start = time.perf_counter()
+        table = cache.query(medium)
+        print(f"superset: {table.num_rows} rows in {(time.perf_counter() - start) * 1000:.1f}ms")
+        for q in narrower:
+            start = time.perf_counter()
+            table = cache.query(q)
+            print(f"derived:  {table.num_rows} rows in {(time.perf_counter() - start) * 1e6:.0f}µs")
+        print(f"Stats: {cache.stats}")
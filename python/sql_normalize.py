@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+SQL Text Normalization
+
+normalize_sql (coalescing and cache keys) and fingerprint_sql (grouping by
+query shape) are implemented once, in the ADBC driver package that ships
+them (adbc_driver_cube/adbc_driver_cube/sql_normalize.py). The module file
+is loaded directly, so the scripts here share it without importing the
+driver package and adbc_driver_manager.
+"""
+
+import importlib.util
+import os
+
+_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "adbc_driver_cube", "adbc_driver_cube", "sql_normalize.py")
+_spec = importlib.util.spec_from_file_location("_adbc_driver_cube_sql_normalize", _PATH)
+_module = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(_module)
+
+normalize_sql = _module.normalize_sql
+fingerprint_sql = _module.fingerprint_sql
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark statistics, regression comparison and runners
+
+Run:
+    python -m pytest test_arrow_benchmark.py -q
+"""
+
+import math
+import random
+import statistics
+
+import pyarrow as pa
+import pytest
+
+import arrow_benchmark
+from arrow_benchmark import (BENCHMARK_CASES, BenchmarkSuite, compare, main, percentile,
+                             summarize, t_critical, t_sf_two_sided, welch_t_test)
+from arrow_native_client import ArrowNativeClient, QueryError
+
+TABLE = pa.table({"market_code": ["a", "b"], "count": [1, 2]})
+
+
+def test_percentile_interpolates():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 100) == 4.0
+    assert percentile(values, 50) == pytest.approx(2.5)
+    assert percentile(values, 90) == pytest.approx(3.7)
+    assert percentile([7.0], 99) == 7.0
+    assert math.isnan(percentile([], 50))
+
+
+@pytest.mark.parametrize("df, expected", [(1, 12.706), (5, 2.571), (10, 2.228),
+                                          (30, 2.042), (10_000, 1.960)])
+def test_t_critical_matches_tables(df, expected):
+    assert t_critical(df) == pytest.approx(expected, abs=1e-3)
+    assert t_sf_two_sided(expected, df) == pytest.approx(0.05, abs=1e-4)
+
+
+def test_summarize_confidence_interval():
+    samples_ms = [10.0, 12.0, 11.0, 13.0, 9.0, 11.0]
+    s = summarize([int(v * 1e6) for v in samples_ms])
+    mean, stdev = statistics.fmean(samples_ms), statistics.stdev(samples_ms)
+    half = 2.571 * stdev / math.sqrt(len(samples_ms))  # t(0.975, df=5)
+    assert s["n"] == 6
+    assert s["mean_ms"] == pytest.approx(mean)
+    assert s["ci95_low_ms"] == pytest.approx(mean - half, rel=1e-3)
+    assert s["ci95_high_ms"] == pytest.approx(mean + half, rel=1e-3)
+
+
+def test_welch_t_test():
+    same = [1.0, 2.0, 3.0, 4.0]
+    assert welch_t_test(same, same)["p_value"] == pytest.approx(1.0)
+    # t = 3 / sqrt(1/3 + 1/3), Welch df = 4: between t(0.98, 4) and t(0.99, 4)
+    test = welch_t_test([1.0, 2.0, 3.0], [4.0, 5.0, 6.0])
+    assert (test["t"], test["df"]) == (pytest.approx(3.6742, abs=1e-4), pytest.approx(4.0))
+    assert 0.02 < test["p_value"] < 0.025
+    assert welch_t_test([4.0, 5.0, 6.0], [1.0, 2.0, 3.0])["t"] < 0
+    # Zero variance in both samples
+    assert welch_t_test([2.0, 2.0], [2.0, 2.0])["p_value"] == 1.0
+    assert welch_t_test([2.0, 2.0], [3.0, 3.0])["p_value"] == 0.0
+
+
+def _results(samples_ms):
+    return {"results": [{"case": "small", "api": "arrow",
+                         "samples_ns": [int(v * 1e6) for v in samples_ms]}]}
+
+
+def test_compare_flags_significant_regression_and_improvement():
+    rng = random.Random(1)
+    base = [10.0 + rng.gauss(0, 0.1) for _ in range(30)]
+    slower = [12.0 + rng.gauss(0, 0.1) for _ in range(30)]
+    [row] = compare(_results(base), _results(slower))
+    assert row["significant"] and row["regression"] and not row["improvement"]
+    assert row["change"] == pytest.approx(0.2, abs=0.01)
+
+    [row] = compare(_results(slower), _results(base))
+    assert row["improvement"] and not row["regression"]
+
+
+def test_compare_ignores_noise_and_small_changes():
+    rng = random.Random(2)
+    noisy = [10.0 + rng.gauss(0, 5) for _ in range(10)]
+    shifted = [v * 1.1 for v in noisy[::-1]]
+    [row] = compare(_results(noisy), _results(shifted))
+    assert row["change"] > 0.05 and not row["significant"] and not row["regression"]
+
+    # Significant, but within the threshold
+    base = [10.0 + rng.gauss(0, 0.01) for _ in range(30)]
+    [row] = compare(_results(base), _results([v * 1.02 for v in base]))
+    assert row["significant"] and not row["regression"]
+
+    # Cases missing from the baseline are skipped
+    other = {"results": [{"case": "large", "api": "http", "samples_ns": [1, 2]}]}
+    assert compare(other, _results(base)) == []
+
+
+@pytest.mark.parametrize("argv", [["--apis", "arrow,bogus"], ["--cases", "nope"]])
+def test_unknown_names_are_usage_errors(argv, capsys):
+    with pytest.raises(SystemExit) as e:
+        main(argv)
+    assert e.value.code == 2
+    assert "unknown" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("reconnect", [False, True])
+def test_arrow_runner_closes_its_client(mock_server, monkeypatch, reconnect):
+    server = mock_server(TABLE)
+    closed = []
+    close = ArrowNativeClient.close
+    monkeypatch.setattr(ArrowNativeClient, "close", lambda self: (closed.append(self), close(self)))
+    suite = BenchmarkSuite("127.0.0.1", server.port, "http://unused",
+                           reconnect=reconnect)
+    [m] = suite.run(BENCHMARK_CASES[:1], ["arrow"], warmup=1, iterations=3)
+    assert (m.rows, len(m.samples_ns)) == (2, 3)
+    assert len(closed) == (4 if reconnect else 1)
+
+    # Closed even when a query fails
+    closed.clear()
+    bad = arrow_benchmark.BenchmarkCase("bad", "SELECT bad", {})
+    with pytest.raises(QueryError):
+        suite.run([bad], ["arrow"], warmup=0, iterations=2)
+    assert len(closed) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
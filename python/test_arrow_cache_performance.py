@@ -5,6 +5,8 @@ Arrow IPC Query Cache Performance Tests
 Tests Arrow Native protocol performance with optional result caching.
 
 NOTE: This test uses Arrow Native protocol (port 4445), not PostgreSQL wire protocol.
+Each query runs once; for repeated, statistically meaningful measurements and
+regression tracking use arrow_benchmark.py.
 See path/to/cube/examples/recipes/arrow-ipc/POWER_OF_THREE_QUERY_EXAMPLES.md
 for Arrow Native examples.
 
@@ -23,14 +25,15 @@ Usage:
 """
 
 import time
-import requests
 import json
 import os
+import statistics
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import sys
 
 from arrow_native_client import ArrowNativeClient
+from cube_http_client import CubeHttpClient
 
 # ANSI color codes for pretty output
 class Colors:
@@ -47,13 +50,13 @@ class Colors:
 class QueryResult:
     """Results from a single query execution"""
     api: str  # "arrow" or "http"
-    query_time_ms: int
+    query_time_ms: float
     row_count: int
     column_count: int
     label: str = ""
 
     def __str__(self):
-        return f"{self.api.upper():6} | {self.query_time_ms:4}ms | {self.row_count:6} rows | {self.column_count} cols"
+        return f"{self.api.upper():6} | {self.query_time_ms:9.3f}ms | {self.row_count:6} rows | {self.column_count} cols"
 
 
 class CachePerformanceTester:
@@ -65,6 +68,7 @@ class CachePerformanceTester:
         self.arrow_port = arrow_port
         self.http_url = http_url
         self.http_token = "test"  # Default token
+        self.http_client: Optional[CubeHttpClient] = None
 
     def run_arrow_query(self, sql: str, label: str = "") -> QueryResult:
         """Execute query via Arrow Native and measure time"""
@@ -76,14 +80,12 @@ class CachePerformanceTester:
 
         client.connect()
 
-        start = time.perf_counter()
-        result = client.query(sql)
-        elapsed_ms = int((time.perf_counter() - start) * 1000)
+        start = time.perf_counter_ns()
+        table = client.query(sql).to_table()
+        elapsed_ms = (time.perf_counter_ns() - start) / 1e6
 
-        # Get DataFrame to count rows and columns
-        df = result.to_dataframe()
-        row_count = len(df)
-        col_count = len(df.columns)
+        row_count = table.num_rows
+        col_count = table.num_columns
 
         client.close()
 
@@ -91,22 +93,16 @@ class CachePerformanceTester:
 
     def run_http_query(self, query_dict: Dict[str, Any], label: str = "") -> QueryResult:
         """Execute query via HTTP API and measure time"""
-        headers = {
-            "Authorization": self.http_token,
-            "Content-Type": "application/json"
-        }
+        if self.http_client is None:
+            # Pooled keep-alive session, reused across queries
+            self.http_client = CubeHttpClient(self.http_url, token=self.http_token)
 
-        start = time.perf_counter()
-        response = requests.post(self.http_url,
-                                headers=headers,
-                                json={"query": query_dict})
-        data = response.json()
-        elapsed_ms = int((time.perf_counter() - start) * 1000)
+        start = time.perf_counter_ns()
+        table = self.http_client.load(query_dict)
+        elapsed_ms = (time.perf_counter_ns() - start) / 1e6
 
-        # Count rows and columns from response
-        dataset = data.get("data", [])
-        row_count = len(dataset)
-        col_count = len(dataset[0].keys()) if dataset else 0
+        row_count = table.num_rows
+        col_count = table.num_columns
 
         return QueryResult("http", elapsed_ms, row_count, col_count, label)
 
@@ -124,20 +120,17 @@ class CachePerformanceTester:
 
     def print_comparison(self, arrow: QueryResult, http: QueryResult):
         """Print performance comparison"""
-        if arrow.query_time_ms == 0:
-            speedup_text = "∞"
-        else:
-            speedup = http.query_time_ms / arrow.query_time_ms
-            speedup_text = f"{speedup:.1f}x"
+        speedup = http.query_time_ms / arrow.query_time_ms
+        speedup_text = f"{speedup:.1f}x"
 
         time_saved = http.query_time_ms - arrow.query_time_ms
 
         print(f"\n{Colors.BOLD}{'─' * 80}{Colors.END}")
         print(f"{Colors.BOLD}PERFORMANCE COMPARISON:{Colors.END}")
-        print(f"  Arrow IPC:  {arrow.query_time_ms}ms")
-        print(f"  HTTP API:   {http.query_time_ms}ms")
+        print(f"  Arrow IPC:  {arrow.query_time_ms:.3f}ms")
+        print(f"  HTTP API:   {http.query_time_ms:.3f}ms")
         print(f"  {Colors.GREEN}{Colors.BOLD}Speedup:    {speedup_text} faster{Colors.END}")
-        print(f"  Time saved: {time_saved}ms")
+        print(f"  Time saved: {time_saved:.3f}ms")
         print(f"{Colors.BOLD}{'─' * 80}{Colors.END}\n")
 
     def test_cache_warmup_and_hit(self):
@@ -166,15 +159,15 @@ class CachePerformanceTester:
         result2 = self.run_arrow_query(sql, "Second run (cache hit)")
         self.print_result(result2, "  ")
 
-        speedup = result1.query_time_ms / result2.query_time_ms if result2.query_time_ms > 0 else float('inf')
+        speedup = result1.query_time_ms / result2.query_time_ms
         time_saved = result1.query_time_ms - result2.query_time_ms
 
         print(f"\n{Colors.BOLD}{'─' * 80}{Colors.END}")
         print(f"{Colors.BOLD}CACHE PERFORMANCE:{Colors.END}")
-        print(f"  First query (miss):  {result1.query_time_ms}ms")
-        print(f"  Second query (hit):  {result2.query_time_ms}ms")
+        print(f"  First query (miss):  {result1.query_time_ms:.3f}ms")
+        print(f"  Second query (hit):  {result2.query_time_ms:.3f}ms")
         print(f"  {Colors.GREEN}{Colors.BOLD}Cache speedup:       {speedup:.1f}x faster{Colors.END}")
-        print(f"  Time saved:          {time_saved}ms")
+        print(f"  Time saved:          {time_saved:.3f}ms")
         print(f"{Colors.BOLD}{'─' * 80}{Colors.END}\n")
 
         return speedup
@@ -218,7 +211,7 @@ class CachePerformanceTester:
         self.print_result(http_result, "  ")
         self.print_comparison(arrow_result, http_result)
 
-        return http_result.query_time_ms / arrow_result.query_time_ms if arrow_result.query_time_ms > 0 else float('inf')
+        return http_result.query_time_ms / arrow_result.query_time_ms
 
     def test_arrow_vs_http_medium(self):
         """Test 3: Medium query (1-2K rows)"""
@@ -270,7 +263,7 @@ class CachePerformanceTester:
         self.print_result(http_result, "  ")
         self.print_comparison(arrow_result, http_result)
 
-        return http_result.query_time_ms / arrow_result.query_time_ms if arrow_result.query_time_ms > 0 else float('inf')
+        return http_result.query_time_ms / arrow_result.query_time_ms
 
     def test_arrow_vs_http_large(self):
         """Test 4: Large query (10K+ rows)"""
@@ -321,7 +314,7 @@ class CachePerformanceTester:
         self.print_result(http_result, "  ")
         self.print_comparison(arrow_result, http_result)
 
-        return http_result.query_time_ms / arrow_result.query_time_ms if arrow_result.query_time_ms > 0 else float('inf')
+        return http_result.query_time_ms / arrow_result.query_time_ms
 
     def run_all_tests(self):
         """Run complete test suite"""
@@ -371,24 +364,22 @@ class CachePerformanceTester:
         print("=" * 80)
         print(f"{Colors.END}\n")
 
-        total = 0
-        count = 0
-
         for test_name, speedup in speedups:
-            color = Colors.GREEN if speedup > 20 else Colors.YELLOW
+            color = Colors.GREEN if speedup > 1 else Colors.RED
             print(f"  {test_name:30} {color}{speedup:6.1f}x faster{Colors.END}")
-            if speedup != float('inf'):
-                total += speedup
-                count += 1
 
-        if count > 0:
-            avg_speedup = total / count
-            print(f"\n  {Colors.BOLD}Average Speedup:{Colors.END} {Colors.GREEN}{Colors.BOLD}{avg_speedup:.1f}x{Colors.END}\n")
+        if speedups:
+            geo_mean = statistics.geometric_mean(s for _, s in speedups)
+            print(f"\n  {Colors.BOLD}Geometric Mean Speedup:{Colors.END} {Colors.GREEN}{Colors.BOLD}{geo_mean:.1f}x{Colors.END}\n")
 
         print(f"{Colors.BOLD}{'=' * 80}{Colors.END}\n")
 
-        print(f"{Colors.GREEN}{Colors.BOLD}✓ All tests passed!{Colors.END}")
-        print(f"{Colors.CYAN}Results show Arrow Native performance with cache behavior as expected.{Colors.END}")
+        slower = [name for name, s in speedups if s <= 1]
+        if slower:
+            print(f"{Colors.RED}{Colors.BOLD}✗ Arrow Native was not faster for: {', '.join(slower)}{Colors.END}")
+        else:
+            print(f"{Colors.GREEN}{Colors.BOLD}✓ Arrow Native was faster in every test{Colors.END}")
+        print(f"{Colors.CYAN}Single-run timings; use arrow_benchmark.py for confidence intervals.{Colors.END}")
         print(f"{Colors.CYAN}Note: HTTP API has caching always enabled.{Colors.END}\n")
 
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for delta results: table diff/merge and the DELTA_RESULTS extension
+
+Run:
+    python -m pytest test_arrow_delta.py -q
+"""
+
+import random
+
+import pyarrow as pa
+import pytest
+
+import arrow_native_codec as codec
+from arrow_delta import apply_delta, delta_keys, diff_tables, result_version
+from arrow_native_client import ArrowNativeClient, Capability, VersionedResult
+from arrow_native_mock_server import MockArrowNativeServer
+
+SQL = "SELECT market, status, SUM(amount) AS amount FROM orders GROUP BY 1, 2"
+
+
+def _rows(table: pa.Table):
+    return sorted(table.to_pylist(), key=repr)
+
+
+def _dashboard(seed: int, markets: int = 40) -> pa.Table:
+    rng = random.Random(seed)
+    rows = [(f"M{m:02d}", status, float(rng.randint(0, 3)))
+            for m in range(markets) for status in ("open", "closed", None)
+            if rng.random() < 0.9]
+    market, status, amount = zip(*rows)
+    return pa.table({"market": list(market), "status": list(status),
+                     "amount": pa.array(amount, pa.float64())})
+
+
+def test_diff_and_apply_round_trip():
+    keys = ["market", "status"]
+    for seed in range(5):
+        old, new = _dashboard(seed), _dashboard(seed + 100)
+        upserts, deletes = diff_tables(old, new, keys)
+        merged = apply_delta(old, upserts, deletes, keys)
+        assert _rows(merged) == _rows(new)
+        assert merged.schema == new.schema
+    same = _dashboard(1)
+    upserts, deletes = diff_tables(same, same, keys)
+    assert upserts.num_rows == deletes.num_rows == 0
+
+
+def test_apply_keeps_row_positions():
+    old = pa.table({"k": ["a", "b", "c"], "v": [1, 2, 3]})
+    upserts = pa.table({"k": ["b", "d"], "v": [20, 4]})
+    deletes = pa.table({"k": ["a"]})
+    merged = apply_delta(old, upserts, deletes, ["k"])
+    assert merged.to_pydict() == {"k": ["b", "c", "d"], "v": [20, 3, 4]}
+
+
+def test_duplicate_keys_are_not_diffed():
+    old = pa.table({"k": ["a", "a"], "v": [1, 2]})
+    assert diff_tables(old, old, ["k"]) is None
+
+
+def test_delta_keys():
+    schema = _dashboard(0).schema
+    assert delta_keys(SQL, schema) == ["market", "status"]
+    assert delta_keys("SELECT market, SUM(x) FROM t GROUP BY orders.market LIMIT 5", schema) == ["market"]
+    assert delta_keys(SQL + " ORDER BY 3 DESC", schema) is None
+    assert delta_keys("SELECT * FROM orders", schema) is None
+    assert delta_keys("SELECT 1 FROM t GROUP BY region", schema) is None
+
+
+def test_versioned_request_round_trip():
+    payloads = [codec.query_request("SELECT 1", codec.QueryOption.RESULT_VERSION, 2 ** 63 + 5),
+                codec.result_version(codec.ResultKind.DELTA, 7, ["a", "b"])]
+    events = codec.FrameDecoder().feed(b"".join(codec.frame(p) for p in payloads))
+    assert events == [codec.QueryRequest("SELECT 1", codec.QueryOption.RESULT_VERSION, 2 ** 63 + 5),
+                      codec.ResultVersion(codec.ResultKind.DELTA, 7, ("a", "b"))]
+
+
+def test_refresh_over_the_wire():
+    state = {"table": _dashboard(0)}
+    with MockArrowNativeServer(lambda sql: state["table"], batch_size=16,
+                               capabilities=Capability.DELTA_RESULTS
+                               | Capability.SCHEMA_FINGERPRINT) as server:
+        client = ArrowNativeClient("127.0.0.1", server.port, delta_results=True,
+                                   schema_fingerprints=True).connect()
+        try:
+            first = client.query_versioned(SQL)
+            assert first.kind == codec.ResultKind.FULL
+            assert first.version == result_version(state["table"])
+
+            again = client.query_versioned(SQL, first)
+            assert again.kind == codec.ResultKind.UNCHANGED
+            assert again.table is first.table
+            assert again.wire_bytes < 64
+
+            changed = state["table"].to_pylist()
+            changed[3]["amount"] += 1
+            del changed[10]
+            changed.append({"market": "NEW", "status": None, "amount": 9.0})
+            state["table"] = pa.Table.from_pylist(changed, schema=first.table.schema)
+
+            refreshed = client.query_versioned(SQL, again)
+            assert refreshed.kind == codec.ResultKind.DELTA
+            assert (refreshed.upserts, refreshed.deletes) == (2, 1)
+            assert _rows(refreshed.table) == _rows(state["table"])
+            assert refreshed.wire_bytes < first.wire_bytes
+
+            # Unknown versions and unkeyed queries get the full result
+            stale = client.query_versioned(SQL, VersionedResult(first.table, 12345))
+            assert stale.kind == codec.ResultKind.FULL
+            state["table"] = state["table"].slice(1)
+            ordered = client.query_versioned(SQL + " ORDER BY 3", refreshed)
+            assert ordered.kind == codec.ResultKind.FULL
+        finally:
+            client.close()
+
+
+def test_without_extension_falls_back_to_full_results(mock_server):
+    table = _dashboard(0)
+    server = mock_server(table)
+    client = ArrowNativeClient("127.0.0.1", server.port, delta_results=True).connect()
+    try:
+        result = client.query_versioned(SQL)
+        assert result.version is None and result.kind == codec.ResultKind.FULL
+        assert client.query_versioned(SQL, result).table.equals(table)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
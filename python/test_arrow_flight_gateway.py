@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the Flight fan-out gateway and the result cache behind it
+
+Run:
+    python -m pytest test_arrow_flight_gateway.py -q
+"""
+
+import json
+import threading
+
+import pyarrow as pa
+import pyarrow.flight as flight
+import pytest
+
+from arrow_flight_gateway import CubeFlightGateway
+from arrow_native_pool import ArrowNativePool
+from result_cache import ResultCache
+
+TABLE = pa.table({"market": ["a", "b", "c"] * 100, "count": list(range(300))})
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(TABLE, batch_size=50, latency=0.2)
+
+
+@pytest.fixture
+def gateway(server):
+    gw = CubeFlightGateway("grpc://127.0.0.1:0", pool=ArrowNativePool("127.0.0.1", server.port, max_size=4))
+    try:
+        yield gw
+    finally:
+        gw.shutdown()
+
+
+def _client(gw: CubeFlightGateway) -> flight.FlightClient:
+    return flight.connect(f"grpc://127.0.0.1:{gw.port}")
+
+
+def test_cache_ttl_and_lru_bounds(clock):
+    cache = ResultCache(max_entries=2, ttl=10, clock=clock)
+    cache.put("a", TABLE)
+    cache.put("b", TABLE)
+    assert cache.get("a") is TABLE
+    cache.put("c", TABLE)            # evicts "b", the least recently used
+    assert "b" not in cache and "a" in cache
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.stats.evictions == 1 and cache.stats.expirations == 1
+
+    small = ResultCache(max_bytes=TABLE.nbytes * 2)
+    for key in "xyz":
+        small.put(key, TABLE)
+    assert len(small) == 2 and small.nbytes == TABLE.nbytes * 2
+    small.put("huge", pa.concat_tables([TABLE] * 3))
+    assert "huge" not in small
+
+    # An oversized value is not stored and drops the stale entry for its key
+    small.put("z", pa.concat_tables([TABLE] * 3))
+    assert small.get("z") is None and "y" in small
+    assert small.nbytes == TABLE.nbytes
+
+
+def test_concurrent_readers_share_one_upstream_execution(gateway, server):
+    results = [None] * 8
+
+    def read(i: int):
+        results[i] = _client(gateway).do_get(flight.Ticket(b"SELECT * FROM t")).read_all()
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(r.equals(TABLE) for r in results)
+    assert server.queries == 1
+    assert gateway.stats.upstream_executions == 1
+    assert gateway.stats.shared + gateway.stats.cache_hits == 7
+
+
+def test_cached_result_and_invalidation(gateway, server):
+    client = _client(gateway)
+    client.do_get(flight.Ticket(b"SELECT 1")).read_all()
+    assert client.do_get(flight.Ticket(b"select  1")).read_all().equals(TABLE)
+    assert server.queries == 1
+
+    list(client.do_action(flight.Action("invalidate", b"SELECT 1")))
+    client.do_get(flight.Ticket(b"SELECT 1")).read_all()
+    assert server.queries == 2
+
+    stats = json.loads(next(iter(client.do_action(flight.Action("stats", b"")))).body.to_pybytes())
+    assert stats["requests"] == 3 and stats["cache_hits"] == 1 and stats["cached"] == 1
+
+
+def test_flight_info_then_get(gateway, server):
+    client = _client(gateway)
+    info = client.get_flight_info(flight.FlightDescriptor.for_command(b"SELECT 2"))
+    assert info.schema == TABLE.schema
+    table = client.do_get(info.endpoints[0].ticket).read_all()
+    assert table.equals(TABLE)
+    assert server.queries == 1
+
+
+def test_query_error_reaches_reader(gateway):
+    with pytest.raises(flight.FlightServerError, match="bad query"):
+        _client(gateway).do_get(flight.Ticket(b"SELECT bad")).read_all()
+    assert gateway.stats.upstream_errors == 1
+    assert len(gateway.cache) == 0
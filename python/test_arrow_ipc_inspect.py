@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for the mmap-based Arrow IPC capture inspector
+
+Run:
+    python -m pytest test_arrow_ipc_inspect.py -q
+"""
+
+import random
+import struct
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pytest
+
+from arrow_ipc_inspect import format_columns, format_messages, format_summary, inspect_capture
+
+TABLE = pa.table({
+    "market_code": pa.array(["US", None, "DE"] * 400),
+    "count": pa.array([1, 2, None] * 400, pa.int64()),
+    "brand": pa.array(["acme", "bolt", None] * 400).dictionary_encode(),
+    "tags": pa.array([["a", "b"], None, []] * 400),
+    "point": pa.array([{"x": 1.5, "y": None}, None, {"x": None, "y": 2}] * 400),
+    "note": pa.array(["a long string value over twelve bytes", "b", None] * 400, pa.string_view()),
+})
+
+
+def _stream(table: pa.Table, compression=None, chunk: int = 500) -> bytes:
+    sink = pa.BufferOutputStream()
+    options = ipc.IpcWriteOptions(compression=compression)
+    with ipc.new_stream(sink, table.schema, options=options) as writer:
+        for batch in table.to_batches(max_chunksize=chunk):
+            writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def test_column_stats_match_the_data(tmp_path):
+    path = tmp_path / "capture.bin"
+    path.write_bytes(_stream(TABLE))
+    summary = inspect_capture(str(path))
+    assert summary.error is None and summary.trailing_bytes == 0
+    assert summary.counts == {"schema": 1, "dictionary_batch": 1, "record_batch": 3, "eos": 1}
+    assert summary.rows == TABLE.num_rows
+    assert summary.metadata_bytes + summary.body_bytes + 8 == path.stat().st_size
+
+    columns = summary.columns
+    for name in TABLE.column_names:
+        assert (columns[name].rows, columns[name].nulls) == (TABLE.num_rows, TABLE[name].null_count)
+    assert columns["point.y"].nulls == TABLE["point"].combine_chunks().field("y").null_count
+    assert columns["tags.item"].rows == 800
+    assert columns["brand.dictionary"].rows == 2
+    assert columns["count"].bytes["data"] == TABLE.num_rows * 8
+    assert set(columns["market_code"].bytes) == {"validity", "offsets", "data"}
+    assert columns["note"].bytes["data"] > 0   # variadic view data buffers
+
+    # Every buffer lies inside its message body
+    summary = inspect_capture(str(path), layout=True)
+    for message in summary.messages:
+        body_start = message.offset + message.metadata_bytes
+        for buffer in message.buffers or ():
+            assert body_start <= buffer.offset and buffer.offset + buffer.length <= body_start + message.body_bytes
+
+
+def test_concatenated_compressed_streams(tmp_path):
+    path = tmp_path / "frames.bin"
+    # One IPC stream per protocol frame, as debug_arrow_data.py captures them
+    frames = [_stream(batch_table, "zstd") for batch_table in
+              (TABLE.slice(0, 600), TABLE.slice(600), TABLE.select(["count"]))]
+    path.write_bytes(b"".join(frames))
+    summary = inspect_capture(str(path), keep_messages=2)
+    assert summary.streams == 3 and summary.counts["eos"] == 3
+    assert summary.rows == TABLE.num_rows * 2
+    assert summary.codecs == {"zstd": summary.counts["record_batch"] + summary.counts["dictionary_batch"]}
+    assert summary.columns["count"].nulls == 800
+    count = summary.columns["count"]
+    assert count.uncompressed_bytes > count.compressed_bytes
+    assert len(summary.messages) == 2
+    assert "... " in format_messages(summary)
+
+
+def test_ipc_file_and_truncated_capture(tmp_path):
+    path = tmp_path / "capture.arrow"
+    with ipc.new_file(str(path), TABLE.schema) as writer:
+        writer.write_table(TABLE)
+    summary = inspect_capture(str(path))
+    assert summary.error is None and summary.rows == TABLE.num_rows
+
+    data = _stream(TABLE)
+    cut = tmp_path / "cut.bin"
+    cut.write_bytes(data[:len(data) // 2])
+    summary = inspect_capture(str(cut))
+    assert summary.error is not None and "extends past the end" in summary.error
+    assert 0 < summary.rows < TABLE.num_rows
+    assert "stopped" in format_summary(summary)
+    assert "market_code" in format_columns(summary)
+
+
+def test_corrupt_header_is_reported(tmp_path):
+    path = tmp_path / "garbage.bin"
+    path.write_bytes(struct.pack("<Ii", 0xFFFFFFFF, 60) + bytes(range(60)))
+    summary = inspect_capture(str(path))
+    assert summary.error.startswith("malformed message 0 (stopped at offset 0)")
+    assert "stopped" in format_summary(summary)
+
+
+def test_corrupted_captures_never_raise(tmp_path):
+    data = _stream(TABLE.slice(0, 30), chunk=10)
+    path = tmp_path / "corrupt.bin"
+    rng = random.Random(3)
+    stopped = 0
+    for _ in range(300):
+        corrupt = bytearray(data)
+        for _ in range(3):
+            corrupt[rng.randrange(600)] = rng.randrange(256)
+        path.write_bytes(bytes(corrupt))
+        summary = inspect_capture(str(path))
+        stopped += summary.error is not None
+    assert stopped > 100
+
+
+def test_empty_capture(tmp_path):
+    path = tmp_path / "empty.bin"
+    path.write_bytes(b"")
+    summary = inspect_capture(str(path))
+    assert summary.messages == [] and summary.rows == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for BalancedArrowNativeClient against local stand-in servers
+
+Run:
+    python -m pytest test_arrow_native_balancer.py -q
+"""
+
+import threading
+
+import pyarrow as pa
+import pytest
+
+from arrow_native_balancer import BalancedArrowNativeClient, parse_endpoint
+from arrow_native_client import ArrowNativeClient, QueryError
+
+TABLE = pa.table({"x": [1, 2, 3]})
+
+
+@pytest.fixture
+def servers(mock_server):
+    return [mock_server(TABLE) for _ in range(3)]
+
+
+def _client(servers, **kwargs) -> BalancedArrowNativeClient:
+    kwargs.setdefault("health_check_interval", None)
+    kwargs.setdefault("seed", 7)
+    return BalancedArrowNativeClient([s.address for s in servers], **kwargs)
+
+
+def test_parse_endpoint():
+    assert parse_endpoint("cube-1:4446") == ("cube-1", 4446)
+    assert parse_endpoint("cube-1") == ("cube-1", 4445)
+    assert parse_endpoint(("10.0.0.1", "4445")) == ("10.0.0.1", 4445)
+
+
+@pytest.mark.parametrize("policy", ["p2c", "least_outstanding", "round_robin", "random"])
+def test_policies_spread_queries(servers, policy):
+    with _client(servers, policy=policy) as client:
+        outcomes = client.query_many([f"SELECT {i}" for i in range(60)], max_concurrency=6)
+        assert all(o.ok for o in outcomes)
+        assert all(o.result.to_table().equals(TABLE) for o in outcomes)
+    assert all(server.queries > 0 for server in servers)
+
+
+def test_least_outstanding_avoids_busy_endpoint(servers):
+    with _client(servers, policy="least_outstanding") as client:
+        busy = client.endpoints[0]
+        busy.outstanding = 100
+        for _ in range(20):
+            client.query("SELECT 1")
+        busy.outstanding = 0
+    assert servers[0].queries == 0
+
+
+def test_slow_endpoint_gets_less_traffic(servers):
+    servers[2].latency = 0.05
+    with _client(servers, policy="p2c", max_size_per_endpoint=8) as client:
+        client.query_many([f"SELECT {i}" for i in range(120)], max_concurrency=12)
+    assert servers[2].queries < min(servers[0].queries, servers[1].queries)
+
+
+def test_query_error_does_not_count_as_failure(servers):
+    with _client(servers, failure_threshold=1) as client:
+        for _ in range(5):
+            with pytest.raises(QueryError):
+                client.query("SELECT bad")
+        assert not any(s.ejected for s in client.stats())
+        assert sum(s.failures for s in client.stats()) == 0
+
+
+def test_other_errors_release_the_endpoint(servers, monkeypatch):
+    def undecodable(self, sql):
+        raise pa.ArrowInvalid("corrupt batch")
+
+    monkeypatch.setattr(ArrowNativeClient, "query", undecodable)
+    with _client(servers, failure_threshold=1) as client:
+        for _ in range(3):
+            with pytest.raises(pa.ArrowInvalid):
+                client.query("SELECT 1")
+        assert [s.outstanding for s in client.stats()] == [0, 0, 0]
+        assert sum(s.failures for s in client.stats()) == 0
+
+
+def test_failed_endpoint_is_ejected_and_retried_elsewhere(servers):
+    servers[0].set_fail_mode("refuse")
+    with _client(servers, policy="round_robin", failure_threshold=2, retries=2) as client:
+        outcomes = client.query_many([f"SELECT {i}" for i in range(30)], max_concurrency=3)
+        assert all(o.ok for o in outcomes)
+        stats = client.stats()
+        assert stats[0].ejected
+        assert stats[0].ejections == 1
+        assert stats[1].ejected is False and stats[2].ejected is False
+
+
+def test_reintroduction_uses_slow_start_and_backoff(servers, clock):
+    clock.now = 1000.0
+    with _client(servers, failure_threshold=1, ejection_time=10.0, slow_start=20.0,
+                 min_weight=0.1, clock=clock) as client:
+        endpoint = client.endpoints[0]
+        with client._lock:
+            client._record(endpoint, ok=False)
+        assert client.stats()[0].ejected
+
+        clock.now += 9.0
+        assert client.stats()[0].ejected
+        clock.now += 1.0
+        client.query("SELECT 1")  # routing reintroduces expired ejections
+        assert not client.stats()[0].ejected
+        assert client.stats()[0].weight == pytest.approx(0.1)
+        clock.now += 10.0
+        assert client.stats()[0].weight == pytest.approx(0.5)
+
+        # Failing again during slow start doubles the ejection time
+        with client._lock:
+            client._record(endpoint, ok=False)
+        clock.now += 10.0
+        assert client.stats()[0].ejected
+        clock.now += 10.0
+        assert not client.stats()[0].ejected
+
+
+def test_probes_while_ejected_keep_the_backoff(servers, clock):
+    with _client(servers, failure_threshold=1, ejection_time=10.0, slow_start=20.0, clock=clock) as client:
+        endpoint = client.endpoints[0]
+        with client._lock:
+            client._record(endpoint, ok=False)
+            client._record(endpoint, ok=True)  # health probe answered while ejected
+        clock.now += 10.0
+        client.query("SELECT 1")  # reintroduced, in slow start
+        with client._lock:
+            client._record(endpoint, ok=True)
+            client._record(endpoint, ok=False)
+        clock.now += 19.0
+        assert client.stats()[0].ejected  # flapping: the ejection time doubled
+
+        # A success after slow start completed resets it
+        clock.now += 1.0 + 20.0
+        client.query("SELECT 1")
+        clock.now += 20.0
+        with client._lock:
+            client._record(endpoint, ok=True)
+            client._record(endpoint, ok=False)
+        clock.now += 10.0
+        assert not client.stats()[0].ejected
+
+
+def test_any_probe_failure_marks_endpoint_down(servers, monkeypatch):
+    def undecodable(self, sql):
+        raise pa.ArrowInvalid("corrupt batch")
+
+    monkeypatch.setattr(ArrowNativeClient, "query", undecodable)
+    with _client(servers, failure_threshold=1) as client:
+        assert client.check_health() == [False, False, False]
+        assert all(s.ejected for s in client.stats())
+
+
+def test_all_ejected_fails_open(servers, clock):
+    with _client(servers, failure_threshold=1, clock=clock) as client:
+        with client._lock:
+            for endpoint in client.endpoints:
+                client._record(endpoint, ok=False)
+        assert all(s.ejected for s in client.stats())
+        assert client.query("SELECT 1").to_table().equals(TABLE)
+
+
+def test_active_health_check_ejects_idle_endpoint(servers):
+    servers[1].set_fail_mode("refuse")
+    with _client(servers, failure_threshold=2, health_check_timeout=1.0) as client:
+        assert client.check_health() == [True, False, True]
+        client.check_health()
+        assert [s.ejected for s in client.stats()] == [False, True, False]
+
+
+def test_background_health_checks(servers):
+    servers[2].set_fail_mode("refuse")
+    with _client(servers, failure_threshold=1, health_check_interval=0.05) as client:
+        ejected = threading.Event()
+        for _ in range(100):
+            if client.stats()[2].ejected:
+                ejected.set()
+                break
+            ejected.wait(0.02)
+        assert ejected.is_set()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for ArrowNativeClient memory budgets, spill-to-disk and streaming
+export against a local stand-in server
+
+Run:
+    python -m pytest test_arrow_native_client.py -q
+"""
+
+import gc
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import pytest
+
+import arrow_native_client
+from arrow_native_client import ArrowNativeClient, Capability
+
+TABLE = pa.table({"market": [f"m{i % 7}" for i in range(2000)],
+                  "count": pa.array(range(2000), pa.int64())})
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(TABLE, batch_size=100, capabilities=Capability.DICTIONARY_ENCODING)
+
+
+def test_query_budget_spills_to_disk(server, tmp_path):
+    with ArrowNativeClient("127.0.0.1", server.port, query_memory_budget=4096,
+                           spill_dir=str(tmp_path)) as client:
+        result = client.query("SELECT 1")
+        assert result.spilled and result.memory_bytes == 0
+        assert result.to_table().equals(TABLE)
+        assert client.memory_in_use() == 0
+        # Unlinked at once: the memory map keeps the data alive
+        assert os.listdir(tmp_path) == []
+
+
+def test_small_results_stay_in_memory(server, tmp_path):
+    with ArrowNativeClient("127.0.0.1", server.port, query_memory_budget=1 << 30,
+                           spill_dir=str(tmp_path)) as client:
+        result = client.query("SELECT 1")
+        assert not result.spilled and result.memory_bytes > 0
+        assert client.memory_in_use() == result.memory_bytes
+
+
+def test_dictionary_results_spill(server, tmp_path):
+    with ArrowNativeClient("127.0.0.1", server.port, query_memory_budget=4096,
+                           dictionary_encoding=True, spill_dir=str(tmp_path)) as client:
+        result = client.query("SELECT 1")
+    assert result.spilled
+    assert pa.types.is_dictionary(result.schema.field("market").type)
+    assert result.to_table().cast(TABLE.schema).equals(TABLE)
+
+
+def test_client_budget_covers_live_results(server, tmp_path):
+    with ArrowNativeClient("127.0.0.1", server.port, spill_dir=str(tmp_path)) as client:
+        size = client.query("SELECT 1").memory_bytes
+        client.client_memory_budget = size * 3 // 2
+
+        first = client.query("SELECT 1")
+        assert not first.spilled
+        second = client.query("SELECT 2")
+        assert second.spilled and second.to_table().equals(TABLE)
+        assert client.memory_in_use() == first.memory_bytes
+
+        # Releasing a result frees its share of the budget
+        del first
+        gc.collect()
+        assert client.memory_in_use() == 0
+        assert not client.query("SELECT 3").spilled
+
+
+def test_spill_file_removed_when_stream_fails(server, tmp_path):
+    with ArrowNativeClient("127.0.0.1", server.port, query_memory_budget=1,
+                           spill_dir=str(tmp_path)) as client:
+        def failing():
+            for batch in TABLE.to_batches(max_chunksize=100)[:3]:
+                yield batch, batch.nbytes
+            raise OSError("connection reset")
+
+        with pytest.raises(OSError):
+            client._collect(TABLE.schema, failing())
+    assert os.listdir(tmp_path) == []
+
+
+def test_export_parquet(server, tmp_path):
+    path = str(tmp_path / "out.parquet")
+    with ArrowNativeClient("127.0.0.1", server.port) as client:
+        stats = client.query_to_file("SELECT 1", path, row_group_size=500)
+    assert (stats.rows, stats.batches) == (2000, 20)
+    assert stats.file_bytes == os.path.getsize(path)
+    assert pq.ParquetFile(path).metadata.num_row_groups == 4
+    assert pq.read_table(path).equals(TABLE)
+
+
+def test_export_arrow(server, tmp_path):
+    path = str(tmp_path / "out.arrow")
+    with ArrowNativeClient("127.0.0.1", server.port, dictionary_encoding=True) as client:
+        client.query_to_file("SELECT 1", path, format="arrow", compression="zstd")
+    with pa.memory_map(path) as source:
+        assert ipc.open_file(source).read_all().equals(TABLE)
+
+
+def test_export_partitioned(server, tmp_path):
+    path = str(tmp_path / "dataset")
+    with ArrowNativeClient("127.0.0.1", server.port) as client:
+        stats = client.query_to_file("SELECT 1", path, partition_by=["market"])
+    assert sorted(os.listdir(path)) == [f"market=m{i}" for i in range(7)]
+    table = ds.dataset(path, partitioning="hive").to_table()
+    assert stats.rows == table.num_rows == 2000
+    assert sorted(table["count"].to_pylist()) == list(range(2000))
+
+
+def _failing_rechunk(batches, rows):
+    yield pa.Table.from_batches([next(batches)])
+    raise OSError("disk full")
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_failed_export_cleans_up_and_resyncs(server, tmp_path, monkeypatch, format):
+    monkeypatch.setattr(arrow_native_client, "_rechunk", _failing_rechunk)
+    path = str(tmp_path / f"out.{format}")
+    with ArrowNativeClient("127.0.0.1", server.port) as client:
+        with pytest.raises(OSError, match="disk full"):
+            client.query_to_file("SELECT 1", path, format=format)
+        assert os.listdir(tmp_path) == []
+        # The rest of the result was drained: the connection is still in sync
+        assert client.query("SELECT 2").to_table().equals(TABLE)
+
+
+def test_failed_partitioned_export_keeps_existing_files(server, tmp_path):
+    path = tmp_path / "dataset"
+    (path / "market=old").mkdir(parents=True)
+    (path / "market=old" / "part-0.parquet").write_bytes(b"kept")
+    with ArrowNativeClient("127.0.0.1", server.port) as client:
+        with pytest.raises(Exception):
+            client.query_to_file("SELECT 1", str(path), partition_by=["no_such_column"])
+        assert os.listdir(path) == ["market=old"]
+        assert client.query("SELECT 2").to_table().equals(TABLE)
+
+
+def test_broken_stream_closes_connection(server, tmp_path, monkeypatch):
+    receive = ArrowNativeClient._iter_batches
+
+    def reset_mid_stream(self, schema):
+        stream = receive(self, schema)
+        yield next(stream)
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(ArrowNativeClient, "_iter_batches", reset_mid_stream)
+    path = str(tmp_path / "out.parquet")
+    with ArrowNativeClient("127.0.0.1", server.port) as client:
+        with pytest.raises(OSError, match="connection reset"):
+            client.query_to_file("SELECT 1", path)
+        # The connection is mid-result: it can't be drained, only closed
+        assert client.socket is None
+    assert os.listdir(tmp_path) == []
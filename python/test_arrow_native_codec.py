@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for the sans-IO Arrow Native codec and the transports sharing it
+
+Run:
+    python -m pytest test_arrow_native_codec.py -q
+"""
+
+import asyncio
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pytest
+
+import arrow_native_codec as codec
+from arrow_native_client import ArrowNativeClient, Capability, QueryError
+from arrow_native_mock_server import result_payloads
+from arrow_native_pool import AsyncArrowNativeClient
+
+TABLE = pa.table({"market": ["a", "b", "a", "c"] * 5, "count": list(range(20))})
+
+
+def _stream(payloads):
+    return b"".join(codec.frame(payload) for payload in payloads)
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(TABLE, batch_size=6,
+                       capabilities=Capability.DICTIONARY_ENCODING | Capability.SCHEMA_FINGERPRINT)
+
+
+def test_requests_round_trip():
+    data = _stream([
+        codec.handshake_request(capabilities=Capability.SCHEMA_FINGERPRINT),
+        codec.auth_request("token", None),
+        codec.auth_request("token", "db"),
+        codec.query_request("SELECT 'é'", options=1),
+        codec.query_request("SELECT 1"),
+    ])
+    assert codec.FrameDecoder().feed(data) == [
+        codec.HandshakeRequest(1, Capability.SCHEMA_FINGERPRINT),
+        codec.AuthRequest("token", None),
+        codec.AuthRequest("token", "db"),
+        codec.QueryRequest("SELECT 'é'", 1),
+        codec.QueryRequest("SELECT 1", None),
+    ]
+
+
+def test_byte_at_a_time_matches_single_feed():
+    data = _stream([codec.handshake_response("v1", accepted=3), codec.auth_response("s")]
+                   + result_payloads(TABLE, batch_size=6)
+                   + [codec.error_response("CODE", "message")])
+    whole = codec.FrameDecoder().feed(data)
+    decoder = codec.FrameDecoder()
+    split = [event for i in range(len(data)) for event in decoder.feed(data[i:i + 1])]
+
+    assert [type(e) for e in whole] == [type(e) for e in split] == [
+        codec.HandshakeResponse, codec.AuthResponse, codec.Schema,
+        codec.Batch, codec.Batch, codec.Batch, codec.Batch, codec.QueryComplete, codec.Error]
+    assert whole[0] == split[0] == codec.HandshakeResponse(1, "v1", 3)
+    assert whole[7] == split[7] == codec.QueryComplete(20)
+    assert split[8].exception().code == "CODE"
+    assert decoder.frames_received == 9 and decoder.bytes_received == len(data)
+    batches = [ipc.open_stream(e.ipc).read_next_batch() for e in split if type(e) is codec.Batch]
+    assert pa.Table.from_batches(batches).equals(TABLE)
+
+
+def test_buffer_protocol_receives_large_bodies_in_place():
+    data = _stream(result_payloads(TABLE, batch_size=20))
+    decoder = codec.FrameDecoder()
+    events, pos = [], 0
+    while pos < len(data):
+        buffer = decoder.get_buffer()
+        n = min(len(buffer), 50, len(data) - pos)
+        buffer[:n] = data[pos:pos + n]
+        pos += n
+        events.extend(decoder.buffer_updated(n))
+    batch = ipc.open_stream(events[1].ipc).read_next_batch()
+    assert batch.equals(TABLE.to_batches()[0])
+    # IPC bytes are 8-byte aligned inside their pool buffer
+    assert events[1].ipc.address % 8 == 0
+
+
+def test_invalid_length_and_unknown_type():
+    with pytest.raises(RuntimeError, match="Invalid message length"):
+        codec.FrameDecoder().feed(b"\x00\x00\x00\x00")
+    with pytest.raises(RuntimeError, match="Unexpected message type: 0x42"):
+        codec.FrameDecoder().feed(codec.frame(b"\x42"))
+
+
+def test_sync_client_through_codec(server):
+    with ArrowNativeClient("127.0.0.1", server.port, dictionary_encoding=True,
+                           schema_fingerprints=True) as client:
+        first = client.query("SELECT 1")
+        second = client.query("SELECT 2", dictionary=False)
+        with pytest.raises(QueryError, match="bad query"):
+            client.query("SELECT bad")
+        third = client.query("SELECT 3", dictionary=False)
+    assert pa.types.is_dictionary(first.schema.field("market").type)
+    assert first.to_table().cast(TABLE.schema).equals(TABLE)
+    assert second.to_table().equals(TABLE) and third.to_table().equals(TABLE)
+    assert client.schema_cache_hits == 1
+
+
+def test_async_client_through_codec(server):
+    async def run():
+        async with AsyncArrowNativeClient("127.0.0.1", server.port) as client:
+            result = await client.query("SELECT 1")
+            with pytest.raises(QueryError, match="bad query"):
+                await client.query("SELECT bad")
+            return result, await client.query("SELECT 2")
+
+    first, second = asyncio.run(run())
+    assert first.to_table().equals(TABLE) and second.rows_affected == 20
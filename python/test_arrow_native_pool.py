@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Tests for ArrowNativePool hedging against a local stand-in server
+
+Run:
+    python -m pytest test_arrow_native_pool.py -q
+"""
+
+import asyncio
+import re
+import threading
+import time
+
+import pyarrow as pa
+import pytest
+
+from arrow_native_client import ArrowNativeClient, QueryError
+from arrow_native_mock_server import MockArrowNativeServer
+from arrow_native_pool import ArrowNativePool, AsyncArrowNativePool, BulkQueryMixin, HedgePolicy
+
+TABLE = pa.table({"x": [1, 2, 3]})
+
+
+class SlowFirstAttempt:
+    """Handler that stalls the first execution of each query"""
+
+    def __init__(self, stall: float):
+        self.stall = stall
+        self.seen = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, sql: str) -> pa.Table:
+        if "bad" in sql:
+            raise QueryError("BAD", "bad query")
+        with self.lock:
+            first = sql not in self.seen
+            self.seen.add(sql)
+        if first and "slow" in sql:
+            time.sleep(self.stall)
+        return TABLE
+
+
+def _sleepy(sql: str) -> pa.Table:
+    """Answer "SELECT <ms>" after <ms> milliseconds with x = <ms>"""
+    if "bad" in sql:
+        raise QueryError("BAD", "bad query")
+    ms = int(re.search(r"\d+", sql).group())
+    time.sleep(ms / 1000)
+    return pa.table({"x": [ms]})
+
+
+@pytest.fixture
+def server():
+    with MockArrowNativeServer(SlowFirstAttempt(stall=1.0)) as s:
+        yield s
+
+
+@pytest.fixture
+def sleepy_server():
+    with MockArrowNativeServer(_sleepy) as s:
+        yield s
+
+
+def test_hedge_wins_over_stalled_attempt(server):
+    policy = HedgePolicy(initial_delay=0.02, burst=5)
+    with ArrowNativePool("127.0.0.1", server.port, max_size=4, hedging=policy) as pool:
+        start = time.perf_counter()
+        result = pool.query("SELECT slow")
+        elapsed = time.perf_counter() - start
+    assert result.to_table().equals(TABLE)
+    assert elapsed < 0.5
+    assert policy.stats.hedges_fired == 1
+    assert policy.stats.hedges_won == 1
+    assert policy.stats.cancelled == 1
+
+
+def test_fast_queries_are_not_hedged(server):
+    policy = HedgePolicy(initial_delay=0.5)
+    with ArrowNativePool("127.0.0.1", server.port, max_size=4, hedging=policy) as pool:
+        for i in range(10):
+            pool.query(f"SELECT {i}")
+    assert policy.stats.queries == 10
+    assert policy.stats.hedges_fired == 0
+
+
+def test_budget_caps_hedges(server):
+    policy = HedgePolicy(initial_delay=0.01, budget=0.0, burst=1)
+    with ArrowNativePool("127.0.0.1", server.port, max_size=4, hedging=policy) as pool:
+        pool.query("SELECT slow 1")
+        start = time.perf_counter()
+        pool.query("SELECT slow 2")
+        assert time.perf_counter() - start >= 0.9
+    assert policy.stats.hedges_fired == 1
+    assert policy.stats.skipped_budget == 1
+
+
+def test_no_free_connection_skips_hedge(server):
+    policy = HedgePolicy(initial_delay=0.01)
+    with ArrowNativePool("127.0.0.1", server.port, max_size=1, hedging=policy) as pool:
+        assert pool.query("SELECT slow").to_table().equals(TABLE)
+    assert policy.stats.hedges_fired == 0
+    assert policy.stats.skipped_no_connection == 1
+
+
+def test_query_error_is_raised_and_connection_kept(server):
+    policy = HedgePolicy(initial_delay=0.5)
+    with ArrowNativePool("127.0.0.1", server.port, max_size=2, hedging=policy) as pool:
+        with pytest.raises(QueryError):
+            pool.query("SELECT bad")
+        pool.query("SELECT 1")
+    assert server.connections == 1
+
+
+class Interrupted(BaseException):
+    """Stands in for KeyboardInterrupt/SystemExit in an attempt thread"""
+
+
+def test_interrupted_attempt_releases_connection(server, monkeypatch):
+    def interrupted(self, sql, on_schema=None):
+        raise Interrupted()
+
+    monkeypatch.setattr(ArrowNativeClient, "_query", interrupted)
+    with ArrowNativePool("127.0.0.1", server.port, max_size=1,
+                         hedging=HedgePolicy(initial_delay=0.5)) as pool:
+        outcome = []
+        caller = threading.Thread(target=lambda: outcome.append(_raised(pool.query, "SELECT 1")), daemon=True)
+        caller.start()
+        caller.join(5)
+        assert not caller.is_alive() and isinstance(outcome[0], Interrupted)
+        # Checked in as broken: the slot is free again
+        assert pool._size == 0 and pool._idle == []
+
+
+def _raised(fn, *args):
+    try:
+        fn(*args)
+    except BaseException as e:
+        return e
+
+
+def test_query_many_keeps_input_order_and_isolates_errors(sleepy_server):
+    sqls = ["SELECT 150", "SELECT bad", "SELECT 10", "SELECT 80"]
+    with ArrowNativePool("127.0.0.1", sleepy_server.port, max_size=4) as pool:
+        outcomes = pool.query_many(sqls)
+    assert [o.index for o in outcomes] == [0, 1, 2, 3]
+    assert [o.sql for o in outcomes] == sqls
+    assert [o.ok for o in outcomes] == [True, False, True, True]
+    assert isinstance(outcomes[1].error, QueryError)
+    assert [o.unwrap().to_table()["x"][0].as_py() for o in outcomes if o.ok] == [150, 10, 80]
+
+
+def test_as_completed_yields_fastest_first(sleepy_server):
+    with ArrowNativePool("127.0.0.1", sleepy_server.port, max_size=4) as pool:
+        order = [o.index for o in pool.as_completed(["SELECT 300", "SELECT 10", "SELECT 150"])]
+    assert order == [1, 2, 0]
+
+
+def test_bulk_mixin_requires_query():
+    class Incomplete(BulkQueryMixin):
+        max_size = 2
+
+    with pytest.raises(TypeError, match="query"):
+        Incomplete()
+
+    class Upper(Incomplete):
+        def query(self, sql):
+            return sql.upper()
+
+    assert [o.result for o in Upper().query_many(["a", "b"])] == ["A", "B"]
+
+
+def test_async_pool_query_many_and_as_completed(sleepy_server):
+    async def scenario():
+        async with AsyncArrowNativePool("127.0.0.1", sleepy_server.port, max_size=4) as pool:
+            outcomes = await pool.query_many(["SELECT 100", "SELECT bad", "SELECT 10"])
+            order = [o.index async for o in pool.as_completed(["SELECT 300", "SELECT 10", "SELECT 150"])]
+        return outcomes, order
+
+    outcomes, order = asyncio.run(scenario())
+    assert [o.index for o in outcomes] == [0, 1, 2]
+    assert [o.ok for o in outcomes] == [True, False, True]
+    assert outcomes[2].unwrap().to_table()["x"].to_pylist() == [10]
+    assert order == [1, 2, 0]
+
+
+def test_connection_is_dropped_after_non_query_error(server):
+    with ArrowNativePool("127.0.0.1", server.port, max_size=2) as pool:
+        with pytest.raises(pa.ArrowInvalid):
+            with pool.connection():
+                raise pa.ArrowInvalid("corrupt batch mid-stream")
+        assert pool._idle == [] and pool._size == 0
+        pool.query("SELECT 1")
+    assert server.connections == 2
+
+
+def test_delay_tracks_observed_quantile():
+    policy = HedgePolicy(quantile=0.9, initial_delay=1.0, min_samples=20, min_delay=0.0)
+    for i in range(1, 33):
+        policy.observe(i / 1000)
+    assert policy.delay() == pytest.approx(0.029)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for zero-copy Arrow handoff to worker processes
+
+Run:
+    python -m pytest test_arrow_process_pool.py -q
+"""
+
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+
+from arrow_native_client import QueryResult
+from arrow_process_pool import ArrowProcessPool, write_shared
+
+TABLE = pa.table({
+    "id": pa.array(range(1000), pa.int64()),
+    "market": pa.array([f"M{i % 7}" for i in range(1000)]).dictionary_encode(),
+})
+
+
+def _sum_ids(table: pa.Table, offset: int = 0) -> int:
+    return pc.sum(table.column("id")).as_py() + offset
+
+
+def _double(table: pa.Table) -> pa.Table:
+    return table.set_column(0, "id", pc.multiply(table.column("id"), 2))
+
+
+def _fail(table: pa.Table):
+    raise ValueError("scoring failed")
+
+
+@pytest.fixture(scope="module")
+def pool(tmp_path_factory):
+    with ArrowProcessPool(max_workers=2, directory=str(tmp_path_factory.mktemp("shared"))) as p:
+        yield p
+
+
+def test_write_shared_reads_back_zero_copy(tmp_path):
+    result = QueryResult(schema=TABLE.schema, batches=TABLE.to_batches(max_chunksize=300),
+                         rows_affected=1000)
+    shared = write_shared(result, str(tmp_path))
+    assert shared.num_rows == 1000 and os.path.getsize(shared.path) == shared.nbytes
+    allocated = pa.total_allocated_bytes()
+    table = shared.to_table()
+    # Zero-copy: columns are views over the mapping, nothing is allocated
+    assert pa.total_allocated_bytes() == allocated
+    assert table.equals(TABLE)
+    # Buffers point into the mapping and survive the file being unlinked
+    os.remove(shared.path)
+    assert table.column("market").to_pylist()[:3] == ["M0", "M1", "M2"]
+
+
+def test_tasks_share_one_file_and_cleanup_is_refcounted(pool):
+    with pool.shared(TABLE) as shared:
+        futures = [pool.submit(_sum_ids, shared, offset=i) for i in range(4)]
+        assert [f.result() for f in futures] == [499500 + i for i in range(4)]
+        assert os.path.exists(shared.path)
+    assert not os.path.exists(shared.path)
+    assert pool.live_files == 0
+
+
+def test_one_off_table_and_map(pool):
+    assert pool.submit(_sum_ids, TABLE).result() == 499500
+    assert pool.map(_sum_ids, TABLE, [1, 2]) == [499501, 499502]
+    assert pool.live_files == 0
+
+
+def test_shared_result_comes_back_as_handle(pool):
+    doubled = pool.submit(_double, TABLE, share_result=True).result()
+    assert pool.live_files == 1
+    assert doubled.to_table().column("id").to_pylist()[:3] == [0, 2, 4]
+    pool.release(doubled)
+    assert pool.live_files == 0 and not os.path.exists(doubled.path)
+
+
+def test_worker_error_releases_input(pool):
+    with pytest.raises(ValueError, match="scoring failed"):
+        pool.submit(_fail, TABLE).result()
+    assert pool.live_files == 0
+
+
+def test_released_handle_cannot_be_submitted(pool):
+    shared = pool.share(TABLE)
+    pool.release(shared)
+    with pytest.raises(ValueError, match="already released"):
+        pool.submit(_sum_ids, shared)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for the hot query log and the background cache warmer
+
+Run:
+    python -m pytest test_cache_warmer.py -q
+"""
+
+import time
+
+import pyarrow as pa
+import pyarrow.flight as flight
+import pytest
+
+from arrow_flight_gateway import CubeFlightGateway
+from arrow_native_pool import ArrowNativePool
+from cache_warmer import CacheWarmer, HotQueryLog, load_queries
+from result_cache import ResultCache
+from sql_normalize import normalize_sql
+
+TABLE = pa.table({"market": ["a", "b", "c"], "count": [1, 2, 3]})
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(TABLE)
+
+
+@pytest.fixture
+def pool(server):
+    with ArrowNativePool("127.0.0.1", server.port, max_size=2) as p:
+        yield p
+
+
+def test_log_ranks_by_total_time_and_decays(clock):
+    clock.now = 1000.0
+    log = HotQueryLog(half_life=100.0, max_age=1000.0, clock=clock)
+    for region in ("eu", "us", "apac"):
+        log.record(f"SELECT * FROM orders WHERE region = '{region}'", 0.1)
+    log.record("SELECT slow FROM reports", 0.5)
+    top = log.top(2)
+    assert [e.count for e in top] == [1, 3]
+    assert top[1].sql.endswith("'apac'")  # latest text of the fingerprint
+
+    # The slow query was only seen long ago: recent frequent queries win
+    clock.now += 200
+    for _ in range(3):
+        log.record("SELECT * FROM orders WHERE region = 'eu'", 0.1)
+    assert log.top(1)[0].count == 6
+    clock.now += 2000
+    assert log.top(5) == []
+
+
+def test_log_round_trips_and_merges(tmp_path):
+    path = str(tmp_path / "hot.json")
+    log = HotQueryLog(path)
+    log.record("SELECT a FROM t WHERE x = 1", 0.2)
+    log.record("SELECT b FROM t", 0.1)
+    log.save()
+    other = HotQueryLog(str(tmp_path / "other.json"))
+    other.record("SELECT a FROM t WHERE x = 2", 0.3)
+    other.save()
+
+    loaded = HotQueryLog.load(path)
+    assert {e.sql for e in loaded.top(10)} == {"SELECT a FROM t WHERE x = 1", "SELECT b FROM t"}
+    merged = load_queries([path, other.path, str(tmp_path / "missing.json")])
+    # Literals are stripped: both files count the same fingerprint
+    top = merged.top(10)[0]
+    assert (top.count, top.total_seconds) == (2, pytest.approx(0.5))
+
+
+def test_warm_fills_cache_and_skips_fresh_entries(server, pool):
+    cache = ResultCache(ttl=100.0)
+    sqls = ["SELECT a FROM t", "SELECT b FROM t", "SELECT bad FROM t"]
+    with CacheWarmer(pool, cache, sqls, max_workers=2, rate=None) as warmer:
+        assert warmer.warm() == 3
+        assert cache.get(normalize_sql("SELECT a FROM t")).equals(TABLE)
+        assert (warmer.stats.warmed, warmer.stats.errors) == (2, 1)
+
+        queries = server.queries
+        warmer.warm()
+        assert warmer.stats.fresh == 2
+        assert server.queries == queries + 1  # only the failing query is retried
+
+
+def test_refresh_ahead_of_ttl(server, pool, clock):
+    cache = ResultCache(ttl=100.0, clock=clock)
+    with CacheWarmer(pool, cache, ["SELECT a FROM t"], rate=None, refresh_ahead=0.2) as warmer:
+        warmer.warm()
+        assert warmer.next_due() == pytest.approx(60.0)  # interval caps it
+        clock.now = 70.0
+        assert warmer.due("SELECT a FROM t") is None
+        assert warmer.next_due() == pytest.approx(10.0)
+        clock.now = 85.0
+        assert warmer.due("SELECT a FROM t") == "refresh"
+        warmer.warm()
+        assert warmer.stats.refreshed == 1
+        assert cache.expires_in(normalize_sql("SELECT a FROM t")) == pytest.approx(100.0)
+
+
+def test_uncached_results_wait_for_the_interval(server, pool):
+    cache = ResultCache(ttl=100.0, max_bytes=TABLE.nbytes - 1)
+    with CacheWarmer(pool, cache, ["SELECT a FROM t"], rate=None, interval=60.0).start() as warmer:
+        time.sleep(0.5)
+        assert server.queries == 1
+        assert warmer.next_due() > 59
+        assert warmer.warm() == 0 and warmer.stats.held == 1
+        assert warmer.warm(force=True) == 1
+
+
+def test_undecodable_result_counts_as_error():
+    class Pool:
+        queries = 0
+
+        def query(self, sql):
+            self.queries += 1
+            if "broken" in sql:
+                raise pa.ArrowInvalid("corrupt batch")
+            return type("Result", (), {"to_table": lambda _: TABLE})()
+
+    cache = ResultCache(ttl=100.0)
+    with CacheWarmer(Pool(), cache, ["SELECT broken", "SELECT a FROM t"], rate=None,
+                     interval=0.05).start() as warmer:
+        deadline = time.monotonic() + 5
+        while warmer.stats.cycles < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert warmer.stats.cycles >= 3 and warmer._thread.is_alive()
+        assert warmer.stats.errors >= 3 and warmer.stats.warmed == 1
+
+
+def test_rate_limit_spaces_replays(pool):
+    cache = ResultCache(ttl=100.0)
+    sqls = [f"SELECT {c} FROM t" for c in "abcde"]
+    with CacheWarmer(pool, cache, sqls, max_workers=4, rate=20.0) as warmer:
+        started = time.perf_counter()
+        warmer.warm()
+        assert time.perf_counter() - started >= 0.19
+        assert warmer.stats.warmed == 5
+
+
+def test_background_warmer_serves_gateway_hot_queries(server):
+    log = HotQueryLog()
+    gateway = CubeFlightGateway("grpc://127.0.0.1:0", pool=ArrowNativePool("127.0.0.1", server.port),
+                                hot_queries=log)
+    try:
+        client = flight.connect(f"grpc://127.0.0.1:{gateway.port}")
+        client.do_get(flight.Ticket(b"SELECT market FROM orders")).read_all()
+        assert log.top(1)[0].sql == "SELECT market FROM orders"
+
+        # After a restart: an empty cache is warmed from the log
+        cache = ResultCache(ttl=100.0)
+        with ArrowNativePool("127.0.0.1", server.port) as pool, \
+                CacheWarmer(pool, cache, log, rate=None).start() as warmer:
+            deadline = time.monotonic() + 5
+            while warmer.stats.warmed == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert normalize_sql("SELECT market FROM orders") in cache
+    finally:
+        gateway.shutdown()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Tests for the Cube REST client's JSON-to-Arrow conversion (no server needed)
+
+Run:
+    python -m pytest test_cube_http_client.py -q
+"""
+
+import datetime
+
+import pyarrow as pa
+import pytest
+
+from cube_http_client import _column, annotation_types, response_to_table
+
+
+@pytest.mark.parametrize("values", [
+    ["1", "2", "3"],        # integral strings
+    ["1.5", "2.25"],        # decimal strings
+    [1, 2.5],               # JSON numbers
+    [],                     # empty result
+    [None, None],           # all null
+    ["7", None],
+])
+def test_number_type_does_not_depend_on_values(values):
+    array = _column(values, "number")
+    assert array.type == pa.float64()
+    assert array.to_pylist() == [None if v is None else float(v) for v in values]
+
+
+def test_annotated_types():
+    assert _column(["10", "20"], "count").to_pylist() == [10, 20]
+    assert _column([True, None], "boolean").type == pa.bool_()
+    assert _column(["2024-01-01T00:00:00.000", None], "time").to_pylist() == [datetime.datetime(2024, 1, 1), None]
+    assert _column(["2024-01-02T12:00:00.000Z"], "time").to_pylist() == [datetime.datetime(2024, 1, 2, 12)]
+    assert _column([None], None).type == pa.string()
+
+
+def test_mixed_values():
+    assert _column([1, "a", None], "string").to_pylist() == ["1", "a", None]
+    assert _column([1, "2.5"], "number").to_pylist() == [1.0, 2.5]
+    with pytest.raises(ValueError, match="'number'"):
+        _column(["1", "n/a"], "number")
+
+
+def test_annotation_types_and_response_schema():
+    annotation = {"measures": {"orders.count": {"type": "number"}},
+                  "dimensions": {"orders.status": {"type": "string"}},
+                  "timeDimensions": {"orders.created_at.day": {"type": "time"}}}
+    assert annotation_types(annotation) == {"orders.count": "number", "orders.status": "string",
+                                            "orders.created_at.day": "time"}
+    integral = response_to_table({"annotation": annotation, "data": [
+        {"orders.count": "3", "orders.status": "paid", "orders.created_at.day": "2024-01-01T00:00:00.000"}]})
+    empty = response_to_table({"annotation": annotation, "data": []})
+    compact = response_to_table({"annotation": annotation, "members": ["orders.status", "orders.count"],
+                                 "dataset": [["paid", "1.5"]]})
+    assert integral.schema == empty.schema
+    assert compact.to_pylist() == [{"orders.status": "paid", "orders.count": 1.5}]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for cube_metrics against a local stand-in server
+
+Run:
+    python -m pytest test_cube_metrics.py -q
+"""
+
+import urllib.request
+
+import pyarrow as pa
+import pytest
+
+from arrow_native_client import ArrowNativeClient, QueryError
+from arrow_native_pool import ArrowNativePool
+from cube_metrics import LogHistogram, Metrics
+from sql_normalize import fingerprint_sql
+
+TABLE = pa.table({"x": list(range(10))})
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(TABLE, batch_size=4)
+
+
+def test_fingerprint_strips_literals():
+    a = fingerprint_sql("SELECT a FROM t WHERE d >= '2024-01-01' AND n IN (1, 2) LIMIT 10")
+    b = fingerprint_sql("select a  from t where d >= '2025-06-01' and n in (7) limit 500;")
+    assert a == b == "select a from t where d >= ? and n in (?) limit ?"
+    assert fingerprint_sql('SELECT "col1" FROM t') == 'select "col1" from t'
+
+
+@pytest.mark.parametrize("seconds", [1e-6, 3.3e-4, 0.001, 0.0042, 0.75, 1.0, 12.5])
+def test_histogram_bucket_bounds(seconds):
+    index = LogHistogram.bucket(seconds)
+    upper = LogHistogram.upper_bound(index)
+    lower = LogHistogram.upper_bound(index - 1) if index else 0.0
+    assert lower <= seconds < upper
+    assert upper / seconds <= 1.25 + 1e-9
+
+
+def test_histogram_quantile():
+    h = LogHistogram()
+    for ms in range(1, 101):
+        h.record(ms / 1000)
+    assert 0.045 <= h.quantile(0.5) <= 0.065
+    assert 0.095 <= h.quantile(0.99) <= 0.125
+
+
+def test_client_records_queries(server):
+    metrics = Metrics()
+    with ArrowNativeClient("127.0.0.1", server.port, metrics=metrics) as client:
+        client.query("SELECT x FROM t WHERE y = 1")
+        client.query("SELECT x FROM t WHERE y = 2")
+        with pytest.raises(QueryError):
+            client.query("SELECT bad")
+
+    counters = metrics.counters
+    assert counters["queries"] == 3
+    assert counters["errors"] == 1
+    assert counters["batches"] == 6
+    assert counters["connections_opened"] == 1
+    assert counters["bytes_in"] > 0 and counters["bytes_out"] > 0
+    fingerprint = metrics.fingerprint("SELECT x FROM t WHERE y = 99")
+    assert metrics.histograms[fingerprint].count == 2
+
+
+def test_pool_waits_are_counted(server):
+    metrics = Metrics()
+    with ArrowNativePool("127.0.0.1", server.port, max_size=1, metrics=metrics) as pool:
+        client = pool.checkout()
+        with pytest.raises(TimeoutError):
+            pool.checkout(timeout=0.01)
+        pool.checkin(client)
+    assert metrics.counters["pool_waits"] == 1
+
+
+def test_fingerprint_cardinality_is_bounded():
+    metrics = Metrics(max_fingerprints=2)
+    for table in ("a", "b", "c", "d"):
+        metrics.record_query(f"SELECT 1 FROM {table}", 0.001)
+    assert len(metrics.histograms) == 3
+    assert metrics.histograms["other"].count == 2
+
+
+def test_shards_of_finished_threads_are_retired(server):
+    metrics = Metrics(max_fingerprints=1)
+    with ArrowNativePool("127.0.0.1", server.port, max_size=4, metrics=metrics) as pool:
+        for i in range(20):
+            # Each call runs on a fresh thread pool
+            list(pool.query_many([f"SELECT {i}", "SELECT 1 FROM other"]))
+    assert len(metrics._shards) <= 2
+    assert metrics.counters["queries"] == 40
+    histograms = metrics.histograms
+    assert sum(h.count for h in histograms.values()) == 40
+    assert histograms["other"].count == 20
+
+
+def test_prometheus_exposition_and_endpoint(server, tmp_path):
+    metrics = Metrics()
+    metrics.record_query('SELECT "a" FROM t WHERE s = \'x\'', 0.002, bytes_in=100, batches=1)
+    text = metrics.render_prometheus()
+    assert "# TYPE cube_client_queries_total counter" in text
+    assert "cube_client_bytes_in_total 100" in text
+    assert 'le="+Inf"} 1' in text
+    assert 'statement="select \\"a\\" from t where s = ?"' in text
+
+    path = tmp_path / "cube.prom"
+    metrics.write_prometheus(str(path))
+    assert path.read_text() == text
+
+    http = metrics.serve(port=0)
+    try:
+        url = f"http://127.0.0.1:{http.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.read().decode() == metrics.render_prometheus()
+    finally:
+        metrics.close()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the semantic query builder: canonicalization, SQL and memoization
+
+Run:
+    python -m pytest test_cube_query_builder.py -q
+"""
+
+import pytest
+
+from cube_query_builder import CubeQuery, Filter, TimeDimension, compile_cache_info
+
+
+def test_equivalent_specs_are_canonical():
+    a = CubeQuery("orders", measures=["total_amount_sum", "count", "count"],
+                  dimensions=["market_code", "orders.brand_code"],
+                  filters=[Filter("financial_status", "equals", ("refunded", "paid", "paid")),
+                           Filter("count", "gt", (10,))],
+                  time_dimension=TimeDimension("updated_at", "DAY", ("2024-01-01", "2024-01-31")))
+    b = CubeQuery.from_rest({
+        "measures": ["orders.count", "orders.total_amount_sum"],
+        "dimensions": ["orders.brand_code", "orders.market_code"],
+        "filters": [{"member": "orders.count", "operator": "gt", "values": [10]},
+                    {"member": "orders.financial_status", "operator": "equals",
+                     "values": ["paid", "refunded"]}],
+        "timeDimensions": [{"dimension": "orders.updated_at", "granularity": "day",
+                            "dateRange": ["2024-01-01", "2024-01-31"]}],
+    })
+    assert a == b and hash(a) == hash(b)
+    assert a.measures == ("orders.count", "orders.total_amount_sum")
+    assert a.dimensions == ("orders.brand_code", "orders.market_code")
+    assert a.filters[1].values == ("paid", "refunded")
+    assert a.to_sql() == b.to_sql() and a.cache_key() == b.cache_key()
+
+
+def test_sql():
+    q = CubeQuery("orders", measures=["count"], dimensions=["market_code"],
+                  filters=[Filter("financial_status", "equals", ("paid", "refunded")),
+                           Filter("brand_code", "contains", ("it's",))],
+                  time_dimension=TimeDimension("updated_at", "month", ("2024-01-01", "2024-03-31")),
+                  limit=100)
+    assert q.to_sql() == (
+        "SELECT orders.market_code, DATE_TRUNC('month', orders.updated_at) AS updated_at_month, "
+        "MEASURE(orders.count)\n"
+        "FROM orders\n"
+        "WHERE orders.brand_code LIKE '%it''s%' ESCAPE '\\' AND orders.financial_status IN ('paid', 'refunded') "
+        "AND orders.updated_at >= '2024-01-01' AND orders.updated_at < '2024-04-01'\n"
+        "GROUP BY 1, 2\n"
+        "LIMIT 100")
+
+
+def test_contains_matches_wildcards_literally():
+    assert Filter("code", "contains", ("50%_off",)).to_sql() == r"code LIKE '%50\%\_off%' ESCAPE '\'"
+    assert Filter("path", "notContains", ("a\\b", "c")).to_sql() == (
+        r"(path NOT LIKE '%a\\b%' ESCAPE '\' AND path NOT LIKE '%c%' ESCAPE '\')")
+
+
+def test_dimensions_without_measures_are_grouped():
+    # As build_cube_sql in Elixir: GROUP BY whenever there are dimensions
+    q = CubeQuery("orders", dimensions=["market_code", "brand_code"])
+    assert q.to_sql().endswith("GROUP BY 1, 2")
+    assert "GROUP BY" not in CubeQuery("orders", measures=["count"]).to_sql()
+
+
+def test_invalid_specs_are_rejected():
+    with pytest.raises(ValueError, match="at least one measure or dimension"):
+        CubeQuery("orders")
+    with pytest.raises(ValueError, match="at least one measure or dimension"):
+        CubeQuery("orders", time_dimension=TimeDimension("updated_at", None, ("2024-01-01", "2024-01-31")))
+    assert CubeQuery("orders", time_dimension=TimeDimension("updated_at", "day")).to_sql().startswith(
+        "SELECT DATE_TRUNC('day', orders.updated_at) AS updated_at_day\n")
+    with pytest.raises(ValueError):
+        CubeQuery("orders", measures=["count"], limit=-1)
+    with pytest.raises(ValueError):
+        Filter("market_code", "gt", (1, 2))
+    with pytest.raises(ValueError):
+        TimeDimension("updated_at", "fortnight")
+
+
+def test_compiled_sql_is_memoized():
+    before = compile_cache_info()
+    first = CubeQuery("memo_orders", measures=["count", "total_amount_sum"], dimensions=["market_code"]).to_sql()
+    after_first = compile_cache_info()
+    second = CubeQuery("memo_orders", measures=["total_amount_sum", "memo_orders.count"],
+                       dimensions=["market_code"]).to_sql()
+    after_second = compile_cache_info()
+    assert after_first.misses == before.misses + 1
+    assert after_second.hits == after_first.hits + 1 and after_second.misses == after_first.misses
+    assert second is first
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Tests for the semantic cache: containment checks and local answers
+
+Every local answer is compared against a reference evaluation of the query
+over the raw rows, for randomly generated superset/subset query pairs.
+
+Run:
+    python -m pytest test_semantic_cache.py -q
+"""
+
+import datetime
+import random
+from dataclasses import replace
+
+import pyarrow as pa
+import pytest
+
+from arrow_native_client import ArrowNativeClient
+from cube_query_builder import CubeQuery, Filter, TimeDimension
+from semantic_cache import SemanticCache, derive, implies
+from time_bucket_cache import truncate
+
+DIMENSIONS = ("market_code", "brand_code", "financial_status")
+MEASURES = ("count", "total_amount_sum")
+VALUES = {
+    "market_code": ["US", "DE", "FR", "JP", None],
+    "brand_code": ["acme", "b_lt", "50%", "da\\sh"],  # LIKE wildcards match literally
+    "financial_status": ["paid", "refunded", "pending", None],
+}
+START = datetime.datetime(2024, 1, 1)
+
+
+def _raw_rows(n: int = 1000, seed: int = 7):
+    rng = random.Random(seed)
+    return [{**{d: rng.choice(VALUES[d]) for d in DIMENSIONS},
+             "amount": float(rng.randint(1, 100)),
+             "updated_at": START + datetime.timedelta(hours=rng.randrange(24 * 60))}
+            for _ in range(n)]
+
+
+RAW = _raw_rows()
+
+
+def _passes(value, f: Filter) -> bool:
+    """SQL semantics: NULL only passes notSet"""
+    if f.operator == "notSet":
+        return value is None
+    if value is None:
+        return False
+    op, values = f.operator, f.values
+    if op == "set":
+        return True
+    if op == "equals":
+        return value in values
+    if op == "notEquals":
+        return value not in values
+    if op == "contains":
+        return any(v in value for v in values)
+    if op == "notContains":
+        return all(v not in value for v in values)
+    bound = values[0]
+    return {"gt": value > bound, "gte": value >= bound, "lt": value < bound, "lte": value <= bound}[op]
+
+
+def _reference(query: CubeQuery) -> pa.Table:
+    """What cubesqld would answer (without LIMIT), computed row by row"""
+    short = lambda member: member.rsplit(".", 1)[-1]  # noqa: E731
+    dims = [short(d) for d in query.dimensions]
+    measures = [short(m) for m in query.measures]
+    td = query.time_dimension
+    start = end = None
+    if td is not None and td.date_range:
+        start = datetime.datetime.fromisoformat(td.date_range[0])
+        end = datetime.datetime.fromisoformat(td.date_range[1]) + datetime.timedelta(days=1)
+    groups = {}
+    for row in RAW:
+        if start is not None and not start <= row["updated_at"] < end:
+            continue
+        if not all(_passes(row[short(f.member)], f) for f in query.filters
+                   if short(f.member) in DIMENSIONS + ("updated_at",)):
+            continue
+        key = tuple(row[d] for d in dims)
+        if td is not None and td.granularity:
+            key += (truncate(row["updated_at"], td.granularity),)
+        acc = groups.setdefault(key, {"count": 0, "total_amount_sum": 0.0})
+        acc["count"] += 1
+        acc["total_amount_sum"] += row["amount"]
+    out = []
+    for key, acc in groups.items():
+        acc["amount_avg"] = acc["total_amount_sum"] / acc["count"]
+        if not all(_passes(acc[short(f.member)], f) for f in query.filters if short(f.member) in MEASURES):
+            continue
+        out.append(list(key) + [acc[m] for m in measures])
+    names = dims + ([td.alias] if td is not None and td.granularity else []) + measures
+    types = ([pa.string()] * len(dims) + ([pa.timestamp("us")] if td is not None and td.granularity else [])
+             + [pa.int64() if m == "count" else pa.float64() for m in measures])
+    return pa.table([pa.array([row[i] for row in out], t) for i, t in enumerate(types)], names=names)
+
+
+def _rows(table: pa.Table):
+    return sorted(table.to_pylist(), key=repr)
+
+
+def _random_filter(rng: random.Random) -> Filter:
+    member = rng.choice(DIMENSIONS + MEASURES)
+    if member in MEASURES:
+        return Filter(member, rng.choice(["gt", "gte", "lt", "lte"]), (rng.choice([5, 20, 50, 500]),))
+    operator = rng.choice(["equals", "equals", "notEquals", "set", "notSet", "contains", "notContains"])
+    if operator in ("set", "notSet"):
+        return Filter(member, operator)
+    pool = [v for v in VALUES[member] if v is not None]
+    if operator in ("contains", "notContains"):
+        return Filter(member, operator, (rng.choice(pool)[:rng.randint(1, 2)],))
+    return Filter(member, operator, tuple(rng.sample(pool, rng.randint(1, 3))))
+
+
+def _time_filter(rng: random.Random) -> Filter:
+    """Filter on the raw timestamps, on a day boundary or inside a day"""
+    bound = START + datetime.timedelta(days=rng.randrange(60), hours=rng.choice([0, 0, 12]))
+    return Filter("updated_at", rng.choice(["gt", "gte", "lt", "lte"]), (bound,))
+
+
+def _narrower(base: CubeQuery, rng: random.Random) -> CubeQuery:
+    """A query that is often, but not always, answerable from `base`"""
+    q = base
+    if rng.random() < 0.5:
+        q = replace(q, measures=tuple(rng.sample(q.measures, 1)))
+    if rng.random() < 0.6:
+        q = replace(q, filters=q.filters + (_random_filter(rng),))
+    if q.time_dimension is not None and rng.random() < 0.4:
+        q = replace(q, filters=q.filters + (_time_filter(rng),))
+    if q.filters and rng.random() < 0.2:
+        q = replace(q, filters=q.filters[1:])  # drops a filter: must not be answered
+    if rng.random() < 0.3:
+        q = replace(q, limit=rng.choice([1, 5, 50]))
+    if q.time_dimension is not None and rng.random() < 0.5:
+        day = rng.randrange(50)
+        start = (START + datetime.timedelta(days=day)).date().isoformat()
+        end = (START + datetime.timedelta(days=day + rng.randint(0, 20))).date().isoformat()
+        q = replace(q, time_dimension=replace(q.time_dimension, date_range=(start, end)))
+    if rng.random() < 0.3:
+        q = replace(q, dimensions=rng.sample(q.dimensions, rng.randint(0, len(q.dimensions) - 1)))
+    if q.time_dimension is not None and rng.random() < 0.3:
+        q = replace(q, time_dimension=replace(q.time_dimension, granularity=rng.choice(["hour", "month", None])))
+    if rng.random() < 0.05:
+        q = replace(q, dimensions=DIMENSIONS)  # finer: must not be answered
+    return q
+
+
+def _check(base: CubeQuery, target: CubeQuery, cached: pa.Table) -> bool:
+    """Derive `target`; if answered, it must match the reference"""
+    result = derive(base, cached, target)
+    if result is None:
+        return False
+    expected = _reference(target)
+    assert result.column_names == expected.column_names, (base, target)
+    if target.limit is None:
+        assert _rows(result) == _rows(expected), (base, target)
+    else:
+        assert result.num_rows == min(target.limit, expected.num_rows), (base, target)
+        expected_rows = expected.to_pylist()
+        assert all(row in expected_rows for row in result.to_pylist()), (base, target)
+    return True
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_random_derived_answers_match_reference(seed):
+    rng = random.Random(seed)
+    answered = 0
+    for _ in range(40):
+        base = CubeQuery("orders", measures=MEASURES, dimensions=rng.sample(DIMENSIONS, rng.randint(1, 3)),
+                         filters=[_random_filter(rng) for _ in range(rng.randint(0, 2))],
+                         time_dimension=(TimeDimension("updated_at", "day", ("2024-01-01", "2024-02-29"))
+                                         if rng.random() < 0.3 else None))
+        table = _reference(base)
+        if rng.random() < 0.2 and table.num_rows > 3:
+            base = replace(base, limit=table.num_rows - 1)
+            table = table.slice(0, base.limit)  # truncated superset
+        for _ in range(5):
+            answered += _check(base, _narrower(base, rng), table)
+    assert answered > 50
+
+
+def test_conservative_refusals():
+    base = CubeQuery("orders", measures=MEASURES, dimensions=DIMENSIONS,
+                     filters=[Filter("financial_status", "equals", ("paid", "refunded"))], limit=100)
+    table = _reference(base)
+    assert table.num_rows < 100  # complete
+    refused = [
+        replace(base, filters=()),                                         # wider
+        replace(base, filters=(Filter("financial_status", "equals", ("paid", "pending")),)),
+        replace(base, filters=(Filter("brand_code", "equals", ("acme",)),)),  # drops a filter
+        replace(base, measures=("count", "tax_amount_sum")),               # unknown measure
+        replace(base, filters=base.filters + (Filter("updated_at", "gt", ("2024-01-05",)),)),
+        replace(base, limit=None),                                         # fine: complete
+    ]
+    answers = [derive(base, table, q) for q in refused]
+    assert answers[:-1] == [None] * 5 and answers[-1] is not None
+    # LIKE wildcards in contains values are escaped, so they're answered locally
+    for value in ("b_", "%", "\\"):
+        assert _check(base, replace(base, filters=base.filters + (Filter("brand_code", "contains", (value,)),)),
+                      table)
+
+    truncated = replace(base, limit=10)
+    head = table.slice(0, 10)
+    assert derive(truncated, head, replace(truncated, limit=5)).num_rows == 5
+    assert derive(truncated, head, replace(truncated, limit=20)) is None
+    assert derive(truncated, head, replace(truncated, filters=base.filters + (
+        Filter("market_code", "equals", ("US",)),))) is None
+
+    # Timestamps within a bucket can't be decided from the bucket column
+    daily = CubeQuery("orders", measures=MEASURES, dimensions=["market_code"],
+                      time_dimension=TimeDimension("updated_at", "day", ("2024-01-01", "2024-01-31")))
+    inner = replace(daily, time_dimension=replace(daily.time_dimension,
+                                                  date_range=("2024-01-05T12:00:00", "2024-01-09")))
+    assert derive(daily, _reference(daily), inner) is None
+    # ...nor can filters on the raw timestamps, unless ">=" / "<" a bucket boundary
+    noon = datetime.datetime(2024, 1, 5, 12)
+    for operator in ("gt", "gte", "lt", "lte"):
+        within = replace(daily, filters=(Filter("updated_at", operator, (noon,)),))
+        assert derive(daily, _reference(daily), within) is None
+    midnight = datetime.datetime(2024, 1, 5)
+    before = replace(daily, filters=(Filter("updated_at", "lt", (midnight,)),))
+    assert _rows(derive(daily, _reference(daily), before)) == _rows(_reference(before))
+    assert derive(daily, _reference(daily), replace(daily, filters=(Filter("updated_at", "lte", (midnight,)),))) is None
+
+
+def test_rollup_to_coarser_groups():
+    medium = CubeQuery("orders", measures=MEASURES + ("amount_avg",), dimensions=DIMENSIONS,
+                       time_dimension=TimeDimension("updated_at", "day", ("2024-01-01", "2024-02-29")))
+    table = _reference(medium)
+    small = CubeQuery("orders", measures=["count"], dimensions=["market_code"],
+                      time_dimension=TimeDimension("updated_at", "month", ("2024-01-01", "2024-01-31")),
+                      filters=[Filter("financial_status", "equals", ("paid",)), Filter("count", "gt", (50,))])
+    assert _rows(derive(medium, table, small)) == _rows(_reference(small))
+    totals = CubeQuery("orders", measures=MEASURES, time_dimension=TimeDimension("updated_at", None,
+                                                                               medium.time_dimension.date_range))
+    assert derive(medium, table, totals).to_pylist() == [{"count": 1000, "total_amount_sum": pytest.approx(
+        sum(row["amount"] for row in RAW))}]
+
+    # avg only rolls up weighted by its count; count-distinct never does
+    averages = replace(small, measures=("amount_avg",), filters=())
+    assert derive(medium, table, averages) is None
+    rolled = derive(medium, table, averages, avg_weights={"orders.amount_avg": "orders.count"})
+    expected = {row["market_code"]: row["amount_avg"] for row in _reference(averages).to_pylist()}
+    assert {row["market_code"]: row["amount_avg"] for row in rolled.to_pylist()} == pytest.approx(expected)
+    # ...also when the weighting count is selected alongside the avg
+    with_count = replace(averages, measures=("count", "amount_avg"))
+    rolled = derive(medium, table, with_count, avg_weights={"orders.amount_avg": "orders.count"})
+    expected = _reference(with_count).to_pylist()
+    assert {row["market_code"]: row["count"] for row in rolled.to_pylist()} == \
+        {row["market_code"]: row["count"] for row in expected}
+    assert {row["market_code"]: row["amount_avg"] for row in rolled.to_pylist()} == \
+        pytest.approx({row["market_code"]: row["amount_avg"] for row in expected})
+    assert derive(medium, table, replace(small, filters=()),
+                  measure_types={"orders.count": "countDistinct"}) is None
+
+    # HAVING on the finer groups, and finer time buckets, can't be rolled up
+    having = replace(medium, filters=(Filter("count", "gt", (2,)),))
+    assert derive(having, _reference(having), replace(small, filters=())) is None
+    hourly = replace(small, time_dimension=replace(small.time_dimension, granularity="hour"), filters=())
+    assert derive(medium, table, hourly) is None
+
+
+def test_implies():
+    assert implies(Filter("a", "equals", ("x",)), Filter("a", "equals", ("x", "y")))
+    assert implies(Filter("a", "gt", (10,)), Filter("a", "gte", (5,)))
+    assert implies(Filter("a", "gt", (5,)), Filter("a", "gte", (5,)))
+    assert not implies(Filter("a", "gte", (5,)), Filter("a", "gt", (5,)))
+    assert implies(Filter("a", "equals", (7,)), Filter("a", "lt", (8.5,)))
+    assert implies(Filter("a", "contains", ("paid",)), Filter("a", "set"))
+    assert not implies(Filter("a", "notSet"), Filter("a", "set"))
+    assert implies(Filter("a", "equals", ("x",)), Filter("a", "notEquals", ("y",)))
+    # Strings order differently as numbers and as text
+    assert not implies(Filter("a", "gt", ("9",)), Filter("a", "gt", ("10",)))
+    assert not implies(Filter("a", "equals", ("1",)), Filter("a", "notEquals", (1,)))
+    assert not implies(Filter("b", "equals", ("x",)), Filter("a", "equals", ("x",)))
+
+
+def test_cache_serves_narrower_queries_locally(mock_server):
+    medium = CubeQuery("orders", measures=MEASURES, dimensions=DIMENSIONS)
+    table = _reference(medium)
+    server = mock_server(table)
+    with ArrowNativeClient("127.0.0.1", server.port) as client:
+        cache = SemanticCache(client)
+        first = cache.query(medium)
+        assert first.equals(table)
+        narrow = replace(medium, measures=("count",), limit=10,
+                         filters=(Filter("market_code", "equals", ("US", "DE")),))
+        result = cache.query(narrow)
+        expected = _reference(replace(narrow, limit=None)).to_pylist()
+        assert result.num_rows == 10 and all(row in expected for row in result.to_pylist())
+        assert cache.query(medium) is first
+        assert server.queries == 1
+        assert (cache.stats.exact_hits, cache.stats.derived_hits, cache.stats.misses) == (1, 1, 1)
+
+        cache.invalidate("orders")
+        cache.query(narrow)
+        assert server.queries == 2
+
+
+def test_repeated_lookups_are_answered_locally():
+    medium = CubeQuery("orders", measures=MEASURES, dimensions=DIMENSIONS)
+    cache = SemanticCache()
+    cache.put(medium, _reference(medium))
+    narrow = replace(medium, measures=("count",), filters=(Filter("financial_status", "equals", ("paid",)),
+                                                           Filter("count", "gt", (10,))))
+    for _ in range(200):
+        assert cache.get(narrow) is not None
+    # A dimension the cached result doesn't have can't be derived
+    assert cache.get(replace(medium, dimensions=("customer_email",))) is None
+    stats = cache.stats
+    assert (stats.requests, stats.exact_hits, stats.derived_hits, stats.misses) == (201, 0, 200, 1)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight query coalescing (threads and asyncio)
+
+Run:
+    python -m pytest test_single_flight.py -q
+"""
+
+import asyncio
+import struct
+import threading
+import time
+
+import pyarrow as pa
+import pytest
+
+from arrow_native_client import ArrowNativeClient, QueryError
+from single_flight import AsyncSingleFlight, CoalescingClient, SingleFlight
+
+TABLE = pa.table({"x": [1, 2, 3]})
+
+
+def _wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def _run_collapsed(flight: SingleFlight, fn, callers: int):
+    """Call `flight.do` from `callers` threads while `fn` is held in flight"""
+    gate = threading.Event()
+    outcomes = [None] * callers
+
+    def gated():
+        gate.wait()
+        return fn()
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do("key", gated)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for t in threads:
+        t.start()
+    _wait_until(lambda: flight.stats.requests == callers)
+    gate.set()
+    for t in threads:
+        t.join()
+    return outcomes
+
+
+def test_threads_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+    outcomes = _run_collapsed(flight, lambda: executions.append(1) or TABLE, callers=8)
+    assert len(executions) == 1
+    assert all(result is TABLE for result, _ in outcomes)
+    assert sorted(shared for _, shared in outcomes) == [False] + [True] * 7
+    assert (flight.stats.executions, flight.stats.collapsed) == (1, 7)
+
+    # The finished execution is forgotten: the next call runs again
+    flight.do("key", lambda: executions.append(1))
+    assert len(executions) == 2
+
+
+def test_thread_errors_reach_every_waiter():
+    flight = SingleFlight()
+    error = QueryError("BAD", "bad query")
+
+    def fail():
+        raise error
+
+    outcomes = _run_collapsed(flight, fail, callers=5)
+    assert all(outcome is error for outcome in outcomes)
+
+
+def test_async_leader_cancellation_spares_waiters():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return TABLE
+
+        leader = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        waiters = [asyncio.ensure_future(flight.do("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        assert leader.cancelled()
+        assert results == [(TABLE, True)] * 3
+        assert flight._calls == {}
+
+    asyncio.run(scenario())
+
+
+def test_async_errors_reach_every_waiter():
+    async def scenario():
+        flight = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise QueryError("BAD", "bad query")
+
+        outcomes = await asyncio.gather(*(flight.do("key", fail) for _ in range(4)),
+                                        return_exceptions=True)
+        assert len({id(e) for e in outcomes}) == 1 and isinstance(outcomes[0], QueryError)
+        assert flight.stats.executions == 1
+
+    asyncio.run(scenario())
+
+
+def test_client_coalesces_threads_and_tasks(mock_server):
+    server = mock_server(TABLE, latency=0.2)
+    with CoalescingClient("127.0.0.1", server.port) as client:
+        async def burst():
+            return await asyncio.gather(*(client.query_async("SELECT 1") for _ in range(5)))
+
+        tables = asyncio.run(burst())
+        assert all(t is tables[0] for t in tables) and tables[0].equals(TABLE)
+        assert server.queries == 1
+        stats = client.stats
+        assert (stats.requests, stats.executions, stats.collapsed) == (5, 1, 4)
+
+        # Flights of a closed loop are dropped, their counts kept
+        asyncio.run(burst())
+        assert len(client._async_flights) == 1
+        assert client.stats.collapsed == 8
+
+
+def test_failed_connection_is_dropped(mock_server):
+    server = mock_server(TABLE)
+    with CoalescingClient("127.0.0.1", server.port) as client:
+        client.query("SELECT 1")
+        server.set_fail_mode("close")
+        with pytest.raises((OSError, RuntimeError)):
+            client.query("SELECT 1")
+        assert client._clients == []
+        server.set_fail_mode(None)
+        assert client.query("SELECT 1").equals(TABLE)
+        assert len(client._clients) == 1
+
+
+def test_connection_is_dropped_after_any_failure(mock_server, monkeypatch):
+    server = mock_server(TABLE)
+    with CoalescingClient("127.0.0.1", server.port) as client:
+        client.query("SELECT 1")
+        monkeypatch.setattr(ArrowNativeClient, "query", lambda self, sql: struct.unpack("<I", b""))
+        with pytest.raises(struct.error):
+            client.query("SELECT 1")
+        assert client._clients == []
+        monkeypatch.undo()
+        assert client.query("SELECT 1").equals(TABLE)
+
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental time-bucketed result cache
+
+Run:
+    python -m pytest test_time_bucket_cache.py -q
+"""
+
+import datetime
+import re
+
+import pyarrow as pa
+
+from cube_query_builder import CubeQuery, TimeDimension
+from time_bucket_cache import TimeBucketCache
+
+NOW = datetime.datetime(2024, 2, 1)
+
+
+class _Result:
+    def __init__(self, table: pa.Table):
+        self.table = table
+
+    def to_table(self) -> pa.Table:
+        return self.table
+
+
+class DailyCounts:
+    """Fake client: one row per day of the requested [start, end) range"""
+
+    def __init__(self):
+        self.queries = []
+        self.extra_column = False
+
+    def query(self, sql: str) -> _Result:
+        self.queries.append(sql)
+        start = datetime.datetime.fromisoformat(re.search(r">= '([^']+)'", sql).group(1))
+        end = datetime.datetime.fromisoformat(re.search(r"< '([^']+)'", sql).group(1))
+        days = [start + datetime.timedelta(days=i) for i in range((end - start).days)]
+        columns = {"updated_at_day": pa.array(days, pa.timestamp("us")),
+                   "count": pa.array([d.day for d in days], pa.int64())}
+        if self.extra_column:
+            columns["total_amount_sum"] = pa.array([1.0] * len(days))
+        return _Result(pa.table(columns))
+
+
+def _query(first: str, last: str) -> CubeQuery:
+    return CubeQuery("orders", measures=["count"],
+                     time_dimension=TimeDimension("updated_at", "day", (first, last)))
+
+
+def _days(table: pa.Table):
+    return [d.day for d in table["updated_at_day"].to_pylist()]
+
+
+def test_rolling_window_fetches_only_new_buckets():
+    client = DailyCounts()
+    cache = TimeBucketCache(client, clock=lambda: NOW)
+    assert _days(cache.query(_query("2024-01-01", "2024-01-10"))) == list(range(1, 11))
+    table = cache.query(_query("2024-01-05", "2024-01-14"))
+    assert _days(table) == list(range(5, 15))
+    assert table["count"].to_pylist() == list(range(5, 15))
+    assert len(client.queries) == 2 and "2024-01-11T00:00:00" in client.queries[1]
+    assert (cache.stats.buckets_hit, cache.stats.buckets_fetched) == (6, 14)
+
+
+def test_open_buckets_are_refetched():
+    client = DailyCounts()
+    cache = TimeBucketCache(client, clock=lambda: datetime.datetime(2024, 1, 3, 12))
+    cache.query(_query("2024-01-01", "2024-01-03"))
+    cache.query(_query("2024-01-01", "2024-01-03"))
+    assert cache.stats.buckets_hit == 2
+    assert "2024-01-03T00:00:00" in client.queries[1]
+
+
+def test_schema_change_refetches_whole_range():
+    client = DailyCounts()
+    cache = TimeBucketCache(client, clock=lambda: NOW)
+    cache.query(_query("2024-01-01", "2024-01-05"))
+    client.extra_column = True
+    # Days 1-5 are cache hits, 6-7 come back with another schema
+    table = cache.query(_query("2024-01-01", "2024-01-07"))
+    assert _days(table) == list(range(1, 8))
+    assert "total_amount_sum" in table.column_names
+    assert "2024-01-01T00:00:00" in client.queries[-1]
+
+    # The old-schema buckets are gone from the cache
+    client.queries.clear()
+    assert cache.query(_query("2024-01-02", "2024-01-06")).equals(table.slice(1, 5))
+    assert client.queries == []
+
+
+def test_buckets_are_bounded_lru():
+    client = DailyCounts()
+    cache = TimeBucketCache(client, clock=lambda: NOW, max_buckets=10)
+    for first in range(1, 20):
+        cache.query(_query(f"2024-01-{first:02d}", f"2024-01-{first + 6:02d}"))
+    assert cache._size == 10
+    assert sorted(cache._store[next(iter(cache._store))].buckets)[0].day == 16
+    assert cache.stats.evictions == 25 - 10
+
+    # The most recent window is still served from the cache
+    client.queries.clear()
+    cache.query(_query("2024-01-19", "2024-01-25"))
+    assert client.queries == []
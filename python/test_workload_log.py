@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Tests for the query workload log and its analyzer
+
+Run:
+    python -m pytest test_workload_log.py -q
+"""
+
+import tempfile
+
+import pyarrow as pa
+import pyarrow.flight as flight
+import pytest
+
+from arrow_flight_gateway import CubeFlightGateway
+from arrow_native_client import ArrowNativeClient, QueryError
+from arrow_native_pool import ArrowNativePool
+from workload_log import Thresholds, WorkloadLog, analyze, hot_query_log, log_files, read_workload
+
+TABLE = pa.table({"market": ["a", "b", "c"], "count": [1, 2, 3]})
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+def test_records_round_trip(tmp_path, format):
+    with WorkloadLog(str(tmp_path), format=format, flush_rows=2, record_sql=True) as log:
+        log.record_query("SELECT a FROM t WHERE x = 1", 0.5, bytes_in=100, rows=3, batches=1)
+        log.record_query("SELECT a FROM t WHERE x = 2", 0.25, bytes_in=50, rows=2, batches=1, cache="hit")
+        log.record_query("SELECT bad", 0.1, error=True)
+    records = read_workload([str(tmp_path)])
+    assert records.num_rows == 3
+    assert records["fingerprint"][0] == records["fingerprint"][1] != records["fingerprint"][2]
+    assert records["variant"][0] != records["variant"][1]
+    assert records.column("cache").to_pylist() == ["none", "hit", "none"]
+    assert records["sql"][1].as_py() == "SELECT a FROM t WHERE x = 2"
+
+
+def test_flush_by_age_and_readable_while_open(tmp_path, clock):
+    clock.now = 1_700_000_000.0
+    log = WorkloadLog(str(tmp_path), flush_rows=100, flush_seconds=5.0, clock=clock)
+    log.record_query("SELECT 1", 0.1)
+    assert read_workload([str(tmp_path)]).num_rows == 0
+    clock.now += 6
+    log.record_query("SELECT 1", 0.1)
+    # An IPC stream being appended to is readable up to the last batch
+    assert read_workload([str(tmp_path)]).num_rows == 2
+    log.close()
+
+
+def test_rotation_keeps_max_files(tmp_path):
+    log = WorkloadLog(str(tmp_path), flush_rows=10, max_file_bytes=1, max_files=3)
+    for i in range(100):
+        log.record_query(f"SELECT c{i} FROM t", 0.01)
+    log.close()
+    assert log.records_written == 100
+    assert len(log_files([str(tmp_path)])) == 3
+    assert read_workload([str(tmp_path)]).num_rows == 30
+
+
+def test_analyze_ranks_and_flags_candidates():
+    rows = []
+    for i in range(200):   # fast, many literal variants: prepared statement
+        rows.append(("SELECT name FROM users WHERE id = %d" % i, 0.01, 1_000, "none"))
+    for _ in range(30):    # slow aggregation, same literals: pre-agg + cache
+        rows.append(("SELECT region, SUM(x) FROM orders GROUP BY region", 2.0, 10_000, "miss"))
+    rows.append(("SELECT * FROM events", 5.0, 50_000_000, "none"))
+    table = _records(rows)
+    stats = analyze(table, Thresholds())
+    assert stats["statement"][0].as_py().startswith("select region")
+    assert stats["total_seconds"].to_pylist() == pytest.approx([60.0, 5.0, 2.0])
+    by_statement = {row["statement"].split()[1]: row for row in stats.to_pylist()}
+    users, orders, events = by_statement["name"], by_statement["region,"], by_statement["*"]
+    assert (users["queries"], users["variants"]) == (200, 200)
+    assert (users["prepare"], users["cache"], users["preaggregation"]) == (True, False, False)
+    assert (orders["preaggregation"], orders["cache"], orders["prepare"]) == (True, True, False)
+    assert orders["p95_seconds"] == pytest.approx(2.0)
+    assert not any((events["preaggregation"], events["cache"], events["prepare"]))
+
+
+def _records(rows) -> pa.Table:
+    """Records as a WorkloadLog writes them"""
+    with tempfile.TemporaryDirectory() as directory:
+        with WorkloadLog(directory, flush_rows=len(rows)) as log:
+            for sql, seconds, size, cache in rows:
+                log.record_query(sql, seconds, bytes_in=size, cache=cache)
+        return read_workload([directory])
+
+
+def test_export_hot_queries(tmp_path):
+    with WorkloadLog(str(tmp_path), record_sql=True) as log:
+        for region in ("eu", "us"):
+            log.record_query(f"SELECT * FROM orders WHERE region = '{region}'", 0.5)
+        log.record_query("SELECT bad", 0.1, error=True)
+    hot = hot_query_log(read_workload([str(tmp_path)]))
+    [entry] = hot.top(5)
+    assert (entry.sql, entry.count, entry.total_seconds) == (
+        "SELECT * FROM orders WHERE region = 'us'", 2, pytest.approx(1.0))
+
+    with WorkloadLog(str(tmp_path / "nosql")) as log:
+        log.record_query("SELECT 1", 0.1)
+    with pytest.raises(ValueError, match="record_sql"):
+        hot_query_log(read_workload([str(tmp_path / "nosql")]))
+
+
+def test_client_and_gateway_record_queries(tmp_path, mock_server):
+    server = mock_server(TABLE)
+    log = WorkloadLog(str(tmp_path / "client"))
+    client = ArrowNativeClient("127.0.0.1", server.port, workload_log=log).connect()
+    try:
+        client.query("SELECT market FROM orders")
+        with pytest.raises(QueryError):
+            client.query("SELECT bad")
+    finally:
+        client.close()
+    log.close()
+    records = read_workload([str(tmp_path / "client")]).to_pylist()
+    assert [(r["rows"], r["batches"], r["error"]) for r in records] == [(3, 1, False), (0, 0, True)]
+    assert records[0]["bytes_in"] > 0 and records[0]["source"] == "client"
+
+    log = WorkloadLog(str(tmp_path / "gateway"), source="gateway")
+    gateway = CubeFlightGateway("grpc://127.0.0.1:0", pool=ArrowNativePool("127.0.0.1", server.port),
+                                workload_log=log)
+    try:
+        consumer = flight.connect(f"grpc://127.0.0.1:{gateway.port}")
+        for _ in range(2):
+            consumer.do_get(flight.Ticket(b"SELECT market FROM orders")).read_all()
+    finally:
+        gateway.shutdown()
+    log.close()
+    records = read_workload([str(tmp_path / "gateway")])
+    assert sorted(records.column("cache").to_pylist()) == ["hit", "miss"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-q"])
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Incremental Time-Bucketed Result Cache
+
+Caches results of time-dimension queries per bucket (hour/day/month) so that
+rolling-window dashboards only re-fetch the buckets that are missing or still
+open, instead of re-running the full `updated_at >= X` aggregation.
+
+How it works:
+1. The query (a `CubeQuery` with a time dimension, granularity and date range)
+   is split into buckets of its granularity.
+2. Closed buckets already in the cache are reused as zero-copy Arrow slices.
+3. Missing buckets, plus open buckets (ending after `now - settle_seconds`),
+   are fetched from cubesqld through `ArrowNativeClient.query`, one query per
+   contiguous run of buckets, using a half-open `>= start AND < end` filter.
+4. Fresh results are split by bucket column and stored; cached and fresh slices
+   are stitched together in bucket order with `pa.concat_tables`.
+5. If a fetch returns a different schema than the cached buckets, every
+   bucket of that query shape is stale: the whole range is fetched again.
+
+At most `max_buckets` buckets are kept; the least recently used ones (of
+the least recently used query shape first) are evicted, so buckets that a
+rolling window has left behind age out.
+
+A date range end given as a plain date is inclusive of the whole day (as in
+Cube). An end given as a timestamp is rounded up to the bucket boundary.
+
+Usage:
+    cache = TimeBucketCache(client)
+    q = CubeQuery(
+        cube="orders_with_preagg",
+        measures=["count", "total_amount_sum"],
+        dimensions=["market_code"],
+        time_dimension=TimeDimension("updated_at", "hour", ("2024-01-01", "2024-12-31")),
+    )
+    table = cache.query(q)
+"""
+
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from cube_query_builder import CubeQuery, Filter
+
+
+BUCKET_GRANULARITIES = ("hour", "day", "month")
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _as_naive_utc(value: datetime.datetime) -> datetime.datetime:
+    if not isinstance(value, datetime.datetime):
+        # date32 bucket columns (e.g. DATE_TRUNC('day', ...) on a date)
+        value = datetime.datetime.combine(value, datetime.time())
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def truncate(value: datetime.datetime, granularity: str) -> datetime.datetime:
+    """Truncate a timestamp to the start of its bucket"""
+    if granularity == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "month":
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unsupported bucket granularity: {granularity}")
+
+
+def next_bucket(start: datetime.datetime, granularity: str) -> datetime.datetime:
+    """Start of the bucket following `start`"""
+    if granularity == "hour":
+        return start + datetime.timedelta(hours=1)
+    if granularity == "day":
+        return start + datetime.timedelta(days=1)
+    if granularity == "month":
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+    raise ValueError(f"Unsupported bucket granularity: {granularity}")
+
+
+def _parse_range(date_range: Tuple[str, str], granularity: str) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Convert an inclusive Cube date range to a half-open bucket-aligned range"""
+    start_s, end_s = date_range
+    start = truncate(_as_naive_utc(datetime.datetime.fromisoformat(start_s)), granularity)
+    try:
+        end_day = datetime.date.fromisoformat(end_s)
+        end = datetime.datetime.combine(end_day + datetime.timedelta(days=1), datetime.time())
+    except ValueError:
+        end = _as_naive_utc(datetime.datetime.fromisoformat(end_s))
+    aligned = truncate(end, granularity)
+    if aligned < end:
+        aligned = next_bucket(aligned, granularity)
+    return start, aligned
+
+
+@dataclass
+class BucketCacheStats:
+    """Counters for bucket reuse and wire traffic"""
+    requests: int = 0
+    buckets_hit: int = 0
+    buckets_fetched: int = 0
+    queries_sent: int = 0
+    rows_fetched: int = 0
+    evictions: int = 0
+
+
+class _Shape:
+    """Cached buckets of one query shape (a query without its date range)"""
+    __slots__ = ("schema", "buckets")
+
+    def __init__(self, schema: pa.Schema):
+        self.schema = schema
+        # bucket start -> table slice, least recently used first
+        self.buckets: "OrderedDict[datetime.datetime, pa.Table]" = OrderedDict()
+
+
+class TimeBucketCache:
+    """Per-bucket cache of time-dimension query results"""
+
+    def __init__(self, client, settle_seconds: float = 0.0,
+                 clock: Callable[[], datetime.datetime] = _utcnow,
+                 metrics=None, max_buckets: int = 100_000):
+        """
+        Args:
+            client: Connected client exposing `query(sql) -> QueryResult`
+                (e.g. ArrowNativeClient)
+            settle_seconds: Buckets ending less than this many seconds before
+                now are still considered open (late-arriving data)
+            clock: Returns the current naive UTC time
+            metrics: cube_metrics.Metrics counting bucket hits/misses
+            max_buckets: Max cached buckets over all query shapes
+        """
+        self.client = client
+        self.settle = datetime.timedelta(seconds=settle_seconds)
+        self.clock = clock
+        self.metrics = metrics
+        self.max_buckets = max_buckets
+        self.stats = BucketCacheStats()
+        # base cache key -> cached buckets, least recently used shape first
+        self._store: "OrderedDict[str, _Shape]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def query(self, query: CubeQuery) -> pa.Table:
+        """Execute a time-dimension query, fetching only missing or open buckets"""
+        td = query.time_dimension
+        if td is None or td.date_range is None:
+            raise ValueError("Query needs a time dimension with a date range")
+        if td.granularity not in BUCKET_GRANULARITIES:
+            raise ValueError(f"Granularity must be one of {BUCKET_GRANULARITIES}, got {td.granularity}")
+        if query.limit is not None:
+            raise ValueError("LIMIT queries cannot be assembled from buckets")
+
+        granularity = td.granularity
+        start, end = _parse_range(td.date_range, granularity)
+        base = replace(query, time_dimension=replace(td, date_range=None))
+        key = base.cache_key()
+        open_after = self.clock() - self.settle
+
+        buckets: List[datetime.datetime] = []
+        b = start
+        while b < end:
+            buckets.append(b)
+            b = next_bucket(b, granularity)
+
+        with self._lock:
+            self.stats.requests += 1
+            shape = self._store.get(key)
+            schema = shape.schema if shape is not None else None
+            # Slices this request assembles, held locally: other requests may
+            # evict or replace buckets meanwhile
+            parts: Dict[datetime.datetime, pa.Table] = {}
+            if shape is not None:
+                self._store.move_to_end(key)
+                for b in buckets:
+                    if b in shape.buckets and next_bucket(b, granularity) <= open_after:
+                        parts[b] = shape.buckets[b]
+                        shape.buckets.move_to_end(b)
+            missing = [b for b in buckets if b not in parts]
+            self.stats.buckets_hit += len(parts)
+        if self.metrics is not None:
+            self.metrics.inc("cache_hits", len(parts))
+            self.metrics.inc("cache_misses", len(missing))
+
+        for run_start, run_end in self._runs(missing, granularity):
+            fresh = self._fetch(base, run_start, run_end)
+            if schema is not None and not fresh.schema.equals(schema):
+                # Result shape changed on the server: every bucket held so far
+                # is stale, so fetch the whole range again
+                if (run_start, run_end) != (start, end):
+                    fresh = self._fetch(base, start, end)
+                parts = self._split(fresh, td.alias, start, end, granularity)
+                self._merge(key, fresh.schema, parts)
+                schema = fresh.schema
+                break
+            schema = fresh.schema
+            fresh_buckets = self._split(fresh, td.alias, run_start, run_end, granularity)
+            parts.update(fresh_buckets)
+            self._merge(key, schema, fresh_buckets)
+
+        slices = [parts[b] for b in buckets]
+        if not slices:
+            return pa.Table.from_batches([], schema=schema) if schema else pa.table({})
+        return pa.concat_tables(slices)
+
+    def invalidate(self, query: Optional[CubeQuery] = None):
+        """Drop cached buckets for one query shape, or everything"""
+        with self._lock:
+            if query is None:
+                self._store.clear()
+                self._size = 0
+                return
+            td = query.time_dimension
+            base = replace(query, time_dimension=replace(td, date_range=None)) if td else query
+            shape = self._store.pop(base.cache_key(), None)
+            if shape is not None:
+                self._size -= len(shape.buckets)
+
+    # === Internals ===
+
+    def _merge(self, key: str, schema: pa.Schema, fresh: Dict[datetime.datetime, pa.Table]):
+        """Store fetched buckets, evicting least recently used ones over the bound"""
+        with self._lock:
+            self.stats.buckets_fetched += len(fresh)
+            shape = self._store.get(key)
+            if shape is None or not shape.schema.equals(schema):
+                # New shape, or its result schema changed: older buckets are stale
+                if shape is not None:
+                    self._size -= len(shape.buckets)
+                shape = self._store[key] = _Shape(schema)
+            self._store.move_to_end(key)
+            for b, table in fresh.items():
+                if b not in shape.buckets:
+                    self._size += 1
+                shape.buckets[b] = table
+                shape.buckets.move_to_end(b)
+            while self._size > self.max_buckets:
+                lru_key, lru = next(iter(self._store.items()))
+                lru.buckets.popitem(last=False)
+                self._size -= 1
+                self.stats.evictions += 1
+                if not lru.buckets:
+                    del self._store[lru_key]
+
+    @staticmethod
+    def _runs(missing: List[datetime.datetime], granularity: str):
+        """Group sorted bucket starts into contiguous [start, end) runs"""
+        run_start = prev_end = None
+        for b in missing:
+            if run_start is not None and b == prev_end:
+                prev_end = next_bucket(b, granularity)
+                continue
+            if run_start is not None:
+                yield run_start, prev_end
+            run_start, prev_end = b, next_bucket(b, granularity)
+        if run_start is not None:
+            yield run_start, prev_end
+
+    def _fetch(self, base: CubeQuery, start: datetime.datetime, end: datetime.datetime) -> pa.Table:
+        """Fetch one contiguous run of buckets from cubesqld"""
+        member = base.time_dimension.dimension
+        run_query = replace(base, filters=base.filters + (
+            Filter(member, "gte", (start.isoformat(),)),
+            Filter(member, "lt", (end.isoformat(),)),
+        ))
+        table = self.client.query(run_query.to_sql()).to_table()
+        with self._lock:
+            self.stats.queries_sent += 1
+            self.stats.rows_fetched += table.num_rows
+        return table
+
+    def _split(self, table: pa.Table, column: str, start: datetime.datetime,
+               end: datetime.datetime, granularity: str) -> Dict[datetime.datetime, pa.Table]:
+        """Split a fetched run into per-bucket zero-copy slices"""
+        slices: Dict[datetime.datetime, pa.Table] = {}
+        b = start
+        while b < end:
+            slices[b] = table.slice(0, 0)
+            b = next_bucket(b, granularity)
+
+        if table.num_rows:
+            ordered = table.sort_by(column)
+            counts = pc.value_counts(ordered[column])
+            offset = 0
+            for item in counts.to_pylist():
+                value, count = item["values"], item["counts"]
+                if value is not None:
+                    bucket = truncate(_as_naive_utc(value), granularity)
+                    slices[bucket] = ordered.slice(offset, count)
+                offset += count
+
+        return slices
+
+
+# Example usage
+if __name__ == "__main__":
+    from arrow_native_client import ArrowNativeClient
+    from cube_query_builder import TimeDimension
+
+    query = CubeQuery(
+        cube="orders_with_preagg",
+        measures=["count", "total_amount_sum"],
+        dimensions=["market_code", "brand_code"],
+        time_dimension=TimeDimension("updated_at", "day", ("2024-01-01", "2024-12-31")),
+    )
+
+    with ArrowNativeClient(host="localhost", port=4445, token="test") as client:
+        cache = TimeBucketCache(client)
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            table = cache.query(query)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"{label}: {table.num_rows} rows in {elapsed_ms:.1f}ms")
+        print(f"Stats: {cache.stats}")
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Query Workload Log and Hot-Query Analyzer
+
+Which SQL does the Python fleet send, how often, and at what cost? Clients
+(ArrowNativeClient, and so the pools, via `workload_log=`) and the Flight
+gateway can append one compact record per query to a WorkloadLog:
+
+    ts, fingerprint, statement, variant, seconds, bytes_in, bytes_out,
+    rows, batches, cache, error, source[, sql]
+
+- fingerprint/statement: query shape with literals stripped
+  (sql_normalize.fingerprint_sql); `statement` is dictionary-encoded, so
+  each distinct shape is stored once per file
+- variant: 64-bit hash of the normalized SQL including literals, so the
+  analyzer can count parameter variants without storing them
+- cache: "hit", "miss", "shared" (joined an in-flight execution) or
+  "none" (no cache involved)
+- sql: the full SQL text, only with `record_sql=True` (literals may be
+  sensitive); needed to export replayable hot queries for cache_warmer
+
+Records are buffered and written in batches to rotating files in a
+directory: Arrow IPC stream files (`.arrows`, readable while being written)
+or Parquet (`.parquet`, readable once rotated). Old files beyond
+`max_files` are deleted.
+
+The analyzer reads every log file under the given paths and aggregates with
+pyarrow's hash aggregation (or DuckDB when installed and asked for):
+queries ranked by total time, with bytes, cache hit rate and candidates for
+pre-aggregations, caching and prepared statements.
+
+Usage:
+    log = WorkloadLog("/var/log/cube_workload", format="arrow")
+    client = ArrowNativeClient(host="localhost", port=4445, workload_log=log).connect()
+
+    python workload_log.py /var/log/cube_workload --top 20
+    python workload_log.py logs/ --engine duckdb --export-hot hot_queries.json
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+from sql_normalize import fingerprint_sql, normalize_sql
+
+SCHEMA = pa.schema([
+    ("ts", pa.timestamp("ms", tz="UTC")),
+    ("fingerprint", pa.string()),
+    ("statement", pa.dictionary(pa.int32(), pa.string())),
+    ("variant", pa.uint64()),
+    ("seconds", pa.float64()),
+    ("bytes_in", pa.int64()),
+    ("bytes_out", pa.int64()),
+    ("rows", pa.int64()),
+    ("batches", pa.int32()),
+    ("cache", pa.dictionary(pa.int8(), pa.string())),
+    ("error", pa.bool_()),
+    ("source", pa.dictionary(pa.int8(), pa.string())),
+])
+
+SQL_FIELD = pa.field("sql", pa.string())
+
+FORMATS = {"arrow": ".arrows", "parquet": ".parquet"}
+
+class _Shape:
+    """Memoized per SQL text: fingerprint, statement and variant hash"""
+    __slots__ = ("fingerprint", "statement", "variant")
+
+    def __init__(self, sql: str):
+        self.statement = fingerprint_sql(sql)
+        self.fingerprint = hashlib.sha256(self.statement.encode("utf-8")).hexdigest()[:12]
+        digest = hashlib.sha256(normalize_sql(sql).encode("utf-8")).digest()
+        self.variant = int.from_bytes(digest[:8], "big")
+
+
+class WorkloadLog:
+    """Thread-safe, buffered, rotating per-query log"""
+
+    def __init__(self, directory: str, format: str = "arrow", flush_rows: int = 1024,
+                 flush_seconds: float = 5.0, max_file_bytes: int = 64 << 20,
+                 max_files: int = 100, record_sql: bool = False, source: str = "client",
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            directory: Where log files are written (created if missing)
+            format: "arrow" (IPC stream) or "parquet"
+            flush_rows: Buffered records that trigger a write
+            flush_seconds: Max age of a buffered record before a write
+                (checked when the next record arrives, and on flush/close)
+            max_file_bytes: Rotate to a new file after this size
+            max_files: Oldest files beyond this count are deleted
+            record_sql: Also store the full SQL text (see module docs)
+            source: Default `source` column value (e.g. "client", "gateway")
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported format: {format} (expected one of {', '.join(FORMATS)})")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.format = format
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.record_sql = record_sql
+        self.source = source
+        self.clock = clock
+        self.schema = SCHEMA.append(SQL_FIELD) if record_sql else SCHEMA
+        self.records_written = 0
+        self._columns: Dict[str, list] = {name: [] for name in self.schema.names}
+        self._first_buffered: Optional[float] = None
+        self._shapes: Dict[str, _Shape] = {}
+        self._writer = None
+        self._sink = None
+        self._path: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def record_query(self, sql: str, seconds: float, bytes_in: int = 0, bytes_out: int = 0,
+                     rows: int = 0, batches: int = 0, cache: str = "none", error: bool = False,
+                     source: Optional[str] = None):
+        """Append one record (buffered)"""
+        shape = self._shapes.get(sql)
+        if shape is None:
+            shape = _Shape(sql)
+            if len(self._shapes) >= 10_000:
+                self._shapes.clear()
+            self._shapes[sql] = shape
+        now = self.clock()
+        with self._lock:
+            columns = self._columns
+            columns["ts"].append(int(now * 1000))
+            columns["fingerprint"].append(shape.fingerprint)
+            columns["statement"].append(shape.statement)
+            columns["variant"].append(shape.variant)
+            columns["seconds"].append(seconds)
+            columns["bytes_in"].append(bytes_in)
+            columns["bytes_out"].append(bytes_out)
+            columns["rows"].append(rows)
+            columns["batches"].append(batches)
+            columns["cache"].append(cache)
+            columns["error"].append(error)
+            columns["source"].append(source or self.source)
+            if self.record_sql:
+                columns["sql"].append(sql)
+            if self._first_buffered is None:
+                self._first_buffered = now
+            if (len(columns["ts"]) >= self.flush_rows
+                    or now - self._first_buffered >= self.flush_seconds):
+                self._flush_locked()
+
+    def flush(self):
+        """Write buffered records"""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._columns["ts"]:
+            return
+        batch = pa.record_batch([pa.array(self._columns[name], field.type)
+                                 for name, field in zip(self.schema.names, self.schema)],
+                                schema=self.schema)
+        for values in self._columns.values():
+            values.clear()
+        self._first_buffered = None
+        if self._writer is None:
+            self._open()
+        self._writer.write_batch(batch)
+        self.records_written += batch.num_rows
+        if self._sink.tell() >= self.max_file_bytes:
+            self._close_file()
+
+    def _open(self):
+        name = f"workload-{time.strftime('%Y%m%dT%H%M%S', time.gmtime(self.clock()))}-{uuid.uuid4().hex[:8]}"
+        self._path = os.path.join(self.directory, name + FORMATS[self.format])
+        self._sink = pa.OSFile(self._path, "wb")
+        if self.format == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+        else:
+            self._writer = ipc.new_stream(self._sink, self.schema)
+        self._prune()
+
+    def _close_file(self):
+        writer, sink = self._writer, self._sink
+        self._writer = self._sink = None
+        writer.close()
+        sink.close()
+
+    def _prune(self):
+        files = sorted(log_files([self.directory]), key=os.path.getmtime)
+        for path in files[:max(len(files) - self.max_files, 0)]:
+            if path != self._path:
+                os.remove(path)
+
+    def close(self):
+        """Flush and close the current file"""
+        with self._lock:
+            self._flush_locked()
+            if self._writer is not None:
+                self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# === Reading ===
+
+def log_files(paths: Iterable[str]) -> List[str]:
+    """Log files under `paths` (files or directories, not recursive)"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith(tuple(FORMATS.values())))
+        else:
+            found.append(path)
+    return found
+
+
+def _read_file(path: str) -> Optional[pa.Table]:
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        try:
+            return pq.read_table(path)
+        except (pa.ArrowInvalid, OSError):
+            return None   # still being written
+    batches = []
+    with pa.memory_map(path) as source:
+        try:
+            reader = ipc.open_stream(source)
+            schema = reader.schema
+            while True:
+                batches.append(reader.read_next_batch())
+        except StopIteration:
+            pass
+        except (pa.ArrowInvalid, OSError):
+            # Empty file or a batch still being written: keep what is complete
+            if not batches:
+                return None
+        return pa.Table.from_batches(batches, schema)
+
+
+def read_workload(paths: Iterable[str]) -> pa.Table:
+    """All records under `paths` as one table (dictionaries unified)"""
+    tables = [t for t in (_read_file(path) for path in log_files(paths)) if t is not None and t.num_rows]
+    if not tables:
+        return SCHEMA.empty_table()
+    if any("sql" in t.schema.names for t in tables):
+        tables = [t if "sql" in t.schema.names
+                  else t.append_column(SQL_FIELD, pa.nulls(t.num_rows, pa.string())) for t in tables]
+    return pa.concat_tables(tables, promote_options="permissive").unify_dictionaries()
+
+
+# === Analysis ===
+
+@dataclass
+class Thresholds:
+    """When a query shape is flagged as a candidate"""
+    slow_seconds: float = 1.0           # pre-aggregation: mean latency above this
+    repeat_count: int = 20              # caching: executions of one variant
+    cache_hit_rate: float = 0.5         #   ... with a hit rate below this
+    cacheable_bytes: int = 16 << 20     #   ... and results below this size
+    prepare_count: int = 100            # prepared statements: executions
+    prepare_variants: int = 10          #   ... with this many literal variants
+    prepare_seconds: float = 0.05       #   ... each this fast (planning dominates)
+
+
+def analyze(records: pa.Table, thresholds: Optional[Thresholds] = None) -> pa.Table:
+    """Per query shape: counts, time, bytes, cache hit rate and candidates
+
+    Sorted by total time, descending.
+    """
+    thresholds = thresholds or Thresholds()
+    records = records.append_column("hit", pc.equal(records["cache"].cast(pa.string()), "hit"))
+    # fingerprint and statement are 1:1; grouping by both carries the text
+    stats = records.group_by(["fingerprint", "statement"], use_threads=False).aggregate([
+        ("seconds", "count"),
+        ("seconds", "sum"),
+        ("seconds", "mean"),
+        ("seconds", "tdigest", pc.TDigestOptions(q=0.95)),
+        ("bytes_in", "sum"),
+        ("bytes_in", "mean"),
+        ("rows", "mean"),
+        ("hit", "mean"),
+        ("error", "sum"),
+        ("variant", "count_distinct"),
+    ])
+    names = {
+        "seconds_count": "queries", "seconds_sum": "total_seconds",
+        "seconds_mean": "mean_seconds", "seconds_tdigest": "p95_seconds", "bytes_in_sum": "total_bytes",
+        "bytes_in_mean": "mean_bytes", "rows_mean": "mean_rows", "hit_mean": "cache_hit_rate",
+        "error_sum": "errors", "variant_count_distinct": "variants",
+    }
+    stats = stats.rename_columns([names.get(name, name) for name in stats.column_names])
+    stats = stats.set_column(stats.schema.get_field_index("statement"), "statement",
+                             stats["statement"].cast(pa.string()))
+    stats = stats.set_column(stats.schema.get_field_index("p95_seconds"), "p95_seconds",
+                             pc.list_element(stats["p95_seconds"], 0))
+    return _with_candidates(stats, thresholds).sort_by([("total_seconds", "descending")])
+
+
+def _with_candidates(stats: pa.Table, t: Thresholds) -> pa.Table:
+    """Add boolean candidate columns (vectorized over all shapes)"""
+    grouping = pc.match_substring(stats["statement"], "group by")
+    preagg = pc.and_(grouping, pc.greater(stats["mean_seconds"], t.slow_seconds))
+    per_variant = pc.divide(pc.cast(stats["queries"], pa.float64()), stats["variants"])
+    cache = pc.and_(pc.and_(pc.greater_equal(per_variant, t.repeat_count),
+                            pc.less(stats["cache_hit_rate"], t.cache_hit_rate)),
+                    pc.less(stats["mean_bytes"], t.cacheable_bytes))
+    prepare = pc.and_(pc.and_(pc.greater_equal(stats["queries"], t.prepare_count),
+                              pc.greater_equal(stats["variants"], t.prepare_variants)),
+                      pc.less(stats["mean_seconds"], t.prepare_seconds))
+    return (stats.append_column("preaggregation", preagg)
+                 .append_column("cache", cache)
+                 .append_column("prepare", prepare))
+
+
+_DUCKDB_QUERY = """
+SELECT fingerprint,
+       first(statement) AS statement,
+       count(*) AS queries,
+       sum(seconds) AS total_seconds,
+       avg(seconds) AS mean_seconds,
+       quantile_cont(seconds, 0.95) AS p95_seconds,
+       sum(bytes_in) AS total_bytes,
+       avg(bytes_in) AS mean_bytes,
+       avg(rows) AS mean_rows,
+       avg(CASE WHEN cache = 'hit' THEN 1.0 ELSE 0.0 END) AS cache_hit_rate,
+       sum(CASE WHEN error THEN 1 ELSE 0 END) AS errors,
+       count(DISTINCT variant) AS variants
+FROM records
+GROUP BY fingerprint
+"""
+
+
+def analyze_duckdb(records: pa.Table, thresholds: Optional[Thresholds] = None) -> pa.Table:
+    """analyze() computed by DuckDB over the Arrow table (zero-copy scan)"""
+    import duckdb
+
+    con = duckdb.connect()
+    con.register("records", records)
+    stats = con.execute(_DUCKDB_QUERY).arrow()
+    stats = stats.set_column(stats.schema.get_field_index("statement"), "statement",
+                             stats["statement"].cast(pa.string()))
+    return _with_candidates(stats, thresholds or Thresholds()).sort_by([("total_seconds", "descending")])
+
+
+def hot_query_log(records: pa.Table, path: Optional[str] = None):
+    """cache_warmer.HotQueryLog built from records that carry SQL text"""
+    from cache_warmer import HotQuery, HotQueryLog
+
+    if "sql" not in records.schema.names:
+        raise ValueError("The workload log has no SQL text (enable record_sql=True)")
+    records = records.filter(pc.and_(pc.is_valid(records["sql"]), pc.invert(records["error"])))
+    records = records.sort_by([("ts", "ascending")])
+    stats = records.group_by(["fingerprint"], use_threads=False).aggregate([
+        ("sql", "last"), ("seconds", "count"), ("seconds", "sum"), ("ts", "max")])
+    log = HotQueryLog(path)
+    for row in stats.to_pylist():
+        log.entries[row["fingerprint"]] = HotQuery(
+            row["sql_last"], row["seconds_count"], row["seconds_sum"], row["ts_max"].timestamp())
+    return log
+
+
+def format_report(stats: pa.Table, top: int = 20) -> str:
+    lines = [f"{'queries':>8} {'total s':>9} {'mean ms':>9} {'p95 ms':>9} {'MB':>8} {'hit%':>5} "
+             f"{'var':>5}  flags  statement"]
+    for row in stats.slice(0, top).to_pylist():
+        flags = "".join(flag if row[name] else "." for flag, name in
+                        (("A", "preaggregation"), ("C", "cache"), ("P", "prepare")))
+        lines.append(f"{row['queries']:>8} {row['total_seconds']:>9.1f} {row['mean_seconds'] * 1000:>9.1f} "
+                     f"{(row['p95_seconds'] or 0) * 1000:>9.1f} {row['total_bytes'] / 1e6:>8.1f} "
+                     f"{row['cache_hit_rate'] * 100:>5.0f} {row['variants']:>5}  {flags:5}  "
+                     f"{row['statement'][:80]}")
+    lines.append("flags: A = pre-aggregation candidate, C = caching candidate, "
+                 "P = prepared statement candidate")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aggregate Cube query workload logs")
+    parser.add_argument("paths", nargs="+", help="log files or directories")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--engine", choices=("arrow", "duckdb"), default="arrow")
+    parser.add_argument("--since", type=float, help="only the last N hours")
+    parser.add_argument("--slow", type=float, default=1.0, help="pre-aggregation threshold (s)")
+    parser.add_argument("--output", help="write the per-shape statistics (.parquet or .csv)")
+    parser.add_argument("--export-hot", help="write a hot query log for cache_warmer.py")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    records = read_workload(args.paths)
+    if args.since is not None:
+        cutoff = pa.scalar(int((time.time() - args.since * 3600) * 1000), pa.timestamp("ms", tz="UTC"))
+        records = records.filter(pc.greater_equal(records["ts"], cutoff))
+    thresholds = Thresholds(slow_seconds=args.slow)
+    stats = (analyze_duckdb if args.engine == "duckdb" else analyze)(records, thresholds)
+    print(f"{records.num_rows:,} queries, {stats.num_rows:,} shapes "
+          f"({time.perf_counter() - started:.2f}s)\n")
+    print(format_report(stats, args.top))
+
+    if args.output:
+        if args.output.endswith(".csv"):
+            import pyarrow.csv as csv
+            csv.write_csv(stats, args.output)
+        else:
+            import pyarrow.parquet as pq
+            pq.write_table(stats, args.output)
+    if args.export_hot:
+        hot_query_log(records, args.export_hot).save()
+        print(f"\n✓ Hot query log written to {args.export_hot}")